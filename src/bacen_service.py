@@ -3,11 +3,22 @@ Serviço de integração com API do Banco Central (BACEN)
 Busca taxas SELIC atualizadas dinamicamente
 """
 import logging
+import threading
 import requests
-from datetime import datetime, date
+from datetime import date, timedelta
 from typing import Dict, List, Optional
 from pathlib import Path
-import json
+
+try:
+    from http_client import obter_http_client
+    from indice_fatores import IndicesTaxas
+    from saude_upstream import obter_circuit_breaker
+    from series_store import obter_series_store
+except ImportError:  # importado como src.<módulo> (taxas_completo_validator)
+    from src.http_client import obter_http_client
+    from src.indice_fatores import IndicesTaxas
+    from src.saude_upstream import obter_circuit_breaker
+    from src.series_store import obter_series_store
 
 logger = logging.getLogger(__name__)
 
@@ -30,12 +41,13 @@ class BacenService:
         "TR": "226"
     }
     
-    def __init__(self, base_url: str = None):
+    def __init__(self, base_url: str = None, cache_dir: Path = None):
         """
         Inicializa o serviço BACEN
         
         Args:
             base_url: URL base da API BACEN
+            cache_dir: Diretório do histórico local (padrão: data/cache)
         """
         if base_url is None:
             # Usar URL padrão da API BACEN (sem /dados no final)
@@ -43,8 +55,12 @@ class BacenService:
         
         # Remove trailing slash if present
         self.base_url = base_url.rstrip('/')
-        self.cache_dir = Path(__file__).parent.parent / "data" / "cache"
+        self.cache_dir = Path(cache_dir) if cache_dir else Path(__file__).parent.parent / "data" / "cache"
         self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.series = obter_series_store(self.cache_dir)
+        self.indices = IndicesTaxas(self.series)
+        self.breaker = obter_circuit_breaker("BACEN")
+        self.http = obter_http_client()  # conexões reaproveitadas + retentativas
         self.timeout = 10  # segundos
         
         logger.info(f"BacenService inicializado: {self.base_url}")
@@ -113,64 +129,89 @@ class BacenService:
             >>> taxas[0]
             {'data': '02/01/2024', 'valor': 11.75}
         """
+        dados = []
         try:
             serie_codigo = self.SERIES.get(taxa_nome)
             if not serie_codigo:
                 logger.error(f"Taxa desconhecida: {taxa_nome}")
                 return None
             
-            # Verificar cache primeiro
+            # Verificar cache primeiro: período coberto é respondido localmente
+            lacunas = [(data_inicio, data_fim)]
             if usar_cache:
                 cached_data = self._ler_cache(taxa_nome, data_inicio, data_fim)
                 if cached_data:
                     logger.info(f"Dados {taxa_nome} carregados do cache ({len(cached_data)} registros)")
                     return cached_data
-            
-            # Formatar datas para API (DD/MM/YYYY)
-            data_inicio_str = data_inicio.strftime("%d/%m/%Y")
-            data_fim_str = data_fim.strftime("%d/%m/%Y")
-            
-            # Montar URL
-            # Formato: https://api.bcb.gov.br/dados/serie/bcdata.sgs.{codigo}/dados
-            url = f"{self.base_url}.{serie_codigo}/dados"
-            params = {
-                "formato": "json",
-                "dataInicial": data_inicio_str,
-                "dataFinal": data_fim_str
-            }
-            
-            logger.info(f"Buscando {taxa_nome} de {data_inicio_str} a {data_fim_str}...")
-            
-            # Fazer requisição
-            response = requests.get(url, params=params, timeout=self.timeout)
-            response.raise_for_status()
-            
-            # Processar resposta
-            dados = response.json()
-            
-            if not dados or len(dados) == 0:
+                # Só as partes do período que ainda não estão no histórico
+                lacunas = self.series.lacunas(taxa_nome, data_inicio, data_fim) or lacunas
+
+            for lacuna_inicio, lacuna_fim in lacunas:
+                # Circuito aberto: a API vem falhando, nem espera o timeout
+                if not self.breaker.permitir():
+                    logger.warning(f"⚡ Circuito BACEN aberto - {taxa_nome} sem consulta à API")
+                    return self._parcial_ou_fallback(taxa_nome, data_inicio, data_fim, dados)
+                try:
+                    novos = self._consultar_api(taxa_nome, serie_codigo, lacuna_inicio, lacuna_fim)
+                except requests.exceptions.RequestException as e:
+                    # Rede/timeout/5xx contam para o circuito; 4xx é problema da consulta
+                    resposta = getattr(e, "response", None)
+                    if resposta is None or resposta.status_code >= 500:
+                        self.breaker.registrar_falha()
+                    raise
+                self.breaker.registrar_sucesso()
+                # Salvar no cache (mesmo vazio: o intervalo fica marcado como consultado)
+                self._salvar_cache(taxa_nome, novos, lacuna_inicio, lacuna_fim)
+                dados.extend(novos)
+
+            if usar_cache and lacunas != [(data_inicio, data_fim)]:
+                # Parte veio do histórico local, parte da API
+                dados = self.series.registros(taxa_nome, data_inicio, data_fim)
+
+            if not dados:
                 logger.warning(f"Nenhum dado {taxa_nome} retornado para o período")
                 return None
-            
-            logger.info(f"✅ {len(dados)} taxas {taxa_nome} obtidas da API BACEN")
-            
-            # Salvar no cache
-            self._salvar_cache(taxa_nome, dados, data_inicio, data_fim)
-            
+
             return dados
             
         except requests.exceptions.Timeout:
             logger.error(f"Timeout ao buscar {taxa_nome} (>{self.timeout}s)")
-            return self._usar_fallback(taxa_nome)
+            return self._parcial_ou_fallback(taxa_nome, data_inicio, data_fim, dados)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Erro na requisição BACEN para {taxa_nome}: {e}")
-            return self._usar_fallback(taxa_nome)
+            return self._parcial_ou_fallback(taxa_nome, data_inicio, data_fim, dados)
             
         except Exception as e:
             logger.error(f"Erro inesperado ao buscar {taxa_nome}: {e}", exc_info=True)
             return self._usar_fallback(taxa_nome)
     
+    def _consultar_api(self, taxa_nome: str, serie_codigo: str, data_inicio: date, data_fim: date) -> List[Dict]:
+        """Busca um intervalo na API BACEN (erros de rede sobem para o chamador)"""
+        # Formatar datas para API (DD/MM/YYYY)
+        data_inicio_str = data_inicio.strftime("%d/%m/%Y")
+        data_fim_str = data_fim.strftime("%d/%m/%Y")
+        
+        # Montar URL
+        # Formato: https://api.bcb.gov.br/dados/serie/bcdata.sgs.{codigo}/dados
+        url = f"{self.base_url}.{serie_codigo}/dados"
+        params = {
+            "formato": "json",
+            "dataInicial": data_inicio_str,
+            "dataFinal": data_fim_str
+        }
+        
+        logger.info(f"Buscando {taxa_nome} de {data_inicio_str} a {data_fim_str}...")
+        
+        # Fazer requisição
+        response = self.http.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        
+        # Processar resposta
+        dados = response.json() or []
+        logger.info(f"✅ {len(dados)} taxas {taxa_nome} obtidas da API BACEN")
+        return dados
+    
     def buscar_selic_mes(self, ano: int, mes: int) -> Optional[float]:
         """
         Busca taxa SELIC acumulada para um mês específico
@@ -185,29 +226,19 @@ class BacenService:
         """
         try:
             data_inicio = date(ano, mes, 1)
-            
             # Último dia do mês
-            if mes == 12:
-                data_fim = date(ano, 12, 31)
-            else:
-                data_fim = date(ano, mes + 1, 1).replace(day=1)
-                data_fim = data_fim.replace(day=1)  # Primeiro dia do mês seguinte
-                from datetime import timedelta
-                data_fim = data_fim - timedelta(days=1)  # Último dia do mês atual
+            data_fim = date(ano + mes // 12, mes % 12 + 1, 1) - timedelta(days=1)
             
-            taxas = self.buscar_selic_periodo(data_inicio, data_fim)
-            
-            if not taxas:
+            # Garante o mês no histórico local (cache ou API)
+            if not self.buscar_selic_periodo(data_inicio, data_fim):
                 return None
             
-            # Calcular taxa acumulada do mês
-            # Fórmula: [(1 + taxa1/100) * (1 + taxa2/100) * ... - 1] * 100
-            fator_acumulado = 1.0
-            for registro in taxas:
-                taxa_dia = float(registro['valor'])
-                fator_acumulado *= (1 + taxa_dia / 100)
-            
-            taxa_mensal = (fator_acumulado - 1) * 100
+            # Total do mês materializado no índice de fatores:
+            # [(1 + taxa1/100) * (1 + taxa2/100) * ... - 1] * 100
+            taxa_mensal = self.indices.total_mensal("SELIC", ano * 12 + mes - 1)
+            if taxa_mensal is None:
+                logger.warning(f"SELIC {mes:02d}/{ano} fora do histórico local")
+                return None
             
             logger.info(f"SELIC {mes:02d}/{ano}: {taxa_mensal:.4f}%")
             return round(taxa_mensal, 4)
@@ -216,71 +247,71 @@ class BacenService:
             logger.error(f"Erro ao calcular SELIC mensal: {e}")
             return None
     
-    def _ler_cache(self, taxa_nome: str, data_inicio: date, data_fim: date) -> Optional[List[Dict]]:
-        """Lê dados do cache local se disponível e dentro do período"""
+    def fator_acumulado(self, taxa_nome: str, data_inicio: date, data_fim: date) -> Optional[float]:
+        """
+        Fator acumulado de uma taxa entre duas datas (inclusive)
+        
+        Args:
+            taxa_nome: "SELIC" (fatores diários) ou "TR" (competências mensais)
+            data_inicio: Data inicial
+            data_fim: Data final
+            
+        Returns:
+            ∏(1 + taxa/100) do período (ex: 1.1325)
+            None se o período não está disponível
+        """
         try:
-            cache_file = self.cache_dir / f"{taxa_nome.lower()}_cache.json"
-            if not cache_file.exists():
+            if not self._buscar_taxa_periodo(taxa_nome, data_inicio, data_fim):
                 return None
-            
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cache = json.load(f)
-            
-            # Verificar se cache cobre o período solicitado
-            cache_inicio = datetime.strptime(cache['data_inicio'], '%Y-%m-%d').date()
-            cache_fim = datetime.strptime(cache['data_fim'], '%Y-%m-%d').date()
-            
-            if cache_inicio <= data_inicio and cache_fim >= data_fim:
-                # Filtrar dados do período
-                dados_filtrados = [
-                    d for d in cache['dados']
-                    if data_inicio <= datetime.strptime(d['data'], '%d/%m/%Y').date() <= data_fim
-                ]
-                return dados_filtrados if dados_filtrados else None
-            
+            return self.indices.fator(taxa_nome, data_inicio, data_fim)
+        except Exception as e:
+            logger.error(f"Erro ao calcular fator acumulado {taxa_nome}: {e}")
             return None
-            
+    
+    def _ler_cache(self, taxa_nome: str, data_inicio: date, data_fim: date) -> Optional[List[Dict]]:
+        """Lê dados do histórico local se o período estiver inteiramente coberto"""
+        try:
+            return self.series.consultar(taxa_nome, data_inicio, data_fim) or None
         except Exception as e:
             logger.debug(f"Cache {taxa_nome} não disponível: {e}")
             return None
     
     def _salvar_cache(self, taxa_nome: str, dados: List[Dict], data_inicio: date, data_fim: date):
-        """Salva dados no cache local"""
+        """Mescla os dados buscados no histórico local"""
         try:
-            # Criar diretório se não existir
-            self.cache_dir.mkdir(parents=True, exist_ok=True)
-            
-            cache_file = self.cache_dir / f"{taxa_nome.lower()}_cache.json"
-            cache = {
-                'taxa': taxa_nome,
-                'data_inicio': data_inicio.strftime('%Y-%m-%d'),
-                'data_fim': data_fim.strftime('%Y-%m-%d'),
-                'atualizado_em': datetime.now().isoformat(),
-                'dados': dados
-            }
-            
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache, f, ensure_ascii=False, indent=2)
-            
-            logger.debug(f"Cache {taxa_nome} salvo: {len(dados)} registros")
-            
+            novos = self.series.mesclar(taxa_nome, dados, data_inicio, data_fim)
+            logger.debug(f"Cache {taxa_nome} salvo: {len(dados)} registros ({novos} novos)")
         except Exception as e:
             logger.warning(f"Erro ao salvar cache {taxa_nome}: {e}")
     
+    def _parcial_ou_fallback(
+        self, taxa_nome: str, data_inicio: date, data_fim: date, obtidos: List[Dict]
+    ) -> Optional[List[Dict]]:
+        """
+        API interrompida no meio das lacunas: registros do período (histórico local
+        mais o que já veio da API nesta consulta); sem nada novo, fallback completo
+        """
+        if not obtidos:
+            return self._usar_fallback(taxa_nome)
+        try:
+            registros = self.series.registros(taxa_nome, data_inicio, data_fim)
+        except Exception as e:
+            logger.warning(f"Erro ao ler histórico {taxa_nome}: {e}")
+            registros = None
+        logger.warning(f"⚠️ {taxa_nome} parcial: lacunas restantes ficam para a próxima consulta")
+        return registros or obtidos
+    
     def _usar_fallback(self, taxa_nome: str) -> Optional[List[Dict]]:
         """
-        Usa cache local como fallback quando API falha
+        Usa o histórico local como fallback quando API falha
         """
         logger.warning(f"⚠️ API BACEN indisponível para {taxa_nome}. Tentando usar cache local...")
         
         try:
-            cache_file = self.cache_dir / f"{taxa_nome.lower()}_cache.json"
-            if cache_file.exists():
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache = json.load(f)
-                
-                logger.info(f"✅ Usando cache {taxa_nome} local ({len(cache['dados'])} registros)")
-                return cache['dados']
+            dados = self.series.todos(taxa_nome)
+            if dados:
+                logger.info(f"✅ Usando cache {taxa_nome} local ({len(dados)} registros)")
+                return dados
         except Exception as e:
             logger.error(f"Erro ao ler cache fallback {taxa_nome}: {e}")
         
@@ -307,7 +338,7 @@ class BacenService:
             # Formato: https://api.bcb.gov.br/dados/serie/bcdata.sgs.{codigo}/dados/ultimos/1
             url = f"{self.base_url}.{serie_codigo}/dados/ultimos/1"
             
-            response = requests.get(url, params={"formato": "json"}, timeout=5)
+            response = self.http.get(url, params={"formato": "json"}, timeout=5, tentativas=1)
             response.raise_for_status()
             
             logger.info(f"✅ API BACEN disponível para {taxa_nome}")
@@ -318,7 +349,22 @@ class BacenService:
             return False
 
 
+# Instância compartilhada (histórico, índice de fatores e conexões reaproveitados)
+_bacen_service: Optional[BacenService] = None
+_bacen_service_lock = threading.Lock()
+
+
 # Funções auxiliares para uso direto
+def obter_bacen_service() -> BacenService:
+    """Serviço BACEN do processo (criado no primeiro uso)"""
+    global _bacen_service
+    if _bacen_service is None:
+        with _bacen_service_lock:
+            if _bacen_service is None:
+                _bacen_service = BacenService()
+    return _bacen_service
+
+
 def obter_selic_atualizada(data_inicio: date, data_fim: date) -> Optional[List[Dict]]:
     """
     Função helper para obter SELIC atualizada
@@ -330,8 +376,7 @@ def obter_selic_atualizada(data_inicio: date, data_fim: date) -> Optional[List[D
     Returns:
         Lista de taxas SELIC ou None
     """
-    service = BacenService()
-    return service.buscar_selic_periodo(data_inicio, data_fim)
+    return obter_bacen_service().buscar_selic_periodo(data_inicio, data_fim)
 
 
 def verificar_api_bacen() -> bool:
@@ -341,5 +386,4 @@ def verificar_api_bacen() -> bool:
     Returns:
         True se disponível
     """
-    service = BacenService()
-    return service.verificar_disponibilidade()
+    return obter_bacen_service().verificar_disponibilidade()
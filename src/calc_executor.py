@@ -0,0 +1,286 @@
+"""
+Execução dos cálculos fora do event loop, em pool limitado com backpressure
+O endpoint só aguarda o resultado; health check, arquivos estáticos e
+outras requisições continuam sendo atendidos enquanto o cálculo roda
+
+Modos (CALC_EXECUTOR):
+- thread: backends que esperam processo externo (Excel COM, LibreOffice)
+- process: motor de fórmulas em Python (CPU) - cada processo mantém seu próprio
+  template/grafo em memória; caches em memória e coalescência ficam por processo
+  (requisições idênticas em processos diferentes calculam de novo), o store SQLite
+  continua compartilhado; os eventos de etapa (run_events) voltam ao processo da
+  API por uma multiprocessing.Queue e a saúde do BACEN vem do monitor dele
+  (saude_upstream - nenhum filho verifica a API). Só quando pedido explicitamente
+- auto: thread - coalescência e cache em memória valem para todas as requisições
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from models import CalculadoraInput, CalculadoraOutput
+
+logger = logging.getLogger(__name__)
+
+
+class FilaCheiaError(Exception):
+    """Pool e fila de cálculos ocupados - cliente deve tentar de novo depois"""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"Fila de cálculos cheia - tente novamente em {retry_after}s")
+
+
+def memoria_disponivel_mb() -> Optional[int]:
+    """Memória disponível (MemAvailable no Linux; total físico como aproximação nos demais)"""
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for linha in f:
+                if linha.startswith("MemAvailable:"):
+                    return int(linha.split()[1]) // 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def calcular_tamanho_pool(modo: str, memoria_por_worker_mb: int) -> int:
+    """
+    Tamanho do pool pela CPU e memória disponíveis
+
+    process: um processo por CPU; thread: CPU + 4 (esperam I/O na maior parte do tempo)
+    Nos dois casos limitado a memória disponível / memória por worker
+    """
+    cpus = os.cpu_count() or 1
+    tamanho = cpus if modo == "process" else min(32, cpus + 4)
+
+    memoria = memoria_disponivel_mb()
+    if memoria and memoria_por_worker_mb > 0:
+        tamanho = min(tamanho, memoria // memoria_por_worker_mb)
+    return max(1, tamanho)
+
+
+def _aquecer_processo():
+    """Inicializador dos processos do pool: template e grafo prontos antes do 1º cálculo"""
+    from calculator_service import CalculadoraService
+    CalculadoraService.aquecer()
+
+
+def _iniciar_processo(fila_eventos, canal_upstream):
+    """
+    Inicializador dos processos do pool: eventos de etapa vão para o processo da API
+    e o monitor do BACEN é o dele (status compartilhado, atualizações enviadas por fila)
+    """
+    from run_events import configurar_envio_processo
+    from saude_upstream import configurar_monitor_processo
+    configurar_envio_processo(fila_eventos)
+    configurar_monitor_processo(*canal_upstream)
+    _aquecer_processo()
+
+
+def _calcular_processo(
+    dados: Dict[str, Any],
+    progresso: Optional[Callable[[str, int], None]] = None,
+    run_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Cálculo em processo filho (entradas, callback de progresso e saída serializáveis)"""
+    from calculator_service import CalculadoraService
+    resultado = CalculadoraService().calcular(CalculadoraInput(**dados), progresso=progresso, run_id=run_id)
+    return resultado.model_dump(mode="json")
+
+
+def _calcular_thread(
+    inputs: CalculadoraInput,
+    progresso: Optional[Callable[[str, int], None]] = None,
+    run_id: Optional[str] = None
+) -> CalculadoraOutput:
+    from calculator_service import CalculadoraService
+    return CalculadoraService().calcular(inputs, progresso=progresso, run_id=run_id)
+
+
+class CalcExecutor:
+    """
+    Pool de cálculos com fila limitada
+
+    Admite no máximo workers + max_fila cálculos (rodando + aguardando);
+    além disso submeter() levanta FilaCheiaError com o Retry-After estimado
+    """
+
+    def __init__(self, modo: str, workers: int, max_fila: int):
+        self.modo = modo
+        self.workers = workers
+        self.max_fila = max_fila
+        self._fila_eventos = None
+        if modo == "process":
+            from run_events import repassar_eventos
+            from saude_upstream import canal_monitor_bacen
+            self._fila_eventos = multiprocessing.Queue()
+            threading.Thread(
+                target=repassar_eventos, args=(self._fila_eventos,), name="calculo-eventos", daemon=True
+            ).start()
+            self._pool: Executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_iniciar_processo,
+                initargs=(self._fila_eventos, canal_monitor_bacen()),
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="calculo")
+        self._lock = threading.Lock()
+        self._ocupados = 0
+        self._duracao_media = 0.0
+        self.concluidos = 0
+        self.rejeitados = 0
+
+        logger.info(f"⚙️ Pool de cálculos: {workers} {modo}(s), fila de {max_fila}")
+
+    @property
+    def capacidade(self) -> int:
+        return self.workers + self.max_fila
+
+    def _reservar(self) -> bool:
+        with self._lock:
+            if self._ocupados >= self.capacidade:
+                self.rejeitados += 1
+                return False
+            self._ocupados += 1
+            return True
+
+    def _liberar(self, inicio: float):
+        duracao = time.monotonic() - inicio
+        with self._lock:
+            self._ocupados -= 1
+            self.concluidos += 1
+            # Média móvel exponencial da duração (estimativa do Retry-After)
+            self._duracao_media = duracao if self.concluidos == 1 else 0.8 * self._duracao_media + 0.2 * duracao
+
+    def retry_after(self) -> int:
+        """Segundos estimados até abrir vaga: fila inteira escoando pelos workers"""
+        with self._lock:
+            media = self._duracao_media or 5.0
+            return max(1, math.ceil(media * self._ocupados / self.workers))
+
+    def iniciar(self, funcao: Callable, *args) -> Future:
+        """
+        Reserva uma vaga e envia funcao(*args) ao pool sem aguardar
+
+        Raises:
+            FilaCheiaError: pool e fila ocupados
+        """
+        if not self._reservar():
+            raise FilaCheiaError(self.retry_after())
+
+        inicio = time.monotonic()
+        try:
+            futuro = self._pool.submit(funcao, *args)
+        except Exception:
+            self._liberar(inicio)
+            raise
+        # A vaga só é liberada quando o trabalho termina de fato (mesmo se o cliente desconectar)
+        futuro.add_done_callback(lambda _: self._liberar(inicio))
+        return futuro
+
+    async def submeter(self, funcao: Callable, *args) -> Any:
+        """
+        Executa funcao(*args) no pool e aguarda o resultado
+
+        Raises:
+            FilaCheiaError: pool e fila ocupados
+        """
+        return await asyncio.wrap_future(self.iniciar(funcao, *args))
+
+    def iniciar_calculo(
+        self,
+        inputs: CalculadoraInput,
+        progresso: Optional[Callable[[str, int], None]] = None,
+        run_id: Optional[str] = None
+    ) -> Future:
+        """
+        Envia CalculadoraService.calcular ao pool (resultado via converter_resultado)
+
+        Args:
+            progresso: Callback (etapa, percentual) - no modo process roda no processo
+                filho, então precisa ser serializável (pickle) e não enxerga a memória da API
+            run_id: ID da execução escolhido pelo cliente (eventos SSE)
+        """
+        if self.modo == "process":
+            return self.iniciar(_calcular_processo, inputs.model_dump(mode="json"), progresso, run_id)
+        return self.iniciar(_calcular_thread, inputs, progresso, run_id)
+
+    @staticmethod
+    def converter_resultado(resultado: Any) -> CalculadoraOutput:
+        """Resultado do pool de processos chega serializado"""
+        if isinstance(resultado, dict):
+            return CalculadoraOutput.model_validate(resultado)
+        return resultado
+
+    async def calcular(self, inputs: CalculadoraInput, run_id: Optional[str] = None) -> CalculadoraOutput:
+        """CalculadoraService.calcular no pool"""
+        return self.converter_resultado(await asyncio.wrap_future(self.iniciar_calculo(inputs, run_id=run_id)))
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "modo": self.modo,
+                "workers": self.workers,
+                "max_fila": self.max_fila,
+                "ocupados": self._ocupados,
+                "aguardando": max(0, self._ocupados - self.workers),
+                "concluidos": self.concluidos,
+                "rejeitados": self.rejeitados,
+                "duracao_media_s": round(self._duracao_media, 3),
+            }
+
+    def encerrar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self._fila_eventos is not None:
+            self._fila_eventos.put(None)  # encerra a thread de repasse
+
+
+# Instância global (por processo da API)
+_calc_executor: Optional[CalcExecutor] = None
+_calc_executor_lock = threading.Lock()
+
+
+def resolver_modo(modo: str) -> str:
+    """
+    Resolve "auto" para thread
+
+    No modo process cada filho tem seu próprio single-flight e cache LRU -
+    a coalescência entre requisições só é garantida com threads
+    """
+    return "thread" if modo == "auto" else modo
+
+
+def configuracao_executor() -> Tuple[str, int]:
+    """(modo, workers) do pool de cálculos conforme CALC_EXECUTOR / CALC_WORKERS"""
+    from config import CALC_EXECUTOR, CALC_WORKER_MEM_MB, CALC_WORKERS
+    modo = resolver_modo(CALC_EXECUTOR)
+    return modo, CALC_WORKERS or calcular_tamanho_pool(modo, CALC_WORKER_MEM_MB)
+
+
+# Funções auxiliares para uso direto
+def obter_calc_executor() -> CalcExecutor:
+    """Pool de cálculos do processo (CALC_EXECUTOR / CALC_WORKERS / CALC_QUEUE_SIZE)"""
+    global _calc_executor
+    if _calc_executor is None:
+        with _calc_executor_lock:
+            if _calc_executor is None:
+                from config import CALC_QUEUE_SIZE
+                modo, workers = configuracao_executor()
+                _calc_executor = CalcExecutor(modo, workers, CALC_QUEUE_SIZE)
+    return _calc_executor
+
+
+def encerrar_calc_executor():
+    global _calc_executor
+    with _calc_executor_lock:
+        if _calc_executor is not None:
+            _calc_executor.encerrar()
+            _calc_executor = None
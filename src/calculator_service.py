@@ -5,14 +5,28 @@ ARQUITETURA: Excel é 100% correto - site ESPELHA a planilha
 import logging
 import time
 import uuid
-from datetime import datetime
-from typing import Dict, Any
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Any, Callable, Dict, Optional
 from pathlib import Path
 from models import CalculadoraInput, CalculadoraOutput, CenarioOutput
-from excel_template_calculator import ExcelTemplateCalculator
-from bacen_service import BacenService
+from excel_template_calculator import ExcelTemplateCalculator, RecalculoError, carregar_template_bytes
+from recalc_backends import obter_backend
+from bacen_service import obter_bacen_service, obter_selic_atualizada
 from taxas_validator import TaxasValidator
-from config import EXCEL_FULL_PATH
+from result_cache import (
+    CAMPOS_BRUTOS,
+    chave_resultado,
+    hash_conteudo,
+    impressao_arquivos,
+    obter_cache_brutos,
+    obter_result_cache,
+)
+from result_store import obter_result_store
+from single_flight import ExecucaoCancelada, obter_single_flight
+from run_events import Acompanhamento
+from saude_upstream import obter_monitor_bacen
+from config import EXCEL_FULL_PATH, TAXAS_CACHE_DIR
 
 logger = logging.getLogger(__name__)
 
@@ -47,13 +61,73 @@ OUTPUT_LINES = {
     "nt36_ipca_e_1pct": 68,    # Era 69 - agora lê BRUTO
 }
 
+# Atraso de publicação da SELIC diária aceito antes de considerar o histórico incompleto
+TOLERANCIA_PUBLICACAO_SELIC = timedelta(days=5)
+
+# Bloco de saída completo (linhas brutas + linhas com deságio) - cone do motor de fórmulas
+OUTPUT_RANGE = ("RESUMO", "D23:F69")
+
+
+def montar_saidas(brutos: Dict[str, float], inputs: CalculadoraInput) -> Dict[str, CenarioOutput]:
+    """
+    Aplica deságio e honorários como o RESUMO do template
+
+    Linha par: D = D_bruto × (1 - B13); E = D_bruto × B11 × (1 - B14); F = B12 × (1 - B14)
+    Honorários = E + F (percentual e fixo somados)
+    """
+    fator_principal = 1 - inputs.desagio_principal / 100.0
+    fator_honorarios = 1 - inputs.desagio_honorarios / 100.0
+
+    saidas = {}
+    for nome, bruto in brutos.items():
+        principal = bruto * fator_principal
+        honorarios = (
+            bruto * inputs.honorarios_perc / 100.0 * fator_honorarios
+            + inputs.honorarios_fixo * fator_honorarios
+        )
+        saidas[nome] = CenarioOutput(
+            principal=principal,
+            honorarios=honorarios,
+            total=principal + honorarios
+        )
+    return saidas
+
 
 class CalculadoraService:
     """Serviço de cálculo trabalhista"""
     
     def __init__(self):
         self.excel_path = EXCEL_FULL_PATH
-        self.bacen_service = BacenService()
+        self.bacen_service = obter_bacen_service()
+    
+    @staticmethod
+    def aquecer() -> bool:
+        """
+        Prepara o template na inicialização do processo
+        Carrega os bytes em memória e, conforme o backend de recálculo,
+        já monta o grafo de fórmulas ou inicia os workers
+        (primeira requisição não paga o custo)
+        
+        Returns:
+            True se o template está pronto para uso
+        """
+        if not ExcelTemplateCalculator.preload(EXCEL_FULL_PATH):
+            return False
+        
+        backend = ExcelTemplateCalculator.resolver_backend()
+        if backend == "formula":
+            if ExcelTemplateCalculator.preparar_formulas(
+                EXCEL_FULL_PATH, [OUTPUT_RANGE], list(INPUT_MAPPING.values())
+            ):
+                return True
+            # RECALC_BACKEND=auto com template recusado: segue para o pool do LibreOffice
+            backend = ExcelTemplateCalculator.resolver_backend()
+            if backend == "formula":
+                return False
+        if backend != "none":
+            # Sobe o pool de workers (Excel/LibreOffice) antes da primeira requisição
+            return obter_backend(backend) is not None
+        return True
     
     def _format_date_for_excel(self, date_obj):
         """Formata data para formato aceito pelo Excel (retorna datetime object)"""
@@ -123,162 +197,182 @@ class CalculadoraService:
             logger.warning(f"[{run_id}] Erro ao salvar CSV backup: {e}")
 
     
-    def calcular(self, inputs: CalculadoraInput) -> CalculadoraOutput:
+    def calcular(
+        self,
+        inputs: CalculadoraInput,
+        progresso: Optional[Callable[[str, int], None]] = None,
+        run_id: Optional[str] = None
+    ) -> CalculadoraOutput:
         """
-        Executa o fluxo completo de cálculo via COM (sem salvar arquivo)
+        Retorna o resultado do cache (memória ou store persistente) quando as mesmas
+        entradas já foram calculadas com o mesmo template e as mesmas taxas;
+        senão executa o cálculo
         
         Args:
             inputs: Dados de entrada validados
+            progresso: Callback (etapa, percentual) chamado a cada etapa do cálculo
+            run_id: ID escolhido pelo cliente (eventos em /api/runs/{run_id}/events)
+            
+        Returns:
+            Resultado do cálculo (cache_hit=True quando veio do cache)
+        """
+        cache = obter_result_cache()
+        store = obter_result_store()
+        chave = self._chave_cache(inputs) if cache.ativo or store is not None else None
+        
+        if chave:
+            inicio = time.time()
+            # 1º nível: memória do processo / 2º nível: SQLite compartilhado entre workers
+            resultado = cache.obter(chave)
+            if resultado is None and store is not None:
+                resultado = store.obter(chave)
+                if resultado is not None:
+                    cache.guardar(chave, resultado)
+            if resultado is not None:
+                # Mesmos cenários, mas com run_id próprio (recuperável em /api/resultados/{run_id}),
+                # horário desta resposta e contexto SELIC atual - o guardado pode ter até dias
+                origem = resultado.run_id
+                excel_output_path = resultado.excel_output_path
+                if excel_output_path and not Path(excel_output_path).exists():
+                    excel_output_path = None
+                resultado = resultado.model_copy(update={
+                    "run_id": run_id or str(uuid.uuid4()),
+                    "timestamp": datetime.now(),
+                    "selic_context": self._contexto_selic(inputs),
+                    "execution_time_ms": int((time.time() - inicio) * 1000),
+                    "excel_output_path": excel_output_path,
+                    "cache_hit": True,
+                }, deep=True)
+                logger.info(f"[{resultado.run_id}] ⚡ Resultado do cache ({inputs.municipio}, origem {origem})")
+                if store is not None:
+                    store.apelidar(resultado.run_id, origem)
+                Acompanhamento(resultado.run_id).concluir({"cache_hit": True, "resultado_run_id": origem})
+                return resultado
+        
+        def executar() -> CalculadoraOutput:
+            calculado = self._executar(inputs, progresso, run_id)
+            if chave:
+                cache.guardar(chave, calculado)
+                if store is not None:
+                    store.guardar(chave, calculado)
+            return calculado
+        
+        # Requisições idênticas simultâneas: só a primeira executa, as demais aguardam o resultado dela
+        # Enquanto aguarda, o callback de progresso segue sendo chamado - um job cancelado
+        # (CalculoCancelado) desiste da espera sem depender do fim da execução líder
+        verificar = (lambda: progresso("aguardando_calculo_identico", 10)) if progresso else None
+        chave_voo = chave or chave_resultado(inputs, "", "", "excel")
+        try:
+            resultado, compartilhado = obter_single_flight().executar(chave_voo, executar, verificar)
+        except Exception as e:
+            if run_id:
+                Acompanhamento(run_id).falhar(e)  # ignorado se a própria execução já publicou o erro
+            raise
+        
+        if compartilhado:
+            # Mesmo resultado, mas com run_id próprio (recuperável em /api/resultados/{run_id})
+            origem = resultado.run_id
+            resultado = resultado.model_copy(update={"run_id": run_id or str(uuid.uuid4())}, deep=True)
+            logger.info(f"[{resultado.run_id}] 🔗 Resultado compartilhado de cálculo idêntico em andamento")
+            if chave and store is not None:
+                store.apelidar(resultado.run_id, origem)
+            Acompanhamento(resultado.run_id).concluir({"compartilhado": True})
+        return resultado
+    
+    def _chave_cache(self, inputs: CalculadoraInput, campos=None) -> Optional[str]:
+        """
+        Chave do cache de resultados: entradas + hash do template + impressão dos caches de taxas
+        
+        Args:
+            campos: Entradas consideradas (padrão: todas; CAMPOS_BRUTOS para os valores brutos)
+        
+        Returns:
+            None se não for possível identificar as fontes (cálculo sem cache)
+        """
+        try:
+            motor = f"excel:{ExcelTemplateCalculator.resolver_backend()}"
+            fonte = hash_conteudo(carregar_template_bytes(self.excel_path))
+            taxas = impressao_arquivos(TAXAS_CACHE_DIR.glob("*.json"))
+            return chave_resultado(inputs, fonte, taxas, motor, campos)
+        except Exception as e:
+            logger.warning(f"⚠️ Cache de resultados ignorado: {e}")
+            return None
+    
+    def _executar(
+        self,
+        inputs: CalculadoraInput,
+        progresso: Optional[Callable[[str, int], None]] = None,
+        run_id: Optional[str] = None
+    ) -> CalculadoraOutput:
+        """
+        Executa o fluxo completo de cálculo (template recalculado)
+        
+        Cada etapa é publicada em /api/runs/{run_id}/events (início/fim com tempo
+        decorrido) e repassada ao callback de progresso dos jobs
+        
+        Args:
+            inputs: Dados de entrada validados
+            progresso: Callback (etapa, percentual)
+            run_id: ID da execução (gerado se ausente)
             
         Returns:
             Resultado do cálculo com todos os cenários
         """
-        run_id = str(uuid.uuid4())
+        run_id = run_id or str(uuid.uuid4())
         start_time = time.time()
+        acompanhamento = Acompanhamento(run_id, progresso)
         
-        logger.info(f"[{run_id}] Iniciando execução COM")
+        logger.info(f"[{run_id}] Iniciando execução")
         logger.info(f"[{run_id}] Inputs validados: {inputs.model_dump()}")
+        acompanhamento.etapa("iniciando", 5)
         
         try:
-            # Usar template protegido (cria cópia temporária)
-            with ExcelTemplateCalculator(self.excel_path) as excel_calc:
-                
-                # 1. Obter versão da planilha
-                workbook_version = "TIMON 01-2025"
-                
-                # 2. ESCREVER inputs no Excel PRIMEIRO (para recalcular com dados corretos)
-                logger.info(f"[{run_id}] Escrevendo inputs no Excel para recálculo")
-                
-                # Preparar input_dict
-                input_dict = inputs.model_dump()
-                
-                # Campos que são percentuais (Excel espera frações: 0.20 = 20%)
-                percentage_fields = ['honorarios_perc', 'desagio_principal', 'desagio_honorarios']
-                
-                for field_name, (worksheet, address) in INPUT_MAPPING.items():
-                    value = input_dict[field_name]
-                    
-                    # Formatar datas (retorna datetime object)
-                    if hasattr(value, 'strftime'):
-                        value = self._format_date_for_excel(value)
-                    
-                    # Converter percentuais (20 -> 0.20)
-                    elif field_name in percentage_fields:
-                        value = self._format_percentage_for_excel(value)
-                    
-                    # Escrever na célula
-                    excel_calc.write_cell(worksheet, address, value)
-                    logger.debug(f"[{run_id}] {field_name} = {value} -> {worksheet}!{address}")
-                
-                # 3. Salvar Excel com inputs escritos
-                logger.info(f"[{run_id}] Salvando Excel antes do recálculo...")
-                excel_calc.save_workbook()
-                
-                # 4. *** RECALCULAR Excel usando win32com ***
-                logger.info(f"[{run_id}] Recalculando fórmulas do Excel...")
-                recalc_success = excel_calc.recalculate_workbook()
-                
-                if not recalc_success:
-                    logger.warning(f"[{run_id}] ⚠️ Excel não foi recalculado (win32com indisponível)")
-                    logger.warning(f"[{run_id}] ⚠️ Resultados podem estar incorretos se município != TIMON")
-                
-                # 5. LER TODOS OS VALORES CALCULADOS DIRETAMENTE DO EXCEL
-                logger.info(f"[{run_id}] Lendo valores calculados após recálculo (100% da planilha)")
-                logger.info(f"[{run_id}] SITE VAI ESPELHAR A PLANILHA - SEM CÁLCULOS EM PYTHON!")
-                
-                results = {}
-                for cenario_name, line_number in OUTPUT_LINES.items():
-                    # Ler linha de DADOS (linha do cenário - ex: 23)
-                    # Lê colunas D, E, F da linha do cenário
-                    range_data = f"D{line_number}:F{line_number}"
-                    values_data = excel_calc.read_range_calculated("RESUMO", range_data)
-                    
-                    # Ler linha de TOTAL (linha + 1 - ex: 24)
-                    # Esta linha TEM o principal com deságio aplicado
-                    range_total = f"D{line_number + 1}:F{line_number + 1}"
-                    values_total = excel_calc.read_range_calculated("RESUMO", range_total)
-                    
-                    if values_data and values_total and len(values_data) > 0 and len(values_total) > 0:
-                        # LINHA DE DADOS (ex: 23)
-                        # D = Valor Atualizado (principal bruto SEM deságio)
-                        # E = Honorários calculados
-                        # F = Honorários fixo
-                        valor_atualizado_bruto = float(values_data[0][0]) if values_data[0][0] is not None else 0.0
-                        honorarios_linha = float(values_data[0][1]) if values_data[0][1] is not None else 0.0
-                        honorarios_fixo_linha = float(values_data[0][2]) if values_data[0][2] is not None else 0.0
-                        
-                        # LINHA DE TOTAL (ex: 24) - TEM DESÁGIO APLICADO
-                        # D = Principal LÍQUIDO (com deságio aplicado)
-                        # E = Honorários % líquido
-                        # F = Honorários fixo líquido
-                        principal_liquido = float(values_total[0][0]) if values_total[0][0] is not None else 0.0
-                        honorarios_perc = float(values_total[0][1]) if values_total[0][1] is not None else 0.0
-                        honorarios_fixo = float(values_total[0][2]) if values_total[0][2] is not None else 0.0
-                        
-                        # TOTAL = Principal Líquido + Honorários % + Honorários Fixo
-                        honorarios_total = honorarios_perc + honorarios_fixo
-                        total = principal_liquido + honorarios_total
-                        
-                        results[cenario_name] = CenarioOutput(
-                            principal=principal_liquido,
-                            honorarios=honorarios_total,
-                            total=total
-                        )
-                        
-                        logger.debug(
-                            f"[{run_id}] {cenario_name} (linha {line_number}): "
-                            f"P_bruto={valor_atualizado_bruto:,.2f}, "
-                            f"P_líquido={principal_liquido:,.2f}, "
-                            f"H={honorarios_total:,.2f}, "
-                            f"T={total:,.2f}"
-                        )
-                    else:
-                        logger.warning(f"[{run_id}] Dados inválidos para {cenario_name} na linha {line_number}")
-                        results[cenario_name] = CenarioOutput(
-                            principal=0.0,
-                            honorarios=0.0,
-                            total=0.0
-                        )
-                
-                # 6. Salvar Excel final (já tem inputs e valores recalculados)
-                logger.info(f"[{run_id}] Salvando Excel final para exportação...")
-                excel_calc.save_workbook()
-                
-                # 5. Copiar para data/output/
-                output_dir = Path("data/output")
-                output_dir.mkdir(parents=True, exist_ok=True)
-                
-                municipio_safe = inputs.municipio.replace(" ", "_").replace("-", "_")
-                output_filename = f"{municipio_safe}_{run_id[:8]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                output_path = output_dir / output_filename
-                
-                import shutil
-                shutil.copy2(excel_calc.temp_path, output_path)
-                logger.info(f"[{run_id}] 📁 Excel processado salvo em: {output_path}")
-                excel_output_path_str = str(output_path.absolute())
+            output_dir = Path("data/output")
+            output_dir.mkdir(parents=True, exist_ok=True)
+            municipio_safe = inputs.municipio.replace(" ", "_").replace("-", "_")
+            
+            excel_output_path_str = None
+            
+            # Valores brutos dependem só de município e datas (CAMPOS_BRUTOS):
+            # mudar honorários/deságio não refaz o ciclo do Excel
+            cache_brutos = obter_cache_brutos()
+            chave_brutos = self._chave_cache(inputs, CAMPOS_BRUTOS) if cache_brutos.ativo else None
+            base = cache_brutos.obter_valores(chave_brutos) if chave_brutos else None
+            
+            if base is not None:
+                logger.info(f"[{run_id}] ⚡ Valores brutos do cache - aplicando só honorários/deságio")
+                workbook_version = base["workbook_version"]
+                brutos = base["brutos"]
+            else:
+                # Levanta RecalculoError se o template não foi recalculado - nada vai para o cache
+                workbook_version, brutos, excel_output_path_str = self._calcular_excel(
+                    inputs, run_id, output_dir, municipio_safe, acompanhamento
+                )
                 
-                # Workbook será fechado automaticamente pelo context manager
-                logger.info(f"[{run_id}] Fechando workbook")
+                if chave_brutos:
+                    cache_brutos.guardar_valores(chave_brutos, {
+                        "workbook_version": workbook_version,
+                        "brutos": brutos,
+                    })
+            
+            # Contexto SELIC montado a cada resposta: status da API BACEN e lacunas
+            # agendadas mudam com o tempo e não fazem parte dos valores brutos
+            selic_info = self._contexto_selic(inputs, acompanhamento)
             
-            # 5. Salvar CSV backup automático (para ter dados calculados legíveis)
+            # Honorários (B11/B12) e deságio (B13/B14) aplicados em Python - mesmas fórmulas das linhas pares
+            results = montar_saidas(brutos, inputs)
+            acompanhamento.parciais(results)
+            
+            # Salvar CSV backup automático (para ter dados calculados legíveis)
+            acompanhamento.etapa("backup_csv", 96)
             csv_filename = f"{municipio_safe}_{run_id[:8]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
             csv_path = output_dir / csv_filename
             self._salvar_csv_backup(inputs, results, run_id, csv_path)
             
-            # 6. Validar completude das taxas
-            taxas_status = self._validar_taxas(
-                inputs.periodo_inicio,
-                inputs.periodo_fim,
-                inputs.correcao_ate
-            )
-            
-            # 7. Buscar informações SELIC (opcional - não bloqueia execução)
-            selic_info = self._obter_info_selic(inputs.periodo_inicio, inputs.correcao_ate)
-            selic_info["taxas_validacao"] = taxas_status
-            
-            # 8. Preparar resposta
+            # Preparar resposta
             execution_time = int((time.time() - start_time) * 1000)
             logger.info(f"[{run_id}] Execução concluída em {execution_time}ms")
+            acompanhamento.concluir({"execution_time_ms": execution_time})
             
             return CalculadoraOutput(
                 run_id=run_id,
@@ -291,15 +385,166 @@ class CalculadoraService:
                 excel_output_path=excel_output_path_str
             )
             
+        except ExecucaoCancelada as e:
+            logger.info(f"[{run_id}] 🛑 Execução cancelada")
+            acompanhamento.falhar(e)
+            raise
+            
         except Exception as e:
             logger.error(f"[{run_id}] Erro durante execução: {str(e)}", exc_info=True)
+            acompanhamento.falhar(e)
             # Context manager já fecha o workbook
             raise
     
+    def _calcular_excel(
+        self,
+        inputs: CalculadoraInput,
+        run_id: str,
+        output_dir: Path,
+        municipio_safe: str,
+        acompanhamento: Optional[Acompanhamento] = None
+    ):
+        """
+        Escreve os inputs no template, recalcula e lê o valor bruto dos 9 cenários
+        Os cenários são publicados (acompanhamento.parciais) logo após a leitura
+        
+        Returns:
+            (workbook_version, valores brutos por cenário, caminho do Excel exportado)
+        
+        Raises:
+            RecalculoError: fórmulas não recalculadas (backend com erro, indisponível ou "none") -
+                nada é lido nem guardado em cache
+            PoolOcupadoError: nenhum worker de recálculo livre
+        """
+        acompanhamento = acompanhamento or Acompanhamento(run_id)
+        
+        # Usar template protegido (clone em memória do template)
+        acompanhamento.etapa("copiando_template", 10)
+        with ExcelTemplateCalculator(
+            self.excel_path,
+            run_id=run_id,
+            celulas_saida=[OUTPUT_RANGE],
+            celulas_entrada=list(INPUT_MAPPING.values())
+        ) as excel_calc:
+            
+            # 1. Obter versão da planilha
+            workbook_version = "TIMON 01-2025"
+            
+            # 2. ESCREVER inputs no Excel PRIMEIRO (para recalcular com dados corretos)
+            logger.info(f"[{run_id}] Escrevendo inputs no Excel para recálculo")
+            acompanhamento.etapa("escrevendo_entradas", 15)
+            
+            # Preparar input_dict
+            input_dict = inputs.model_dump()
+            
+            # Campos que são percentuais (Excel espera frações: 0.20 = 20%)
+            percentage_fields = ['honorarios_perc', 'desagio_principal', 'desagio_honorarios']
+            
+            for field_name, (worksheet, address) in INPUT_MAPPING.items():
+                value = input_dict[field_name]
+                
+                # Formatar datas (retorna datetime object)
+                if hasattr(value, 'strftime'):
+                    value = self._format_date_for_excel(value)
+                
+                # Converter percentuais (20 -> 0.20)
+                elif field_name in percentage_fields:
+                    value = self._format_percentage_for_excel(value)
+                
+                # Escrever na célula
+                excel_calc.write_cell(worksheet, address, value)
+                logger.debug(f"[{run_id}] {field_name} = {value} -> {worksheet}!{address}")
+            
+            # 3. Salvar Excel com inputs escritos
+            logger.info(f"[{run_id}] Salvando Excel antes do recálculo...")
+            acompanhamento.etapa("salvando_entradas", 25)
+            excel_calc.save_workbook()
+            
+            # 4. *** RECALCULAR fórmulas (Excel COM ou motor Python) ***
+            logger.info(f"[{run_id}] Recalculando fórmulas do Excel...")
+            acompanhamento.etapa("recalculando", 30)
+            recalc_success = excel_calc.recalculate_workbook()
+            
+            if not recalc_success:
+                logger.error(f"[{run_id}] ❌ Fórmulas não foram recalculadas (backend: {excel_calc.backend})")
+                raise RecalculoError(
+                    f"Fórmulas do template não recalculadas (backend: {excel_calc.backend})"
+                )
+            
+            # 5. LER OS VALORES BRUTOS (linhas ímpares, coluna D) DIRETAMENTE DO EXCEL
+            # Honorários e deságio (linhas pares) são aplicados em Python sobre eles -
+            # mesma conta das fórmulas do RESUMO (test_valores_brutos.py confere a paridade)
+            logger.info(f"[{run_id}] Lendo valores brutos calculados após recálculo")
+            acompanhamento.etapa("lendo_resultados", 70)
+            
+            # Leitura em lote: uma única abertura do arquivo para os 9 ranges
+            ranges_saida = [("RESUMO", f"D{line_number}:D{line_number}") for line_number in OUTPUT_LINES.values()]
+            valores_lidos = excel_calc.read_ranges_calculated(ranges_saida)
+            
+            brutos = {}
+            for values_data, (cenario_name, line_number) in zip(valores_lidos, OUTPUT_LINES.items()):
+                if values_data and values_data[0] and values_data[0][0] is not None:
+                    # D = Valor Atualizado (principal bruto SEM deságio)
+                    brutos[cenario_name] = float(values_data[0][0])
+                    logger.debug(f"[{run_id}] {cenario_name} (linha {line_number}): P_bruto={brutos[cenario_name]:,.2f}")
+                else:
+                    logger.warning(f"[{run_id}] Dados inválidos para {cenario_name} na linha {line_number}")
+                    brutos[cenario_name] = 0.0
+            
+            # Cenários disponíveis para a interface antes de salvar/copiar o Excel
+            acompanhamento.parciais(montar_saidas(brutos, inputs))
+            
+            # 6. Salvar Excel final (já tem inputs e valores recalculados)
+            logger.info(f"[{run_id}] Salvando Excel final para exportação...")
+            acompanhamento.etapa("salvando_excel", 80)
+            excel_calc.save_workbook()
+            
+            # 5. Copiar para data/output/
+            output_filename = f"{municipio_safe}_{run_id[:8]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            output_path = output_dir / output_filename
+            
+            acompanhamento.etapa("copiando_saida", 85)
+            excel_calc.export(output_path)
+            logger.info(f"[{run_id}] 📁 Excel processado salvo em: {output_path}")
+            excel_output_path_str = str(output_path.absolute())
+            
+            # Workbook será fechado automaticamente pelo context manager
+            logger.info(f"[{run_id}] Fechando workbook")
+        
+        return workbook_version, brutos, excel_output_path_str
+    
+    def _contexto_selic(
+        self,
+        inputs: CalculadoraInput,
+        acompanhamento: Optional[Acompanhamento] = None
+    ) -> Dict[str, Any]:
+        """
+        selic_context da resposta: validação das taxas do período + status da SELIC
+        Montado a cada resposta, inclusive quando o resultado vem do cache
+        """
+        if acompanhamento:
+            acompanhamento.etapa("validando_taxas", 90)
+        taxas_status = self._validar_taxas(
+            inputs.periodo_inicio,
+            inputs.periodo_fim,
+            inputs.correcao_ate
+        )
+        
+        # Buscar informações SELIC (opcional - não bloqueia execução)
+        if acompanhamento:
+            acompanhamento.etapa("info_selic", 93)
+        selic_info = self._obter_info_selic(inputs.periodo_inicio, inputs.correcao_ate)
+        selic_info["taxas_validacao"] = taxas_status
+        return selic_info
+    
     def _obter_info_selic(self, data_inicio, data_fim) -> Dict[str, Any]:
         """
         Obtém informações sobre disponibilidade e status da SELIC
         
+        Sem chamadas de rede: a cobertura vem do histórico local (series_store)
+        e a saúde do BACEN do monitor em segundo plano. Lacunas no histórico são
+        agendadas para o monitor buscar, fora da requisição
+        
         Args:
             data_inicio: Data inicial do período
             data_fim: Data final do período
@@ -308,37 +553,50 @@ class CalculadoraService:
             Dict com informações sobre SELIC
         """
         try:
-            # Verificar disponibilidade da API
-            api_disponivel = self.bacen_service.verificar_disponibilidade()
-            
-            if api_disponivel:
-                # Tentar buscar dados do período
-                taxas = self.bacen_service.buscar_selic_periodo(
-                    data_inicio, 
-                    data_fim,
-                    usar_cache=True
+            series = self.bacen_service.series
+            datas, _ = series.vetores("SELIC", data_inicio, data_fim)
+            lacunas = series.lacunas("SELIC", data_inicio, data_fim)
+            periodo = f"{data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}"
+            
+            monitor = obter_monitor_bacen()
+            if lacunas:
+                # partial (não lambda): no pool de processos a tarefa vai por fila ao processo da API
+                monitor.agendar(
+                    f"SELIC:{data_inicio.isoformat()}:{data_fim.isoformat()}",
+                    partial(obter_selic_atualizada, data_inicio, data_fim)
                 )
-                
-                if taxas and len(taxas) > 0:
-                    return {
-                        "updated": True,
-                        "source": "API BACEN",
-                        "registros": len(taxas),
-                        "periodo": f"{data_inicio.strftime('%d/%m/%Y')} a {data_fim.strftime('%d/%m/%Y')}",
-                        "message": f"✅ {len(taxas)} taxas SELIC obtidas da API BACEN"
-                    }
-                else:
-                    return {
-                        "updated": False,
-                        "source": "Cache local",
-                        "message": "⚠️ API BACEN disponível mas sem dados para o período. Usando cache."
-                    }
-            else:
+            api = monitor.status()
+            
+            # Dias ainda não publicados pelo BACEN não contam como falta
+            recente = date.today() - TOLERANCIA_PUBLICACAO_SELIC
+            faltando = [(inicio, fim) for inicio, fim in lacunas if inicio < recente]
+            
+            info = {
+                "registros": len(datas),
+                "periodo": periodo,
+                "cobertura": [[inicio.isoformat(), fim.isoformat()] for inicio, fim in series.cobertura("SELIC")],
+                "api_bacen": api,
+            }
+            if len(datas) > 0 and not faltando:
+                return {
+                    "updated": True,
+                    "source": "API BACEN",
+                    **info,
+                    "message": f"✅ {len(datas)} taxas SELIC da API BACEN no histórico local"
+                }
+            if api["disponivel"] is False:
                 return {
                     "updated": False,
                     "source": "Offline",
+                    **info,
                     "message": "⚠️ API BACEN indisponível. Usando taxas do Excel."
                 }
+            return {
+                "updated": False,
+                "source": "Cache local",
+                **info,
+                "message": "⚠️ Histórico SELIC incompleto para o período - atualização agendada em segundo plano. Usando cache."
+            }
                 
         except Exception as e:
             logger.warning(f"Erro ao obter info SELIC: {e}")
@@ -0,0 +1,167 @@
+"""
+Cálculo em lote (/api/calcular/lote)
+Valida todos os casos antes de começar e distribui os cálculos pelo pool;
+cada resultado sai como uma linha NDJSON assim que fica pronto, seguido de
+uma linha de resumo
+
+Entrada: lista JSON de CalculadoraInput ou CSV com cabeçalho nos nomes dos campos
+(separador , ou ; - datas AAAA-MM-DD ou DD/MM/AAAA, decimais com ponto ou vírgula)
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from calc_executor import CalcExecutor, FilaCheiaError
+from models import CalculadoraInput
+from recalc_backends import PoolOcupadoError
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_DATA = ("periodo_inicio", "periodo_fim", "ajuizamento", "citacao", "correcao_ate")
+CAMPOS_NUMERO = ("honorarios_perc", "honorarios_fixo", "desagio_principal", "desagio_honorarios")
+
+
+class LoteInvalidoError(ValueError):
+    """Um ou mais casos do lote não passaram na validação (nenhum foi calculado)"""
+
+    def __init__(self, mensagem: str, erros: Optional[List[Dict[str, Any]]] = None):
+        self.erros = erros or []
+        super().__init__(mensagem)
+
+
+def ler_csv(texto: str) -> List[Dict[str, Any]]:
+    """
+    Converte o CSV em dicionários com os nomes de campo de CalculadoraInput
+
+    Células vazias ficam de fora (valem os padrões do modelo)
+    """
+    texto = texto.lstrip("﻿")
+    if not texto.strip():
+        return []
+    try:
+        dialeto = csv.Sniffer().sniff(texto.split("\n", 1)[0], delimiters=",;\t")
+    except csv.Error:
+        dialeto = csv.excel
+
+    itens = []
+    for linha in csv.DictReader(io.StringIO(texto), dialect=dialeto):
+        item = {}
+        for campo, valor in linha.items():
+            if campo is None or valor is None:
+                continue
+            campo = campo.strip().lower()
+            valor = valor.strip()
+            if not valor:
+                continue
+            if campo in CAMPOS_DATA and "/" in valor:
+                try:
+                    valor = datetime.strptime(valor, "%d/%m/%Y").date().isoformat()
+                except ValueError:
+                    pass  # o modelo acusa o formato inválido
+            elif campo in CAMPOS_NUMERO and "," in valor:
+                valor = valor.replace(".", "").replace(",", ".")
+            item[campo] = valor
+        if item:
+            itens.append(item)
+    return itens
+
+
+def validar_lote(itens: Any, max_itens: int) -> List[CalculadoraInput]:
+    """
+    Valida todos os casos antes de calcular qualquer um
+
+    Raises:
+        LoteInvalidoError: lote vazio, grande demais ou com casos inválidos
+            (erros = [{"indice": i, "erro": "..."}] com todos os problemas encontrados)
+    """
+    if not isinstance(itens, list) or not itens:
+        raise LoteInvalidoError("Lote vazio: envie uma lista de casos ou um CSV com cabeçalho")
+    if max_itens and len(itens) > max_itens:
+        raise LoteInvalidoError(f"Lote com {len(itens)} casos excede o limite de {max_itens}")
+
+    validos, erros = [], []
+    for indice, item in enumerate(itens):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("caso deve ser um objeto com os campos do cálculo")
+            validos.append(CalculadoraInput(**item))
+        except ValidationError as e:
+            mensagens = [f"{'.'.join(str(p) for p in erro['loc'])}: {erro['msg']}" for erro in e.errors()]
+            erros.append({"indice": indice, "erro": "; ".join(mensagens)})
+        except ValueError as e:
+            erros.append({"indice": indice, "erro": str(e)})
+
+    if erros:
+        raise LoteInvalidoError(f"{len(erros)} de {len(itens)} casos inválidos", erros)
+    return validos
+
+
+def _linha(dados: Dict[str, Any]) -> str:
+    return json.dumps(dados, ensure_ascii=False, default=str) + "\n"
+
+
+async def executar_lote(
+    casos: List[CalculadoraInput],
+    executor: CalcExecutor,
+    concorrencia: int = 0
+) -> AsyncIterator[str]:
+    """
+    Calcula os casos no pool e gera linhas NDJSON na ordem em que terminam
+
+    Linhas: {"tipo": "resultado", "indice": i, "resultado": {...}}
+            {"tipo": "erro", "indice": i, "erro": "..."}
+            {"tipo": "resumo", "total": n, "concluidos": n, "erros": n, "cache_hits": n, "tempo_ms": n}
+
+    Args:
+        concorrencia: Casos do lote no pool ao mesmo tempo (0 = número de workers);
+            o restante da fila fica livre para as requisições interativas
+    """
+    inicio = time.time()
+    limite = asyncio.Semaphore(concorrencia or executor.workers)
+
+    async def calcular(indice: int, caso: CalculadoraInput) -> Dict[str, Any]:
+        async with limite:
+            while True:
+                try:
+                    resultado = await executor.calcular(caso)
+                    return {"tipo": "resultado", "indice": indice, "resultado": resultado.model_dump(mode="json")}
+                except (FilaCheiaError, PoolOcupadoError) as e:
+                    # Pool ocupado por outras requisições: espera abrir vaga
+                    await asyncio.sleep(min(e.retry_after, 2))
+                except Exception as e:
+                    logger.warning(f"⚠️ Lote: caso {indice} ({caso.municipio}) falhou: {e}")
+                    return {"tipo": "erro", "indice": indice, "erro": str(e)}
+
+    tarefas = [asyncio.ensure_future(calcular(i, caso)) for i, caso in enumerate(casos)]
+    concluidos = erros = cache_hits = 0
+    try:
+        for proxima in asyncio.as_completed(tarefas):
+            linha = await proxima
+            if linha["tipo"] == "resultado":
+                concluidos += 1
+                cache_hits += int(linha["resultado"].get("cache_hit", False))
+            else:
+                erros += 1
+            yield _linha(linha)
+    finally:
+        # Cliente desconectou: casos ainda não enviados ao pool são descartados
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+    tempo_ms = int((time.time() - inicio) * 1000)
+    logger.info(f"📦 Lote concluído: {concluidos}/{len(casos)} em {tempo_ms}ms ({erros} erros, {cache_hits} do cache)")
+    yield _linha({
+        "tipo": "resumo",
+        "total": len(casos),
+        "concluidos": concluidos,
+        "erros": erros,
+        "cache_hits": cache_hits,
+        "tempo_ms": tempo_ms,
+    })
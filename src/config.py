@@ -13,8 +13,57 @@ EXCEL_FILE_PATH = os.getenv("EXCEL_FILE_PATH", "data/timon_01-2025.xlsx")
 # Diretório base do projeto (raiz, não src/)
 BASE_DIR = Path(__file__).parent.parent  # Sobe um nível para chegar na raiz
 
-# Caminho completo do Excel
-EXCEL_FULL_PATH = BASE_DIR / EXCEL_FILE_PATH
+# Template completo (fonte para a poda - src/template_pruner.py)
+EXCEL_SOURCE_PATH = BASE_DIR / EXCEL_FILE_PATH
+
+# Template podado de execução (opcional - vazio = usar o template completo)
+EXCEL_RUNTIME_FILE_PATH = os.getenv("EXCEL_RUNTIME_FILE_PATH", "")
+
+# Caminho completo do Excel usado nos cálculos
+EXCEL_FULL_PATH = BASE_DIR / EXCEL_RUNTIME_FILE_PATH if EXCEL_RUNTIME_FILE_PATH else EXCEL_SOURCE_PATH
+
+# Workspaces por execução (vazio = /dev/shm quando disponível, senão temp do sistema)
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "")
+WORKSPACE_MAX_AGE = int(os.getenv("WORKSPACE_MAX_AGE", 3600))  # segundos
+
+# Backend de recálculo das fórmulas do template
+# auto = Excel via COM quando disponível, senão motor Python (LibreOffice se o motor recusar o template)
+# excel | libreoffice | formula | none
+RECALC_BACKEND = os.getenv("RECALC_BACKEND", "auto").lower()
+
+# Pool de workers de recálculo (excel/libreoffice) - instâncias reaproveitadas
+# 0 = um worker por cálculo simultâneo do pool de cálculos (CALC_WORKERS; 1 por processo no modo process)
+RECALC_POOL_SIZE = int(os.getenv("RECALC_POOL_SIZE", 0))
+RECALC_MAX_JOBS = int(os.getenv("RECALC_MAX_JOBS", 200))  # recicla worker após N recálculos
+RECALC_TIMEOUT = int(os.getenv("RECALC_TIMEOUT", 60))  # segundos
+LIBREOFFICE_PATH = os.getenv("LIBREOFFICE_PATH", "soffice")
+
+# Caches locais de taxas (SELIC, TR, IPCA, IPCA-E)
+TAXAS_CACHE_DIR = BASE_DIR / "data" / "cache"
+
+# Cache de resultados de /api/calcular (LRU em memória)
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", 64))  # 0 = desligado
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 0))  # segundos (0 = sem expiração)
+
+# Store persistente de resultados (SQLite WAL, compartilhado entre workers e reinícios)
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", "data/resultados.db")  # vazio = desligado
+RESULT_STORE_MAX_AGE_DAYS = float(os.getenv("RESULT_STORE_MAX_AGE_DAYS", 30))  # sem acesso há mais tempo = removido
+RESULT_STORE_MAX_ROWS = int(os.getenv("RESULT_STORE_MAX_ROWS", 50000))
+RESULT_STORE_COMPACT_INTERVAL = int(os.getenv("RESULT_STORE_COMPACT_INTERVAL", 3600))  # segundos
+
+# Pool de cálculos fora do event loop
+# auto = thread | thread | process (motor de fórmulas em paralelo real, mas coalescência e cache em memória por processo)
+CALC_EXECUTOR = os.getenv("CALC_EXECUTOR", "auto").lower()
+CALC_WORKERS = int(os.getenv("CALC_WORKERS", 0))  # 0 = derivar de CPU e memória
+CALC_WORKER_MEM_MB = int(os.getenv("CALC_WORKER_MEM_MB", 512))  # memória estimada por worker
+CALC_QUEUE_SIZE = int(os.getenv("CALC_QUEUE_SIZE", 32))  # cálculos aguardando além dos em execução
+
+# Cálculo em lote (/api/calcular/lote)
+LOTE_MAX_ITENS = int(os.getenv("LOTE_MAX_ITENS", 1000))  # casos por requisição (0 = sem limite; nunca acima de RATE_LIMIT_BATCH_PER_HOUR)
+LOTE_CONCORRENCIA = int(os.getenv("LOTE_CONCORRENCIA", 0))  # casos no pool ao mesmo tempo (0 = CALC_WORKERS)
+
+# Jobs assíncronos (/api/jobs) - estado no store de resultados
+JOBS_RETENTION_HOURS = float(os.getenv("JOBS_RETENTION_HOURS", 24))  # jobs encerrados há mais tempo = removidos
 
 # API
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
@@ -24,8 +73,23 @@ API_PORT = int(os.getenv("API_PORT", 8000))
 BACEN_API_BASE = os.getenv("BACEN_API_BASE", "https://api.bcb.gov.br/dados/serie/bcdata.sgs")
 BACEN_SERIE_SELIC = os.getenv("BACEN_SERIE_SELIC", "432")
 
+# Saúde do BACEN verificada em segundo plano (circuit breaker) - cálculos não esperam pela API
+UPSTREAM_PROBE_INTERVAL = int(os.getenv("UPSTREAM_PROBE_INTERVAL", 300))  # segundos entre verificações (0 = sem verificação periódica)
+UPSTREAM_BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", 3))  # falhas seguidas para abrir o circuito
+UPSTREAM_BREAKER_OPEN_SECONDS = float(os.getenv("UPSTREAM_BREAKER_OPEN_SECONDS", 120))  # aberto antes de tentar de novo
+
+# Cliente HTTP compartilhado (BACEN/IBGE): keep-alive, retentativas com backoff e limite por host
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", 4))  # requisições simultâneas por host
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))  # tentativas por requisição (1 = sem retentativa)
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))  # segundos (dobra a cada tentativa, com jitter)
+
 # Timeouts
 EXECUTION_TIMEOUT = 60  # 60 segundos
 
-# Rate Limiting
-RATE_LIMIT_PER_MINUTE = 10
+# Rate Limiting (por IP, janela deslizante de 60s; 0 = sem limite)
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", 10))  # rotas de cálculo
+RATE_LIMIT_API_PER_MINUTE = int(os.getenv("RATE_LIMIT_API_PER_MINUTE", 120))  # demais rotas /api (health e estáticos isentos)
+RATE_LIMIT_BATCH_PER_HOUR = int(os.getenv("RATE_LIMIT_BATCH_PER_HOUR", 5000))  # casos de /api/calcular/lote (janela de 1h)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()  # memory | sqlite (compartilhado entre workers)
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "data/rate_limit.db")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 10000))  # IPs em memória (backend memory)
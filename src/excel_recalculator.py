@@ -1,5 +1,7 @@
 """
 Módulo para recalcular planilhas Excel/Calc usando win32com
+(instância por chamada - para uso contínuo prefira recalc_backends, que
+mantém um pool de instâncias abertas)
 Suporta: Microsoft Excel e LibreOffice Calc
 Força recálculo de todas as fórmulas após modificar valores
 """
@@ -102,6 +104,15 @@ class ExcelRecalculator:
             logger.debug(f"LibreOffice subprocess falhou: {e}")
             return False
     
+    @staticmethod
+    def _aguardar_calculo(excel, timeout: float = 60.0):
+        """Aguarda Excel informar fim do cálculo (CalculationState == xlDone)"""
+        limite = time.monotonic() + timeout
+        while excel.CalculationState != 0:
+            if time.monotonic() > limite:
+                raise TimeoutError("Excel não concluiu o cálculo")
+            time.sleep(0.01)
+    
     @staticmethod
     def recalculate_workbook(file_path: Path, visible: bool = False) -> bool:
         """
@@ -143,9 +154,6 @@ class ExcelRecalculator:
             # Forçar recálculo COMPLETO
             logger.debug(f"Forçando recálculo...")
             
-            # Aguardar Excel estar pronto
-            time.sleep(1.0)
-            
             try:
                 # Método 1: Recálculo completo (pode falhar se Excel estiver ocupado)
                 excel.CalculateFullRebuild()
@@ -158,8 +166,8 @@ class ExcelRecalculator:
             except:
                 logger.debug("Calculate falhou")
             
-            # Aguardar cálculo completar
-            time.sleep(1.0)  # Pausa maior para garantir
+            # Aguardar cálculo completar (estado informado pelo Excel)
+            ExcelRecalculator._aguardar_calculo(excel)
             
             # Salvar
             logger.debug(f"Salvando workbook...")
@@ -184,7 +192,6 @@ class ExcelRecalculator:
             if workbook:
                 try:
                     workbook.Close(SaveChanges=True)  # Salvar mudanças
-                    time.sleep(0.5)
                 except Exception as e:
                     logger.debug(f"Erro ao fechar workbook: {e}")
             
@@ -192,7 +199,6 @@ class ExcelRecalculator:
             if excel:
                 try:
                     excel.Quit()
-                    time.sleep(0.5)  # Aguardar Excel fechar completamente
                 except Exception as e:
                     logger.debug(f"Erro ao fechar Excel: {e}")
             
@@ -236,7 +242,7 @@ class ExcelRecalculator:
             # Forçar recálculo
             excel.CalculateFullRebuild()
             excel.Calculate()
-            time.sleep(0.5)
+            ExcelRecalculator._aguardar_calculo(excel)
             
             # Ler valores
             worksheet = workbook.Worksheets(worksheet_name)
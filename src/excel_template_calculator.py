@@ -1,140 +1,423 @@
 """
 Calculadora Excel com template protegido
 Usa arquivo template (com valores calculados) como base
-Cria cópias temporárias para cada cálculo
+Template é lido do disco uma única vez e mantido em memória;
+cada cálculo trabalha sobre um clone isolado desses bytes
+Entradas são gravadas direto no XML da aba (xlsx_patcher), sem openpyxl
+
+Recálculo (RECALC_BACKEND):
+- excel: Excel via COM (Windows) - pool de instâncias persistentes
+- libreoffice: LibreOffice headless via UNO - pool de processos persistentes
+- formula: motor de fórmulas em Python (formula_engine)
+- auto: excel quando win32com disponível, senão formula; se o motor de fórmulas
+  recusar o template (função não suportada, ex: OFFSET/INDIRECT no cone de
+  saída), passa a usar o pool do LibreOffice
 """
+import io
 import logging
-import shutil
-import tempfile
+import threading
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from openpyxl import load_workbook
-from excel_recalculator import ExcelRecalculator
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from openpyxl.worksheet.formula import ArrayFormula, DataTableFormula
+from recalc_backends import WIN32COM_AVAILABLE, PoolOcupadoError, RecalcBackend, obter_backend
+from formula_engine import Avaliacao, FormulaEngineError, obter_formula_engine
+from xlsx_patcher import XlsxPatcher, localizar_planilhas
+from xlsx_stream_reader import XlsxStreamReader
+from config import RECALC_BACKEND
+from workspace_manager import WorkspaceManager, obter_workspace_manager
 
 logger = logging.getLogger(__name__)
 
 
+# Cache de templates em memória: caminho -> (mtime_ns, tamanho, bytes)
+_template_cache: Dict[Path, Tuple[int, int, bytes]] = {}
+_template_lock = threading.Lock()
+
+
+def carregar_template_bytes(template_path: Path) -> bytes:
+    """
+    Retorna os bytes do template, lendo o arquivo apenas quando necessário
+    
+    O conteúdo fica em memória e só é relido se o arquivo mudar no disco
+    (mtime/tamanho diferentes), permitindo trocar o template sem reiniciar.
+    
+    Args:
+        template_path: Caminho do arquivo template (.xlsx)
+        
+    Returns:
+        Conteúdo do arquivo (bytes imutáveis, compartilhados entre cálculos)
+    """
+    template_path = Path(template_path).resolve()
+    stat = template_path.stat()
+    assinatura = (stat.st_mtime_ns, stat.st_size)
+    
+    cached = _template_cache.get(template_path)
+    if cached and cached[:2] == assinatura:
+        return cached[2]
+    
+    with _template_lock:
+        cached = _template_cache.get(template_path)
+        if cached and cached[:2] == assinatura:
+            return cached[2]
+        
+        logger.info(f"Carregando template em memória: {template_path}")
+        conteudo = template_path.read_bytes()
+        _template_cache[template_path] = (assinatura[0], assinatura[1], conteudo)
+        logger.info(f"Template em memória: {len(conteudo) / 1024:.0f} KB")
+        return conteudo
+
+
+def _sem_formula(valor: Any) -> Any:
+    """Célula lida com data_only=False: fórmula (texto "=..." ou ArrayFormula) vira None"""
+    if isinstance(valor, (ArrayFormula, DataTableFormula)):
+        return None
+    if isinstance(valor, str) and valor.startswith("="):
+        return None
+    return valor
+
+
+class RecalculoError(RuntimeError):
+    """Fórmulas do template não recalculadas - valores lidos não correspondem às entradas"""
+
+
 class ExcelTemplateCalculator:
     """
     Mantém arquivo template intacto (com valores pré-calculados)
-    Cria cópia temporária para cada cálculo
+    Cria clone em memória para cada cálculo
+    Arquivo temporário só é escrito quando o recálculo precisa de um caminho,
+    dentro de um workspace exclusivo da execução (run_id)
     """
     
-    def __init__(self, template_path: Path):
+    # Motor de fórmulas recusou o template com RECALC_BACKEND=auto (por processo)
+    _formula_recusada = False
+    
+    def __init__(
+        self,
+        template_path: Path,
+        run_id: Optional[str] = None,
+        workspaces: Optional[WorkspaceManager] = None,
+        backend: Optional[str] = None,
+        celulas_saida: Optional[Sequence[Tuple[str, str]]] = None,
+        celulas_entrada: Optional[Sequence[Tuple[str, str]]] = None
+    ):
+        """
+        Args:
+            template_path: Caminho do template .xlsx
+            run_id: Identificador da execução (nome do workspace)
+            workspaces: Gerenciador de workspaces (padrão: singleton do processo)
+            backend: Backend de recálculo (padrão: RECALC_BACKEND)
+            celulas_saida: Ranges lidos após o recálculo [(aba, "D23:F69")] -
+                obrigatório para o backend "formula"
+            celulas_entrada: Células escritas pelo cálculo [(aba, "B6")]
+        """
         self.template_path = template_path
+        self.run_id = run_id
+        self.workspaces = workspaces
+        self.workspace_path = None
         self.temp_path = None
-        self.workbook = None
+        # Conteúdo atual do workbook deste cálculo (template + alterações salvas)
+        self._conteudo: Optional[bytes] = None
+        self._template_conteudo: Optional[bytes] = None
         
-    def __enter__(self):
-        """Context manager - cria cópia temporária"""
-        # Criar arquivo temporário
-        temp_dir = Path(tempfile.gettempdir())
-        self.temp_path = temp_dir / f"calc_{self.template_path.name}"
+        self.backend = (backend or RECALC_BACKEND).lower()
+        self.celulas_saida = list(celulas_saida) if celulas_saida else None
+        self.celulas_entrada = list(celulas_entrada) if celulas_entrada else None
+        # Valores escritos neste cálculo: {(aba, endereço): valor}
+        self._escritas: Dict[Tuple[str, str], Any] = {}
+        # Escritas ainda não gravadas no XML: {aba: {endereço: valor}}
+        self._pendentes: Dict[str, Dict[str, Any]] = {}
+        self._planilhas: Optional[Dict[str, str]] = None
+        # Resultado do motor de fórmulas (backend "formula")
+        self._calculados: Optional[Avaliacao] = None
+        # Arquivo recalculado (Excel/LibreOffice) depois da última escrita
+        self._arquivo_recalculado = False
+    
+    @staticmethod
+    def preload(template_path: Path) -> bool:
+        """
+        Carrega o template em memória (chamado na inicialização do processo)
         
-        logger.info(f"Criando cópia temporária: {self.temp_path}")
-        shutil.copy2(self.template_path, self.temp_path)
+        Returns:
+            True se carregou, False se o arquivo não está disponível
+        """
+        try:
+            carregar_template_bytes(template_path)
+            return True
+        except OSError as e:
+            logger.warning(f"Template não pôde ser pré-carregado ({template_path}): {e}")
+            return False
+    
+    @classmethod
+    def resolver_backend(cls, backend: Optional[str] = None) -> str:
+        """Resolve "auto" para o backend efetivo (excel, libreoffice, formula ou none)"""
+        backend = (backend or RECALC_BACKEND).lower()
+        if backend == "auto":
+            if WIN32COM_AVAILABLE:
+                return "excel"
+            return "libreoffice" if cls._formula_recusada else "formula"
+        return backend
+    
+    @classmethod
+    def recusar_formulas(cls, motivo: Exception):
+        """Motor de fórmulas não suporta o template: "auto" passa a usar o pool do LibreOffice"""
+        if not cls._formula_recusada:
+            logger.warning(
+                f"⚠️ Motor de fórmulas não suporta o template ({motivo}) - "
+                f"RECALC_BACKEND=auto passa a recalcular via LibreOffice"
+            )
+        cls._formula_recusada = True
+    
+    @staticmethod
+    def preparar_formulas(
+        template_path: Path,
+        celulas_saida: Sequence[Tuple[str, str]],
+        celulas_entrada: Sequence[Tuple[str, str]] = ()
+    ) -> bool:
+        """
+        Monta o grafo de fórmulas do template antecipadamente (inicialização)
         
-        logger.info(f"Abrindo cópia temporária...")
-        self.workbook = load_workbook(self.temp_path, data_only=False)
+        Returns:
+            True se o motor ficou pronto, False caso contrário
+        """
+        try:
+            conteudo = carregar_template_bytes(template_path)
+            obter_formula_engine(
+                Path(template_path).resolve(), conteudo, celulas_saida, celulas_entrada
+            )
+            return True
+        except FormulaEngineError as e:
+            logger.warning(f"Motor de fórmulas não pôde ser preparado ({template_path}): {e}")
+            if RECALC_BACKEND == "auto":
+                ExcelTemplateCalculator.recusar_formulas(e)
+            return False
+        except OSError as e:
+            logger.warning(f"Motor de fórmulas não pôde ser preparado ({template_path}): {e}")
+            return False
+        
+    def __enter__(self):
+        """Context manager - cria clone em memória do template"""
+        self._conteudo = carregar_template_bytes(self.template_path)
+        self._template_conteudo = self._conteudo
+        logger.info(f"Clone em memória do template pronto ({len(self._conteudo) / 1024:.0f} KB)")
         
         return self
         
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager - fecha e deleta cópia"""
-        if self.workbook:
-            self.workbook.close()
+        """Context manager - descarta clone e deleta cópia temporária (se criada)"""
+        self._conteudo = None
+        self._pendentes = {}
+        self._template_conteudo = None
+        self._calculados = None
             
-        # Deletar arquivo temporário
-        if self.temp_path and self.temp_path.exists():
-            try:
-                self.temp_path.unlink()
-                logger.info(f"Cópia temporária deletada: {self.temp_path}")
-            except Exception as e:
-                logger.warning(f"Erro ao deletar temp: {e}")
+        # Deletar workspace (e arquivo temporário) desta execução
+        if self.workspace_path:
+            self.workspaces.remover(self.workspace_path)
+            logger.info(f"Workspace deletado: {self.workspace_path}")
+            self.workspace_path = None
+    
+    def _materializar_temp(self) -> Path:
+        """Grava o conteúdo atual em arquivo temporário (para backends que exigem caminho)"""
+        if self.temp_path is None:
+            if self.workspaces is None:
+                self.workspaces = obter_workspace_manager()
+            self.workspace_path = self.workspaces.criar(self.run_id)
+            self.temp_path = self.workspace_path / f"calc_{self.template_path.name}"
+        
+        logger.info(f"Criando cópia temporária: {self.temp_path}")
+        self.temp_path.write_bytes(self._conteudo)
+        return self.temp_path
+    
+    def export(self, destino: Path):
+        """Grava o workbook atual (com escritas pendentes aplicadas) em `destino`"""
+        self.save_workbook()
+        Path(destino).write_bytes(self._conteudo)
             
     def write_cell(self, worksheet_name: str, address: str, value: Any):
-        """Escreve valor em célula"""
+        """
+        Escreve valor em célula
+        A escrita fica pendente até save_workbook (gravada direto no XML da aba)
+        """
         try:
-            ws = self.workbook[worksheet_name]
-            ws[address] = value
+            if self._planilhas is None:
+                self._planilhas = localizar_planilhas(self._conteudo)
+            if worksheet_name not in self._planilhas:
+                raise KeyError(f"Worksheet {worksheet_name} does not exist.")
+            coordinate_to_tuple(address.replace("$", ""))  # valida endereço
+            
+            self._pendentes.setdefault(worksheet_name, {})[address] = value
+            self._escritas[(worksheet_name, address)] = value
+            # Valores avaliados anteriormente deixam de valer
+            self._calculados = None
+            self._arquivo_recalculado = False
             logger.debug(f"Escrito: {worksheet_name}!{address} = {value}")
         except Exception as e:
             logger.error(f"Erro ao escrever {address}: {e}")
             raise
             
     def save_workbook(self):
-        """Salva workbook temporário (necessário para recálculo)"""
+        """
+        Aplica as escritas pendentes ao conteúdo em memória
+        Só o XML das abas alteradas é reescrito; demais partes (e valores
+        em cache) são copiadas do template sem alteração
+        """
+        if not self._pendentes:
+            return
+        
         try:
-            self.workbook.save(self.temp_path)
-            logger.debug(f"Workbook salvo: {self.temp_path}")
+            self._conteudo = XlsxPatcher.aplicar(self._conteudo, self._pendentes)
+            self._pendentes = {}
+            logger.debug(f"Workbook salvo em memória ({len(self._conteudo) / 1024:.0f} KB)")
         except Exception as e:
             logger.error(f"Erro ao salvar workbook: {e}")
             raise
     
     def recalculate_workbook(self) -> bool:
         """
-        Força recálculo do Excel usando win32com
+        Força recálculo das fórmulas usando o backend configurado
         Deve ser chamado após escrever valores e antes de ler resultados
         
         Returns:
             True se recalculou com sucesso, False caso contrário
+        
+        Raises:
+            PoolOcupadoError: backend Excel/LibreOffice sem worker livre
+        """
+        backend = self.resolver_backend(self.backend)
+        
+        if backend == "formula":
+            if self._recalcular_formulas():
+                return True
+            # auto: template recusado pelo motor -> mesmo cálculo pelo pool
+            backend = self.resolver_backend(self.backend)
+            if backend == "formula":
+                return False
+        if backend == "none":
+            logger.warning("⚠️ Recálculo desabilitado (backend: none)")
+            return False
+        
+        backend_arquivo = obter_backend(backend)
+        if backend_arquivo is None:
+            logger.warning(f"⚠️ Backend de recálculo {backend} indisponível - pulando recálculo")
+            return False
+        return self._recalcular_arquivo(backend_arquivo)
+    
+    def _recalcular_formulas(self) -> bool:
+        """
+        Recalcula em processo com o motor de fórmulas Python
+        Os valores ficam em memória e são usados por read_range(s)_calculated
         """
-        if not ExcelRecalculator.is_available():
-            logger.warning("⚠️ win32com não disponível - pulando recálculo Excel")
+        if not self.celulas_saida:
+            logger.warning("⚠️ Backend formula requer celulas_saida - pulando recálculo")
             return False
         
         try:
-            # Fechar workbook openpyxl e aguardar
-            if self.workbook:
-                self.workbook.close()
-                self.workbook = None
+            import time
+            inicio = time.time()
             
-            # Aguardar para garantir que arquivo foi liberado
+            entradas = self.celulas_entrada or list(self._escritas)
+            engine = obter_formula_engine(
+                Path(self.template_path).resolve(),
+                self._template_conteudo,
+                self.celulas_saida,
+                entradas
+            )
+            self._calculados = engine.avaliar(self._escritas)
+            
+            logger.info(
+                f"✅ Fórmulas recalculadas em Python: {self._calculados.recalculadas} células "
+                f"({(time.time() - inicio) * 1000:.1f}ms)"
+            )
+            return True
+            
+        except FormulaEngineError as e:
+            logger.error(f"❌ Motor de fórmulas não suporta o template: {e}")
+            if self.backend == "auto":
+                self.recusar_formulas(e)
+            return False
+        except Exception as e:
+            logger.error(f"Erro ao recalcular fórmulas: {e}")
+            return False
+    
+    def _recalcular_arquivo(self, backend: RecalcBackend) -> bool:
+        """
+        Recalcula via backend baseado em arquivo (Excel/LibreOffice/stub)
+        
+        Raises:
+            PoolOcupadoError: nenhum worker livre (propagado para virar HTTP 503)
+        """
+        try:
             import time
-            time.sleep(1.0)
+            inicio = time.time()
+            self.save_workbook()
             
-            # Recalcular usando Excel COM
-            logger.info("🔄 Recalculando Excel via win32com...")
-            success = ExcelRecalculator.recalculate_workbook(self.temp_path, visible=False)
+            # Aplicações externas precisam de um arquivo em disco
+            self._materializar_temp()
+            
+            logger.info(f"🔄 Recalculando via {backend.nome}...")
+            success = backend.recalcular_arquivo(self.temp_path)
             
             if success:
-                logger.info("✅ Excel recalculado com sucesso")
+                logger.info(f"✅ Recalculado via {backend.nome} ({(time.time() - inicio) * 1000:.0f}ms)")
             else:
-                logger.error("❌ Falha ao recalcular Excel")
-            
-            # Aguardar antes de reabrir
-            time.sleep(1.0)
+                logger.error(f"❌ Falha ao recalcular via {backend.nome}")
             
-            # Reabrir workbook openpyxl
-            self.workbook = load_workbook(self.temp_path, data_only=False)
+            # Trazer resultado do recálculo de volta para memória
+            self._conteudo = self.temp_path.read_bytes()
+            self._arquivo_recalculado = success
             
             return success
             
+        except PoolOcupadoError:
+            raise
         except Exception as e:
             logger.error(f"Erro ao recalcular workbook: {e}")
-            # Tentar reabrir workbook mesmo em caso de erro
-            if not self.workbook:
-                try:
-                    import time
-                    time.sleep(1.0)
-                    self.workbook = load_workbook(self.temp_path, data_only=False)
-                except:
-                    pass
             return False
             
+    @property
+    def cache_valido(self) -> bool:
+        """
+        True se os valores em cache das fórmulas no arquivo correspondem às entradas
+        
+        O patcher preserva os valores do template; depois de uma escrita eles só
+        valem se o arquivo foi recalculado nesta execução. Sem isso as fórmulas
+        são lidas como None (nunca os números do template)
+        """
+        return not self._escritas or self._arquivo_recalculado
+    
+    def _ler_streaming(self, ranges: Sequence[Tuple[str, str]]) -> Optional[List[List[List]]]:
+        """
+        Caminho rápido: lê valores em cache direto do XML das abas
+        Retorna None para cair no caminho openpyxl (estrutura não suportada)
+        """
+        if not self.cache_valido:
+            logger.warning("⚠️ Arquivo não recalculado após as escritas - fórmulas lidas como vazias")
+        try:
+            return XlsxStreamReader.ler_ranges(self._conteudo, ranges, formulas_em_cache=self.cache_valido)
+        except KeyError:
+            raise
+        except Exception as e:
+            logger.debug(f"Leitura em streaming indisponível ({e}) - usando openpyxl")
+            return None
+    
     def read_range_calculated(self, worksheet_name: str, range_address: str) -> List[List]:
         """
         Lê range com valores calculados
-        Fecha e reabre com data_only=True
+        Abre o conteúdo atual (em memória) com data_only=True
         """
+        if self._calculados is not None:
+            valores = self._calculados.ler_range(worksheet_name, range_address)
+            if valores is not None:
+                return valores
+        
+        valores = self._ler_streaming([(worksheet_name, range_address)])
+        if valores is not None:
+            return valores[0]
+        
         try:
-            # Fechar workbook atual
-            if self.workbook:
-                self.workbook.close()
-                
-            # Reabrir com data_only=True para ler valores
-            logger.debug(f"Reabrindo temp com data_only=True para {range_address}")
-            wb_read = load_workbook(self.temp_path, data_only=True)
+            logger.debug(f"Lendo {range_address} com data_only={self.cache_valido}")
+            wb_read = load_workbook(io.BytesIO(self._conteudo), data_only=self.cache_valido)
             ws = wb_read[worksheet_name]
             
             # Ler range
@@ -146,20 +429,99 @@ class ExcelTemplateCalculator:
                 result = []
                 for row in cells:
                     if isinstance(row, tuple):
-                        result.append([cell.value for cell in row])
+                        result.append([_sem_formula(cell.value) for cell in row])
                     else:
-                        result.append([row.value])
+                        result.append([_sem_formula(row.value)])
             else:
                 # Célula única
-                result = [[cells.value]]
+                result = [[_sem_formula(cells.value)]]
                 
             wb_read.close()
             
-            # Reabrir workbook para continuar (caso necessário)
-            self.workbook = load_workbook(self.temp_path, data_only=False)
-            
             return result
             
         except Exception as e:
             logger.error(f"Erro ao ler range {range_address}: {e}")
             raise
+            
+    def read_ranges_calculated(self, ranges: Sequence[Tuple[str, str]]) -> List[List[List]]:
+        """
+        Lê vários ranges com valores calculados em uma única leitura do arquivo
+        
+        Abre o conteúdo atual uma única vez (read_only + data_only) e
+        percorre cada aba apenas no intervalo de linhas necessário.
+        
+        Args:
+            ranges: Lista de pares (aba, range) - ex: [("RESUMO", "D23:F23")]
+            
+        Returns:
+            Lista de resultados (lista de listas) na mesma ordem de `ranges`
+        """
+        # Valores do motor de fórmulas (sem reabrir o arquivo)
+        if self._calculados is not None:
+            valores = [self._calculados.ler_range(aba, endereco) for aba, endereco in ranges]
+            if all(v is not None for v in valores):
+                return valores
+        
+        valores = self._ler_streaming(ranges)
+        if valores is not None:
+            return valores
+        
+        # Agrupar pedidos por aba: uma passada por aba cobre todos os ranges
+        pedidos: Dict[str, List[Tuple[int, int, int, int, int]]] = {}
+        for indice, (worksheet_name, range_address) in enumerate(ranges):
+            min_col, min_row, max_col, max_row = range_boundaries(range_address)
+            pedidos.setdefault(worksheet_name, []).append(
+                (indice, min_col, min_row, max_col, max_row)
+            )
+        
+        resultados: List[List[List]] = [None] * len(ranges)
+        
+        try:
+            logger.debug(f"Lendo {len(ranges)} ranges em uma única passada (read_only)")
+            # Cache inválido: lê as fórmulas (data_only=False) para devolvê-las como None
+            wb_read = load_workbook(io.BytesIO(self._conteudo), read_only=True, data_only=self.cache_valido)
+            
+            try:
+                for worksheet_name, itens in pedidos.items():
+                    ws = wb_read[worksheet_name]
+                    
+                    # Janela mínima que contém todos os ranges desta aba
+                    min_col = min(item[1] for item in itens)
+                    min_row = min(item[2] for item in itens)
+                    max_col = max(item[3] for item in itens)
+                    max_row = max(item[4] for item in itens)
+                    
+                    linhas = {}
+                    for numero, row in enumerate(
+                        ws.iter_rows(
+                            min_row=min_row,
+                            max_row=max_row,
+                            min_col=min_col,
+                            max_col=max_col,
+                            values_only=True
+                        ),
+                        start=min_row
+                    ):
+                        linhas[numero] = row
+                    
+                    # Recortar cada range da janela lida
+                    for indice, r_min_col, r_min_row, r_max_col, r_max_row in itens:
+                        inicio = r_min_col - min_col
+                        fim = r_max_col - min_col + 1
+                        resultado = []
+                        for numero in range(r_min_row, r_max_row + 1):
+                            row = linhas.get(numero, ())
+                            valores = [_sem_formula(v) for v in row[inicio:fim]]
+                            # Linhas curtas/ausentes no modo read_only
+                            valores.extend([None] * (fim - inicio - len(valores)))
+                            resultado.append(valores)
+                        resultados[indice] = resultado
+            finally:
+                wb_read.close()
+            
+            return resultados
+            
+        except Exception as e:
+            logger.error(f"Erro ao ler ranges {list(ranges)}: {e}")
+            raise
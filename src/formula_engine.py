@@ -0,0 +1,943 @@
+"""
+Motor de fórmulas nativo (Python)
+Lê as fórmulas do template uma única vez, monta o grafo de dependências
+das células de saída (RESUMO D23:F69) até as células de entrada (B6:B15)
+e avalia tudo em processo - sem Excel/LibreOffice
+"""
+import io
+import logging
+import heapq
+import re
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, time as dt_time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from openpyxl import load_workbook
+from openpyxl.formula.tokenizer import Token, Tokenizer
+from openpyxl.utils.cell import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import to_excel
+from openpyxl.worksheet.formula import ArrayFormula
+
+import formula_functions as ff
+
+logger = logging.getLogger(__name__)
+
+# Chave de célula: (aba, linha, coluna)
+Chave = Tuple[str, int, int]
+# Intervalo referenciado: (aba, min_row, min_col, max_row, max_col)
+Faixa = Tuple[str, int, int, int, int]
+
+_CELULA = re.compile(r"^\$?([A-Za-z]{1,3})\$?(\d+)$")
+_COLUNAS = re.compile(r"^\$?([A-Za-z]{1,3}):\$?([A-Za-z]{1,3})$")
+_LINHAS = re.compile(r"^\$?(\d+):\$?(\d+)$")
+
+# Precedência dos operadores binários (maior = liga mais forte)
+_PRECEDENCIA = {
+    "=": 1, "<>": 1, "<": 1, ">": 1, "<=": 1, ">=": 1,
+    "&": 2,
+    "+": 3, "-": 3,
+    "*": 4, "/": 4,
+    "^": 5,
+}
+# Negação unária liga mais forte que ^ no Excel (-2^2 = 4)
+_PRECEDENCIA_PREFIXO = 6
+
+# Funções cuja dependência não pode ser determinada estaticamente
+_NAO_SUPORTADAS = {"OFFSET", "INDIRECT"}
+
+_AUSENTE = object()
+
+
+class FormulaEngineError(Exception):
+    """Erro ao montar ou avaliar o grafo de fórmulas"""
+
+
+class FormulaNaoSuportada(FormulaEngineError):
+    """Fórmula usa construção que o motor não avalia (ex: INDIRECT, link externo)"""
+
+
+def normalizar_valor(v: Any) -> Any:
+    """Converte valores lidos/escritos para a representação do motor (datas → serial)"""
+    if isinstance(v, (datetime, date)):
+        return float(to_excel(v))
+    if isinstance(v, dt_time):
+        return float(to_excel(v))
+    if isinstance(v, str) and v in ff.ERROS:
+        return ff.ERROS[v]
+    return v
+
+
+def _valor_para_leitura(v: Any) -> Any:
+    """Representação igual à do openpyxl (data_only): erros viram texto"""
+    if isinstance(v, ff.ExcelError):
+        return v.codigo
+    return v
+
+
+def _avaliar_celula(fn: Callable, get: Callable, origem: Chave) -> Any:
+    try:
+        v = ff.escalar(fn(get), origem)
+    except ff.ErroExcel as e:
+        return e.erro
+    except ZeroDivisionError:
+        return ff.ERRO_DIV0
+    except (ValueError, OverflowError):
+        return ff.ERRO_NUM
+    except (TypeError, IndexError):
+        return ff.ERRO_VALOR
+    if v is None:
+        return 0.0
+    if isinstance(v, int) and not isinstance(v, bool):
+        return float(v)
+    return v
+
+
+class _Compilador:
+    """
+    Converte o texto de uma fórmula em uma função Python `fn(get) -> valor`
+    Registra as células/intervalos referenciados (arestas do grafo)
+    """
+
+    def __init__(self, engine: "FormulaEngine", origem: Chave):
+        self.engine = engine
+        self.origem = origem
+        self.celulas: Set[Chave] = set()
+        self.faixas: Set[Faixa] = set()
+        self.volatil = False
+        self._nomes_em_uso: Set[str] = set()
+
+    def compilar(self, formula: str) -> Callable:
+        tokens_anteriores = getattr(self, "_tokens", None), getattr(self, "_pos", 0)
+        self._tokens = [t for t in Tokenizer(formula).items if t.type != Token.WSPACE]
+        self._pos = 0
+        try:
+            fn = self._expr(0)
+            if self._pos != len(self._tokens):
+                raise FormulaNaoSuportada(f"Token inesperado em {formula!r}: {self._tokens[self._pos].value!r}")
+            return fn
+        finally:
+            self._tokens, self._pos = tokens_anteriores
+
+    # ---------------------------------------------------------- parser
+    def _proximo(self) -> Optional[Token]:
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else None
+
+    def _consumir(self) -> Token:
+        token = self._proximo()
+        if token is None:
+            raise FormulaNaoSuportada("Fim inesperado da fórmula")
+        self._pos += 1
+        return token
+
+    def _expr(self, precedencia_minima: int) -> Callable:
+        esquerda = self._prefixo()
+        while True:
+            token = self._proximo()
+            if token is None:
+                return esquerda
+            if token.type == Token.OP_POST and token.value == "%":
+                self._pos += 1
+                esquerda = self._unario("%", esquerda)
+                continue
+            if token.type == Token.OP_IN and token.value in _PRECEDENCIA:
+                precedencia = _PRECEDENCIA[token.value]
+                if precedencia < precedencia_minima:
+                    return esquerda
+                self._pos += 1
+                direita = self._expr(precedencia + 1)
+                esquerda = self._binario(token.value, esquerda, direita)
+                continue
+            if token.type == Token.OP_IN:
+                raise FormulaNaoSuportada(f"Operador não suportado: {token.value!r}")
+            return esquerda
+
+    def _prefixo(self) -> Callable:
+        token = self._consumir()
+
+        if token.type == Token.OP_PRE:
+            operando = self._expr(_PRECEDENCIA_PREFIXO)
+            return self._unario("-", operando) if token.value == "-" else self._unario("+", operando)
+
+        if token.type == Token.OPERAND:
+            if token.subtype == Token.NUMBER:
+                valor = float(token.value)
+                return lambda get: valor
+            if token.subtype == Token.TEXT:
+                texto = token.value[1:-1].replace('""', '"')
+                return lambda get: texto
+            if token.subtype == Token.LOGICAL:
+                logico = token.value.upper() == "TRUE"
+                return lambda get: logico
+            if token.subtype == Token.ERROR:
+                erro = ff.ERROS.get(token.value.upper(), ff.ERRO_VALOR)
+                return lambda get: erro
+            return self._referencia(token.value)
+
+        if token.type == Token.FUNC and token.subtype == Token.OPEN:
+            nome = token.value[:-1].upper()
+            for prefixo in ("_XLFN.", "_XLWS."):
+                if nome.startswith(prefixo):
+                    nome = nome[len(prefixo):]
+            return self._funcao(nome, self._argumentos())
+
+        if token.type == Token.PAREN and token.subtype == Token.OPEN:
+            interno = self._expr(0)
+            fechamento = self._consumir()
+            if fechamento.type != Token.PAREN:
+                raise FormulaNaoSuportada("Parêntese não fechado")
+            return interno
+
+        if token.type == Token.ARRAY and token.subtype == Token.OPEN:
+            return self._matriz_constante()
+
+        raise FormulaNaoSuportada(f"Token não suportado: {token.value!r} ({token.type})")
+
+    def _argumentos(self) -> List[Optional[Callable]]:
+        argumentos: List[Optional[Callable]] = []
+        token = self._proximo()
+        if token is not None and token.type == Token.FUNC and token.subtype == Token.CLOSE:
+            self._pos += 1
+            return argumentos
+        while True:
+            token = self._proximo()
+            if token is not None and (
+                (token.type == Token.SEP and token.subtype == Token.ARG)
+                or (token.type == Token.FUNC and token.subtype == Token.CLOSE)
+            ):
+                argumentos.append(None)  # argumento omitido: IF(A1,,2)
+            else:
+                argumentos.append(self._expr(0))
+            separador = self._consumir()
+            if separador.type == Token.SEP and separador.subtype == Token.ARG:
+                continue
+            if separador.type == Token.FUNC and separador.subtype == Token.CLOSE:
+                return argumentos
+            raise FormulaNaoSuportada(f"Separador inesperado: {separador.value!r}")
+
+    def _matriz_constante(self) -> Callable:
+        linhas: List[List[Any]] = [[]]
+        while True:
+            token = self._consumir()
+            if token.type == Token.ARRAY and token.subtype == Token.CLOSE:
+                break
+            if token.type == Token.SEP:
+                if token.subtype == Token.ROW:
+                    linhas.append([])
+                continue
+            negativo = False
+            if token.type == Token.OP_PRE:
+                negativo = token.value == "-"
+                token = self._consumir()
+            if token.subtype == Token.NUMBER:
+                valor: Any = float(token.value) * (-1 if negativo else 1)
+            elif token.subtype == Token.TEXT:
+                valor = token.value[1:-1].replace('""', '"')
+            elif token.subtype == Token.LOGICAL:
+                valor = token.value.upper() == "TRUE"
+            elif token.subtype == Token.ERROR:
+                valor = ff.ERROS.get(token.value.upper(), ff.ERRO_VALOR)
+            else:
+                raise FormulaNaoSuportada(f"Constante de matriz inválida: {token.value!r}")
+            linhas[-1].append(valor)
+        return lambda get: linhas
+
+    # ------------------------------------------------------- operações
+    @staticmethod
+    def _binario(op: str, esquerda: Callable, direita: Callable) -> Callable:
+        return lambda get: ff.op_binario(op, esquerda(get), direita(get))
+
+    @staticmethod
+    def _unario(op: str, operando: Callable) -> Callable:
+        if op == "+":
+            return operando
+        return lambda get: ff.op_unario(op, operando(get))
+
+    def _funcao(self, nome: str, args: List[Optional[Callable]]) -> Callable:
+        if nome in _NAO_SUPORTADAS:
+            raise FormulaNaoSuportada(f"Função {nome} não suportada (referência dinâmica)")
+        if nome in ff.VOLATEIS:
+            self.volatil = True
+
+        avaliar = lambda arg, get: arg(get) if arg is not None else None
+
+        if nome == "IF":
+            if len(args) not in (2, 3):
+                raise FormulaNaoSuportada("IF com número inválido de argumentos")
+            condicao, verdadeiro = args[0], args[1]
+            falso = args[2] if len(args) == 3 else _AUSENTE
+
+            def f_if(get):
+                if ff.booleano(condicao(get)):
+                    return avaliar(verdadeiro, get) if verdadeiro is not None else 0.0
+                if falso is _AUSENTE:
+                    return False
+                return avaliar(falso, get) if falso is not None else 0.0
+            return f_if
+
+        if nome in ("IFERROR", "IFNA"):
+            if len(args) != 2:
+                raise FormulaNaoSuportada(f"{nome} com número inválido de argumentos")
+            valor, alternativa = args
+            so_na = nome == "IFNA"
+
+            def f_iferror(get):
+                try:
+                    resultado = avaliar(valor, get)
+                    teste = resultado
+                    if isinstance(resultado, ff.Intervalo) and resultado.altura == resultado.largura == 1:
+                        teste = resultado.valor(0, 0)
+                except ff.ErroExcel as e:
+                    teste = e.erro
+                    resultado = e.erro
+                if isinstance(teste, ff.ExcelError) and (not so_na or teste == ff.ERRO_NA):
+                    return avaliar(alternativa, get)
+                return resultado
+            return f_iferror
+
+        if nome == "CHOOSE":
+            indice, opcoes = args[0], args[1:]
+
+            def f_choose(get):
+                i = ff.inteiro(indice(get))
+                if i < 1 or i > len(opcoes):
+                    raise ff.ErroExcel(ff.ERRO_VALOR)
+                return avaliar(opcoes[i - 1], get)
+            return f_choose
+
+        if nome in ("AND", "OR"):
+            e_and = nome == "AND"
+
+            def f_logica(get):
+                valores = []
+                for arg in args:
+                    v = avaliar(arg, get)
+                    if ff.e_matriz(v):
+                        itens = v.valores() if isinstance(v, ff.Intervalo) else (x for linha in v for x in linha)
+                        for x in itens:
+                            if isinstance(x, ff.ExcelError):
+                                raise ff.ErroExcel(x)
+                            if isinstance(x, (bool, int, float)):
+                                valores.append(bool(x))
+                    elif v is not None:
+                        valores.append(ff.booleano(v))
+                if not valores:
+                    raise ff.ErroExcel(ff.ERRO_VALOR)
+                return all(valores) if e_and else any(valores)
+            return f_logica
+
+        funcao = ff.FUNCOES.get(nome)
+        if funcao is None:
+            raise FormulaNaoSuportada(f"Função {nome} não suportada")
+        return lambda get: funcao(*[avaliar(arg, get) for arg in args])
+
+    # ----------------------------------------------------- referências
+    def _referencia(self, texto: str) -> Callable:
+        if "[" in texto:
+            raise FormulaNaoSuportada(f"Referência externa não suportada: {texto}")
+
+        planilha = self.origem[0]
+        ref = texto
+        if "!" in texto:
+            nome_planilha, ref = texto.rsplit("!", 1)
+            if nome_planilha.startswith("'") and nome_planilha.endswith("'"):
+                nome_planilha = nome_planilha[1:-1].replace("''", "'")
+            planilha = self.engine.resolver_planilha(nome_planilha)
+            if planilha is None:
+                return lambda get: ff.ERRO_REF
+
+        if ref.upper() == "#REF!":
+            return lambda get: ff.ERRO_REF
+
+        m = _CELULA.match(ref)
+        if m:
+            chave = (planilha, int(m.group(2)), column_index_from_string(m.group(1).upper()))
+            self.celulas.add(chave)
+            return lambda get: get(chave)
+
+        faixa = self._faixa(planilha, ref)
+        if faixa is not None:
+            self.faixas.add(faixa)
+            p, r1, c1, r2, c2 = faixa
+            return lambda get: ff.Intervalo(p, r1, c1, r2, c2, get)
+
+        return self._nome(ref)
+
+    def _faixa(self, planilha: str, ref: str) -> Optional[Faixa]:
+        max_row, max_col = self.engine.limites.get(planilha, (1, 1))
+        m = _COLUNAS.match(ref)
+        if m:
+            c1 = column_index_from_string(m.group(1).upper())
+            c2 = column_index_from_string(m.group(2).upper())
+            return (planilha, 1, min(c1, c2), max_row, max(c1, c2))
+        m = _LINHAS.match(ref)
+        if m:
+            r1, r2 = int(m.group(1)), int(m.group(2))
+            return (planilha, min(r1, r2), 1, max(r1, r2), max_col)
+        if ":" in ref:
+            try:
+                min_col, min_row, max_col_ref, max_row_ref = range_boundaries(ref.replace("$", ""))
+            except (ValueError, TypeError):
+                return None
+            if None in (min_col, min_row, max_col_ref, max_row_ref):
+                return None
+            return (planilha, min_row, min_col, max_row_ref, max_col_ref)
+        return None
+
+    def _nome(self, nome: str) -> Callable:
+        definicao = self.engine.nome_definido(nome, self.origem[0])
+        if definicao is None:
+            return lambda get: ff.ERRO_NOME
+        chave_nome = nome.upper()
+        if chave_nome in self._nomes_em_uso:
+            raise FormulaEngineError(f"Nome definido recursivo: {nome}")
+        if "#REF!" in definicao:
+            return lambda get: ff.ERRO_REF
+        self._nomes_em_uso.add(chave_nome)
+        try:
+            return self.compilar("=" + definicao)
+        finally:
+            self._nomes_em_uso.discard(chave_nome)
+
+
+class Avaliacao:
+    """Resultado de uma avaliação: valores calculados + entradas usadas"""
+
+    def __init__(
+        self,
+        engine: "FormulaEngine",
+        calculados: Dict[Chave, Any],
+        entradas: Dict[Chave, Any],
+        recalculadas: Optional[int] = None
+    ):
+        self.engine = engine
+        self.calculados = calculados
+        self.entradas = entradas
+        # Quantas fórmulas foram de fato avaliadas (incremental < total do cone)
+        self.recalculadas = len(calculados) if recalculadas is None else recalculadas
+
+    def _get(self, chave: Chave) -> Any:
+        v = self.calculados.get(chave, _AUSENTE)
+        if v is not _AUSENTE:
+            return v
+        v = self.entradas.get(chave, _AUSENTE)
+        if v is not _AUSENTE:
+            return v
+        return self.engine.constantes.get(chave)
+
+    def cobre(self, chave: Chave) -> bool:
+        """True se o valor da célula é conhecido (constante, entrada ou fórmula avaliada)"""
+        return (
+            chave not in self.engine.formulas
+            or chave in self.calculados
+            or chave in self.entradas
+        )
+
+    def valor(self, planilha: str, endereco: str) -> Any:
+        min_col, min_row, _, _ = range_boundaries(endereco)
+        return _valor_para_leitura(self._get((self.engine.resolver_planilha(planilha), min_row, min_col)))
+
+    def ler_range(self, planilha: str, range_address: str) -> Optional[List[List]]:
+        """
+        Lê range no mesmo formato de ExcelTemplateCalculator.read_range_calculated
+
+        Returns:
+            Lista de listas, ou None se alguma fórmula do range não foi avaliada
+        """
+        nome = self.engine.resolver_planilha(planilha)
+        if nome is None:
+            return None
+        min_col, min_row, max_col, max_row = range_boundaries(range_address)
+        resultado = []
+        for r in range(min_row, max_row + 1):
+            linha = []
+            for c in range(min_col, max_col + 1):
+                chave = (nome, r, c)
+                if not self.cobre(chave):
+                    return None
+                linha.append(_valor_para_leitura(self._get(chave)))
+            resultado.append(linha)
+        return resultado
+
+
+class FormulaEngine:
+    """
+    Avalia as fórmulas do template em Python
+
+    Fluxo:
+    1. Lê fórmulas e constantes do workbook (uma vez)
+    2. A partir das células de saída, percorre os precedentes até chegar em
+       constantes ou células de entrada (cone de dependências)
+    3. Compila cada fórmula do cone e define a ordem topológica
+    4. `avaliar(entradas)` calcula o cone com os valores informados
+
+    Exemplo:
+        >>> engine = FormulaEngine.carregar(conteudo, saidas=[("RESUMO", "D23:F69")],
+        ...                                  entradas=[("RESUMO", "B6")])
+        >>> avaliacao = engine.avaliar({("RESUMO", "B6"): "TIMON"})
+        >>> avaliacao.ler_range("RESUMO", "D23:F23")
+    """
+
+    def __init__(
+        self,
+        formulas: Dict[Chave, str],
+        constantes: Dict[Chave, Any],
+        limites: Dict[str, Tuple[int, int]],
+        saidas: Sequence[Tuple[str, str]],
+        entradas: Sequence[Tuple[str, str]] = (),
+        nomes: Optional[Dict[Tuple[Optional[str], str], str]] = None,
+        valores_cache: Optional[Dict[Chave, Any]] = None,
+        matriciais: Optional[Set[Chave]] = None
+    ):
+        """
+        Args:
+            formulas: {(aba, linha, coluna): "=fórmula"}
+            constantes: {(aba, linha, coluna): valor} para células sem fórmula
+            limites: {aba: (max_row, max_col)} - usado em referências A:A / 1:1
+            saidas: Ranges de saída [(aba, "D23:F69")]
+            entradas: Células de entrada [(aba, "B6")] - tratadas como folhas
+            nomes: Nomes definidos {(aba ou None, NOME): "Aba!$A$1"}
+            valores_cache: Valores calculados salvos no arquivo (para fórmulas)
+            matriciais: Células com fórmula matricial de várias células
+        """
+        self.formulas = formulas
+        self.limites = limites
+        self.nomes = nomes or {}
+        self.valores_cache = valores_cache or {}
+        self._matriciais = matriciais or set()
+        self._planilhas = {nome.lower(): nome for nome in limites}
+
+        self.entradas: Set[Chave] = {self._chave(p, a) for p, a in entradas}
+        self.saidas: List[Chave] = []
+        for planilha, range_address in saidas:
+            nome = self.resolver_planilha(planilha)
+            if nome is None:
+                raise FormulaEngineError(f"Aba de saída não encontrada: {planilha}")
+            min_col, min_row, max_col, max_row = range_boundaries(range_address)
+            for r in range(min_row, max_row + 1):
+                for c in range(min_col, max_col + 1):
+                    self.saidas.append((nome, r, c))
+
+        # Entradas que são fórmulas no template: usar valor salvo quando não informadas
+        self.constantes = dict(constantes)
+        for chave in self.entradas:
+            if chave in formulas and chave not in self.constantes:
+                self.constantes[chave] = self.valores_cache.get(chave)
+
+        self._compiladas: Dict[Chave, Callable] = {}
+        self._celulas_ref: Dict[Chave, Set[Chave]] = {}
+        self._faixas_ref: Dict[Chave, Set[Faixa]] = {}
+        self._precedentes: Dict[Chave, Set[Chave]] = {}
+        self._volateis: Set[Chave] = set()
+        self._formulas_por_faixa: Dict[Faixa, List[Chave]] = {}
+        self._formulas_por_planilha: Dict[str, List[Chave]] = {}
+        # Nomes definidos referenciados pelo cone: {(aba ou None, NOME)}
+        self.nomes_usados: Set[Tuple[Optional[str], str]] = set()
+        for chave in formulas:
+            self._formulas_por_planilha.setdefault(chave[0], []).append(chave)
+
+        inicio = time.time()
+        self._montar_grafo()
+        self._ordem = self._ordenar()
+        self._posicao: Dict[Chave, int] = {chave: i for i, chave in enumerate(self._ordem)}
+        self._dependentes = self._mapear_dependentes()
+        logger.info(
+            f"FormulaEngine: {len(self._ordem)} fórmulas no cone de {len(self.saidas)} "
+            f"células de saída ({(time.time() - inicio) * 1000:.0f}ms)"
+        )
+
+        # Estado de referência para recálculo incremental:
+        # valores das entradas no template + fórmulas avaliadas com elas
+        self._entradas_template: Dict[Chave, Any] = {
+            chave: self.constantes.get(chave) for chave in self.entradas
+        }
+        self._base_template: Optional[Dict[Chave, Any]] = None
+        self._ultima: Optional[Tuple[Dict[Chave, Any], Dict[Chave, Any]]] = None
+        self._estado_lock = threading.Lock()
+
+    # ------------------------------------------------------------ carga
+    @classmethod
+    def carregar(
+        cls,
+        conteudo: bytes,
+        saidas: Sequence[Tuple[str, str]],
+        entradas: Sequence[Tuple[str, str]] = ()
+    ) -> "FormulaEngine":
+        """Monta o motor a partir dos bytes de um arquivo .xlsx"""
+        inicio = time.time()
+        wb_formulas = load_workbook(io.BytesIO(conteudo), read_only=True, data_only=False)
+        wb_valores = load_workbook(io.BytesIO(conteudo), read_only=True, data_only=True)
+
+        try:
+            formulas: Dict[Chave, str] = {}
+            constantes: Dict[Chave, Any] = {}
+            limites: Dict[str, Tuple[int, int]] = {}
+            nomes: Dict[Tuple[Optional[str], str], str] = {}
+            matriciais: Set[Chave] = set()
+
+            for ws in wb_formulas.worksheets:
+                max_row = max_col = 1
+                for row in ws.iter_rows():
+                    for cell in row:
+                        v = cell.value
+                        if v is None:
+                            continue
+                        chave = (ws.title, cell.row, cell.column)
+                        max_row = max(max_row, cell.row)
+                        max_col = max(max_col, cell.column)
+                        if isinstance(v, ArrayFormula):
+                            formulas[chave] = v.text
+                            if v.ref and ":" in v.ref:
+                                matriciais.add(chave)
+                        elif isinstance(v, str) and v.startswith("=") and len(v) > 1:
+                            formulas[chave] = v
+                        else:
+                            constantes[chave] = normalizar_valor(v)
+                limites[ws.title] = (max_row, max_col)
+                for nome, definicao in getattr(ws, "defined_names", {}).items():
+                    nomes[(ws.title, nome.upper())] = definicao.attr_text
+
+            for nome, definicao in wb_formulas.defined_names.items():
+                nomes[(None, nome.upper())] = definicao.attr_text
+
+            valores_cache: Dict[Chave, Any] = {}
+            for ws in wb_valores.worksheets:
+                for row in ws.iter_rows():
+                    for cell in row:
+                        if cell.value is None:
+                            continue
+                        chave = (ws.title, cell.row, cell.column)
+                        if chave in formulas:
+                            valores_cache[chave] = normalizar_valor(cell.value)
+        finally:
+            wb_formulas.close()
+            wb_valores.close()
+
+        logger.info(
+            f"Template lido para FormulaEngine: {len(formulas)} fórmulas, "
+            f"{len(constantes)} constantes ({(time.time() - inicio) * 1000:.0f}ms)"
+        )
+        return cls(formulas, constantes, limites, saidas, entradas, nomes, valores_cache, matriciais)
+
+    # ---------------------------------------------------------- apoio
+    def resolver_planilha(self, nome: str) -> Optional[str]:
+        """Nome real da aba (Excel não diferencia maiúsculas em referências)"""
+        return self._planilhas.get(nome.lower())
+
+    def nome_definido(self, nome: str, planilha: str) -> Optional[str]:
+        chave = nome.upper()
+        escopo = (planilha, chave) if (planilha, chave) in self.nomes else (None, chave)
+        definicao = self.nomes.get(escopo)
+        if definicao is not None:
+            self.nomes_usados.add(escopo)
+        return definicao
+
+    def _chave(self, planilha: str, endereco: str) -> Chave:
+        nome = self.resolver_planilha(planilha)
+        if nome is None:
+            raise FormulaEngineError(f"Aba não encontrada: {planilha}")
+        min_col, min_row, _, _ = range_boundaries(endereco)
+        return (nome, min_row, min_col)
+
+    def _formulas_em(self, faixa: Faixa) -> List[Chave]:
+        """Células com fórmula dentro de um intervalo (cache por intervalo)"""
+        encontradas = self._formulas_por_faixa.get(faixa)
+        if encontradas is None:
+            planilha, r1, c1, r2, c2 = faixa
+            encontradas = [
+                chave for chave in self._formulas_por_planilha.get(planilha, ())
+                if r1 <= chave[1] <= r2 and c1 <= chave[2] <= c2
+            ]
+            self._formulas_por_faixa[faixa] = encontradas
+        return encontradas
+
+    # ----------------------------------------------------------- grafo
+    def _montar_grafo(self):
+        """Percorre precedentes a partir das saídas e compila as fórmulas do cone"""
+        pendentes = deque(self.saidas)
+        visitadas: Set[Chave] = set()
+
+        while pendentes:
+            chave = pendentes.popleft()
+            if chave in visitadas:
+                continue
+            visitadas.add(chave)
+
+            if chave in self.entradas:
+                continue
+            formula = self.formulas.get(chave)
+            if formula is None:
+                continue
+            if chave in self._matriciais:
+                raise FormulaNaoSuportada(f"Fórmula matricial de várias células em {chave}")
+
+            compilador = _Compilador(self, chave)
+            try:
+                self._compiladas[chave] = compilador.compilar(formula)
+            except FormulaEngineError as e:
+                raise FormulaNaoSuportada(f"{chave[0]}!{_endereco(chave)}: {e}") from e
+
+            self._celulas_ref[chave] = compilador.celulas
+            self._faixas_ref[chave] = compilador.faixas
+            if compilador.volatil:
+                self._volateis.add(chave)
+
+            precedentes = set(compilador.celulas)
+            for faixa in compilador.faixas:
+                precedentes.update(self._formulas_em(faixa))
+            self._precedentes[chave] = precedentes
+            pendentes.extend(p for p in precedentes if p not in visitadas)
+
+        # Arestas apenas entre fórmulas avaliadas (entradas/constantes são folhas)
+        for chave, precedentes in self._precedentes.items():
+            self._precedentes[chave] = {p for p in precedentes if p in self._compiladas}
+
+    def _ordenar(self) -> List[Chave]:
+        """Ordem topológica (precedentes antes) - detecta referência circular"""
+        estado: Dict[Chave, int] = {}
+        ordem: List[Chave] = []
+
+        for raiz in self._compiladas:
+            if raiz in estado:
+                continue
+            estado[raiz] = 1
+            pilha = [(raiz, iter(self._precedentes[raiz]))]
+            while pilha:
+                no, proximos = pilha[-1]
+                for proximo in proximos:
+                    situacao = estado.get(proximo)
+                    if situacao is None:
+                        estado[proximo] = 1
+                        pilha.append((proximo, iter(self._precedentes[proximo])))
+                        break
+                    if situacao == 1:
+                        raise FormulaEngineError(
+                            f"Referência circular envolvendo {proximo[0]}!{_endereco(proximo)}"
+                        )
+                else:
+                    pilha.pop()
+                    estado[no] = 2
+                    ordem.append(no)
+        return ordem
+
+    def _mapear_dependentes(self) -> Dict[Chave, Set[Chave]]:
+        """
+        Mapa inverso do grafo: célula -> fórmulas que a leem
+        Considera referências diretas e intervalos (ex: VLOOKUP sobre A1:B3)
+        """
+        alteraveis = set(self._compiladas) | self.entradas
+        entradas_por_planilha: Dict[str, List[Chave]] = {}
+        for chave in self.entradas:
+            entradas_por_planilha.setdefault(chave[0], []).append(chave)
+
+        dependentes: Dict[Chave, Set[Chave]] = {}
+        for chave in self._compiladas:
+            lidas = {c for c in self._celulas_ref[chave] if c in alteraveis}
+            for faixa in self._faixas_ref[chave]:
+                planilha, r1, c1, r2, c2 = faixa
+                lidas.update(c for c in self._formulas_em(faixa) if c in self._compiladas)
+                lidas.update(
+                    c for c in entradas_por_planilha.get(planilha, ())
+                    if r1 <= c[1] <= r2 and c1 <= c[2] <= c2
+                )
+            for lida in lidas:
+                dependentes.setdefault(lida, set()).add(chave)
+        return dependentes
+
+    def celulas_do_cone(self) -> Set[Chave]:
+        """
+        Células cujo conteúdo influencia as saídas:
+        fórmulas do cone, células lidas por elas (inclusive intervalos),
+        entradas e as próprias células de saída
+        """
+        celulas: Set[Chave] = set(self._compiladas) | self.entradas | set(self.saidas)
+        for chave in self._compiladas:
+            celulas.update(self._celulas_ref[chave])
+        return celulas
+
+    def faixas_do_cone(self) -> Set[Faixa]:
+        """Intervalos lidos pelas fórmulas do cone"""
+        faixas: Set[Faixa] = set()
+        for chave in self._compiladas:
+            faixas.update(self._faixas_ref[chave])
+        return faixas
+
+    def dependentes_de(self, chaves: Iterable[Chave]) -> Set[Chave]:
+        """Todas as fórmulas afetadas (direta ou indiretamente) pelas células informadas"""
+        afetadas: Set[Chave] = set()
+        pendentes = list(chaves)
+        while pendentes:
+            for dependente in self._dependentes.get(pendentes.pop(), ()):
+                if dependente not in afetadas:
+                    afetadas.add(dependente)
+                    pendentes.append(dependente)
+        return afetadas
+
+    # -------------------------------------------------------- avaliação
+    def normalizar_entradas(self, entradas: Dict[Tuple[str, str], Any]) -> Dict[Chave, Any]:
+        return {self._chave(p, a): normalizar_valor(v) for (p, a), v in entradas.items()}
+
+    def _getter(self, calculados: Dict[Chave, Any], valores_entrada: Dict[Chave, Any]) -> Callable:
+        constantes = self.constantes
+
+        def get(chave: Chave) -> Any:
+            v = calculados.get(chave, _AUSENTE)
+            if v is _AUSENTE:
+                v = valores_entrada.get(chave, _AUSENTE)
+                if v is _AUSENTE:
+                    return constantes.get(chave)
+            return v
+        return get
+
+    def avaliar_completo(self, entradas: Dict[Tuple[str, str], Any]) -> Avaliacao:
+        """
+        Avalia todas as fórmulas do cone (sem aproveitar avaliações anteriores)
+
+        Args:
+            entradas: {(aba, endereço): valor} - datas podem ser date/datetime
+
+        Returns:
+            Avaliacao com os valores calculados
+        """
+        valores_entrada = self.normalizar_entradas(entradas)
+        calculados: Dict[Chave, Any] = {}
+        get = self._getter(calculados, valores_entrada)
+
+        for chave in self._ordem:
+            calculados[chave] = _avaliar_celula(self._compiladas[chave], get, chave)
+
+        return Avaliacao(self, calculados, valores_entrada)
+
+    def _obter_base_template(self) -> Dict[Chave, Any]:
+        """
+        Valores das fórmulas com as entradas do template
+        Usa os valores salvos no arquivo; se faltar algum (arquivo salvo
+        sem recálculo), avalia o cone inteiro uma vez
+        """
+        if self._base_template is None:
+            if all(chave in self.valores_cache for chave in self._ordem):
+                base = {chave: self.valores_cache[chave] for chave in self._ordem}
+            else:
+                logger.info("FormulaEngine: template sem valores calculados - avaliando base completa")
+                base = self.avaliar_completo({}).calculados
+            self._base_template = base
+        return self._base_template
+
+    def avaliar(self, entradas: Dict[Tuple[str, str], Any]) -> Avaliacao:
+        """
+        Avalia o cone recalculando apenas o que depende das entradas alteradas
+
+        A referência é o template ou a avaliação anterior - a que tiver menos
+        entradas diferentes. Só as fórmulas a jusante dessas entradas (e as
+        voláteis, ex: TODAY) são reavaliadas; a propagação para quando o
+        novo valor de uma célula é igual ao anterior.
+
+        Args:
+            entradas: {(aba, endereço): valor} - datas podem ser date/datetime
+
+        Returns:
+            Avaliacao com os valores calculados (`recalculadas` = fórmulas avaliadas)
+        """
+        valores_entrada = self.normalizar_entradas(entradas)
+        if any(chave not in self.entradas for chave in valores_entrada):
+            # Célula escrita fora das entradas declaradas: não há mapa de dependentes
+            return self.avaliar_completo(entradas)
+
+        vetor = dict(self._entradas_template)
+        vetor.update(valores_entrada)
+
+        with self._estado_lock:
+            base = self._obter_base_template()
+            referencias = [(self._entradas_template, base)]
+            if self._ultima is not None:
+                referencias.append(self._ultima)
+
+        melhor = None
+        for entradas_ref, calculados_ref in referencias:
+            alteradas = [c for c in vetor if not _mesmo_valor(vetor[c], entradas_ref.get(c))]
+            if melhor is None or len(alteradas) < len(melhor[0]):
+                melhor = (alteradas, calculados_ref)
+        alteradas, calculados_ref = melhor
+
+        calculados = dict(calculados_ref)
+        get = self._getter(calculados, vetor)
+
+        # Fila em ordem topológica: precedentes sempre avaliados antes
+        fila: List[Tuple[int, Chave]] = []
+        agendadas: Set[Chave] = set()
+
+        def agendar(chaves: Iterable[Chave]):
+            for chave in chaves:
+                if chave not in agendadas:
+                    agendadas.add(chave)
+                    heapq.heappush(fila, (self._posicao[chave], chave))
+
+        for chave in alteradas:
+            agendar(self._dependentes.get(chave, ()))
+        agendar(self._volateis)
+
+        recalculadas = 0
+        while fila:
+            _, chave = heapq.heappop(fila)
+            novo = _avaliar_celula(self._compiladas[chave], get, chave)
+            recalculadas += 1
+            if not _mesmo_valor(novo, calculados.get(chave, _AUSENTE)):
+                calculados[chave] = novo
+                agendar(self._dependentes.get(chave, ()))
+
+        with self._estado_lock:
+            self._ultima = (vetor, calculados)
+
+        return Avaliacao(self, calculados, vetor, recalculadas)
+
+
+def _mesmo_valor(a: Any, b: Any) -> bool:
+    """Igualdade estrita de valores de célula (1 == True não conta)"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    return type(a) is type(b) and a == b
+
+
+def _endereco(chave: Chave) -> str:
+    from openpyxl.utils.cell import get_column_letter
+    return f"{get_column_letter(chave[2])}{chave[1]}"
+
+
+# Motores já montados: (identificador do template, saídas, entradas) -> (bytes, motor)
+_engines: Dict[Tuple, Tuple[bytes, FormulaEngine]] = {}
+_engines_lock = threading.Lock()
+
+
+def obter_formula_engine(
+    identificador: Any,
+    conteudo: bytes,
+    saidas: Sequence[Tuple[str, str]],
+    entradas: Sequence[Tuple[str, str]] = ()
+) -> FormulaEngine:
+    """
+    Retorna motor compartilhado para o template (montado uma vez por conteúdo)
+
+    Args:
+        identificador: Identifica o template (ex: caminho resolvido)
+        conteudo: Bytes atuais do template - motor é remontado se mudarem
+        saidas: Ranges de saída
+        entradas: Células de entrada
+
+    Returns:
+        FormulaEngine pronto para avaliar
+    """
+    chave = (identificador, tuple(saidas), tuple(entradas))
+    cached = _engines.get(chave)
+    if cached and cached[0] is conteudo:
+        return cached[1]
+
+    with _engines_lock:
+        cached = _engines.get(chave)
+        if cached and cached[0] is conteudo:
+            return cached[1]
+        engine = FormulaEngine.carregar(conteudo, saidas, entradas)
+        _engines[chave] = (conteudo, engine)
+        return engine
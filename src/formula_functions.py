@@ -0,0 +1,997 @@
+"""
+Funções Excel para o motor de fórmulas (FormulaEngine)
+Reproduz a semântica do Excel: coerção de tipos, erros (#DIV/0!, #N/A...),
+datas como número serial e operações elemento a elemento sobre ranges
+"""
+import calendar
+import math
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP, ROUND_DOWN, ROUND_UP
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from openpyxl.utils.datetime import from_excel, to_excel
+
+
+class ExcelError:
+    """Valor de erro do Excel (#DIV/0!, #N/A, ...)"""
+
+    __slots__ = ("codigo",)
+
+    def __init__(self, codigo: str):
+        self.codigo = codigo
+
+    def __eq__(self, other):
+        return isinstance(other, ExcelError) and other.codigo == self.codigo
+
+    def __hash__(self):
+        return hash(self.codigo)
+
+    def __repr__(self):
+        return self.codigo
+
+
+ERRO_DIV0 = ExcelError("#DIV/0!")
+ERRO_NA = ExcelError("#N/A")
+ERRO_VALOR = ExcelError("#VALUE!")
+ERRO_REF = ExcelError("#REF!")
+ERRO_NUM = ExcelError("#NUM!")
+ERRO_NOME = ExcelError("#NAME?")
+ERRO_NULO = ExcelError("#NULL!")
+
+ERROS = {e.codigo: e for e in (ERRO_DIV0, ERRO_NA, ERRO_VALOR, ERRO_REF, ERRO_NUM, ERRO_NOME, ERRO_NULO)}
+
+
+class ErroExcel(Exception):
+    """Propaga um ExcelError pela avaliação (capturado ao gravar o valor da célula)"""
+
+    def __init__(self, erro: ExcelError):
+        super().__init__(erro.codigo)
+        self.erro = erro
+
+
+class Intervalo:
+    """
+    Referência a um bloco retangular de células
+    Valores são obtidos sob demanda através de `get((planilha, linha, coluna))`
+    """
+
+    __slots__ = ("planilha", "min_row", "min_col", "max_row", "max_col", "_get")
+
+    def __init__(self, planilha: str, min_row: int, min_col: int, max_row: int, max_col: int, get: Callable):
+        self.planilha = planilha
+        self.min_row = min_row
+        self.min_col = min_col
+        self.max_row = max_row
+        self.max_col = max_col
+        self._get = get
+
+    @property
+    def altura(self) -> int:
+        return self.max_row - self.min_row + 1
+
+    @property
+    def largura(self) -> int:
+        return self.max_col - self.min_col + 1
+
+    def valor(self, i: int, j: int) -> Any:
+        """Valor na posição relativa (i, j), base 0"""
+        return self._get((self.planilha, self.min_row + i, self.min_col + j))
+
+    def linhas(self) -> List[List[Any]]:
+        get = self._get
+        planilha = self.planilha
+        return [
+            [get((planilha, r, c)) for c in range(self.min_col, self.max_col + 1)]
+            for r in range(self.min_row, self.max_row + 1)
+        ]
+
+    def valores(self) -> Iterator[Any]:
+        get = self._get
+        planilha = self.planilha
+        for r in range(self.min_row, self.max_row + 1):
+            for c in range(self.min_col, self.max_col + 1):
+                yield get((planilha, r, c))
+
+    def vetor(self) -> List[Any]:
+        """Valores de um range de uma linha ou uma coluna"""
+        if self.altura != 1 and self.largura != 1:
+            raise ErroExcel(ERRO_NA)
+        return list(self.valores())
+
+    def sub(self, i: int, j: int, altura: int, largura: int) -> "Intervalo":
+        return Intervalo(
+            self.planilha,
+            self.min_row + i,
+            self.min_col + j,
+            self.min_row + i + altura - 1,
+            self.min_col + j + largura - 1,
+            self._get
+        )
+
+
+# ============================================================
+# Coerção de tipos
+# ============================================================
+
+def e_matriz(v: Any) -> bool:
+    return isinstance(v, (Intervalo, list))
+
+
+def para_matriz(v: Any) -> List[List[Any]]:
+    if isinstance(v, Intervalo):
+        return v.linhas()
+    if isinstance(v, list):
+        return v
+    return [[v]]
+
+
+def escalar(v: Any, origem: Optional[Tuple[str, int, int]] = None) -> Any:
+    """
+    Reduz um range/matriz a um único valor
+
+    Range 1x1 → valor; com `origem` (célula da fórmula) aplica interseção
+    implícita como o Excel: mesma linha (range de uma coluna) ou mesma coluna
+    """
+    if isinstance(v, Intervalo):
+        if v.altura == 1 and v.largura == 1:
+            return v.valor(0, 0)
+        if origem is not None and origem[0] == v.planilha:
+            _, linha, coluna = origem
+            if v.largura == 1 and v.min_row <= linha <= v.max_row:
+                return v.valor(linha - v.min_row, 0)
+            if v.altura == 1 and v.min_col <= coluna <= v.max_col:
+                return v.valor(0, coluna - v.min_col)
+        return ERRO_VALOR
+    if isinstance(v, list):
+        return v[0][0] if v and v[0] else None
+    return v
+
+
+def verificar(v: Any) -> Any:
+    if isinstance(v, ExcelError):
+        raise ErroExcel(v)
+    return v
+
+
+def num(v: Any) -> float:
+    """Converte para número (regras de argumento direto do Excel)"""
+    v = verificar(escalar(v))
+    if v is None:
+        return 0.0
+    if isinstance(v, bool):
+        return 1.0 if v else 0.0
+    if isinstance(v, (int, float)):
+        return float(v)
+    if isinstance(v, datetime):
+        return float(to_excel(v))
+    if isinstance(v, date):
+        return float(to_excel(v))
+    if isinstance(v, str):
+        texto = v.strip()
+        if texto.endswith("%"):
+            try:
+                return float(texto[:-1]) / 100
+            except ValueError:
+                pass
+        try:
+            return float(texto)
+        except ValueError:
+            raise ErroExcel(ERRO_VALOR)
+    raise ErroExcel(ERRO_VALOR)
+
+
+def inteiro(v: Any) -> int:
+    return int(math.floor(num(v)))
+
+
+def formatar_numero(x: float) -> str:
+    """Formato 'Geral' do Excel (até 15 dígitos significativos)"""
+    if x == int(x) and abs(x) < 1e15:
+        return str(int(x))
+    return f"{x:.15g}"
+
+
+def txt(v: Any) -> str:
+    v = verificar(escalar(v))
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, (int, float)):
+        return formatar_numero(float(v))
+    return str(v)
+
+
+def booleano(v: Any) -> bool:
+    v = verificar(escalar(v))
+    if v is None:
+        return False
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, (int, float)):
+        return v != 0
+    if isinstance(v, str):
+        if v.upper() == "TRUE":
+            return True
+        if v.upper() == "FALSE":
+            return False
+    raise ErroExcel(ERRO_VALOR)
+
+
+def numeros(args) -> Iterator[float]:
+    """
+    Números para funções de agregação (SUM, MIN, ...)
+    Em ranges: ignora textos, booleanos e vazios; argumentos diretos são convertidos
+    """
+    for arg in args:
+        if e_matriz(arg):
+            valores = arg.valores() if isinstance(arg, Intervalo) else (x for linha in arg for x in linha)
+            for v in valores:
+                if isinstance(v, ExcelError):
+                    raise ErroExcel(v)
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    yield float(v)
+        elif arg is None:
+            continue
+        else:
+            yield num(arg)
+
+
+def _tipo(v: Any) -> int:
+    if isinstance(v, bool):
+        return 2
+    if isinstance(v, str):
+        return 1
+    return 0
+
+
+def comparar(a: Any, b: Any) -> int:
+    """Comparação do Excel: números < textos < booleanos; textos sem distinguir maiúsculas"""
+    a = verificar(escalar(a))
+    b = verificar(escalar(b))
+    if a is None:
+        a = "" if isinstance(b, str) else (False if isinstance(b, bool) else 0.0)
+    if b is None:
+        b = "" if isinstance(a, str) else (False if isinstance(a, bool) else 0.0)
+    ta, tb = _tipo(a), _tipo(b)
+    if ta != tb:
+        return -1 if ta < tb else 1
+    if ta == 1:
+        a, b = a.lower(), b.lower()
+    elif ta == 0:
+        a, b = float(a), float(b)
+    return (a > b) - (a < b)
+
+
+# ============================================================
+# Operadores
+# ============================================================
+
+def _op_escalar(op: str, a: Any, b: Any) -> Any:
+    if op == "&":
+        return txt(a) + txt(b)
+    if op in ("=", "<>", "<", ">", "<=", ">="):
+        c = comparar(a, b)
+        return {
+            "=": c == 0, "<>": c != 0, "<": c < 0,
+            ">": c > 0, "<=": c <= 0, ">=": c >= 0,
+        }[op]
+    x, y = num(a), num(b)
+    if op == "+":
+        return x + y
+    if op == "-":
+        return x - y
+    if op == "*":
+        return x * y
+    if op == "/":
+        if y == 0:
+            raise ErroExcel(ERRO_DIV0)
+        return x / y
+    if op == "^":
+        try:
+            resultado = math.pow(x, y)
+        except (ValueError, OverflowError):
+            raise ErroExcel(ERRO_NUM)
+        return resultado
+    raise ErroExcel(ERRO_VALOR)
+
+
+def _elemento(fn: Callable, *args) -> Any:
+    try:
+        return fn(*args)
+    except ErroExcel as e:
+        return e.erro
+
+
+def _expandir(m: List[List[Any]], altura: int, largura: int) -> Optional[List[List[Any]]]:
+    """Expande matriz 1xN / Nx1 / 1x1 para as dimensões pedidas (broadcast do Excel)"""
+    h, w = len(m), len(m[0]) if m else 0
+    if (h, w) == (altura, largura):
+        return m
+    if h == 1 and w == 1:
+        return [[m[0][0]] * largura for _ in range(altura)]
+    if h == 1 and w == largura:
+        return [list(m[0]) for _ in range(altura)]
+    if w == 1 and h == altura:
+        return [[linha[0]] * largura for linha in m]
+    return None
+
+
+def op_binario(op: str, a: Any, b: Any) -> Any:
+    if not e_matriz(a) and not e_matriz(b):
+        return _op_escalar(op, a, b)
+    ma, mb = para_matriz(a), para_matriz(b)
+    altura = max(len(ma), len(mb))
+    largura = max(len(ma[0]), len(mb[0]))
+    ea, eb = _expandir(ma, altura, largura), _expandir(mb, altura, largura)
+    if ea is None or eb is None:
+        raise ErroExcel(ERRO_VALOR)
+    return [
+        [_elemento(_op_escalar, op, ea[i][j], eb[i][j]) for j in range(largura)]
+        for i in range(altura)
+    ]
+
+
+def op_unario(op: str, a: Any) -> Any:
+    def aplicar(v):
+        if op == "-":
+            return -num(v)
+        if op == "%":
+            return num(v) / 100
+        return num(v)
+    if e_matriz(a):
+        return [[_elemento(aplicar, v) for v in linha] for linha in para_matriz(a)]
+    return aplicar(a)
+
+
+# ============================================================
+# Datas (número serial do Excel)
+# ============================================================
+
+def para_data(v: Any) -> date:
+    serial = num(v)
+    if serial < 0:
+        raise ErroExcel(ERRO_NUM)
+    valor = from_excel(int(serial))
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+def serial(d: date) -> float:
+    return float(to_excel(d))
+
+
+def _somar_meses(d: date, meses: int) -> date:
+    total = d.year * 12 + (d.month - 1) + meses
+    ano, mes = divmod(total, 12)
+    dia = min(d.day, calendar.monthrange(ano, mes + 1)[1])
+    return date(ano, mes + 1, dia)
+
+
+def _fim_do_mes(d: date, meses: int) -> date:
+    total = d.year * 12 + (d.month - 1) + meses
+    ano, mes = divmod(total, 12)
+    return date(ano, mes + 1, calendar.monthrange(ano, mes + 1)[1])
+
+
+def f_date(ano, mes, dia):
+    a, m, d = inteiro(ano), inteiro(mes), inteiro(dia)
+    if 0 <= a < 1900:
+        a += 1900
+    total = a * 12 + (m - 1)
+    a, m = divmod(total, 12)
+    try:
+        resultado = date(a, m + 1, 1) + timedelta(days=d - 1)
+    except (ValueError, OverflowError):
+        raise ErroExcel(ERRO_NUM)
+    return serial(resultado)
+
+
+def f_datedif(inicio, fim, unidade):
+    d1, d2 = para_data(inicio), para_data(fim)
+    if d1 > d2:
+        raise ErroExcel(ERRO_NUM)
+    u = txt(unidade).upper()
+    meses = (d2.year - d1.year) * 12 + d2.month - d1.month - (1 if d2.day < d1.day else 0)
+    if u == "Y":
+        return float(meses // 12)
+    if u == "M":
+        return float(meses)
+    if u == "D":
+        return float((d2 - d1).days)
+    if u == "YM":
+        return float(meses % 12)
+    if u == "MD":
+        base = _somar_meses(d1, meses)
+        return float((d2 - base).days)
+    if u == "YD":
+        base = _somar_meses(d1, (meses // 12) * 12)
+        return float((d2 - base).days)
+    raise ErroExcel(ERRO_NUM)
+
+
+def f_days360(inicio, fim, metodo=None):
+    d1, d2 = para_data(inicio), para_data(fim)
+    europeu = booleano(metodo) if metodo is not None else False
+    dia1, dia2 = d1.day, d2.day
+    if europeu:
+        dia1 = min(dia1, 30)
+        dia2 = min(dia2, 30)
+    else:
+        ultimo_fev = d1.month == 2 and d1.day == calendar.monthrange(d1.year, 2)[1]
+        if dia1 == 31 or ultimo_fev:
+            dia1 = 30
+        if dia2 == 31 and dia1 >= 30:
+            dia2 = 30
+    return float((d2.year - d1.year) * 360 + (d2.month - d1.month) * 30 + (dia2 - dia1))
+
+
+def f_yearfrac(inicio, fim, base=None):
+    d1, d2 = para_data(inicio), para_data(fim)
+    if d1 > d2:
+        d1, d2 = d2, d1
+    b = inteiro(base) if base is not None else 0
+    if b == 0:
+        return f_days360(serial(d1), serial(d2)) / 360
+    if b == 1:
+        if d1.year == d2.year:
+            dias_ano = 366 if calendar.isleap(d1.year) else 365
+            return (d2 - d1).days / dias_ano
+        anos = range(d1.year, d2.year + 1)
+        media = sum(366 if calendar.isleap(a) else 365 for a in anos) / len(anos)
+        return (d2 - d1).days / media
+    if b == 2:
+        return (d2 - d1).days / 360
+    if b == 3:
+        return (d2 - d1).days / 365
+    if b == 4:
+        return f_days360(serial(d1), serial(d2), True) / 360
+    raise ErroExcel(ERRO_NUM)
+
+
+# ============================================================
+# Critérios (SUMIF/COUNTIF) e curingas
+# ============================================================
+
+def _regex_curinga(padrao: str) -> "re.Pattern":
+    partes = []
+    i = 0
+    while i < len(padrao):
+        c = padrao[i]
+        if c == "~" and i + 1 < len(padrao):
+            partes.append(re.escape(padrao[i + 1]))
+            i += 2
+            continue
+        partes.append(".*" if c == "*" else "." if c == "?" else re.escape(c))
+        i += 1
+    return re.compile("^" + "".join(partes) + "$", re.IGNORECASE | re.DOTALL)
+
+
+def _tem_curinga(texto: str) -> bool:
+    return any(c in texto for c in "*?~")
+
+
+def criterio(c: Any) -> Callable[[Any], bool]:
+    c = verificar(escalar(c))
+    if isinstance(c, str):
+        for op in ("<>", ">=", "<=", "=", ">", "<"):
+            if c.startswith(op):
+                resto = c[len(op):]
+                break
+        else:
+            op, resto = "=", c
+        try:
+            alvo: Any = float(resto)
+        except ValueError:
+            alvo = resto
+        if isinstance(alvo, str):
+            if op in ("=", "<>"):
+                if alvo == "":
+                    vazio = lambda v: v is None or v == ""
+                    return vazio if op == "=" else (lambda v: not vazio(v))
+                regex = _regex_curinga(alvo)
+                igual = lambda v: isinstance(v, str) and regex.match(v) is not None
+                return igual if op == "=" else (lambda v: not igual(v))
+            comparador = lambda v: isinstance(v, str) and _op_escalar(op, v, alvo)
+            return comparador
+        def numerico(v):
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                return op == "<>"
+            return _op_escalar(op, float(v), alvo)
+        return numerico
+    if isinstance(c, bool):
+        return lambda v: isinstance(v, bool) and v == c
+    if c is None:
+        c = 0.0
+    alvo_num = float(c)
+    return lambda v: isinstance(v, (int, float)) and not isinstance(v, bool) and float(v) == alvo_num
+
+
+def _iguais_busca(valor: Any, candidato: Any) -> bool:
+    if isinstance(valor, str) and _tem_curinga(valor):
+        return isinstance(candidato, str) and _regex_curinga(valor).match(candidato) is not None
+    if isinstance(candidato, ExcelError) or candidato is None:
+        return False
+    if _tipo(valor) != _tipo(candidato):
+        return False
+    return comparar(valor, candidato) == 0
+
+
+# ============================================================
+# Busca (VLOOKUP/MATCH/INDEX...)
+# ============================================================
+
+def _buscar(valor: Any, candidatos: List[Any], tipo: int) -> int:
+    """Retorna índice (base 0) segundo as regras de MATCH; -1 se não encontrado"""
+    valor = verificar(escalar(valor))
+    if tipo == 0:
+        for i, candidato in enumerate(candidatos):
+            if _iguais_busca(valor, candidato):
+                return i
+        return -1
+
+    encontrado = -1
+    for i, candidato in enumerate(candidatos):
+        if candidato is None or isinstance(candidato, ExcelError) or _tipo(candidato) != _tipo(valor):
+            continue
+        c = comparar(candidato, valor)
+        if tipo > 0:
+            if c <= 0:
+                encontrado = i
+            else:
+                break
+        else:
+            if c >= 0:
+                encontrado = i
+            else:
+                break
+    return encontrado
+
+
+def f_match(valor, vetor, tipo=None):
+    t = inteiro(tipo) if tipo is not None else 1
+    candidatos = vetor.vetor() if isinstance(vetor, Intervalo) else [x for linha in para_matriz(vetor) for x in linha]
+    i = _buscar(valor, candidatos, 0 if t == 0 else (1 if t > 0 else -1))
+    if i < 0:
+        raise ErroExcel(ERRO_NA)
+    return float(i + 1)
+
+
+def _procv(valor, tabela, indice, aproximado, horizontal: bool):
+    if not isinstance(tabela, Intervalo):
+        tabela_m = para_matriz(tabela)
+    idx = inteiro(indice)
+    aprox = True if aproximado is None else booleano(aproximado)
+    if isinstance(tabela, Intervalo):
+        limite = tabela.altura if horizontal else tabela.largura
+        if horizontal:
+            chaves = [tabela.valor(0, j) for j in range(tabela.largura)]
+        else:
+            chaves = [tabela.valor(i, 0) for i in range(tabela.altura)]
+    else:
+        limite = len(tabela_m) if horizontal else len(tabela_m[0])
+        chaves = list(tabela_m[0]) if horizontal else [linha[0] for linha in tabela_m]
+    if idx < 1:
+        raise ErroExcel(ERRO_VALOR)
+    if idx > limite:
+        raise ErroExcel(ERRO_REF)
+    pos = _buscar(valor, chaves, 1 if aprox else 0)
+    if pos < 0:
+        raise ErroExcel(ERRO_NA)
+    if isinstance(tabela, Intervalo):
+        return tabela.valor(idx - 1, pos) if horizontal else tabela.valor(pos, idx - 1)
+    return tabela_m[idx - 1][pos] if horizontal else tabela_m[pos][idx - 1]
+
+
+def f_vlookup(valor, tabela, indice, aproximado=None):
+    return _procv(valor, tabela, indice, aproximado, horizontal=False)
+
+
+def f_hlookup(valor, tabela, indice, aproximado=None):
+    return _procv(valor, tabela, indice, aproximado, horizontal=True)
+
+
+def f_lookup(valor, vetor, resultado=None):
+    if isinstance(vetor, Intervalo):
+        chaves = vetor.vetor() if (vetor.altura == 1 or vetor.largura == 1) else [vetor.valor(i, 0) for i in range(vetor.altura)]
+    else:
+        chaves = [x for linha in para_matriz(vetor) for x in linha]
+    pos = _buscar(valor, chaves, 1)
+    if pos < 0:
+        raise ErroExcel(ERRO_NA)
+    if resultado is None:
+        if isinstance(vetor, Intervalo) and vetor.altura > 1 and vetor.largura > 1:
+            return vetor.valor(pos, vetor.largura - 1)
+        return chaves[pos]
+    if isinstance(resultado, Intervalo):
+        valores = resultado.vetor()
+    else:
+        valores = [x for linha in para_matriz(resultado) for x in linha]
+    if pos >= len(valores):
+        raise ErroExcel(ERRO_NA)
+    return valores[pos]
+
+
+def f_index(ref, linha, coluna=None):
+    lin = inteiro(linha) if linha is not None else 0
+    col = inteiro(coluna) if coluna is not None else None
+    if isinstance(ref, Intervalo):
+        altura, largura = ref.altura, ref.largura
+        if col is None:
+            # Vetor de uma linha: o índice informado é a coluna
+            if altura == 1:
+                lin, col = 1, lin
+            else:
+                col = 1 if largura == 1 else 0
+        if lin < 0 or col < 0 or lin > altura or col > largura:
+            raise ErroExcel(ERRO_REF)
+        if lin == 0 and col == 0:
+            return ref
+        if lin == 0:
+            return ref.sub(0, col - 1, altura, 1)
+        if col == 0:
+            return ref.sub(lin - 1, 0, 1, largura)
+        return ref.valor(lin - 1, col - 1)
+    m = para_matriz(ref)
+    if col is None:
+        if len(m) == 1:
+            lin, col = 1, lin
+        else:
+            col = 1
+    if lin < 1 or col < 1 or lin > len(m) or col > len(m[0]):
+        raise ErroExcel(ERRO_REF)
+    return m[lin - 1][col - 1]
+
+
+# ============================================================
+# Matemáticas e agregação
+# ============================================================
+
+def _arredondar(x: float, digitos: int, modo) -> float:
+    if not math.isfinite(x):
+        raise ErroExcel(ERRO_NUM)
+    # repr() usa a menor representação decimal: 2.675 arredonda para 2.68 como no Excel
+    quantum = Decimal(1).scaleb(-digitos)
+    return float(Decimal(repr(x)).quantize(quantum, rounding=modo))
+
+
+def f_round(x, digitos=None):
+    return _arredondar(num(x), inteiro(digitos) if digitos is not None else 0, ROUND_HALF_UP)
+
+
+def f_roundup(x, digitos=None):
+    return _arredondar(num(x), inteiro(digitos) if digitos is not None else 0, ROUND_UP)
+
+
+def f_rounddown(x, digitos=None):
+    return _arredondar(num(x), inteiro(digitos) if digitos is not None else 0, ROUND_DOWN)
+
+
+def f_ceiling(x, multiplo=None):
+    valor, m = num(x), num(multiplo) if multiplo is not None else 1.0
+    if m == 0:
+        return 0.0
+    return math.ceil(valor / m) * m
+
+
+def f_floor(x, multiplo=None):
+    valor, m = num(x), num(multiplo) if multiplo is not None else 1.0
+    if m == 0:
+        raise ErroExcel(ERRO_DIV0)
+    return math.floor(valor / m) * m
+
+
+def f_mod(x, divisor):
+    a, b = num(x), num(divisor)
+    if b == 0:
+        raise ErroExcel(ERRO_DIV0)
+    return a - b * math.floor(a / b)
+
+
+def f_sqrt(x):
+    v = num(x)
+    if v < 0:
+        raise ErroExcel(ERRO_NUM)
+    return math.sqrt(v)
+
+
+def f_ln(x):
+    v = num(x)
+    if v <= 0:
+        raise ErroExcel(ERRO_NUM)
+    return math.log(v)
+
+
+def f_log(x, base=None):
+    v, b = num(x), num(base) if base is not None else 10.0
+    if v <= 0 or b <= 0 or b == 1:
+        raise ErroExcel(ERRO_NUM)
+    return math.log(v, b)
+
+
+def f_average(*args):
+    valores = list(numeros(args))
+    if not valores:
+        raise ErroExcel(ERRO_DIV0)
+    return sum(valores) / len(valores)
+
+
+def f_product(*args):
+    resultado = 1.0
+    encontrou = False
+    for v in numeros(args):
+        resultado *= v
+        encontrou = True
+    return resultado if encontrou else 0.0
+
+
+def f_min(*args):
+    valores = list(numeros(args))
+    return min(valores) if valores else 0.0
+
+
+def f_max(*args):
+    valores = list(numeros(args))
+    return max(valores) if valores else 0.0
+
+
+def f_count(*args):
+    total = 0
+    for arg in args:
+        if e_matriz(arg):
+            valores = arg.valores() if isinstance(arg, Intervalo) else (x for linha in arg for x in linha)
+            total += sum(1 for v in valores if isinstance(v, (int, float)) and not isinstance(v, bool))
+        else:
+            try:
+                num(arg)
+                total += 1
+            except ErroExcel:
+                pass
+    return float(total)
+
+
+def f_counta(*args):
+    total = 0
+    for arg in args:
+        if e_matriz(arg):
+            valores = arg.valores() if isinstance(arg, Intervalo) else (x for linha in arg for x in linha)
+            total += sum(1 for v in valores if v is not None)
+        elif arg is not None:
+            total += 1
+    return float(total)
+
+
+def f_countblank(ref):
+    valores = ref.valores() if isinstance(ref, Intervalo) else (x for linha in para_matriz(ref) for x in linha)
+    return float(sum(1 for v in valores if v is None or v == ""))
+
+
+def f_sumproduct(*args):
+    matrizes = [para_matriz(a) for a in args]
+    altura, largura = len(matrizes[0]), len(matrizes[0][0])
+    for m in matrizes:
+        if len(m) != altura or len(m[0]) != largura:
+            raise ErroExcel(ERRO_VALOR)
+    total = 0.0
+    for i in range(altura):
+        for j in range(largura):
+            produto = 1.0
+            for m in matrizes:
+                v = m[i][j]
+                if isinstance(v, ExcelError):
+                    raise ErroExcel(v)
+                produto *= float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else 0.0
+            total += produto
+    return total
+
+
+def _pares_criterio(pares) -> List[Tuple[Any, Callable]]:
+    if len(pares) % 2:
+        raise ErroExcel(ERRO_VALOR)
+    return [(pares[i], criterio(pares[i + 1])) for i in range(0, len(pares), 2)]
+
+
+def _posicoes_validas(ref, testes: List[Tuple[Any, Callable]]) -> Iterator[Tuple[int, int]]:
+    base = para_matriz(ref) if not isinstance(ref, Intervalo) else None
+    altura = ref.altura if isinstance(ref, Intervalo) else len(base)
+    largura = ref.largura if isinstance(ref, Intervalo) else len(base[0])
+    matrizes = []
+    for faixa, teste in testes:
+        if isinstance(faixa, Intervalo):
+            if faixa.altura != altura or faixa.largura != largura:
+                raise ErroExcel(ERRO_VALOR)
+            matrizes.append((faixa, teste))
+        else:
+            matrizes.append((_MatrizLiteral(para_matriz(faixa)), teste))
+    for i in range(altura):
+        for j in range(largura):
+            if all(teste(faixa.valor(i, j)) for faixa, teste in matrizes):
+                yield i, j
+
+
+class _MatrizLiteral:
+    """Adaptador mínimo para tratar matriz literal como Intervalo em critérios"""
+
+    def __init__(self, m):
+        self.m = m
+
+    def valor(self, i, j):
+        return self.m[i][j]
+
+
+def _valor_em(ref, i, j):
+    return ref.valor(i, j) if isinstance(ref, Intervalo) else para_matriz(ref)[i][j]
+
+
+def f_sumif(faixa, crit, soma=None):
+    alvo = faixa if soma is None else soma
+    if isinstance(alvo, Intervalo) and isinstance(faixa, Intervalo):
+        # Excel usa apenas o canto superior esquerdo de sum_range (mesmo tamanho de range)
+        alvo = alvo.sub(0, 0, faixa.altura, faixa.largura)
+    total = 0.0
+    for i, j in _posicoes_validas(faixa, [(faixa, criterio(crit))]):
+        v = _valor_em(alvo, i, j)
+        if isinstance(v, ExcelError):
+            raise ErroExcel(v)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            total += float(v)
+    return total
+
+
+def f_sumifs(soma, *pares):
+    testes = _pares_criterio(pares)
+    total = 0.0
+    for i, j in _posicoes_validas(soma, testes):
+        v = _valor_em(soma, i, j)
+        if isinstance(v, ExcelError):
+            raise ErroExcel(v)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            total += float(v)
+    return total
+
+
+def f_countif(faixa, crit):
+    return float(sum(1 for _ in _posicoes_validas(faixa, [(faixa, criterio(crit))])))
+
+
+def f_countifs(*pares):
+    testes = _pares_criterio(pares)
+    return float(sum(1 for _ in _posicoes_validas(testes[0][0], testes)))
+
+
+def f_averageif(faixa, crit, media=None):
+    alvo = faixa if media is None else media
+    valores = []
+    for i, j in _posicoes_validas(faixa, [(faixa, criterio(crit))]):
+        v = _valor_em(alvo, i, j)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            valores.append(float(v))
+    if not valores:
+        raise ErroExcel(ERRO_DIV0)
+    return sum(valores) / len(valores)
+
+
+# ============================================================
+# Texto
+# ============================================================
+
+def f_text(valor, formato):
+    v = num(valor)
+    f = txt(formato)
+    chave = f.lower()
+    if any(x in chave for x in ("d", "m", "y", "a")) and not any(x in chave for x in ("0", "#")):
+        d = para_data(v)
+        resultado = chave
+        for padrao, subst in (
+            ("yyyy", f"{d.year:04d}"), ("aaaa", f"{d.year:04d}"),
+            ("yy", f"{d.year % 100:02d}"), ("aa", f"{d.year % 100:02d}"),
+            ("mm", f"{d.month:02d}"), ("dd", f"{d.day:02d}"),
+        ):
+            resultado = resultado.replace(padrao, subst)
+        return resultado
+    decimais = len(f.split(".")[1]) if "." in f else 0
+    texto = f"{v:,.{decimais}f}" if "," in f else f"{v:.{decimais}f}"
+    return texto
+
+
+def f_value(v):
+    return num(txt(v)) if isinstance(escalar(v), str) else num(v)
+
+
+def f_mid(texto, inicio, quantidade):
+    s, i, n = txt(texto), inteiro(inicio), inteiro(quantidade)
+    if i < 1 or n < 0:
+        raise ErroExcel(ERRO_VALOR)
+    return s[i - 1:i - 1 + n]
+
+
+def _e_erro(v) -> bool:
+    v = escalar(v)
+    return isinstance(v, ExcelError)
+
+
+# Funções que dependem do relógio: sempre recalculadas
+VOLATEIS = {"TODAY", "NOW"}
+
+# Funções que exigem avaliação preguiçosa dos argumentos (tratadas no compilador)
+PREGUICOSAS = {"IF", "IFERROR", "IFNA", "CHOOSE", "AND", "OR"}
+
+FUNCOES: Dict[str, Callable] = {
+    # Matemáticas
+    "SUM": lambda *a: float(sum(numeros(a))),
+    "PRODUCT": f_product,
+    "MIN": f_min,
+    "MAX": f_max,
+    "AVERAGE": f_average,
+    "COUNT": f_count,
+    "COUNTA": f_counta,
+    "COUNTBLANK": f_countblank,
+    "SUMPRODUCT": f_sumproduct,
+    "SUMIF": f_sumif,
+    "SUMIFS": f_sumifs,
+    "COUNTIF": f_countif,
+    "COUNTIFS": f_countifs,
+    "AVERAGEIF": f_averageif,
+    "ABS": lambda x: abs(num(x)),
+    "ROUND": f_round,
+    "ROUNDUP": f_roundup,
+    "ROUNDDOWN": f_rounddown,
+    "TRUNC": f_rounddown,
+    "INT": lambda x: float(math.floor(num(x))),
+    "MOD": f_mod,
+    "POWER": lambda x, y: _op_escalar("^", x, y),
+    "SQRT": f_sqrt,
+    "EXP": lambda x: math.exp(num(x)),
+    "LN": f_ln,
+    "LOG": f_log,
+    "LOG10": lambda x: f_log(x, 10.0),
+    "SIGN": lambda x: float((num(x) > 0) - (num(x) < 0)),
+    "CEILING": f_ceiling,
+    "FLOOR": f_floor,
+    # Lógicas / informação
+    "NOT": lambda x: not booleano(x),
+    "TRUE": lambda: True,
+    "FALSE": lambda: False,
+    "ISBLANK": lambda x: escalar(x) is None,
+    "ISNUMBER": lambda x: isinstance(escalar(x), (int, float)) and not isinstance(escalar(x), bool),
+    "ISTEXT": lambda x: isinstance(escalar(x), str),
+    "ISERROR": _e_erro,
+    "ISERR": lambda x: _e_erro(x) and escalar(x) != ERRO_NA,
+    "ISNA": lambda x: escalar(x) == ERRO_NA,
+    "NA": lambda: ERRO_NA,
+    # Datas
+    "DATE": f_date,
+    "YEAR": lambda x: float(para_data(x).year),
+    "MONTH": lambda x: float(para_data(x).month),
+    "DAY": lambda x: float(para_data(x).day),
+    "EDATE": lambda d, m: serial(_somar_meses(para_data(d), inteiro(m))),
+    "EOMONTH": lambda d, m: serial(_fim_do_mes(para_data(d), inteiro(m))),
+    "DAYS": lambda fim, inicio: float(int(num(fim)) - int(num(inicio))),
+    "DAYS360": f_days360,
+    "DATEDIF": f_datedif,
+    "YEARFRAC": f_yearfrac,
+    "TODAY": lambda: serial(date.today()),
+    "NOW": lambda: float(to_excel(datetime.now())),
+    # Busca e referência
+    "VLOOKUP": f_vlookup,
+    "HLOOKUP": f_hlookup,
+    "LOOKUP": f_lookup,
+    "MATCH": f_match,
+    "INDEX": f_index,
+    "ROWS": lambda r: float(r.altura if isinstance(r, Intervalo) else len(para_matriz(r))),
+    "COLUMNS": lambda r: float(r.largura if isinstance(r, Intervalo) else len(para_matriz(r)[0])),
+    # Texto
+    "CONCATENATE": lambda *a: "".join(txt(x) for x in a),
+    "CONCAT": lambda *a: "".join(
+        txt(v) for x in a for v in (x.valores() if isinstance(x, Intervalo) else [x])
+    ),
+    "LEFT": lambda t, n=None: txt(t)[:inteiro(n) if n is not None else 1],
+    "RIGHT": lambda t, n=None: (lambda s, k: s[-k:] if k else "")(txt(t), inteiro(n) if n is not None else 1),
+    "MID": f_mid,
+    "LEN": lambda t: float(len(txt(t))),
+    "UPPER": lambda t: txt(t).upper(),
+    "LOWER": lambda t: txt(t).lower(),
+    "TRIM": lambda t: " ".join(txt(t).split()),
+    "VALUE": f_value,
+    "TEXT": f_text,
+}
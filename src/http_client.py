@@ -0,0 +1,206 @@
+"""
+Cliente HTTP compartilhado para as APIs externas (BACEN, IBGE)
+
+- Uma requests.Session por processo: conexões keep-alive reaproveitadas
+  (pool por host) em vez de um handshake TCP/TLS a cada consulta
+- Retentativa com backoff exponencial e jitter ("full jitter") para erros de
+  rede, timeouts e respostas 429/5xx; Retry-After é respeitado quando vem
+- Limite de requisições simultâneas por host (não sobrecarrega a API quando
+  várias séries são buscadas em paralelo)
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Mapping, Optional, TypeVar
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Respostas que valem nova tentativa
+STATUS_RETENTAVEIS = frozenset({429, 500, 502, 503, 504})
+
+
+class HttpClient:
+    """
+    GET com pool de conexões, retentativas e limite por host
+
+    Uso:
+        resposta = obter_http_client().get(url, params={...}, timeout=10)
+        resposta.raise_for_status()
+
+    Exceções são as do requests (Timeout, ConnectionError...), então quem
+    já tratava requests.get continua igual
+    """
+
+    def __init__(
+        self,
+        max_por_host: int = 4,
+        tentativas: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        pool_conexoes: int = 10,
+        dormir: Callable[[float], None] = time.sleep,
+        aleatorio: Callable[[], float] = random.random
+    ):
+        """
+        Args:
+            max_por_host: Requisições simultâneas por host
+            tentativas: Total de tentativas por requisição (1 = sem retentativa)
+            backoff_base: Espera base em segundos (dobra a cada tentativa)
+            backoff_max: Teto da espera entre tentativas
+            pool_conexoes: Conexões mantidas abertas por host
+            dormir / aleatorio: Injeção para testes
+        """
+        self.max_por_host = max(1, max_por_host)
+        self.tentativas = max(1, tentativas)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._dormir = dormir
+        self._aleatorio = aleatorio
+
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=pool_conexoes, pool_maxsize=max(pool_conexoes, self.max_por_host))
+        self.sessao.mount("http://", adaptador)
+        self.sessao.mount("https://", adaptador)
+
+        self._hosts: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self.requisicoes = 0
+        self.retentativas = 0
+        self.falhas = 0
+
+    def _semaforo(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.max_por_host)
+            return self._hosts[host]
+
+    def espera(self, tentativa: int, resposta: Optional[requests.Response] = None) -> float:
+        """Segundos antes da próxima tentativa (tentativa = 1 após a primeira falha)"""
+        if resposta is not None:
+            retry_after = resposta.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        teto = min(self.backoff_max, self.backoff_base * 2 ** (tentativa - 1))
+        return teto * self._aleatorio()
+
+    def get(
+        self,
+        url: str,
+        params: Optional[Mapping[str, Any]] = None,
+        timeout: float = 10,
+        tentativas: Optional[int] = None
+    ) -> requests.Response:
+        """
+        GET com retentativas
+
+        Args:
+            tentativas: Sobrescreve o total de tentativas (ex: 1 para health check)
+
+        Returns:
+            Última resposta (pode ser 4xx/5xx - o chamador decide com raise_for_status)
+
+        Raises:
+            requests.exceptions.RequestException: erro de rede na última tentativa
+        """
+        total = max(1, tentativas or self.tentativas)
+        semaforo = self._semaforo(url)
+
+        for tentativa in range(1, total + 1):
+            resposta = None
+            # O limite vale só enquanto a requisição está em voo (não durante o backoff)
+            with semaforo:
+                with self._lock:
+                    self.requisicoes += 1
+                try:
+                    resposta = self.sessao.get(url, params=params, timeout=timeout)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if tentativa == total:
+                        with self._lock:
+                            self.falhas += 1
+                        raise
+                    logger.warning(f"⚠️ {urlsplit(url).netloc}: {type(e).__name__} (tentativa {tentativa}/{total})")
+
+            if resposta is not None:
+                if resposta.status_code not in STATUS_RETENTAVEIS or tentativa == total:
+                    if resposta.status_code >= 400:
+                        with self._lock:
+                            self.falhas += 1
+                    return resposta
+                logger.warning(
+                    f"⚠️ {urlsplit(url).netloc}: HTTP {resposta.status_code} (tentativa {tentativa}/{total})"
+                )
+                resposta.close()
+
+            with self._lock:
+                self.retentativas += 1
+            self._dormir(self.espera(tentativa, resposta))
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requisicoes": self.requisicoes,
+                "retentativas": self.retentativas,
+                "falhas": self.falhas,
+                "hosts": sorted(self._hosts),
+                "max_por_host": self.max_por_host,
+            }
+
+    def fechar(self):
+        self.sessao.close()
+
+
+def executar_em_paralelo(tarefas: Mapping[str, Callable[[], T]], max_workers: Optional[int] = None) -> Dict[str, T]:
+    """
+    Executa as tarefas em threads e devolve {nome: resultado} na ordem recebida
+    (o limite por host do HttpClient segura a carga em cada API)
+
+    Raises:
+        A primeira exceção de uma tarefa, depois que todas terminam
+    """
+    if not tarefas:
+        return {}
+    with ThreadPoolExecutor(max_workers=max_workers or len(tarefas), thread_name_prefix="http") as pool:
+        futuros = {nome: pool.submit(tarefa) for nome, tarefa in tarefas.items()}
+    return {nome: futuro.result() for nome, futuro in futuros.items()}
+
+
+# Instância global (por processo)
+_http_client: Optional[HttpClient] = None
+_http_client_lock = threading.Lock()
+
+
+# Funções auxiliares para uso direto
+def obter_http_client() -> HttpClient:
+    """Cliente compartilhado (HTTP_* no config)"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                try:
+                    from config import HTTP_BACKOFF_BASE, HTTP_MAX_PER_HOST, HTTP_RETRIES
+                except ImportError:  # importado como src.<módulo>
+                    from src.config import HTTP_BACKOFF_BASE, HTTP_MAX_PER_HOST, HTTP_RETRIES
+                _http_client = HttpClient(
+                    max_por_host=HTTP_MAX_PER_HOST,
+                    tentativas=HTTP_RETRIES,
+                    backoff_base=HTTP_BACKOFF_BASE,
+                )
+    return _http_client
+
+
+def encerrar_http_client():
+    """Fecha as conexões do pool (shutdown da API)"""
+    global _http_client
+    with _http_client_lock:
+        cliente, _http_client = _http_client, None
+    if cliente is not None:
+        cliente.fechar()
@@ -4,12 +4,21 @@ Permite buscar taxas de IPCA e IPCA-E atualizadas dinamicamente
 """
 
 import requests
-import json
 import logging
-from datetime import date, datetime
+import threading
+from datetime import date
 from typing import Optional, List, Dict
 from pathlib import Path
 
+try:
+    from http_client import obter_http_client
+    from indice_fatores import IndicesTaxas
+    from series_store import obter_series_store
+except ImportError:  # importado como src.<módulo> (taxas_completo_validator)
+    from src.http_client import obter_http_client
+    from src.indice_fatores import IndicesTaxas
+    from src.series_store import obter_series_store
+
 logger = logging.getLogger(__name__)
 
 
@@ -35,17 +44,21 @@ class IbgeService:
         "IPCA-E": "7060"
     }
     
-    def __init__(self, cache_dir: str = "data/cache", timeout: int = 10):
+    def __init__(self, cache_dir: str = "data/cache", timeout: int = 10, base_url: str = None):
         """
         Inicializa serviço IBGE
         
         Args:
             cache_dir: Diretório para armazenar cache local
             timeout: Timeout para requisições HTTP (segundos)
+            base_url: URL base da API de agregados
         """
-        self.base_url = "https://servicodados.ibge.gov.br/api/v3/agregados"
+        self.base_url = (base_url or "https://servicodados.ibge.gov.br/api/v3/agregados").rstrip('/')
         self.cache_dir = Path(cache_dir)
+        self.series = obter_series_store(self.cache_dir)
+        self.indices = IndicesTaxas(self.series)
         self.timeout = timeout
+        self.http = obter_http_client()  # conexões reaproveitadas + retentativas
         
         logger.info("IbgeService inicializado")
     
@@ -119,53 +132,31 @@ class IbgeService:
                 logger.error(f"Taxa desconhecida: {taxa_nome}")
                 return None
             
-            # Verificar cache primeiro
+            # Verificar cache primeiro: período coberto é respondido localmente
+            lacunas = [(data_inicio, data_fim)]
             if usar_cache:
                 cached_data = self._ler_cache(taxa_nome, data_inicio, data_fim)
                 if cached_data:
                     logger.info(f"Dados {taxa_nome} carregados do cache ({len(cached_data)} registros)")
                     return cached_data
+                # Só as partes do período que ainda não estão no histórico
+                lacunas = self.series.lacunas(taxa_nome, data_inicio, data_fim) or lacunas
             
-            # Formatar período para API (YYYYMM-YYYYMM)
-            periodo_inicio = data_inicio.strftime("%Y%m")
-            periodo_fim = data_fim.strftime("%Y%m")
-            periodo_str = f"{periodo_inicio}-{periodo_fim}"
-            
-            # Montar URL
-            # Estrutura: /agregacao/periodos/YYYYMM-YYYYMM/variaveis/63?localidades=N1[all]
-            # Variável 63 = Variação mensal (%)
-            # N1[all] = Brasil
-            url = f"{self.base_url}/{agregacao}/periodos/{periodo_str}/variaveis/63"
-            params = {
-                "localidades": "N1[all]"
-            }
-            
-            logger.info(f"Buscando {taxa_nome} de {data_inicio.strftime('%m/%Y')} a {data_fim.strftime('%m/%Y')}...")
-            
-            # Fazer requisição
-            response = requests.get(url, params=params, timeout=self.timeout)
-            response.raise_for_status()
-            
-            # Processar resposta (estrutura complexa do IBGE)
-            dados_json = response.json()
-            
-            if not dados_json or len(dados_json) == 0:
-                logger.warning(f"Nenhum dado {taxa_nome} retornado para o período")
-                return None
+            dados_processados = []
+            for lacuna_inicio, lacuna_fim in lacunas:
+                novos = self._consultar_api(taxa_nome, agregacao, lacuna_inicio, lacuna_fim)
+                # Salvar no cache (mesmo vazio: o intervalo fica marcado como consultado)
+                self._salvar_cache(taxa_nome, novos, lacuna_inicio, lacuna_fim)
+                dados_processados.extend(novos)
             
-            # Extrair dados da estrutura do IBGE
-            # Formato: [{"resultados": [{"series": [{"serie": {"YYYYMM": "valor"}}]}]}]
-            dados_processados = self._processar_resposta_ibge(dados_json)
+            if usar_cache and lacunas != [(data_inicio, data_fim)]:
+                # Parte veio do histórico local, parte da API
+                dados_processados = self.series.registros(taxa_nome, data_inicio, data_fim)
             
             if not dados_processados:
-                logger.warning(f"Não foi possível processar dados {taxa_nome}")
+                logger.warning(f"Nenhum dado {taxa_nome} retornado para o período")
                 return None
             
-            logger.info(f"✅ {len(dados_processados)} taxas {taxa_nome} obtidas da API IBGE")
-            
-            # Salvar no cache
-            self._salvar_cache(taxa_nome, dados_processados, data_inicio, data_fim)
-            
             return dados_processados
             
         except requests.exceptions.Timeout:
@@ -180,6 +171,51 @@ class IbgeService:
             logger.error(f"Erro inesperado ao buscar {taxa_nome}: {e}", exc_info=True)
             return self._usar_fallback(taxa_nome)
     
+    def fator_acumulado(self, taxa_nome: str, data_inicio: date, data_fim: date) -> Optional[float]:
+        """
+        Fator acumulado de IPCA/IPCA-E das competências de data_inicio a data_fim
+        (razão entre os números-índice encadeados)
+        
+        Returns:
+            ∏(1 + variação/100) dos meses do período (ex: 1.0483)
+            None se falta alguma competência
+        """
+        try:
+            if not self._buscar_taxa_periodo(taxa_nome, data_inicio, data_fim):
+                return None
+            return self.indices.fator(taxa_nome, data_inicio, data_fim)
+        except Exception as e:
+            logger.error(f"Erro ao calcular fator acumulado {taxa_nome}: {e}")
+            return None
+    
+    def _consultar_api(self, taxa_nome: str, agregacao: str, data_inicio: date, data_fim: date) -> List[Dict]:
+        """Busca um intervalo na API IBGE (erros de rede sobem para o chamador)"""
+        # Formatar período para API (YYYYMM-YYYYMM)
+        periodo_inicio = data_inicio.strftime("%Y%m")
+        periodo_fim = data_fim.strftime("%Y%m")
+        periodo_str = f"{periodo_inicio}-{periodo_fim}"
+        
+        # Montar URL
+        # Estrutura: /agregacao/periodos/YYYYMM-YYYYMM/variaveis/63?localidades=N1[all]
+        # Variável 63 = Variação mensal (%)
+        # N1[all] = Brasil
+        url = f"{self.base_url}/{agregacao}/periodos/{periodo_str}/variaveis/63"
+        params = {
+            "localidades": "N1[all]"
+        }
+        
+        logger.info(f"Buscando {taxa_nome} de {data_inicio.strftime('%m/%Y')} a {data_fim.strftime('%m/%Y')}...")
+        
+        # Fazer requisição
+        response = self.http.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        
+        # Extrair dados da estrutura do IBGE
+        # Formato: [{"resultados": [{"series": [{"serie": {"YYYYMM": "valor"}}]}]}]
+        dados_processados = self._processar_resposta_ibge(response.json() or [])
+        logger.info(f"✅ {len(dados_processados)} taxas {taxa_nome} obtidas da API IBGE")
+        return dados_processados
+    
     def _processar_resposta_ibge(self, dados_json: List[Dict]) -> List[Dict]:
         """
         Processa a resposta complexa da API do IBGE
@@ -253,75 +289,32 @@ class IbgeService:
             return []
     
     def _ler_cache(self, taxa_nome: str, data_inicio: date, data_fim: date) -> Optional[List[Dict]]:
-        """Lê dados do cache local se disponível e dentro do período"""
+        """Lê dados do histórico local se o período estiver inteiramente coberto"""
         try:
-            cache_file = self.cache_dir / f"{taxa_nome.lower().replace('-', '_')}_cache.json"
-            if not cache_file.exists():
-                return None
-            
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cache = json.load(f)
-            
-            # Verificar se cache cobre o período solicitado
-            cache_inicio = datetime.strptime(cache['data_inicio'], '%Y-%m-%d').date()
-            cache_fim = datetime.strptime(cache['data_fim'], '%Y-%m-%d').date()
-            
-            if cache_inicio <= data_inicio and cache_fim >= data_fim:
-                # Filtrar dados do período
-                dados_filtrados = []
-                for d in cache['dados']:
-                    # Converter MM/YYYY para date
-                    mes, ano = d['data'].split('/')
-                    data_registro = date(int(ano), int(mes), 1)
-                    
-                    if data_inicio <= data_registro <= data_fim:
-                        dados_filtrados.append(d)
-                
-                return dados_filtrados if dados_filtrados else None
-            
-            return None
-            
+            return self.series.consultar(taxa_nome, data_inicio, data_fim) or None
         except Exception as e:
             logger.debug(f"Cache {taxa_nome} não disponível: {e}")
             return None
     
     def _salvar_cache(self, taxa_nome: str, dados: List[Dict], data_inicio: date, data_fim: date):
-        """Salva dados no cache local"""
+        """Mescla os dados buscados no histórico local"""
         try:
-            # Criar diretório se não existir
-            self.cache_dir.mkdir(parents=True, exist_ok=True)
-            
-            cache_file = self.cache_dir / f"{taxa_nome.lower().replace('-', '_')}_cache.json"
-            cache = {
-                'taxa': taxa_nome,
-                'data_inicio': data_inicio.strftime('%Y-%m-%d'),
-                'data_fim': data_fim.strftime('%Y-%m-%d'),
-                'atualizado_em': datetime.now().isoformat(),
-                'dados': dados
-            }
-            
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache, f, ensure_ascii=False, indent=2)
-            
-            logger.debug(f"Cache {taxa_nome} salvo: {len(dados)} registros")
-            
+            novos = self.series.mesclar(taxa_nome, dados, data_inicio, data_fim)
+            logger.debug(f"Cache {taxa_nome} salvo: {len(dados)} registros ({novos} novos)")
         except Exception as e:
             logger.warning(f"Erro ao salvar cache {taxa_nome}: {e}")
     
     def _usar_fallback(self, taxa_nome: str) -> Optional[List[Dict]]:
         """
-        Usa cache local como fallback quando API falha
+        Usa o histórico local como fallback quando API falha
         """
         logger.warning(f"⚠️ API IBGE indisponível para {taxa_nome}. Tentando usar cache local...")
         
         try:
-            cache_file = self.cache_dir / f"{taxa_nome.lower().replace('-', '_')}_cache.json"
-            if cache_file.exists():
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cache = json.load(f)
-                
-                logger.info(f"✅ Usando cache {taxa_nome} local ({len(cache['dados'])} registros)")
-                return cache['dados']
+            dados = self.series.todos(taxa_nome)
+            if dados:
+                logger.info(f"✅ Usando cache {taxa_nome} local ({len(dados)} registros)")
+                return dados
         
         except Exception as e:
             logger.error(f"Erro ao ler cache fallback {taxa_nome}: {e}")
@@ -351,7 +344,7 @@ class IbgeService:
             url = f"{self.base_url}/{agregacao}/periodos/{periodo_str}/variaveis/63"
             params = {"localidades": "N1[all]"}
             
-            response = requests.get(url, params=params, timeout=5)
+            response = self.http.get(url, params=params, timeout=5, tentativas=1)
             response.raise_for_status()
             
             logger.info(f"✅ API IBGE disponível para {taxa_nome}")
@@ -362,7 +355,22 @@ class IbgeService:
             return False
 
 
+# Instância compartilhada (histórico, índice de fatores e conexões reaproveitados)
+_ibge_service: Optional[IbgeService] = None
+_ibge_service_lock = threading.Lock()
+
+
 # Funções auxiliares para uso direto
+def obter_ibge_service() -> IbgeService:
+    """Serviço IBGE do processo (criado no primeiro uso)"""
+    global _ibge_service
+    if _ibge_service is None:
+        with _ibge_service_lock:
+            if _ibge_service is None:
+                _ibge_service = IbgeService()
+    return _ibge_service
+
+
 def obter_ipca_atualizado(data_inicio: date, data_fim: date) -> Optional[List[Dict]]:
     """
     Atalho para buscar IPCA atualizado
@@ -374,8 +382,7 @@ def obter_ipca_atualizado(data_inicio: date, data_fim: date) -> Optional[List[Di
     Returns:
         Lista de taxas IPCA mensais
     """
-    service = IbgeService()
-    return service.buscar_ipca_periodo(data_inicio, data_fim)
+    return obter_ibge_service().buscar_ipca_periodo(data_inicio, data_fim)
 
 
 def obter_ipca_e_atualizado(data_inicio: date, data_fim: date) -> Optional[List[Dict]]:
@@ -389,5 +396,4 @@ def obter_ipca_e_atualizado(data_inicio: date, data_fim: date) -> Optional[List[
     Returns:
         Lista de taxas IPCA-E mensais
     """
-    service = IbgeService()
-    return service.buscar_ipca_e_periodo(data_inicio, data_fim)
+    return obter_ibge_service().buscar_ipca_e_periodo(data_inicio, data_fim)
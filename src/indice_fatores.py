@@ -0,0 +1,251 @@
+"""
+Índice de fatores acumulados das séries de taxas (produtos prefixados)
+
+Para cada série guarda acumulado[k] = ∏ (1 + taxa/100) dos k primeiros
+registros, de modo que o fator entre quaisquer duas datas é uma divisão
+(acumulado[fim] / acumulado[inicio]) - sem laço sobre as taxas a cada consulta
+
+- SELIC: fatores diários (chave = dia)
+- TR, IPCA, IPCA-E: número-índice mensal encadeado (chave = competência)
+
+O índice acompanha o histórico local (series_store): quando a série recebe
+registros novos no fim, só eles são acrescentados ao acumulado; qualquer
+outra mudança (revisão de valor antigo, lacuna preenchida) reconstrói a série
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def competencia(data: date) -> int:
+    """Competência como inteiro contínuo (ano * 12 + mês - 1)"""
+    return data.year * 12 + data.month - 1
+
+
+@dataclass(frozen=True)
+class _Instantaneo:
+    """
+    Conteúdo de um IndiceFatores num instante (arrays somente leitura)
+
+    acumulado[0] = 1; acumulado[k] = fator dos registros 0..k-1
+    """
+    chaves: np.ndarray
+    taxas: np.ndarray
+    acumulado: np.ndarray
+
+
+def _somente_leitura(vetor: np.ndarray) -> np.ndarray:
+    vetor.flags.writeable = False
+    return vetor
+
+
+class IndiceFatores:
+    """
+    Produtos prefixados de uma série
+
+    Leitores não usam lock: cada mudança monta vetores novos e publica um
+    _Instantaneo numa única atribuição; as consultas leem só o instantâneo que pegaram
+
+    Args:
+        nome: Nome da série
+        diario: True = chave é o dia (date.toordinal); False = competência mensal
+    """
+
+    def __init__(self, nome: str, diario: bool):
+        self.nome = nome
+        self.diario = diario
+        self._atual = _Instantaneo(
+            _somente_leitura(np.empty(0, dtype=np.int64)),
+            _somente_leitura(np.empty(0, dtype=np.float64)),
+            _somente_leitura(np.ones(1, dtype=np.float64)),
+        )
+        # (instantâneo, totais mensais dele) - materializado na primeira consulta
+        self._mensais: Tuple[Optional[_Instantaneo], Dict[int, float]] = (None, {})
+
+    def __len__(self) -> int:
+        return len(self._atual.chaves)
+
+    def anexar(self, chaves: np.ndarray, taxas: np.ndarray):
+        """
+        Acrescenta registros posteriores ao último (chaves crescentes, taxas em %)
+        Um escritor por vez (IndicesTaxas chama com o lock)
+        """
+        if not len(chaves):
+            return
+        atual = self._atual
+        if len(atual.chaves) and chaves[0] <= atual.chaves[-1]:
+            raise ValueError(f"{self.nome}: registros fora de ordem ({chaves[0]} <= {atual.chaves[-1]})")
+        taxas = np.asarray(taxas, dtype=np.float64)
+        novos = atual.acumulado[-1] * np.cumprod(1.0 + taxas / 100.0)
+        self._atual = _Instantaneo(
+            _somente_leitura(np.concatenate([atual.chaves, np.asarray(chaves, dtype=np.int64)])),
+            _somente_leitura(np.concatenate([atual.taxas, taxas])),
+            _somente_leitura(np.concatenate([atual.acumulado, novos])),
+        )
+
+    def estende(self, chaves: np.ndarray, taxas: np.ndarray) -> bool:
+        """True se (chaves, taxas) é o conteúdo atual com registros a mais no fim"""
+        atual = self._atual
+        n = len(atual.chaves)
+        return (
+            len(chaves) >= n
+            and np.array_equal(chaves[:n], atual.chaves)
+            and np.array_equal(taxas[:n], atual.taxas)
+        )
+
+    def fator(self, inicio: int, fim: int) -> Optional[float]:
+        """
+        Fator acumulado dos registros com chave em [inicio, fim]
+
+        Returns:
+            None se não há registro no intervalo ou, na série mensal, se falta
+            alguma competência (o encadeamento ficaria errado)
+        """
+        vetores = self._atual
+        i = int(np.searchsorted(vetores.chaves, inicio, side="left"))
+        j = int(np.searchsorted(vetores.chaves, fim, side="right"))
+        if j <= i:
+            return None
+        if not self.diario and j - i != fim - inicio + 1:
+            return None
+        return float(vetores.acumulado[j] / vetores.acumulado[i])
+
+    def totais_mensais(self) -> Dict[int, float]:
+        """
+        {competência: % no mês} de todos os meses da série
+        Materializado na primeira consulta após cada mudança
+        """
+        vetores = self._atual
+        origem, mensais = self._mensais
+        if origem is vetores:
+            return mensais
+
+        if not self.diario:
+            mensais = {int(c): float(t) for c, t in zip(vetores.chaves, vetores.taxas)}
+        else:
+            meses = np.fromiter(
+                (competencia(date.fromordinal(int(c))) for c in vetores.chaves),
+                dtype=np.int64, count=len(vetores.chaves)
+            )
+            # Início de cada mês no vetor; o fim é o início do seguinte
+            inicios = np.flatnonzero(np.r_[True, meses[1:] != meses[:-1]]) if len(meses) else np.empty(0, np.int64)
+            fins = np.r_[inicios[1:], len(meses)]
+            totais = (vetores.acumulado[fins] / vetores.acumulado[inicios] - 1.0) * 100.0
+            mensais = {int(meses[i]): float(t) for i, t in zip(inicios, totais)}
+        self._mensais = (vetores, mensais)
+        return mensais
+
+
+def _diarias(conteudo: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """SELIC: vetores já convertidos pelo store (dia ordinal, %) - sem reparse das datas"""
+    chaves = np.array(conteudo["datas"], dtype=np.int64)
+    taxas = np.array(conteudo["valores"], dtype=np.float64)
+    validos = ~np.isnan(taxas)
+    return chaves[validos], taxas[validos]
+
+
+def _mensais(conteudo: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """IPCA / IPCA-E: {"data": "MM/YYYY", "valor": %} -> (competência, %)"""
+    taxas = {}
+    for d in conteudo["dados"]:
+        mes, ano = d["data"].split("/")
+        taxas[int(ano) * 12 + int(mes) - 1] = float(d["valor"])
+    return _vetores(taxas)
+
+
+def _mensais_tr(conteudo: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """TR: a taxa da competência é a de referência dia 1 -> dia 1 do mês seguinte"""
+    taxas = {}
+    for d in conteudo["dados"]:
+        inicio = datetime.strptime(d["data"], "%d/%m/%Y").date()
+        fim = datetime.strptime(d.get("dataFim", d["data"]), "%d/%m/%Y").date()
+        if inicio.day == 1 and fim.day == 1 and fim > inicio:
+            taxas[competencia(inicio)] = float(d["valor"])
+    return _vetores(taxas)
+
+
+def _vetores(taxas: Dict[int, float]) -> Tuple[np.ndarray, np.ndarray]:
+    chaves = sorted(taxas)
+    return (
+        np.fromiter(chaves, dtype=np.int64, count=len(chaves)),
+        np.fromiter((taxas[c] for c in chaves), dtype=np.float64, count=len(chaves)),
+    )
+
+
+@dataclass(frozen=True)
+class _Formato:
+    diario: bool
+    leitor: Callable[[Dict[str, Any]], Tuple[np.ndarray, np.ndarray]]
+
+
+FORMATOS = {
+    "SELIC": _Formato(True, _diarias),
+    "TR": _Formato(False, _mensais_tr),
+    "IPCA": _Formato(False, _mensais),
+    "IPCA-E": _Formato(False, _mensais),
+}
+
+
+class IndicesTaxas:
+    """
+    Índices de fatores das séries de um SeriesStore, atualizados sob demanda
+
+    Cada consulta confere se o histórico mudou (o store devolve o mesmo objeto
+    enquanto o arquivo não muda); se mudou só no fim, anexa; senão reconstrói
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._indices: Dict[str, Tuple[Any, IndiceFatores]] = {}
+        self._lock = threading.Lock()
+        self.reconstrucoes = 0
+        self.anexacoes = 0
+
+    def indice(self, nome: str) -> IndiceFatores:
+        formato = FORMATOS[nome]
+        conteudo = self.store.ler(nome)
+        with self._lock:
+            origem, indice = self._indices.get(nome, (None, None))
+            if indice is not None and origem is conteudo:
+                return indice
+
+            chaves, taxas = formato.leitor(conteudo)
+            if indice is not None and indice.estende(chaves, taxas):
+                if len(chaves) > len(indice):
+                    indice.anexar(chaves[len(indice):], taxas[len(indice):])
+                    self.anexacoes += 1
+            else:
+                indice = IndiceFatores(nome, formato.diario)
+                indice.anexar(chaves, taxas)
+                self.reconstrucoes += 1
+                logger.debug(f"Índice {nome} reconstruído: {len(indice)} registros")
+            self._indices[nome] = (conteudo, indice)
+            return indice
+
+    def fator(self, nome: str, inicio: date, fim: date) -> Optional[float]:
+        """
+        Fator acumulado de inicio a fim (inclusive)
+        Séries mensais: competências de inicio a fim (o mês inicial entra)
+        """
+        indice = self.indice(nome)
+        if indice.diario:
+            return indice.fator(inicio.toordinal(), fim.toordinal())
+        return indice.fator(competencia(inicio), competencia(fim))
+
+    def total_mensal(self, nome: str, mes: int) -> Optional[float]:
+        """Taxa acumulada no mês em % (mes = competência)"""
+        return self.indice(nome).totais_mensais().get(mes)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "series": {nome: len(indice) for nome, (_, indice) in self._indices.items()},
+                "reconstrucoes": self.reconstrucoes,
+                "anexacoes": self.anexacoes,
+            }
@@ -0,0 +1,288 @@
+"""
+Cálculos assíncronos (/api/jobs)
+POST devolve um job_id na hora; o cálculo roda no pool de cálculos e o cliente
+acompanha status, etapa e progresso por GET até o resultado final
+
+O estado de cada job fica no store de resultados (tabela jobs), então qualquer
+worker do uvicorn responde pelo job e o cancelamento pedido em um worker chega
+ao cálculo que roda em outro. Sem store, os jobs vivem só na memória do processo
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from calc_executor import CalcExecutor, obter_calc_executor
+from models import CalculadoraInput, CalculadoraOutput, JobStatus
+from result_store import JOB_STATUS_FINAIS, ResultStore, obter_result_store
+from single_flight import ExecucaoCancelada
+
+logger = logging.getLogger(__name__)
+
+
+class CalculoCancelado(ExecucaoCancelada):
+    """Job cancelado enquanto o cálculo rodava (levantada na próxima etapa)"""
+
+
+class ProgressoJob:
+    """
+    Callback de progresso que grava no store e verifica o pedido de cancelamento
+
+    Serializável: no modo process roda dentro do processo filho, que abre o
+    próprio store (o arquivo SQLite é o mesmo)
+    """
+
+    def __init__(self, job_id: str, criado_em: float):
+        self.job_id = job_id
+        self.criado_em = criado_em
+
+    def __call__(self, etapa: str, progresso: int):
+        store = obter_result_store()
+        if store is None:
+            return
+        if store.cancelamento_pedido(self.job_id):
+            raise CalculoCancelado(f"Job {self.job_id} cancelado")
+        store.salvar_job({
+            "job_id": self.job_id,
+            "status": "executando",
+            "etapa": etapa,
+            "progresso": progresso,
+            "criado_em": self.criado_em,
+            "atualizado_em": time.time(),
+        })
+
+
+class Job:
+    """Estado de um job na memória do processo que o criou"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.status = "pendente"
+        self.etapa: Optional[str] = None
+        self.progresso = 0
+        self.erro: Optional[str] = None
+        self.run_id: Optional[str] = None
+        self.resultado: Optional[CalculadoraOutput] = None
+        self.criado_em = time.time()
+        self.atualizado_em = self.criado_em
+        self.cancelar = False
+        self.futuro: Optional[Future] = None
+        self.lock = threading.Lock()
+
+    @property
+    def encerrado(self) -> bool:
+        return self.status in JOB_STATUS_FINAIS
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "etapa": self.etapa,
+            "progresso": self.progresso,
+            "erro": self.erro,
+            "run_id": self.run_id,
+            "criado_em": self.criado_em,
+            "atualizado_em": self.atualizado_em,
+        }
+
+
+class JobManager:
+    """
+    Cria, acompanha e cancela jobs de cálculo
+
+    Thread-safe: o progresso chega das threads do pool e as consultas do event loop
+    """
+
+    def __init__(self, executor: CalcExecutor, store: Optional[ResultStore], retencao_horas: float = 24):
+        """
+        Args:
+            executor: Pool de cálculos (o job ocupa uma vaga como qualquer cálculo)
+            store: Store de resultados (None = jobs só em memória)
+            retencao_horas: Jobs encerrados há mais tempo saem da memória (0 = sem limite)
+        """
+        self.executor = executor
+        self.store = store
+        self.retencao_horas = retencao_horas
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def criar(self, inputs: CalculadoraInput) -> JobStatus:
+        """
+        Enfileira o cálculo e devolve o job pendente
+
+        Raises:
+            FilaCheiaError: pool e fila ocupados (nenhum job é criado)
+        """
+        self._limpar_expirados()
+        job = Job(str(uuid.uuid4()))
+
+        if self.executor.modo == "process":
+            # O callback roda no processo filho e só enxerga o store
+            progresso = ProgressoJob(job.job_id, job.criado_em) if self.store is not None else None
+        else:
+            progresso = lambda etapa, percentual: self._progresso(job, etapa, percentual)
+
+        with job.lock:
+            job.futuro = self.executor.iniciar_calculo(inputs, progresso)
+            self._persistir(job)
+        with self._lock:
+            self._jobs[job.job_id] = job
+
+        job.futuro.add_done_callback(lambda futuro: self._finalizar(job, futuro))
+        logger.info(f"📋 Job {job.job_id} criado ({inputs.municipio})")
+        return self._status(job.como_dict(), job.resultado)
+
+    def obter(self, job_id: str) -> Optional[JobStatus]:
+        """Estado do job (None se não existe ou já expirou)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+
+        if job is not None:
+            with job.lock:
+                dados, resultado = job.como_dict(), job.resultado
+            # No modo process o progresso é gravado pelo processo filho direto no store
+            if not job.encerrado and self.store is not None:
+                gravado = self.store.obter_job(job_id)
+                if gravado and gravado["status"] not in JOB_STATUS_FINAIS and gravado["progresso"] > dados["progresso"]:
+                    dados.update(status=gravado["status"], etapa=gravado["etapa"],
+                                 progresso=gravado["progresso"], atualizado_em=gravado["atualizado_em"])
+            return self._status(dados, resultado)
+
+        # Job criado por outro worker (ou antes de um reinício)
+        if self.store is None:
+            return None
+        dados = self.store.obter_job(job_id)
+        if dados is None:
+            return None
+        resultado = None
+        if dados["status"] == "concluido" and dados["run_id"]:
+            resultado = self.store.obter_por_run_id(dados["run_id"])
+        return self._status(dados, resultado)
+
+    def cancelar(self, job_id: str) -> Optional[JobStatus]:
+        """
+        Cancela o job: se ainda está na fila sai sem rodar; se está rodando
+        para na próxima etapa do cálculo
+
+        Returns:
+            Estado do job após o pedido (None se não existe)
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+
+        if self.store is not None:
+            self.store.pedir_cancelamento(job_id)
+
+        if job is not None:
+            with job.lock:
+                if not job.encerrado:
+                    job.cancelar = True
+                    futuro = job.futuro
+                else:
+                    futuro = None
+            if futuro is not None and futuro.cancel():
+                logger.info(f"🛑 Job {job_id} cancelado antes de iniciar")
+            elif futuro is not None:
+                logger.info(f"🛑 Cancelamento do job {job_id} pedido - para na próxima etapa")
+
+        return self.obter(job_id)
+
+    def _progresso(self, job: Job, etapa: str, percentual: int):
+        """Callback do cálculo (modo thread): atualiza o job ou interrompe se cancelado"""
+        with job.lock:
+            cancelar = job.cancelar
+        if not cancelar and self.store is not None:
+            cancelar = self.store.cancelamento_pedido(job.job_id)
+        if cancelar:
+            raise CalculoCancelado(f"Job {job.job_id} cancelado")
+
+        with job.lock:
+            job.status = "executando"
+            job.etapa = etapa
+            job.progresso = percentual
+            job.atualizado_em = time.time()
+            self._persistir(job)
+
+    def _finalizar(self, job: Job, futuro: Future):
+        """Done-callback do Future: registra resultado, erro ou cancelamento"""
+        with job.lock:
+            if futuro.cancelled():
+                job.status = "cancelado"
+            else:
+                erro = futuro.exception()
+                if isinstance(erro, ExecucaoCancelada):
+                    job.status = "cancelado"
+                elif erro is not None:
+                    job.status = "erro"
+                    job.erro = str(erro)
+                else:
+                    job.resultado = self.executor.converter_resultado(futuro.result())
+                    job.run_id = job.resultado.run_id
+                    job.status = "concluido"
+                    job.etapa = "concluido"
+                    job.progresso = 100
+            job.atualizado_em = time.time()
+            job.futuro = None
+            self._persistir(job)
+
+        logger.info(f"📋 Job {job.job_id}: {job.status}")
+
+    def _persistir(self, job: Job):
+        """Grava o estado no store (chamado com job.lock - gravações do mesmo job em ordem)"""
+        if self.store is not None:
+            self.store.salvar_job(job.como_dict())
+
+    def _limpar_expirados(self):
+        if not self.retencao_horas:
+            return
+        limite = time.time() - self.retencao_horas * 3600
+        with self._lock:
+            for job_id in [j.job_id for j in self._jobs.values() if j.encerrado and j.atualizado_em < limite]:
+                del self._jobs[job_id]
+
+    @staticmethod
+    def _status(dados: Dict[str, Any], resultado: Optional[CalculadoraOutput]) -> JobStatus:
+        return JobStatus(
+            job_id=dados["job_id"],
+            status=dados["status"],
+            etapa=dados["etapa"],
+            progresso=dados["progresso"],
+            criado_em=datetime.fromtimestamp(dados["criado_em"]),
+            atualizado_em=datetime.fromtimestamp(dados["atualizado_em"]),
+            erro=dados["erro"],
+            resultado=resultado,
+        )
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            por_status: Dict[str, int] = {}
+            for job in self._jobs.values():
+                por_status[job.status] = por_status.get(job.status, 0) + 1
+            return {"jobs": len(self._jobs), "por_status": por_status}
+
+
+# Instância global (por processo da API)
+_job_manager: Optional[JobManager] = None
+_job_manager_lock = threading.Lock()
+
+
+# Funções auxiliares para uso direto
+def obter_job_manager() -> JobManager:
+    """Gerenciador de jobs do processo (pool de cálculos + store de resultados)"""
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                from config import JOBS_RETENTION_HOURS
+                _job_manager = JobManager(obter_calc_executor(), obter_result_store(), JOBS_RETENTION_HOURS)
+    return _job_manager
+
+
+def encerrar_job_manager():
+    """Descarta o gerenciador (o pool é encerrado por encerrar_calc_executor)"""
+    global _job_manager
+    with _job_manager_lock:
+        _job_manager = None
@@ -1,18 +1,32 @@
 """
 API REST com FastAPI
 """
+import json
 import logging
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.staticfiles import StaticFiles
+import re
+from typing import Annotated, Optional
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from models import CalculadoraInput, CalculadoraOutput, ErrorResponse
+from models import CalculadoraInput, CalculadoraOutput, ErrorResponse, JobStatus
 from calculator_service import CalculadoraService
+from workspace_manager import obter_workspace_manager
+from recalc_backends import PoolOcupadoError, encerrar_backends
+from result_store import encerrar_result_store, obter_result_store
+from result_cache import obter_cache_brutos, obter_result_cache
+from single_flight import obter_single_flight
+from calc_executor import FilaCheiaError, encerrar_calc_executor, obter_calc_executor
+from job_manager import encerrar_job_manager, obter_job_manager
+from run_events import Acompanhamento, RunIdEmUsoError, obter_eventos
+from rate_limiter import obter_rate_limiter
+from saude_upstream import encerrar_monitor_bacen, obter_monitor_bacen
+from http_client import encerrar_http_client, obter_http_client
+from static_assets import StaticAssets
+from calculo_lote import LoteInvalidoError, executar_lote, ler_csv, validar_lote
+from config import LOTE_CONCORRENCIA, LOTE_MAX_ITENS
 from datetime import datetime
 import csv
 import io
-from collections import defaultdict
-import time
 
 # Configurar logging
 logging.basicConfig(
@@ -37,40 +51,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Rate limiting simples
-rate_limit_storage = defaultdict(list)
-RATE_LIMIT = 10  # requisições
-RATE_WINDOW = 60  # segundos
+def _ip_cliente(request: Request) -> str:
+    return request.client.host if request.client else "desconhecido"
 
 
-def check_rate_limit(ip: str) -> bool:
-    """Verifica rate limit por IP"""
-    now = time.time()
-    # Limpar timestamps antigos
-    rate_limit_storage[ip] = [ts for ts in rate_limit_storage[ip] if now - ts < RATE_WINDOW]
-    
-    if len(rate_limit_storage[ip]) >= RATE_LIMIT:
-        return False
-    
-    rate_limit_storage[ip].append(now)
-    return True
+def _limite_excedido(decisao) -> JSONResponse:
+    """Resposta 429 com Retry-After da política que negou a requisição"""
+    return JSONResponse(
+        status_code=429,
+        content={
+            "error": "RateLimitExceeded",
+            "message": f"Muitas requisições. Tente novamente em {decisao.retry_after} segundos."
+        },
+        headers={
+            "Retry-After": str(decisao.retry_after),
+            "X-RateLimit-Limit": str(decisao.politica.limite),
+            "X-RateLimit-Remaining": "0",
+        }
+    )
 
 
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
-    """Middleware de rate limiting"""
-    client_ip = request.client.host
+    """Middleware de rate limiting (política por rota - ver rate_limiter.py)"""
+    decisao = obter_rate_limiter().verificar(_ip_cliente(request), request.method, request.url.path)
     
-    if not check_rate_limit(client_ip):
-        return JSONResponse(
-            status_code=429,
-            content={"error": "RateLimitExceeded", "message": "Muitas requisições. Tente novamente em 1 minuto."}
-        )
+    if not decisao.permitido:
+        return _limite_excedido(decisao)
     
     response = await call_next(request)
+    if decisao.politica is not None:
+        response.headers["X-RateLimit-Limit"] = str(decisao.politica.limite)
+        response.headers["X-RateLimit-Remaining"] = str(decisao.restante)
     return response
 
 
+@app.on_event("startup")
+async def carregar_template():
+    """Carrega o template Excel (e grafo de fórmulas) e limpa workspaces abandonados"""
+    CalculadoraService.aquecer()
+    obter_workspace_manager().limpar_antigos()
+    obter_result_store()  # abre o SQLite e inicia a compactação em segundo plano
+    obter_calc_executor()  # sobe o pool de cálculos
+    obter_monitor_bacen()  # saúde do BACEN verificada em segundo plano
+
+
+@app.on_event("shutdown")
+async def encerrar_recalculo():
+    """Fecha o pool de cálculos, instâncias de Excel/LibreOffice, o monitor do BACEN, as conexões HTTP e o store de resultados"""
+    encerrar_monitor_bacen()
+    encerrar_http_client()
+    encerrar_job_manager()
+    encerrar_calc_executor()
+    encerrar_backends()
+    encerrar_result_store()
+
+
 @app.get("/api/health")
 async def health():
     """Endpoint de health check"""
@@ -82,14 +118,25 @@ async def health():
     }
 
 
+# IDs de execução aceitos no header X-Run-Id (ex: UUID gerado no navegador)
+RUN_ID_VALIDO = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
 @app.post("/api/calcular", response_model=CalculadoraOutput, responses={
     400: {"model": ErrorResponse},
-    500: {"model": ErrorResponse}
+    409: {"model": ErrorResponse},
+    500: {"model": ErrorResponse},
+    503: {"model": ErrorResponse}
 })
-async def calcular(inputs: CalculadoraInput):
+async def calcular(inputs: CalculadoraInput, x_run_id: Annotated[Optional[str], Header()] = None):
     """
     Executa cálculo trabalhista
     
+    Header opcional **X-Run-Id**: ID da execução escolhido pelo cliente, para
+    acompanhar as etapas em GET /api/runs/{run_id}/events enquanto o cálculo roda.
+    Um ID em andamento ou com resultado gravado é recusado (409); um ID cuja
+    execução falhou pode ser reenviado
+    
     - **municipio**: Nome do município
     - **periodo_inicio**: Data de início (AAAA-MM-DD)
     - **periodo_fim**: Data de fim (AAAA-MM-DD)
@@ -104,11 +151,31 @@ async def calcular(inputs: CalculadoraInput):
     try:
         logger.info(f"Nova requisição de cálculo: {inputs.municipio}")
         
-        service = CalculadoraService()
-        result = service.calcular(inputs)
+        if x_run_id is not None and not RUN_ID_VALIDO.match(x_run_id):
+            raise ValueError("X-Run-Id inválido: use 8 a 64 caracteres entre letras, números, '-' e '_'")
+        
+        if x_run_id is not None:
+            # Reusar o ID misturaria os eventos e sobrescreveria /api/resultados/{run_id}
+            store = obter_result_store()
+            if (store is not None and store.contem_run_id(x_run_id)) or not obter_eventos().reservar(x_run_id):
+                raise RunIdEmUsoError(x_run_id)
+        
+        # Cálculo bloqueante roda no pool de cálculos - o event loop segue
+        # atendendo health check, estáticos e demais requisições
+        result = await obter_calc_executor().calcular(inputs, run_id=x_run_id)
         
         return result
         
+    except RunIdEmUsoError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=409, detail=str(e))
+        
+    except (FilaCheiaError, PoolOcupadoError) as e:
+        logger.warning(f"Sem capacidade para calcular: {str(e)}")
+        if x_run_id is not None:
+            Acompanhamento(x_run_id).falhar(e)  # encerra o stream e libera o ID para a nova tentativa
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        
     except ValueError as e:
         logger.warning(f"Erro de validação: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -118,6 +185,188 @@ async def calcular(inputs: CalculadoraInput):
         raise HTTPException(status_code=500, detail=f"Erro ao processar cálculo: {str(e)}")
 
 
+@app.post("/api/calcular/lote", responses={
+    200: {"content": {"application/x-ndjson": {}}, "description": "Uma linha JSON por caso + linha de resumo"},
+    400: {"model": ErrorResponse}
+})
+async def calcular_lote(request: Request):
+    """
+    Calcula vários casos de uma vez, em paralelo no pool de cálculos
+    
+    Corpo: lista JSON de casos (mesmos campos de /api/calcular), CSV (text/csv)
+    ou upload multipart com o CSV no campo **arquivo**. Todos os casos são
+    validados antes do primeiro cálculo.
+    
+    Resposta NDJSON: cada resultado sai assim que termina
+    (`{"tipo": "resultado", "indice": i, "resultado": {...}}` ou `{"tipo": "erro", ...}`)
+    e a última linha é `{"tipo": "resumo", ...}`
+    
+    Cada caso consome a cota de lote do IP (RATE_LIMIT_BATCH_PER_HOUR, separada
+    do limite das rotas de cálculo), então o lote também não passa desse número de casos
+    """
+    limiter = obter_rate_limiter()
+    politica = limiter.politica(request.method, request.url.path)
+    max_itens = LOTE_MAX_ITENS
+    if politica is not None and politica.limite > 0:
+        max_itens = min(max_itens, politica.limite) if max_itens else politica.limite
+    
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            arquivo = form.get("arquivo")
+            if arquivo is None or not hasattr(arquivo, "read"):
+                raise LoteInvalidoError("Envie o CSV no campo 'arquivo'")
+            itens = ler_csv((await arquivo.read()).decode("utf-8-sig"))
+        elif "csv" in content_type or content_type.startswith("text/plain"):
+            itens = ler_csv((await request.body()).decode("utf-8-sig"))
+        else:
+            try:
+                itens = await request.json()
+            except ValueError:
+                raise LoteInvalidoError("Corpo inválido: esperado JSON (lista de casos) ou CSV")
+        casos = validar_lote(itens, max_itens)
+    except LoteInvalidoError as e:
+        logger.warning(f"Lote rejeitado: {str(e)}")
+        raise HTTPException(status_code=400, detail={"message": str(e), "erros": e.erros})
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV deve estar em UTF-8")
+    
+    # A requisição já contou um caso no middleware - cobra os demais
+    if len(casos) > 1:
+        decisao = limiter.verificar(_ip_cliente(request), request.method, request.url.path, custo=len(casos) - 1)
+        if not decisao.permitido:
+            logger.warning(f"Lote de {len(casos)} casos acima do rate limit")
+            return _limite_excedido(decisao)
+    
+    logger.info(f"Novo lote de cálculo: {len(casos)} casos")
+    return StreamingResponse(
+        executar_lote(casos, obter_calc_executor(), LOTE_CONCORRENCIA),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.get("/api/runs/{run_id}/events", responses={
+    200: {"content": {"text/event-stream": {}}, "description": "Stream SSE com as etapas da execução"},
+    400: {"model": ErrorResponse}
+})
+async def eventos_execucao(run_id: str):
+    """
+    Etapas de uma execução em tempo real (Server-Sent Events)
+    
+    Abra o stream com o mesmo ID enviado em X-Run-Id (antes ou durante o cálculo).
+    Eventos: **etapa_inicio** / **etapa_fim** (etapa, duracao_ms, decorrido_ms),
+    **cenario** (resultado de cada cenário assim que lido), **concluido** ou **erro**
+    (encerram o stream) e **expirado** quando a execução não começa
+    """
+    if not RUN_ID_VALIDO.match(run_id):
+        raise HTTPException(status_code=400, detail=f"run_id inválido: {run_id}")
+    
+    async def stream():
+        async for evento in obter_eventos().assinar(run_id):
+            if evento is None:
+                yield ": keepalive\n\n"
+                continue
+            dados = json.dumps(evento, ensure_ascii=False, default=str)
+            yield f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {dados}\n\n"
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/metricas")
+async def metricas():
+    """
+    Métricas de reaproveitamento de cálculos neste processo
+    
+    - **single_flight.coalescidas**: cálculos evitados por requisições idênticas simultâneas
+    - **result_cache / brutos_cache**: acertos e despejos dos caches em memória
+    - **result_store**: registros no store persistente
+    - **upstream**: saúde do BACEN (última verificação, circuito, atualizações em segundo plano)
+    """
+    store = obter_result_store()
+    return {
+        "executor": obter_calc_executor().estatisticas(),
+        "jobs": obter_job_manager().estatisticas(),
+        "eventos": obter_eventos().estatisticas(),
+        "rate_limit": obter_rate_limiter().estatisticas(),
+        "upstream": {"BACEN": obter_monitor_bacen().estatisticas()},
+        "http": obter_http_client().estatisticas(),
+        "single_flight": obter_single_flight().estatisticas(),
+        "result_cache": obter_result_cache().estatisticas(),
+        "brutos_cache": obter_cache_brutos().estatisticas(),
+        "result_store": store.estatisticas() if store is not None else None,
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@app.post("/api/jobs", response_model=JobStatus, status_code=202, responses={
+    503: {"model": ErrorResponse}
+})
+async def criar_job(inputs: CalculadoraInput):
+    """
+    Enfileira um cálculo e responde na hora com o job_id
+    
+    Acompanhe em GET /api/jobs/{job_id}; o resultado final vem no campo resultado
+    (mesmo formato de /api/calcular)
+    """
+    try:
+        job = obter_job_manager().criar(inputs)
+    except FilaCheiaError as e:
+        logger.warning(f"Fila de cálculos cheia: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    
+    logger.info(f"Novo job de cálculo: {inputs.municipio} ({job.job_id})")
+    return job
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobStatus, responses={
+    404: {"model": ErrorResponse}
+})
+async def obter_job(job_id: str):
+    """
+    Estado do job: pendente | executando | concluido | erro | cancelado
+    
+    - **etapa / progresso**: etapa atual do cálculo e percentual estimado
+    - **resultado**: CalculadoraOutput quando concluido
+    """
+    job = obter_job_manager().obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job não encontrado: {job_id}")
+    return job
+
+
+@app.delete("/api/jobs/{job_id}", response_model=JobStatus, responses={
+    404: {"model": ErrorResponse}
+})
+async def cancelar_job(job_id: str):
+    """
+    Cancela o job: na fila sai sem rodar; em execução para na próxima etapa
+    """
+    job = obter_job_manager().cancelar(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job não encontrado: {job_id}")
+    return job
+
+
+@app.get("/api/resultados/{run_id}", response_model=CalculadoraOutput, responses={
+    404: {"model": ErrorResponse}
+})
+async def obter_resultado(run_id: str):
+    """
+    Recupera um resultado já calculado pelo run_id (store persistente)
+    """
+    store = obter_result_store()
+    resultado = store.obter_por_run_id(run_id) if store is not None else None
+    
+    if resultado is None:
+        raise HTTPException(status_code=404, detail=f"Resultado não encontrado: {run_id}")
+    return resultado
+
+
 @app.post("/api/exportar-csv")
 async def exportar_csv(result: CalculadoraOutput):
     """
@@ -197,16 +446,17 @@ async def exportar_csv(result: CalculadoraOutput):
 
 # Servir arquivos estáticos (frontend)
 # Caminho absoluto para a pasta static na raiz do projeto
+# Pré-comprimidos em memória, com ETag e nomes com hash (ver static_assets.py)
 from pathlib import Path
 STATIC_DIR = Path(__file__).parent.parent / "static"
 
 try:
     if STATIC_DIR.exists():
-        app.mount("/", StaticFiles(directory=str(STATIC_DIR), html=True), name="static")
+        app.mount("/", StaticAssets(STATIC_DIR), name="static")
         logger.info(f"Frontend servido de: {STATIC_DIR}")
     else:
         logger.warning(f"Diretório 'static' não encontrado em: {STATIC_DIR}")
-except RuntimeError as e:
+except (RuntimeError, OSError) as e:
     logger.warning(f"Erro ao montar static: {e}")
 
 
@@ -59,6 +59,19 @@ class CalculadoraOutput(BaseModel):
     selic_context: Dict[str, Any] = Field(default_factory=dict, description="Contexto da SELIC")
     execution_time_ms: int = Field(..., description="Tempo de execução em ms")
     excel_output_path: Optional[str] = Field(None, description="Caminho do Excel processado salvo")
+    cache_hit: bool = Field(False, description="Resultado servido do cache de resultados")
+
+
+class JobStatus(BaseModel):
+    """Estado de um cálculo assíncrono (/api/jobs)"""
+    job_id: str = Field(..., description="ID do job")
+    status: str = Field(..., description="pendente | executando | concluido | erro | cancelado")
+    etapa: Optional[str] = Field(None, description="Etapa atual do cálculo")
+    progresso: int = Field(0, description="Progresso estimado (0-100)")
+    criado_em: datetime = Field(..., description="Data/hora de criação")
+    atualizado_em: datetime = Field(..., description="Última mudança de estado")
+    erro: Optional[str] = Field(None, description="Mensagem de erro (status=erro)")
+    resultado: Optional[CalculadoraOutput] = Field(None, description="Resultado final (status=concluido)")
 
 
 class ErrorResponse(BaseModel):
@@ -0,0 +1,337 @@
+"""
+Rate limiting por IP com janela deslizante aproximada (sliding window counter)
+
+Cada chave guarda só três números - índice da janela, contagem da janela atual
+e da anterior - e a estimativa é anterior * (fração restante) + atual: O(1) por
+requisição, memória constante por chave. Chaves ociosas são despejadas e o total
+de chaves é limitado, então a memória fica estável mesmo com varreduras de
+muitos IPs
+
+Políticas por rota: estáticos e health check não contam; cálculos têm limite
+próprio, mais baixo que o restante da API. O lote (/api/calcular/lote) tem cota
+própria em casos por hora, separada do limite interativo: cada caso custa 1
+
+Backends:
+- memory: por processo (cada worker do uvicorn tem o seu limite)
+- sqlite: arquivo compartilhado - o limite vale para todos os workers
+"""
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (índice da janela, contagem atual, contagem anterior)
+Estado = Tuple[int, int, int]
+
+
+@dataclass(frozen=True)
+class PoliticaLimite:
+    """Limite de requisições por IP para um grupo de rotas"""
+    nome: str
+    limite: int
+    janela: float  # segundos
+
+
+@dataclass(frozen=True)
+class Decisao:
+    permitido: bool
+    politica: Optional[PoliticaLimite] = None
+    restante: int = 0
+    retry_after: int = 0
+
+
+def janela_deslizante(
+    estado: Optional[Estado], agora: float, politica: PoliticaLimite, custo: int = 1
+) -> Tuple[Estado, Decisao]:
+    """
+    Aplica uma requisição ao estado da chave
+
+    Args:
+        custo: Unidades consumidas (ex: casos de um lote) - no máximo politica.limite
+
+    Returns:
+        (novo estado, decisão) - requisição negada não é contada
+    """
+    indice = int(agora // politica.janela)
+    atual = anterior = 0
+    if estado is not None:
+        if estado[0] == indice:
+            atual, anterior = estado[1], estado[2]
+        elif estado[0] == indice - 1:
+            anterior = estado[1]
+
+    fracao = (agora - indice * politica.janela) / politica.janela
+    estimativa = anterior * (1 - fracao) + atual
+
+    if estimativa + custo <= politica.limite:
+        atual += custo
+        restante = max(0, int(politica.limite - (estimativa + custo)))
+        return (indice, atual, anterior), Decisao(True, politica, restante)
+
+    # Tempo até a estimativa abrir espaço para o custo pedido
+    if atual + custo > politica.limite:
+        # Só na próxima janela, quando a atual vira "anterior" e começa a decair
+        necessario = 1 - (politica.limite - custo) / atual if atual else 0
+        espera = (1 - fracao) * politica.janela + max(0.0, necessario) * politica.janela
+    else:
+        necessario = 1 - (politica.limite - atual - custo) / anterior
+        espera = (necessario - fracao) * politica.janela
+    return (indice, atual, anterior), Decisao(False, politica, 0, max(1, math.ceil(espera)))
+
+
+class MemoriaBackend:
+    """
+    Estados em memória do processo, em ordem de último acesso (LRU)
+
+    Despeja chaves ociosas (sem requisições há mais de duas janelas) e, acima
+    de max_chaves, as menos recentes
+    """
+
+    def __init__(self, max_chaves: int = 10000, ociosidade: float = 120):
+        self.max_chaves = max_chaves
+        self.ociosidade = ociosidade
+        self._estados: "OrderedDict[str, Tuple[float, Estado]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.despejos = 0
+
+    def atualizar(self, chave: str, agora: float, funcao: Callable[[Optional[Estado]], Tuple[Estado, Decisao]]) -> Decisao:
+        with self._lock:
+            item = self._estados.pop(chave, None)
+            estado, decisao = funcao(item[1] if item else None)
+            self._estados[chave] = (agora, estado)
+
+            # Mais antigos primeiro: para no primeiro ainda ativo
+            while self._estados:
+                antiga, (ultimo, _) = next(iter(self._estados.items()))
+                if len(self._estados) <= self.max_chaves and agora - ultimo <= self.ociosidade:
+                    break
+                del self._estados[antiga]
+                self.despejos += 1
+        return decisao
+
+    def estatisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {"chaves": len(self._estados), "max_chaves": self.max_chaves, "despejos": self.despejos}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS limites (
+    chave TEXT PRIMARY KEY,
+    indice INTEGER NOT NULL,
+    atual INTEGER NOT NULL,
+    anterior INTEGER NOT NULL,
+    acessado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_limites_acesso ON limites (acessado_em);
+"""
+
+
+class SQLiteBackend:
+    """
+    Estados em SQLite (WAL), compartilhados entre os workers do uvicorn
+
+    Cada atualização é uma transação BEGIN IMMEDIATE (leitura + escrita atômicas
+    entre processos). Chaves ociosas são apagadas a cada `limpeza_a_cada` atualizações.
+    Erro no banco libera a requisição (fail-open) - o limite não derruba a API
+    """
+
+    def __init__(self, caminho: Path, ociosidade: float = 120, limpeza_a_cada: int = 1000):
+        self.caminho = Path(caminho)
+        self.ociosidade = ociosidade
+        self.limpeza_a_cada = limpeza_a_cada
+        self._local = threading.local()
+        self._operacoes = 0
+        self._lock = threading.Lock()
+
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        self._conexao().executescript(_SCHEMA)
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.caminho), timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def atualizar(self, chave: str, agora: float, funcao: Callable[[Optional[Estado]], Tuple[Estado, Decisao]]) -> Decisao:
+        try:
+            conn = self._conexao()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                linha = conn.execute(
+                    "SELECT indice, atual, anterior FROM limites WHERE chave = ?", (chave,)
+                ).fetchone()
+                estado, decisao = funcao(tuple(linha) if linha else None)
+                conn.execute(
+                    "INSERT OR REPLACE INTO limites (chave, indice, atual, anterior, acessado_em) VALUES (?, ?, ?, ?, ?)",
+                    (chave, *estado, agora),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Rate limit indisponível ({e}) - requisição liberada")
+            return Decisao(True)
+
+        with self._lock:
+            self._operacoes += 1
+            limpar = self._operacoes % self.limpeza_a_cada == 0
+        if limpar:
+            self.limpar(agora)
+        return decisao
+
+    def limpar(self, agora: Optional[float] = None) -> int:
+        """Apaga chaves sem acesso há mais que a ociosidade"""
+        limite = (agora or time.time()) - self.ociosidade
+        try:
+            return self._conexao().execute("DELETE FROM limites WHERE acessado_em < ?", (limite,)).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao limpar rate limit: {e}")
+            return 0
+
+    def estatisticas(self) -> Dict[str, object]:
+        try:
+            chaves = self._conexao().execute("SELECT COUNT(*) FROM limites").fetchone()[0]
+        except sqlite3.Error:
+            chaves = None
+        return {"arquivo": str(self.caminho), "chaves": chaves}
+
+
+class RateLimiter:
+    """
+    Escolhe a política pela rota e aplica a janela deslizante no backend
+
+    Rotas isentas: tudo fora de /api (frontend estático) e as listadas em `isentas`
+    """
+
+    def __init__(
+        self,
+        backend,
+        politica_api: PoliticaLimite,
+        politica_calculo: PoliticaLimite,
+        rotas_calculo: Sequence[Tuple[str, str]] = (),
+        politica_lote: Optional[PoliticaLimite] = None,
+        rotas_lote: Sequence[Tuple[str, str]] = (),
+        isentas: Sequence[str] = ("/api/health",),
+        relogio: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            backend: MemoriaBackend ou SQLiteBackend
+            politica_api: Limite padrão das rotas /api
+            politica_calculo: Limite das rotas que disparam cálculo
+            rotas_calculo: (método, prefixo do caminho) das rotas de cálculo
+            politica_lote: Cota em casos das rotas de lote (None = usam a de cálculo)
+            rotas_lote: (método, caminho exato) das rotas de lote - têm precedência
+                sobre os prefixos de rotas_calculo
+            isentas: Caminhos /api sem limite
+            relogio: Fonte de tempo (testes)
+        """
+        self.backend = backend
+        self.politica_api = politica_api
+        self.politica_calculo = politica_calculo
+        self.rotas_calculo = tuple(rotas_calculo)
+        self.politica_lote = politica_lote
+        self.rotas_lote = tuple(rotas_lote)
+        self.isentas = tuple(isentas)
+        self._relogio = relogio
+        self.negadas = 0
+
+    def politica(self, metodo: str, caminho: str) -> Optional[PoliticaLimite]:
+        """Política da rota (None = isenta)"""
+        if not caminho.startswith("/api/") or caminho in self.isentas:
+            return None
+        if self.politica_lote is not None and (metodo, caminho) in self.rotas_lote:
+            return self.politica_lote
+        for metodo_rota, prefixo in self.rotas_calculo:
+            if metodo == metodo_rota and caminho.startswith(prefixo):
+                return self.politica_calculo
+        return self.politica_api
+
+    def verificar(self, ip: str, metodo: str, caminho: str, custo: int = 1) -> Decisao:
+        """
+        Args:
+            custo: Unidades consumidas pela requisição (casos de um lote)
+
+        Raises:
+            ValueError: custo acima do limite da política (nunca seria aceito -
+                quem cobra por caso limita o tamanho antes)
+        """
+        politica = self.politica(metodo, caminho)
+        if politica is None or politica.limite <= 0:
+            return Decisao(True)
+        if custo > politica.limite:
+            raise ValueError(f"Custo {custo} acima do limite da política {politica.nome} ({politica.limite})")
+
+        agora = self._relogio()
+        custo = max(1, custo)
+        decisao = self.backend.atualizar(
+            f"{politica.nome}:{ip}", agora, lambda estado: janela_deslizante(estado, agora, politica, custo)
+        )
+        if not decisao.permitido:
+            self.negadas += 1
+        return decisao
+
+    def estatisticas(self) -> Dict[str, object]:
+        return {
+            "backend": type(self.backend).__name__,
+            "negadas": self.negadas,
+            **self.backend.estatisticas(),
+        }
+
+
+# Instância global (por processo; o backend sqlite é compartilhado entre processos)
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+# Rotas que disparam cálculo (limite RATE_LIMIT_PER_MINUTE)
+ROTAS_CALCULO = (("POST", "/api/calcular"), ("POST", "/api/jobs"))
+# Lote: cota em casos por hora (RATE_LIMIT_BATCH_PER_HOUR), fora do limite interativo
+ROTAS_LOTE = (("POST", "/api/calcular/lote"),)
+
+
+# Funções auxiliares para uso direto
+def obter_rate_limiter() -> RateLimiter:
+    """Rate limiter do processo (RATE_LIMIT_* no config)"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                from config import (
+                    BASE_DIR,
+                    RATE_LIMIT_API_PER_MINUTE,
+                    RATE_LIMIT_BACKEND,
+                    RATE_LIMIT_BATCH_PER_HOUR,
+                    RATE_LIMIT_DB_PATH,
+                    RATE_LIMIT_MAX_KEYS,
+                    RATE_LIMIT_PER_MINUTE,
+                )
+                backend = None
+                if RATE_LIMIT_BACKEND == "sqlite":
+                    try:
+                        backend = SQLiteBackend(BASE_DIR / RATE_LIMIT_DB_PATH)
+                        logger.info(f"🚦 Rate limit compartilhado: {backend.caminho}")
+                    except (sqlite3.Error, OSError) as e:
+                        logger.error(f"❌ Rate limit SQLite indisponível, usando memória: {e}")
+                if backend is None:
+                    backend = MemoriaBackend(RATE_LIMIT_MAX_KEYS)
+                _rate_limiter = RateLimiter(
+                    backend,
+                    PoliticaLimite("api", RATE_LIMIT_API_PER_MINUTE, 60),
+                    PoliticaLimite("calculo", RATE_LIMIT_PER_MINUTE, 60),
+                    ROTAS_CALCULO,
+                    PoliticaLimite("lote", RATE_LIMIT_BATCH_PER_HOUR, 3600),
+                    ROTAS_LOTE,
+                )
+    return _rate_limiter
@@ -0,0 +1,580 @@
+"""
+Backends de recálculo de planilhas com pool de workers persistentes
+Cada worker mantém uma instância de Excel (COM) ou LibreOffice (UNO)
+aberta entre requisições - sem custo de inicialização nem pausas fixas
+
+Backends baseados em arquivo:
+- excel: Microsoft Excel via COM (Windows + pywin32)
+- libreoffice: LibreOffice headless via socket UNO (Linux)
+- stub: sem aplicação externa (testes)
+"""
+import logging
+import math
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (
+    LIBREOFFICE_PATH,
+    RECALC_MAX_JOBS,
+    RECALC_POOL_SIZE,
+    RECALC_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Flags para verificar dependências opcionais
+WIN32COM_AVAILABLE = False
+try:
+    import pythoncom
+    import win32com.client
+    WIN32COM_AVAILABLE = True
+except ImportError:
+    pass
+
+UNO_AVAILABLE = False
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    UNO_AVAILABLE = True
+except ImportError:
+    pass
+
+# Excel: XlCalculationState.xlDone
+_XL_DONE = 0
+
+
+class PoolOcupadoError(Exception):
+    """Nenhum worker de recálculo livre dentro do timeout - cliente deve tentar de novo depois"""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"Todos os workers de recálculo ocupados - tente novamente em {retry_after}s")
+
+    def __reduce__(self):
+        # Atravessa o pool de processos (pickle) com o mesmo retry_after
+        return self.__class__, (self.retry_after,)
+
+
+def tamanho_pool_padrao() -> int:
+    """
+    RECALC_POOL_SIZE, ou (0) um worker por cálculo simultâneo do pool de cálculos
+
+    No modo thread cada thread do pool pode pedir um recálculo ao mesmo tempo:
+    com menos workers que threads, as excedentes esperam na fila do pool e
+    estouram RECALC_TIMEOUT sob carga. No modo process cada processo calcula
+    um caso por vez e tem seu próprio pool
+    """
+    if RECALC_POOL_SIZE > 0:
+        return RECALC_POOL_SIZE
+    from calc_executor import configuracao_executor
+    modo, workers = configuracao_executor()
+    return 1 if modo == "process" else workers
+
+
+class RecalcWorker(ABC):
+    """
+    Worker com aplicação de planilha de longa duração
+
+    Todas as chamadas acontecem na thread própria do worker (COM/UNO
+    exigem afinidade de thread). Subclasses implementam recalcular e,
+    quando precisam, iniciar/saudavel/encerrar.
+    """
+
+    nome = "worker"
+
+    def iniciar(self):
+        """Sobe a aplicação (chamado na thread do worker)"""
+
+    @abstractmethod
+    def recalcular(self, caminho: Path) -> bool:
+        """Abre, recalcula, salva e fecha o arquivo"""
+
+    def saudavel(self) -> bool:
+        """True se a aplicação continua respondendo"""
+        return True
+
+    def encerrar(self):
+        """Fecha a aplicação"""
+
+
+class _WorkerThread:
+    """Executa um RecalcWorker em thread dedicada, recebendo tarefas por fila"""
+
+    def __init__(self, worker: RecalcWorker, identificador: int):
+        self.worker = worker
+        self.identificador = identificador
+        self.jobs = 0
+        self._fila: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._pronto: Future = Future()
+        self._thread = threading.Thread(
+            target=self._loop, name=f"recalc-{worker.nome}-{identificador}", daemon=True
+        )
+        self._thread.start()
+
+    def _loop(self):
+        try:
+            self.worker.iniciar()
+            self._pronto.set_result(True)
+        except Exception as e:
+            self._pronto.set_exception(e)
+            return
+
+        while True:
+            tarefa = self._fila.get()
+            if tarefa is None:
+                break
+            funcao, args, futuro = tarefa
+            if not futuro.set_running_or_notify_cancel():
+                continue
+            try:
+                futuro.set_result(funcao(*args))
+            except Exception as e:
+                futuro.set_exception(e)
+
+        try:
+            self.worker.encerrar()
+        except Exception as e:
+            logger.debug(f"Erro ao encerrar worker {self.worker.nome}: {e}")
+
+    def aguardar_inicio(self, timeout: float):
+        self._pronto.result(timeout=timeout)
+
+    def executar(self, funcao: Callable, *args, timeout: float) -> Any:
+        futuro: Future = Future()
+        self._fila.put((funcao, args, futuro))
+        return futuro.result(timeout=timeout)
+
+    def parar(self):
+        self._fila.put(None)
+
+    @property
+    def vivo(self) -> bool:
+        return self._thread.is_alive()
+
+
+class WorkerPool:
+    """
+    Pool de workers reaproveitados entre requisições
+
+    - Health check antes de cada uso (worker com problema é recriado)
+    - Reciclagem após `max_jobs` tarefas (evita vazamento de memória da aplicação)
+    - Conclusão sinalizada pelo próprio worker (Future), sem pausas fixas
+    """
+
+    def __init__(
+        self,
+        fabrica: Callable[[int], RecalcWorker],
+        tamanho: Optional[int] = None,
+        max_jobs: int = RECALC_MAX_JOBS,
+        timeout: float = RECALC_TIMEOUT
+    ):
+        """
+        Args:
+            fabrica: Cria o worker a partir do identificador
+            tamanho: Workers no pool (padrão: tamanho_pool_padrao())
+            max_jobs: Recicla o worker após N recálculos
+            timeout: Segundos de espera por worker livre e por recálculo
+        """
+        self.fabrica = fabrica
+        self.tamanho = max(1, tamanho or tamanho_pool_padrao())
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self._livres: "queue.Queue[_WorkerThread]" = queue.Queue()
+        self._todos: List[_WorkerThread] = []
+        self._lock = threading.Lock()
+        self._contador = 0
+        self._encerrado = False
+        self.estatisticas = {"jobs": 0, "falhas": 0, "reciclados": 0, "ocupado": 0}
+
+        for _ in range(self.tamanho):
+            self._livres.put(self._criar())
+
+    def _criar(self) -> _WorkerThread:
+        with self._lock:
+            self._contador += 1
+            identificador = self._contador
+        thread = _WorkerThread(self.fabrica(identificador), identificador)
+        with self._lock:
+            self._todos.append(thread)
+        return thread
+
+    def _descartar(self, thread: _WorkerThread):
+        thread.parar()
+        with self._lock:
+            if thread in self._todos:
+                self._todos.remove(thread)
+            self.estatisticas["reciclados"] += 1
+
+    def _saudavel(self, thread: _WorkerThread) -> bool:
+        try:
+            thread.aguardar_inicio(self.timeout)
+            return thread.vivo and thread.executar(thread.worker.saudavel, timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"⚠️ Worker {thread.worker.nome}-{thread.identificador} sem resposta: {e}")
+            return False
+
+    def executar(self, caminho: Path) -> bool:
+        """
+        Recalcula `caminho` em um worker livre
+
+        Returns:
+            True se o worker recalculou e salvou o arquivo
+
+        Raises:
+            PoolOcupadoError: nenhum worker livre dentro do timeout
+        """
+        if self._encerrado:
+            raise RuntimeError("Pool de recálculo encerrado")
+
+        try:
+            thread = self._livres.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.estatisticas["ocupado"] += 1
+            logger.warning(f"⚠️ Nenhum worker de recálculo livre em {self.timeout}s ({self.tamanho} no pool)")
+            raise PoolOcupadoError(max(1, math.ceil(self.timeout / self.tamanho)))
+
+        try:
+            if not self._saudavel(thread):
+                self._descartar(thread)
+                thread = self._criar()
+                thread.aguardar_inicio(self.timeout)
+
+            sucesso = thread.executar(thread.worker.recalcular, caminho, timeout=self.timeout)
+            thread.jobs += 1
+            with self._lock:
+                self.estatisticas["jobs"] += 1
+                if not sucesso:
+                    self.estatisticas["falhas"] += 1
+            return sucesso
+
+        except Exception as e:
+            logger.error(f"❌ Erro no worker de recálculo: {e}")
+            with self._lock:
+                self.estatisticas["falhas"] += 1
+            # Estado desconhecido: recriar o worker
+            self._descartar(thread)
+            thread = self._criar()
+            return False
+
+        finally:
+            if thread.jobs >= self.max_jobs:
+                logger.info(f"♻️ Reciclando worker {thread.worker.nome}-{thread.identificador} após {thread.jobs} jobs")
+                self._descartar(thread)
+                thread = self._criar()
+            self._livres.put(thread)
+
+    def encerrar(self):
+        """Encerra todos os workers"""
+        self._encerrado = True
+        with self._lock:
+            todos = list(self._todos)
+            self._todos.clear()
+        for thread in todos:
+            thread.parar()
+
+
+class ExcelComWorker(RecalcWorker):
+    """Instância de Excel (DispatchEx) mantida aberta pelo worker"""
+
+    nome = "excel"
+
+    def __init__(self, identificador: int = 0, visible: bool = False):
+        self.identificador = identificador
+        self.visible = visible
+        self.excel = None
+
+    def iniciar(self):
+        pythoncom.CoInitialize()
+        self.excel = win32com.client.DispatchEx("Excel.Application")
+        self.excel.Visible = self.visible
+        self.excel.DisplayAlerts = False
+        self.excel.ScreenUpdating = False
+        logger.info(f"✅ Excel iniciado (worker {self.identificador})")
+
+    def saudavel(self) -> bool:
+        try:
+            return bool(self.excel.Ready)
+        except Exception:
+            return False
+
+    def recalcular(self, caminho: Path) -> bool:
+        workbook = None
+        try:
+            workbook = self.excel.Workbooks.Open(str(Path(caminho).absolute()))
+            self.excel.CalculateFullRebuild()
+
+            # Conclusão informada pelo Excel (cálculo assíncrono em segundo plano)
+            limite = time.monotonic() + RECALC_TIMEOUT
+            while self.excel.CalculationState != _XL_DONE:
+                if time.monotonic() > limite:
+                    raise TimeoutError("Excel não concluiu o cálculo")
+                pythoncom.PumpWaitingMessages()
+                time.sleep(0.01)
+
+            workbook.Save()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erro ao recalcular no Excel: {e}")
+            return False
+        finally:
+            if workbook is not None:
+                try:
+                    workbook.Close(SaveChanges=False)
+                except Exception as e:
+                    logger.debug(f"Erro ao fechar workbook: {e}")
+
+    def encerrar(self):
+        try:
+            if self.excel is not None:
+                self.excel.Quit()
+        finally:
+            self.excel = None
+            pythoncom.CoUninitialize()
+
+
+class LibreOfficeUnoWorker(RecalcWorker):
+    """LibreOffice headless com socket UNO próprio (um processo por worker)"""
+
+    nome = "libreoffice"
+
+    def __init__(self, identificador: int = 0, executavel: str = LIBREOFFICE_PATH):
+        self.identificador = identificador
+        self.executavel = executavel
+        self.processo: Optional[subprocess.Popen] = None
+        self.desktop = None
+        self.perfil: Optional[Path] = None
+        self.porta: Optional[int] = None
+
+    @staticmethod
+    def _porta_livre() -> int:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    def iniciar(self):
+        import tempfile
+
+        self.porta = self._porta_livre()
+        # Perfil isolado: vários processos soffice não compartilham bloqueios
+        self.perfil = Path(tempfile.mkdtemp(prefix=f"lo_worker_{self.identificador}_"))
+        self.processo = subprocess.Popen(
+            [
+                self.executavel,
+                "--headless", "--invisible", "--nologo", "--norestore", "--nodefault",
+                f"-env:UserInstallation={self.perfil.as_uri()}",
+                f"--accept=socket,host=127.0.0.1,port={self.porta};urp;",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        contexto_local = uno.getComponentContext()
+        resolver = contexto_local.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", contexto_local
+        )
+        url = f"uno:socket,host=127.0.0.1,port={self.porta};urp;StarOffice.ComponentContext"
+
+        # Aguarda o socket aceitar conexões (processo sinaliza quando está pronto)
+        limite = time.monotonic() + RECALC_TIMEOUT
+        while True:
+            try:
+                contexto = resolver.resolve(url)
+                break
+            except Exception:
+                if self.processo.poll() is not None or time.monotonic() > limite:
+                    raise RuntimeError("LibreOffice não iniciou")
+                time.sleep(0.1)
+
+        self.desktop = contexto.ServiceManager.createInstanceWithContext(
+            "com.sun.star.frame.Desktop", contexto
+        )
+        logger.info(f"✅ LibreOffice iniciado (worker {self.identificador}, porta {self.porta})")
+
+    @staticmethod
+    def _propriedades(**valores) -> tuple:
+        propriedades = []
+        for nome, valor in valores.items():
+            propriedade = PropertyValue()
+            propriedade.Name = nome
+            propriedade.Value = valor
+            propriedades.append(propriedade)
+        return tuple(propriedades)
+
+    def saudavel(self) -> bool:
+        if self.processo is None or self.processo.poll() is not None:
+            return False
+        try:
+            self.desktop.getComponents()
+            return True
+        except Exception:
+            return False
+
+    def recalcular(self, caminho: Path) -> bool:
+        documento = None
+        try:
+            url = Path(caminho).absolute().as_uri()
+            documento = self.desktop.loadComponentFromURL(
+                url, "_blank", 0, self._propriedades(Hidden=True, ReadOnly=False)
+            )
+            documento.calculateAll()
+            documento.storeToURL(url, self._propriedades(FilterName="Calc MS Excel 2007 XML", Overwrite=True))
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erro ao recalcular no LibreOffice: {e}")
+            return False
+        finally:
+            if documento is not None:
+                try:
+                    documento.close(True)
+                except Exception as e:
+                    logger.debug(f"Erro ao fechar documento: {e}")
+
+    def encerrar(self):
+        try:
+            if self.desktop is not None:
+                self.desktop.terminate()
+        except Exception:
+            pass
+        if self.processo is not None:
+            try:
+                self.processo.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.processo.kill()
+        if self.perfil is not None:
+            shutil.rmtree(self.perfil, ignore_errors=True)
+
+
+class RecalcBackend(ABC):
+    """
+    Interface de backend de recálculo baseado em arquivo
+
+    O arquivo é recalculado e salvo no próprio caminho; quem chama lê o
+    resultado de volta (ExcelTemplateCalculator)
+    """
+
+    nome = "base"
+
+    def disponivel(self) -> bool:
+        return True
+
+    @abstractmethod
+    def recalcular_arquivo(self, caminho: Path) -> bool:
+        """
+        Recalcula e salva o arquivo
+
+        Raises:
+            PoolOcupadoError: backend sem capacidade no momento
+        """
+
+    def encerrar(self):
+        """Libera recursos (workers, processos)"""
+
+
+class PoolBackend(RecalcBackend):
+    """Backend que delega a um WorkerPool"""
+
+    def __init__(self, nome: str, fabrica: Callable[[int], RecalcWorker], **opcoes_pool):
+        self.nome = nome
+        self.pool = WorkerPool(fabrica, **opcoes_pool)
+
+    def recalcular_arquivo(self, caminho: Path) -> bool:
+        return self.pool.executar(caminho)
+
+    def encerrar(self):
+        self.pool.encerrar()
+
+
+class StubBackend(RecalcBackend):
+    """
+    Backend sem aplicação externa para testes
+
+    Opcionalmente grava `valores` ({aba: {endereço: valor}}) no arquivo,
+    simulando os valores que o recálculo produziria
+    """
+
+    nome = "stub"
+
+    def __init__(self, valores: Optional[Dict[str, Dict[str, Any]]] = None, sucesso: bool = True):
+        self.valores = valores or {}
+        self.sucesso = sucesso
+        self.chamadas: List[Path] = []
+
+    def recalcular_arquivo(self, caminho: Path) -> bool:
+        self.chamadas.append(Path(caminho))
+        if self.valores:
+            from xlsx_patcher import XlsxPatcher
+            caminho.write_bytes(
+                XlsxPatcher.aplicar(caminho.read_bytes(), self.valores, recalcular_ao_abrir=False)
+            )
+        return self.sucesso
+
+
+def _criar_excel() -> Optional[RecalcBackend]:
+    if not WIN32COM_AVAILABLE:
+        return None
+    return PoolBackend("excel", lambda i: ExcelComWorker(i))
+
+
+def _criar_libreoffice() -> Optional[RecalcBackend]:
+    if not UNO_AVAILABLE or not (shutil.which(LIBREOFFICE_PATH) or os.path.exists(LIBREOFFICE_PATH)):
+        return None
+    return PoolBackend("libreoffice", lambda i: LibreOfficeUnoWorker(i))
+
+
+_FABRICAS: Dict[str, Callable[[], Optional[RecalcBackend]]] = {
+    "excel": _criar_excel,
+    "libreoffice": _criar_libreoffice,
+    "stub": StubBackend,
+}
+
+# Backends ativos no processo (pools são compartilhados entre requisições)
+_backends: Dict[str, Optional[RecalcBackend]] = {}
+_backends_lock = threading.Lock()
+
+
+def registrar_backend(nome: str, backend: RecalcBackend):
+    """Registra instância de backend (ex: StubBackend configurado em testes)"""
+    with _backends_lock:
+        anterior = _backends.get(nome)
+        _backends[nome] = backend
+    if anterior is not None and anterior is not backend:
+        anterior.encerrar()
+
+
+def obter_backend(nome: str) -> Optional[RecalcBackend]:
+    """
+    Retorna backend compartilhado pelo nome (criado e aquecido na primeira chamada)
+
+    Returns:
+        Backend, ou None se o nome é desconhecido ou a dependência não está disponível
+    """
+    with _backends_lock:
+        if nome not in _backends:
+            fabrica = _FABRICAS.get(nome)
+            try:
+                _backends[nome] = fabrica() if fabrica else None
+            except Exception as e:
+                logger.error(f"❌ Backend de recálculo {nome} não pôde ser iniciado: {e}")
+                _backends[nome] = None
+            if _backends[nome] is None:
+                logger.warning(f"⚠️ Backend de recálculo indisponível: {nome}")
+        return _backends[nome]
+
+
+def encerrar_backends():
+    """Encerra todos os pools (shutdown da aplicação)"""
+    with _backends_lock:
+        ativos = [b for b in _backends.values() if b is not None]
+        _backends.clear()
+    for backend in ativos:
+        backend.encerrar()
@@ -0,0 +1,260 @@
+"""
+Cache de resultados de /api/calcular endereçado por conteúdo
+Mesmas entradas + mesmo template + mesmas taxas = mesmo resultado,
+então a chave é o hash desses três e o ciclo clone/escrita/recálculo/leitura
+só roda na primeira vez
+
+Despejo por LRU com orçamento de memória (bytes do JSON guardado) e TTL opcional
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from models import CalculadoraInput, CalculadoraOutput
+
+logger = logging.getLogger(__name__)
+
+
+# Hash do template por identidade dos bytes (carregar_template_bytes reaproveita o mesmo objeto)
+_hash_conteudo: Dict[int, Tuple[bytes, str]] = {}
+# Hash de arquivos por assinatura (mtime_ns, tamanho) - só relê o que mudou
+_hash_arquivos: Dict[Path, Tuple[int, int, str]] = {}
+_hash_lock = threading.Lock()
+
+
+def hash_conteudo(conteudo: bytes) -> str:
+    """sha256 dos bytes, calculado uma vez por objeto"""
+    with _hash_lock:
+        cached = _hash_conteudo.get(id(conteudo))
+        if cached and cached[0] is conteudo:
+            return cached[1]
+    digest = hashlib.sha256(conteudo).hexdigest()
+    with _hash_lock:
+        _hash_conteudo.clear()  # só o template atual interessa
+        _hash_conteudo[id(conteudo)] = (conteudo, digest)
+    return digest
+
+
+def impressao_arquivos(caminhos: Iterable[Path]) -> str:
+    """
+    Impressão digital do conteúdo de um conjunto de arquivos (ex: caches de taxas)
+    Arquivo ausente entra como ausente - criar o arquivo muda a impressão
+    """
+    total = hashlib.sha256()
+    for caminho in sorted(Path(c) for c in caminhos):
+        total.update(str(caminho.name).encode("utf-8"))
+        try:
+            stat = caminho.stat()
+        except OSError:
+            total.update(b"<ausente>")
+            continue
+        with _hash_lock:
+            cached = _hash_arquivos.get(caminho)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            digest = cached[2]
+        else:
+            digest = hashlib.sha256(caminho.read_bytes()).hexdigest()
+            with _hash_lock:
+                _hash_arquivos[caminho] = (stat.st_mtime_ns, stat.st_size, digest)
+        total.update(digest.encode("ascii"))
+    return total.hexdigest()
+
+
+# Entradas que determinam os valores brutos dos cenários (linhas ímpares de OUTPUT_LINES)
+# Honorários e deságio (B11-B14) são aplicados depois, em Python
+CAMPOS_BRUTOS = ("municipio", "periodo_inicio", "periodo_fim", "ajuizamento", "citacao", "correcao_ate")
+
+
+def entradas_canonicas(inputs: CalculadoraInput, campos: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Entradas normalizadas: município sem variação de caixa/espaços, números como float
+
+    Args:
+        campos: Restringe às entradas listadas (ex: CAMPOS_BRUTOS)
+    """
+    dados = inputs.model_dump(mode="json")
+    if campos is not None:
+        dados = {campo: dados[campo] for campo in campos}
+    dados["municipio"] = " ".join(str(dados["municipio"]).upper().split())
+    for campo, valor in dados.items():
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            dados[campo] = float(valor)
+    return dados
+
+
+def chave_resultado(
+    inputs: CalculadoraInput,
+    template_hash: str,
+    taxas_hash: str,
+    motor: str = "",
+    campos: Optional[Sequence[str]] = None
+) -> str:
+    """
+    Chave do cache: sha256 das entradas canônicas + hash do template + impressão das taxas
+    """
+    material = json.dumps(
+        {
+            "entradas": entradas_canonicas(inputs, campos),
+            "template": template_hash,
+            "taxas": taxas_hash,
+            "motor": motor,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU de resultados com orçamento de memória e TTL
+
+    Guarda JSON (imutável): resultados completos (obter/guardar, cada leitura
+    devolve um objeto novo marcado com cache_hit=True) ou dicionários simples
+    (obter_valores/guardar_valores - ex: valores brutos dos cenários)
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = 0, relogio: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_bytes: Orçamento de memória (0 = cache desligado)
+            ttl: Validade das entradas em segundos (0 = sem expiração)
+            relogio: Fonte de tempo (testes)
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._relogio = relogio
+        self._entradas: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.despejos = 0
+
+    @property
+    def ativo(self) -> bool:
+        return self.max_bytes > 0
+
+    def obter(self, chave: str) -> Optional[CalculadoraOutput]:
+        """Resultado em cache (None se ausente ou expirado)"""
+        conteudo = self._obter_bytes(chave)
+        if conteudo is None:
+            return None
+        resultado = CalculadoraOutput.model_validate_json(conteudo)
+        resultado.cache_hit = True
+        return resultado
+
+    def guardar(self, chave: str, resultado: CalculadoraOutput) -> bool:
+        """
+        Guarda o resultado, despejando os menos usados até caber no orçamento
+
+        Returns:
+            False se o resultado sozinho não cabe no orçamento
+        """
+        if not self.ativo:
+            return False
+        return self._guardar_bytes(
+            chave, resultado.model_copy(update={"cache_hit": False}).model_dump_json().encode("utf-8")
+        )
+
+    def obter_valores(self, chave: str) -> Optional[Dict[str, Any]]:
+        """Dicionário em cache (None se ausente ou expirado)"""
+        conteudo = self._obter_bytes(chave)
+        return json.loads(conteudo) if conteudo is not None else None
+
+    def guardar_valores(self, chave: str, valores: Dict[str, Any]) -> bool:
+        """Guarda um dicionário serializável em JSON"""
+        if not self.ativo:
+            return False
+        return self._guardar_bytes(chave, json.dumps(valores, default=str).encode("utf-8"))
+
+    def _obter_bytes(self, chave: str) -> Optional[bytes]:
+        if not self.ativo:
+            return None
+        with self._lock:
+            item = self._entradas.get(chave)
+            if item is not None and self.ttl and self._relogio() - item[0] > self.ttl:
+                self._remover(chave)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return item[1]
+
+    def _guardar_bytes(self, chave: str, conteudo: bytes) -> bool:
+        if len(conteudo) > self.max_bytes:
+            logger.warning(f"⚠️ Entrada de {len(conteudo)} bytes excede o orçamento do cache")
+            return False
+
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._entradas[chave] = (self._relogio(), conteudo)
+            self._bytes += len(conteudo)
+            while self._bytes > self.max_bytes:
+                antiga = next(iter(self._entradas))
+                self._remover(antiga)
+                self.despejos += 1
+        return True
+
+    def _remover(self, chave: str):
+        _, conteudo = self._entradas.pop(chave)
+        self._bytes -= len(conteudo)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "despejos": self.despejos,
+                "taxa_acerto": round(self.hits / consultas, 3) if consultas else 0.0,
+            }
+
+
+# Instâncias globais (compartilhadas entre requisições)
+_result_cache: Optional[ResultCache] = None
+_brutos_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def _criar_cache() -> ResultCache:
+    from config import RESULT_CACHE_MAX_MB, RESULT_CACHE_TTL
+    return ResultCache(int(RESULT_CACHE_MAX_MB * 1024 * 1024), RESULT_CACHE_TTL)
+
+
+# Funções auxiliares para uso direto
+def obter_result_cache() -> ResultCache:
+    """Cache de resultados do processo (configurado por RESULT_CACHE_MAX_MB / RESULT_CACHE_TTL)"""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = _criar_cache()
+    return _result_cache
+
+
+def obter_cache_brutos() -> ResultCache:
+    """Cache dos valores brutos por cenário, chaveado só por CAMPOS_BRUTOS"""
+    global _brutos_cache
+    if _brutos_cache is None:
+        with _result_cache_lock:
+            if _brutos_cache is None:
+                _brutos_cache = _criar_cache()
+    return _brutos_cache
@@ -0,0 +1,382 @@
+"""
+Armazenamento persistente de resultados (SQLite em modo WAL)
+Segundo nível do cache de /api/calcular: sobrevive a deploys/reinícios e é
+compartilhado entre os workers do uvicorn (cada processo abre o mesmo arquivo)
+
+Cada CalculadoraOutput fica guardado pela chave de entradas (result_cache.chave_resultado)
+e pelo run_id. Respostas servidas do cache ganham só um apelido (run_id -> run_id do
+resultado gravado), não uma cópia do resultado. A tabela jobs guarda o estado dos
+cálculos assíncronos (/api/jobs), visível a todos os workers. Uma thread em segundo
+plano compacta o arquivo periodicamente: remove registros velhos / excedentes,
+apelidos órfãos, jobs encerrados além da retenção e faz checkpoint do WAL
+"""
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from models import CalculadoraOutput
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resultados (
+    run_id TEXT PRIMARY KEY,
+    chave TEXT,
+    criado_em REAL NOT NULL,
+    acessado_em REAL NOT NULL,
+    conteudo BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_resultados_chave ON resultados (chave, criado_em);
+CREATE INDEX IF NOT EXISTS idx_resultados_acesso ON resultados (acessado_em);
+CREATE TABLE IF NOT EXISTS aliases (
+    run_id TEXT PRIMARY KEY,
+    run_id_origem TEXT NOT NULL,
+    criado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_aliases_origem ON aliases (run_id_origem);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    etapa TEXT,
+    progresso INTEGER NOT NULL DEFAULT 0,
+    erro TEXT,
+    run_id TEXT,
+    cancelar INTEGER NOT NULL DEFAULT 0,
+    criado_em REAL NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_atualizado ON jobs (status, atualizado_em);
+"""
+
+# Status de job que não mudam mais
+JOB_STATUS_FINAIS = ("concluido", "erro", "cancelado")
+_JOB_CAMPOS = ("job_id", "status", "etapa", "progresso", "erro", "run_id", "cancelar", "criado_em", "atualizado_em")
+
+
+class ResultStore:
+    """
+    Resultados em SQLite, uma conexão por thread
+
+    Escritas concorrentes de vários processos são serializadas pelo próprio
+    SQLite (WAL + busy_timeout); leitores não bloqueiam o escritor
+    """
+
+    def __init__(
+        self,
+        caminho: Path,
+        max_idade_dias: float = 30,
+        max_registros: int = 50000,
+        retencao_jobs_horas: float = 24
+    ):
+        """
+        Args:
+            caminho: Arquivo do banco (criado se não existir)
+            max_idade_dias: Registros sem acesso há mais tempo são removidos na compactação (0 = sem limite)
+            max_registros: Máximo de registros mantidos (os menos acessados saem primeiro; 0 = sem limite)
+            retencao_jobs_horas: Jobs encerrados há mais tempo são removidos na compactação (0 = sem limite)
+        """
+        self.caminho = Path(caminho)
+        self.max_idade_dias = max_idade_dias
+        self.max_registros = max_registros
+        self.retencao_jobs_horas = retencao_jobs_horas
+        self._local = threading.local()
+        self._conexoes = []
+        self._conexoes_lock = threading.Lock()
+        self._parar = threading.Event()
+        self._compactador: Optional[threading.Thread] = None
+
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        with self._conexao() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.caminho), timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+            with self._conexoes_lock:
+                self._conexoes.append(conn)
+        return conn
+
+    def guardar(self, chave: Optional[str], resultado: CalculadoraOutput) -> bool:
+        """Grava (ou substitui) o resultado pelo run_id, associado à chave de entradas"""
+        try:
+            conteudo = resultado.model_copy(update={"cache_hit": False}).model_dump_json()
+            agora = time.time()
+            with self._conexao() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO resultados (run_id, chave, criado_em, acessado_em, conteudo) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (resultado.run_id, chave, agora, agora, conteudo.encode("utf-8")),
+                )
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao gravar resultado {resultado.run_id}: {e}")
+            return False
+
+    def apelidar(self, run_id: str, run_id_origem: str) -> bool:
+        """Registra run_id como outro nome do resultado já gravado em run_id_origem (hit de cache)"""
+        try:
+            with self._conexao() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO aliases (run_id, run_id_origem, criado_em) VALUES (?, ?, ?)",
+                    (run_id, run_id_origem, time.time()),
+                )
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao gravar apelido {run_id} -> {run_id_origem}: {e}")
+            return False
+
+    def obter(self, chave: str) -> Optional[CalculadoraOutput]:
+        """Resultado mais recente para a chave de entradas (cache_hit=True)"""
+        return self._buscar("chave = ? ORDER BY criado_em DESC LIMIT 1", chave)
+
+    def obter_por_run_id(self, run_id: str) -> Optional[CalculadoraOutput]:
+        """
+        Resultado de uma execução específica
+        Apelidos devolvem o resultado de origem com o próprio run_id e o horário do hit
+        """
+        resultado = self._buscar("run_id = ?", run_id)
+        if resultado is not None:
+            return resultado
+
+        try:
+            apelido = self._conexao().execute(
+                "SELECT run_id_origem, criado_em FROM aliases WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao ler apelido {run_id}: {e}")
+            return None
+        if apelido is None:
+            return None
+        resultado = self._buscar("run_id = ?", apelido[0])
+        if resultado is None:
+            return None
+        return resultado.model_copy(update={"run_id": run_id, "timestamp": datetime.fromtimestamp(apelido[1])})
+
+    def contem_run_id(self, run_id: str) -> bool:
+        """Há resultado ou apelido gravado para o run_id (sem ler o conteúdo)"""
+        try:
+            return self._conexao().execute(
+                "SELECT 1 FROM resultados WHERE run_id = ? UNION ALL SELECT 1 FROM aliases WHERE run_id = ?",
+                (run_id, run_id),
+            ).fetchone() is not None
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao consultar run_id {run_id}: {e}")
+            return False
+
+    def _buscar(self, condicao: str, valor: str) -> Optional[CalculadoraOutput]:
+        try:
+            conn = self._conexao()
+            linha = conn.execute(f"SELECT run_id, conteudo FROM resultados WHERE {condicao}", (valor,)).fetchone()
+            if linha is None:
+                return None
+            with conn:
+                conn.execute("UPDATE resultados SET acessado_em = ? WHERE run_id = ?", (time.time(), linha[0]))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao ler resultado: {e}")
+            return None
+
+        resultado = CalculadoraOutput.model_validate_json(linha[1])
+        resultado.cache_hit = True
+        return resultado
+
+    def salvar_job(self, job: Dict[str, Any]) -> bool:
+        """
+        Grava o estado do job (status, etapa, progresso, erro, run_id)
+        O pedido de cancelamento já registrado é preservado
+        """
+        try:
+            with self._conexao() as conn:
+                conn.execute(
+                    "INSERT INTO jobs (job_id, status, etapa, progresso, erro, run_id, criado_em, atualizado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(job_id) DO UPDATE SET status = excluded.status, etapa = excluded.etapa, "
+                    "progresso = excluded.progresso, erro = excluded.erro, run_id = excluded.run_id, "
+                    "atualizado_em = excluded.atualizado_em",
+                    (
+                        job["job_id"], job["status"], job.get("etapa"), job.get("progresso", 0),
+                        job.get("erro"), job.get("run_id"), job["criado_em"], job["atualizado_em"],
+                    ),
+                )
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao gravar job {job.get('job_id')}: {e}")
+            return False
+
+    def obter_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado do job (None se não existe ou já foi removido)"""
+        try:
+            linha = self._conexao().execute(
+                f"SELECT {', '.join(_JOB_CAMPOS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao ler job {job_id}: {e}")
+            return None
+        return dict(zip(_JOB_CAMPOS, linha)) if linha else None
+
+    def pedir_cancelamento(self, job_id: str) -> bool:
+        """Marca o job para cancelamento (False se não existe ou já terminou)"""
+        try:
+            with self._conexao() as conn:
+                return conn.execute(
+                    f"UPDATE jobs SET cancelar = 1, atualizado_em = ? "
+                    f"WHERE job_id = ? AND status NOT IN ({', '.join('?' * len(JOB_STATUS_FINAIS))})",
+                    (time.time(), job_id, *JOB_STATUS_FINAIS),
+                ).rowcount > 0
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao cancelar job {job_id}: {e}")
+            return False
+
+    def cancelamento_pedido(self, job_id: str) -> bool:
+        """True se alguém (qualquer worker) pediu o cancelamento do job"""
+        try:
+            linha = self._conexao().execute("SELECT cancelar FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        except sqlite3.Error:
+            return False
+        return bool(linha and linha[0])
+
+    def compactar(self) -> Dict[str, int]:
+        """
+        Remove registros velhos/excedentes e faz checkpoint do WAL
+
+        Apelidos saem junto com o resultado de origem
+
+        Returns:
+            {"removidos_idade": n, "removidos_excedentes": n, "registros": n,
+             "jobs_removidos": n, "aliases_removidos": n}
+        """
+        relatorio = {
+            "removidos_idade": 0, "removidos_excedentes": 0, "registros": 0,
+            "jobs_removidos": 0, "aliases_removidos": 0,
+        }
+        try:
+            conn = self._conexao()
+            with conn:
+                if self.max_idade_dias:
+                    limite = time.time() - self.max_idade_dias * 86400
+                    relatorio["removidos_idade"] = conn.execute(
+                        "DELETE FROM resultados WHERE acessado_em < ?", (limite,)
+                    ).rowcount
+                if self.max_registros:
+                    relatorio["removidos_excedentes"] = conn.execute(
+                        "DELETE FROM resultados WHERE run_id IN ("
+                        "SELECT run_id FROM resultados ORDER BY acessado_em DESC LIMIT -1 OFFSET ?)",
+                        (self.max_registros,),
+                    ).rowcount
+                relatorio["aliases_removidos"] = conn.execute(
+                    "DELETE FROM aliases WHERE run_id_origem NOT IN (SELECT run_id FROM resultados)"
+                ).rowcount
+                if self.retencao_jobs_horas:
+                    limite = time.time() - self.retencao_jobs_horas * 3600
+                    relatorio["jobs_removidos"] = conn.execute(
+                        f"DELETE FROM jobs WHERE atualizado_em < ? "
+                        f"AND status IN ({', '.join('?' * len(JOB_STATUS_FINAIS))})",
+                        (limite, *JOB_STATUS_FINAIS),
+                    ).rowcount
+            relatorio["registros"] = conn.execute("SELECT COUNT(*) FROM resultados").fetchone()[0]
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+            removidos = (
+                relatorio["removidos_idade"] + relatorio["removidos_excedentes"]
+                + relatorio["jobs_removidos"] + relatorio["aliases_removidos"]
+            )
+            if removidos:
+                logger.info(f"🧹 Store de resultados compactado: {removidos} removidos, {relatorio['registros']} mantidos")
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Erro ao compactar store de resultados: {e}")
+        return relatorio
+
+    def iniciar_compactacao(self, intervalo: float):
+        """Compacta agora e depois a cada `intervalo` segundos (thread daemon)"""
+        if self._compactador is not None or intervalo <= 0:
+            return
+
+        def laco():
+            while True:
+                self.compactar()
+                if self._parar.wait(intervalo):
+                    break
+
+        self._compactador = threading.Thread(target=laco, name="result-store-compactacao", daemon=True)
+        self._compactador.start()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        try:
+            conn = self._conexao()
+            registros, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(conteudo)), 0) FROM resultados"
+            ).fetchone()
+            aliases = conn.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]
+        except sqlite3.Error:
+            registros, total, aliases = None, None, None
+        return {"arquivo": str(self.caminho), "registros": registros, "aliases": aliases, "bytes": total}
+
+    def fechar(self):
+        self._parar.set()
+        if self._compactador is not None:
+            self._compactador.join(timeout=5)
+            self._compactador = None
+        with self._conexoes_lock:
+            for conn in self._conexoes:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._conexoes.clear()
+        self._local = threading.local()
+
+
+# Instância global (uma por processo; o arquivo é compartilhado entre processos)
+_result_store: Optional[ResultStore] = None
+_result_store_falhou = False
+_result_store_lock = threading.Lock()
+
+
+# Funções auxiliares para uso direto
+def obter_result_store() -> Optional[ResultStore]:
+    """Store do processo (None se RESULT_STORE_PATH vazio ou banco inacessível)"""
+    global _result_store, _result_store_falhou
+    if _result_store is None and not _result_store_falhou:
+        with _result_store_lock:
+            if _result_store is None and not _result_store_falhou:
+                from config import (
+                    BASE_DIR,
+                    JOBS_RETENTION_HOURS,
+                    RESULT_STORE_COMPACT_INTERVAL,
+                    RESULT_STORE_MAX_AGE_DAYS,
+                    RESULT_STORE_MAX_ROWS,
+                    RESULT_STORE_PATH,
+                )
+                if not RESULT_STORE_PATH:
+                    return None
+                try:
+                    store = ResultStore(
+                        BASE_DIR / RESULT_STORE_PATH,
+                        RESULT_STORE_MAX_AGE_DAYS,
+                        RESULT_STORE_MAX_ROWS,
+                        JOBS_RETENTION_HOURS,
+                    )
+                    store.iniciar_compactacao(RESULT_STORE_COMPACT_INTERVAL)
+                    _result_store = store
+                    logger.info(f"💾 Store de resultados: {store.caminho}")
+                except Exception as e:
+                    logger.error(f"❌ Store de resultados indisponível: {e}")
+                    _result_store_falhou = True
+    return _result_store
+
+
+def encerrar_result_store():
+    """Para a compactação e fecha as conexões (shutdown da aplicação)"""
+    global _result_store
+    with _result_store_lock:
+        if _result_store is not None:
+            _result_store.fechar()
+            _result_store = None
@@ -0,0 +1,299 @@
+"""
+Eventos de progresso por execução (GET /api/runs/{run_id}/events, Server-Sent Events)
+
+O cálculo publica início/fim de cada etapa (com tempo decorrido) e os cenários
+assim que são lidos; o endpoint SSE repassa ao navegador. O cliente escolhe o
+run_id (header X-Run-Id em /api/calcular) e pode assinar antes do cálculo começar
+
+Os eventos ficam na memória do processo da API: com vários workers do uvicorn,
+o stream precisa cair no mesmo worker do POST. Cálculos no pool de processos
+enviam os eventos ao processo da API por uma multiprocessing.Queue
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Eventos que encerram o stream
+EVENTOS_FINAIS = ("concluido", "erro")
+
+
+class RunIdEmUsoError(Exception):
+    """X-Run-Id já usado por uma execução em andamento ou concluída"""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        super().__init__(f"X-Run-Id já usado por outra execução: {run_id}")
+
+
+class _Execucao:
+    """Histórico e assinantes de um run_id"""
+
+    def __init__(self):
+        self.eventos: List[Dict[str, Any]] = []
+        self.assinantes: List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = []
+        self.finalizado_em: Optional[float] = None
+        # Já pedido por um POST (assinar antes do cálculo não reserva)
+        self.reservado = False
+
+
+class EventosExecucao:
+    """
+    Barramento de eventos por run_id
+
+    publicar() é chamado das threads do pool; assinar() roda no event loop.
+    Quem assina depois do início recebe o histórico antes dos eventos novos
+    """
+
+    def __init__(
+        self,
+        retencao: float = 300,
+        max_execucoes: int = 1000,
+        relogio: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            retencao: Segundos que o histórico de uma execução encerrada (ou que nunca começou) é mantido
+            max_execucoes: Máximo de execuções em memória (as mais antigas saem primeiro)
+            relogio: Fonte de tempo monotônica (testes)
+        """
+        self.retencao = retencao
+        self.max_execucoes = max_execucoes
+        self._relogio = relogio
+        self._execucoes: Dict[str, _Execucao] = {}
+        # run_id -> instante de expiração, em ordem de expiração (retenção fixa: basta
+        # reinserir no fim a cada mudança). Execuções em andamento não entram
+        self._expiracoes: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def publicar(self, run_id: str, tipo: str, dados: Optional[Dict[str, Any]] = None):
+        """Registra o evento e entrega aos assinantes (ignorado se a execução já terminou)"""
+        with self._lock:
+            execucao = self._execucoes.get(run_id)
+            if execucao is None:
+                execucao = self._execucoes[run_id] = _Execucao()
+            if execucao.finalizado_em is not None:
+                return
+            evento = {"id": len(execucao.eventos) + 1, "tipo": tipo, "run_id": run_id, **(dados or {})}
+            execucao.eventos.append(evento)
+            if tipo in EVENTOS_FINAIS:
+                execucao.finalizado_em = self._relogio()
+                self._agendar_expiracao(run_id)
+            else:
+                self._expiracoes.pop(run_id, None)  # em andamento: não expira
+            for loop, fila in execucao.assinantes:
+                try:
+                    loop.call_soon_threadsafe(fila.put_nowait, evento)
+                except RuntimeError:
+                    pass  # loop do assinante já fechou
+            self._limpar()
+
+    def reservar(self, run_id: str) -> bool:
+        """
+        Reserva o run_id para uma nova execução
+
+        Returns:
+            False se o run_id está em andamento ou já concluiu (dentro da retenção);
+            execução anterior que terminou em erro é descartada e o run_id recomeça
+        """
+        with self._lock:
+            self._limpar()
+            execucao = self._execucoes.get(run_id)
+            if execucao is not None and (execucao.reservado or execucao.eventos):
+                if execucao.finalizado_em is None or execucao.eventos[-1]["tipo"] != "erro":
+                    return False
+                execucao = None
+            if execucao is None:
+                execucao = self._execucoes[run_id] = _Execucao()
+            execucao.reservado = True
+            self._agendar_expiracao(run_id)  # retenção conta a partir do POST
+            return True
+
+    async def assinar(
+        self,
+        run_id: str,
+        intervalo_keepalive: float = 15,
+        espera_max: float = 120
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Eventos da execução até o evento final
+
+        Gera None a cada `intervalo_keepalive` sem eventos (o chamador envia um
+        comentário SSE para manter a conexão). Se nada chegar em `espera_max`
+        segundos, encerra com um evento "expirado"
+        """
+        loop = asyncio.get_running_loop()
+        fila: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._limpar()
+            execucao = self._execucoes.get(run_id)
+            if execucao is None:
+                execucao = self._execucoes[run_id] = _Execucao()
+                self._agendar_expiracao(run_id)
+            historico = list(execucao.eventos)
+            if execucao.finalizado_em is None:
+                execucao.assinantes.append((loop, fila))
+
+        try:
+            for evento in historico:
+                yield evento
+            if historico and historico[-1]["tipo"] in EVENTOS_FINAIS:
+                return
+
+            ultimo = time.monotonic()
+            while True:
+                try:
+                    evento = await asyncio.wait_for(fila.get(), timeout=intervalo_keepalive)
+                except asyncio.TimeoutError:
+                    if time.monotonic() - ultimo >= espera_max:
+                        yield {"id": 0, "tipo": "expirado", "run_id": run_id}
+                        return
+                    yield None
+                    continue
+                ultimo = time.monotonic()
+                yield evento
+                if evento["tipo"] in EVENTOS_FINAIS:
+                    return
+        finally:
+            with self._lock:
+                if (loop, fila) in execucao.assinantes:
+                    execucao.assinantes.remove((loop, fila))
+
+    def _agendar_expiracao(self, run_id: str):
+        """(Re)coloca o run_id no fim da fila de expiração (chamado com o lock)"""
+        self._expiracoes.pop(run_id, None)
+        self._expiracoes[run_id] = self._relogio() + self.retencao
+
+    def _limpar(self):
+        """
+        Remove execuções encerradas/abandonadas além da retenção (chamado com o lock)
+        Percorre só o início da fila de expiração - para na primeira ainda válida
+        """
+        agora = self._relogio()
+        while self._expiracoes:
+            run_id, expira_em = next(iter(self._expiracoes.items()))
+            if expira_em > agora:
+                break
+            del self._expiracoes[run_id]
+            execucao = self._execucoes.get(run_id)
+            if execucao is not None and execucao.assinantes:
+                self._agendar_expiracao(run_id)  # ainda assistida: confere de novo depois
+            elif execucao is not None:
+                del self._execucoes[run_id]
+        while len(self._execucoes) > self.max_execucoes:
+            run_id = next(iter(self._execucoes))
+            del self._execucoes[run_id]
+            self._expiracoes.pop(run_id, None)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "execucoes": len(self._execucoes),
+                "assinantes": sum(len(e.assinantes) for e in self._execucoes.values()),
+            }
+
+
+class Acompanhamento:
+    """
+    Etapas de uma execução: cada etapa() encerra a anterior (etapa_fim com duração)
+    e inicia a próxima (etapa_inicio), repassando (etapa, percentual) ao callback
+    de progresso dos jobs
+    """
+
+    def __init__(self, run_id: str, progresso: Optional[Callable[[str, int], None]] = None):
+        self.run_id = run_id
+        self.progresso = progresso
+        self.inicio = time.monotonic()
+        self._etapa: Optional[Tuple[str, float]] = None
+        self._parciais_enviados = False
+
+    def _decorrido_ms(self) -> int:
+        return int((time.monotonic() - self.inicio) * 1000)
+
+    def _encerrar_etapa(self):
+        if self._etapa is not None:
+            nome, inicio = self._etapa
+            publicar_evento(self.run_id, "etapa_fim", {
+                "etapa": nome,
+                "duracao_ms": int((time.monotonic() - inicio) * 1000),
+                "decorrido_ms": self._decorrido_ms(),
+            })
+            self._etapa = None
+
+    def etapa(self, nome: str, percentual: int):
+        self._encerrar_etapa()
+        if self.progresso is not None:
+            self.progresso(nome, percentual)  # jobs: pode interromper (cancelamento)
+        self._etapa = (nome, time.monotonic())
+        publicar_evento(self.run_id, "etapa_inicio", {
+            "etapa": nome,
+            "progresso": percentual,
+            "decorrido_ms": self._decorrido_ms(),
+        })
+
+    def parciais(self, cenarios: Dict[str, Any]):
+        """Um evento "cenario" por cenário calculado (uma vez por execução)"""
+        if self._parciais_enviados:
+            return
+        self._parciais_enviados = True
+        for nome, saida in cenarios.items():
+            valores = saida.model_dump() if hasattr(saida, "model_dump") else dict(saida)
+            publicar_evento(self.run_id, "cenario", {"cenario": nome, **valores})
+
+    def concluir(self, dados: Optional[Dict[str, Any]] = None):
+        self._encerrar_etapa()
+        publicar_evento(self.run_id, "concluido", {"decorrido_ms": self._decorrido_ms(), **(dados or {})})
+
+    def falhar(self, erro: BaseException):
+        self._encerrar_etapa()
+        publicar_evento(self.run_id, "erro", {"mensagem": str(erro), "decorrido_ms": self._decorrido_ms()})
+
+
+# Instância global (processo da API) e fila de envio (processos do pool)
+_eventos: Optional[EventosExecucao] = None
+_eventos_lock = threading.Lock()
+_fila_envio = None
+
+
+def configurar_envio_processo(fila):
+    """No processo filho do pool: publicar_evento passa a enviar pela fila ao processo da API"""
+    global _fila_envio
+    _fila_envio = fila
+
+
+def repassar_eventos(fila):
+    """Thread do processo da API: entrega ao barramento os eventos vindos do pool (None encerra)"""
+    while True:
+        try:
+            item = fila.get()
+        except (EOFError, OSError):
+            return
+        if item is None:
+            return
+        obter_eventos().publicar(*item)
+
+
+# Funções auxiliares para uso direto
+def obter_eventos() -> EventosExecucao:
+    """Barramento de eventos do processo"""
+    global _eventos
+    if _eventos is None:
+        with _eventos_lock:
+            if _eventos is None:
+                _eventos = EventosExecucao()
+    return _eventos
+
+
+def publicar_evento(run_id: str, tipo: str, dados: Optional[Dict[str, Any]] = None):
+    """Publica no barramento local ou, dentro do pool de processos, envia ao processo da API"""
+    if _fila_envio is not None:
+        try:
+            _fila_envio.put((run_id, tipo, dados))
+        except (OSError, ValueError) as e:
+            logger.debug(f"Evento {tipo} de {run_id} não enviado: {e}")
+        return
+    obter_eventos().publicar(run_id, tipo, dados)
@@ -0,0 +1,426 @@
+"""
+Saúde das APIs externas (BACEN) fora do caminho das requisições
+
+- CircuitBreaker: depois de N falhas seguidas o circuito abre e ninguém chama a
+  API até passar o tempo de espera; então uma única tentativa (meio aberto)
+  decide se fecha de novo ou continua aberto
+- MonitorUpstream: thread em segundo plano que verifica a API a cada intervalo
+  e executa atualizações agendadas (ex: lacunas do histórico SELIC), para que
+  nenhuma requisição espere pela rede
+
+Estado por processo: cada worker do uvicorn que usa o monitor tem o seu (a
+verificação é leve - um registro a cada UPSTREAM_PROBE_INTERVAL segundos).
+Os processos do pool de cálculos (CALC_EXECUTOR=process) não verificam nada:
+leem o status publicado pelo monitor do processo da API (memória compartilhada)
+e enviam a ele as atualizações agendadas por uma multiprocessing.Queue
+"""
+import json
+import logging
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Circuito fechado -> aberto -> meio aberto -> fechado
+
+    Uso:
+        if breaker.permitir():
+            try:
+                chamar_api()
+                breaker.registrar_sucesso()
+            except Exception:
+                breaker.registrar_falha()
+    """
+
+    FECHADO = "fechado"
+    ABERTO = "aberto"
+    MEIO_ABERTO = "meio_aberto"
+
+    def __init__(
+        self,
+        nome: str,
+        limite_falhas: int = 3,
+        tempo_aberto: float = 120.0,
+        relogio: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            nome: Nome do serviço (logs)
+            limite_falhas: Falhas seguidas para abrir o circuito
+            tempo_aberto: Segundos aberto antes de permitir uma nova tentativa
+            relogio: Fonte de tempo (testes)
+        """
+        self.nome = nome
+        self.limite_falhas = max(1, limite_falhas)
+        self.tempo_aberto = tempo_aberto
+        self._relogio = relogio
+        self._estado = self.FECHADO
+        self._falhas = 0
+        self._desde = relogio()
+        self._lock = threading.Lock()
+        self.aberturas = 0
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            return self._estado
+
+    def permitir(self) -> bool:
+        """True se a chamada pode ir à API (no meio aberto, só uma por vez)"""
+        with self._lock:
+            if self._estado == self.FECHADO:
+                return True
+            if self._relogio() - self._desde < self.tempo_aberto:
+                return False
+            # Aberto há tempo suficiente (ou tentativa anterior sem resposta): testa de novo
+            self._estado = self.MEIO_ABERTO
+            self._desde = self._relogio()
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            if self._estado != self.FECHADO:
+                logger.info(f"✅ Circuito {self.nome} fechado - API respondendo")
+            self._estado = self.FECHADO
+            self._falhas = 0
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            if self._estado == self.MEIO_ABERTO or self._falhas >= self.limite_falhas:
+                if self._estado == self.FECHADO:
+                    self.aberturas += 1
+                    logger.warning(
+                        f"⚡ Circuito {self.nome} aberto após {self._falhas} falha(s) - "
+                        f"nova tentativa em {self.tempo_aberto:.0f}s"
+                    )
+                self._estado = self.ABERTO
+                self._desde = self._relogio()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"estado": self._estado, "falhas_seguidas": self._falhas, "aberturas": self.aberturas}
+
+
+class MonitorUpstream:
+    """
+    Verificação periódica de uma API e fila de atualizações em segundo plano
+
+    A verificação e as tarefas agendadas passam pelo circuit breaker: com o
+    circuito aberto nada é chamado; as tarefas esperam ele fechar
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        verificar: Callable[[], bool],
+        breaker: CircuitBreaker,
+        intervalo: float = 300,
+        max_pendentes: int = 32,
+        relogio: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            nome: Nome da API (logs e métricas)
+            verificar: Chamada leve que retorna True se a API responde
+            breaker: Circuit breaker compartilhado com quem chama a API
+            intervalo: Segundos entre verificações (0 = só executa tarefas agendadas)
+            max_pendentes: Tarefas aguardando; além disso novas são descartadas
+            relogio: Fonte de tempo (testes)
+        """
+        self.nome = nome
+        self.verificar = verificar
+        self.breaker = breaker
+        self.intervalo = intervalo
+        self.max_pendentes = max_pendentes
+        self._relogio = relogio
+
+        self._pendentes: "OrderedDict[str, Callable[[], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.disponivel: Optional[bool] = None  # None = ainda não verificado
+        # Status publicado para os processos do pool de cálculos (None = só este processo)
+        self.compartilhado: Optional["EstadoCompartilhado"] = None
+        self.ultima_verificacao: Optional[datetime] = None
+        self.latencia_ms: Optional[int] = None
+        self.verificacoes = 0
+        self.tarefas_executadas = 0
+        self.tarefas_descartadas = 0
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name=f"monitor-{self.nome}", daemon=True)
+            self._thread.start()
+            logger.info(f"🩺 Monitor {self.nome} iniciado (verificação a cada {self.intervalo}s)")
+
+    def parar(self, timeout: float = 5.0):
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def verificar_agora(self) -> Optional[bool]:
+        """Uma verificação (respeitando o circuito); retorna o estado resultante"""
+        if not self.breaker.permitir():
+            self.disponivel = False
+            self._publicar()
+            return self.disponivel
+
+        inicio = self._relogio()
+        try:
+            ok = bool(self.verificar())
+        except Exception as e:
+            logger.warning(f"⚠️ Verificação {self.nome} falhou: {e}")
+            ok = False
+        self.latencia_ms = int((self._relogio() - inicio) * 1000)
+        self.ultima_verificacao = datetime.now()
+        self.verificacoes += 1
+
+        if ok:
+            self.breaker.registrar_sucesso()
+        else:
+            self.breaker.registrar_falha()
+        self.disponivel = ok
+        self._publicar()
+        return ok
+
+    def agendar(self, chave: str, tarefa: Callable[[], Any]) -> bool:
+        """
+        Executa `tarefa` em segundo plano (mesma chave pendente = uma execução só)
+
+        Returns:
+            False se a fila está cheia (tarefa descartada)
+        """
+        with self._lock:
+            if chave in self._pendentes:
+                return True
+            if len(self._pendentes) >= self.max_pendentes:
+                self.tarefas_descartadas += 1
+                return False
+            self._pendentes[chave] = tarefa
+        self._acordar.set()
+        return True
+
+    def executar_pendentes(self) -> int:
+        """
+        Executa as tarefas agendadas enquanto o circuito estiver fechado
+        (a tentativa do meio aberto fica com a verificação periódica)
+        """
+        executadas = 0
+        while not self._parar.is_set():
+            with self._lock:
+                if not self._pendentes:
+                    break
+            if self.breaker.estado != CircuitBreaker.FECHADO:
+                break
+            with self._lock:
+                chave, tarefa = self._pendentes.popitem(last=False)
+            try:
+                tarefa()
+            except Exception as e:
+                logger.warning(f"⚠️ Atualização {chave} falhou: {e}")
+            executadas += 1
+            self.tarefas_executadas += 1
+            self._publicar()  # a tarefa pode ter aberto ou fechado o circuito
+        return executadas
+
+    def _executar(self):
+        proxima = self._relogio()
+        while not self._parar.is_set():
+            if self.intervalo > 0 and self._relogio() >= proxima:
+                self.verificar_agora()
+                proxima = self._relogio() + self.intervalo
+            self.executar_pendentes()
+
+            espera = proxima - self._relogio() if self.intervalo > 0 else None
+            # Com tarefas pendentes e circuito aberto, revisita quando ele puder meio-abrir
+            if self._pendentes and self.breaker.estado != CircuitBreaker.FECHADO:
+                espera = min(espera or self.breaker.tempo_aberto, self.breaker.tempo_aberto)
+            self._acordar.wait(timeout=max(0.0, espera) if espera is not None else None)
+            self._acordar.clear()
+
+    def status(self) -> Dict[str, Any]:
+        """Estado para selic_context e métricas (sem rede)"""
+        return {
+            "disponivel": self.disponivel,
+            "circuito": self.breaker.estado,
+            "ultima_verificacao": self.ultima_verificacao.isoformat() if self.ultima_verificacao else None,
+            "latencia_ms": self.latencia_ms,
+        }
+
+    def _publicar(self):
+        if self.compartilhado is not None:
+            self.compartilhado.gravar(self.status())
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            pendentes = len(self._pendentes)
+        return {
+            **self.status(),
+            **self.breaker.estatisticas(),
+            "verificacoes": self.verificacoes,
+            "tarefas_pendentes": pendentes,
+            "tarefas_executadas": self.tarefas_executadas,
+            "tarefas_descartadas": self.tarefas_descartadas,
+        }
+
+
+class EstadoCompartilhado:
+    """
+    Último status() de um monitor em memória compartilhada entre processos
+    O processo da API grava; os processos do pool de cálculos só leem
+    """
+
+    TAMANHO = 512  # bytes - status() serializado tem menos de 200
+
+    def __init__(self):
+        self._valor = multiprocessing.Array("c", self.TAMANHO)
+
+    def gravar(self, status: Dict[str, Any]):
+        conteudo = json.dumps(status).encode("utf-8")
+        if len(conteudo) >= self.TAMANHO:
+            logger.warning(f"⚠️ Status do monitor grande demais para publicar ({len(conteudo)} bytes)")
+            return
+        with self._valor.get_lock():
+            self._valor.value = conteudo
+
+    def ler(self) -> Optional[Dict[str, Any]]:
+        with self._valor.get_lock():
+            conteudo = self._valor.value
+        return json.loads(conteudo) if conteudo else None
+
+
+class MonitorRemoto:
+    """
+    Monitor visto de um processo do pool de cálculos: sem thread nem rede
+
+    status() lê o que o monitor do processo da API publicou; agendar() envia a
+    tarefa (precisa ser serializável - função de módulo ou functools.partial)
+    para ser executada por ele
+    """
+
+    def __init__(self, nome: str, estado: EstadoCompartilhado, fila):
+        self.nome = nome
+        self._estado = estado
+        self._fila = fila
+
+    def agendar(self, chave: str, tarefa: Callable[[], Any]) -> bool:
+        try:
+            self._fila.put((chave, tarefa))
+            return True
+        except (OSError, ValueError) as e:
+            logger.debug(f"Atualização {chave} não enviada ao processo da API: {e}")
+            return False
+
+    def status(self) -> Dict[str, Any]:
+        return self._estado.ler() or {
+            "disponivel": None,
+            "circuito": None,
+            "ultima_verificacao": None,
+            "latencia_ms": None,
+        }
+
+
+def repassar_agendamentos(fila):
+    """Thread do processo da API: agenda no monitor as tarefas vindas do pool (None encerra)"""
+    while True:
+        try:
+            item = fila.get()
+        except (EOFError, OSError):
+            return
+        if item is None:
+            return
+        obter_monitor_bacen().agendar(*item)
+
+
+# Instâncias globais (por processo)
+_breakers: Dict[str, CircuitBreaker] = {}
+_monitor_bacen: Optional[Union[MonitorUpstream, MonitorRemoto]] = None
+# Canal com os processos do pool: (status publicado, fila de agendamentos)
+_canal_bacen: Optional[Tuple[EstadoCompartilhado, Any]] = None
+_lock = threading.Lock()
+
+
+# Funções auxiliares para uso direto
+def obter_circuit_breaker(nome: str) -> CircuitBreaker:
+    """Circuit breaker do serviço (UPSTREAM_BREAKER_* no config)"""
+    with _lock:
+        if nome not in _breakers:
+            try:
+                from config import UPSTREAM_BREAKER_FAILURES, UPSTREAM_BREAKER_OPEN_SECONDS
+            except ImportError:  # importado como src.<módulo>
+                from src.config import UPSTREAM_BREAKER_FAILURES, UPSTREAM_BREAKER_OPEN_SECONDS
+            _breakers[nome] = CircuitBreaker(nome, UPSTREAM_BREAKER_FAILURES, UPSTREAM_BREAKER_OPEN_SECONDS)
+        return _breakers[nome]
+
+
+def obter_monitor_bacen() -> Union[MonitorUpstream, MonitorRemoto]:
+    """
+    Monitor da API BACEN, iniciado no primeiro uso do processo
+    (nos processos do pool de cálculos: o MonitorRemoto de configurar_monitor_processo)
+    """
+    global _monitor_bacen
+    if _monitor_bacen is None:
+        from bacen_service import obter_bacen_service
+        from config import UPSTREAM_PROBE_INTERVAL
+        servico = obter_bacen_service()
+        breaker = obter_circuit_breaker("BACEN")
+        with _lock:
+            if _monitor_bacen is None:
+                monitor = MonitorUpstream("BACEN", servico.verificar_disponibilidade, breaker, UPSTREAM_PROBE_INTERVAL)
+                if _canal_bacen is not None:
+                    monitor.compartilhado = _canal_bacen[0]
+                    monitor._publicar()
+                monitor.iniciar()
+                _monitor_bacen = monitor
+    return _monitor_bacen
+
+
+def canal_monitor_bacen() -> Tuple[EstadoCompartilhado, Any]:
+    """
+    No processo da API: (status compartilhado, fila de agendamentos) para os
+    processos do pool - argumentos de configurar_monitor_processo
+    """
+    global _canal_bacen
+    with _lock:
+        if _canal_bacen is None:
+            fila = multiprocessing.Queue()
+            _canal_bacen = (EstadoCompartilhado(), fila)
+            threading.Thread(
+                target=repassar_agendamentos, args=(fila,), name="monitor-BACEN-agendamentos", daemon=True
+            ).start()
+            if isinstance(_monitor_bacen, MonitorUpstream):
+                _monitor_bacen.compartilhado = _canal_bacen[0]
+                _monitor_bacen._publicar()
+        return _canal_bacen
+
+
+def configurar_monitor_processo(estado: EstadoCompartilhado, fila):
+    """No processo filho do pool: obter_monitor_bacen passa a ler o monitor do processo da API"""
+    global _monitor_bacen
+    with _lock:
+        _monitor_bacen = MonitorRemoto("BACEN", estado, fila)
+
+
+def encerrar_monitor_bacen():
+    """Para a thread do monitor e o repasse de agendamentos do pool (shutdown da API)"""
+    global _monitor_bacen, _canal_bacen
+    with _lock:
+        monitor, _monitor_bacen = _monitor_bacen, None
+        canal, _canal_bacen = _canal_bacen, None
+    if isinstance(monitor, MonitorUpstream):
+        monitor.parar()
+    if canal is not None:
+        canal[1].put(None)  # encerra a thread de repasse
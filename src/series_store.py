@@ -0,0 +1,338 @@
+"""
+Histórico local das séries de taxas (SELIC, TR, IPCA, IPCA-E)
+
+Um arquivo por série em data/cache (<taxa>_cache.json, os mesmos de antes).
+Cada busca na API é mesclada ao histórico - ordenado, sem duplicatas - e o
+intervalo buscado entra na lista de intervalos cobertos; consultas a períodos
+já cobertos são respondidas sem rede e só as lacunas vão para a API
+
+O conteúdo lido fica em memória já convertido - datas ordenadas e valores em
+vetores `array` - e só é relido quando o arquivo muda (mtime/tamanho); uma
+consulta por período é uma busca binária (bisect) mais a fatia
+
+Gravação atômica (arquivo temporário + os.replace) sob trava de arquivo, então
+vários workers podem mesclar ao mesmo tempo sem perder dados. Arquivos no
+formato antigo (um único data_inicio/data_fim) são lidos como um intervalo
+coberto e convertidos na primeira gravação
+"""
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Flags para verificar dependências opcionais (trava de arquivo por plataforma)
+FCNTL_AVAILABLE = False
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    pass
+
+MSVCRT_AVAILABLE = False
+try:
+    import msvcrt
+    MSVCRT_AVAILABLE = True
+except ImportError:
+    pass
+
+Intervalo = Tuple[date, date]
+
+
+def arquivo_serie(nome: str) -> str:
+    """'IPCA-E' -> 'ipca_e_cache.json' (nomes usados por BacenService/IbgeService)"""
+    return f"{nome.lower().replace('-', '_')}_cache.json"
+
+
+def data_registro(registro: Dict[str, Any]) -> date:
+    """Data do registro: 'DD/MM/YYYY' (BACEN) ou 'MM/YYYY' (IBGE, dia 1)"""
+    partes = [int(p) for p in registro["data"].split("/")]
+    if len(partes) == 2:
+        return date(partes[1], partes[0], 1)
+    return date(partes[2], partes[1], partes[0])
+
+
+def _fim_do_periodo(registro: Dict[str, Any]) -> date:
+    """Último dia coberto pelo registro (mensal: fim do mês)"""
+    inicio = data_registro(registro)
+    if registro["data"].count("/") == 1:
+        proximo = date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+        return proximo - timedelta(days=1)
+    return inicio
+
+
+def _valor(registro: Dict[str, Any]) -> float:
+    try:
+        return float(registro["valor"])
+    except (KeyError, TypeError, ValueError):
+        return math.nan
+
+
+def _chave(registro: Dict[str, Any]) -> Tuple[date, str]:
+    # TR: várias taxas com a mesma data de início (dataFim diferente)
+    return data_registro(registro), registro.get("dataFim", "")
+
+
+def mesclar_intervalos(intervalos: List[Intervalo]) -> List[Intervalo]:
+    """Ordena e une intervalos sobrepostos ou contíguos (dia seguinte)"""
+    unidos: List[Intervalo] = []
+    for inicio, fim in sorted(intervalos):
+        if unidos and inicio <= unidos[-1][1] + timedelta(days=1):
+            unidos[-1] = (unidos[-1][0], max(unidos[-1][1], fim))
+        else:
+            unidos.append((inicio, fim))
+    return unidos
+
+
+class SeriesStore:
+    """
+    Séries de taxas em arquivos JSON, com cobertura por intervalos
+
+    Leituras não travam (os.replace é atômico); o conteúdo lido fica em memória
+    até o arquivo mudar (mtime/tamanho) e as gravações do próprio processo já
+    deixam a versão nova em memória
+    """
+
+    def __init__(self, diretorio: Path, margem_publicacao_dias: int = 45):
+        """
+        Args:
+            diretorio: Pasta dos arquivos (data/cache)
+            margem_publicacao_dias: Períodos buscados que terminam há menos que isso
+                só contam como cobertos até o último dado recebido (o resto pode
+                ainda não ter sido publicado)
+        """
+        self.diretorio = Path(diretorio)
+        self.margem_publicacao_dias = margem_publicacao_dias
+        self._lidos: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def _caminho(self, nome: str) -> Path:
+        return self.diretorio / arquivo_serie(nome)
+
+    def ler(self, nome: str) -> Dict[str, Any]:
+        """
+        Conteúdo da série (não alterar - é compartilhado entre as consultas):
+        {
+            "dados": [...] ordenados,
+            "datas": array('q') com date.toordinal() de cada registro,
+            "valores": array('d') com o valor de cada registro (NaN se inválido),
+            "intervalos": [(inicio, fim), ...]
+        }
+        (vazio se o arquivo não existe ou está ilegível)
+        """
+        caminho = self._caminho(nome)
+        try:
+            stat = caminho.stat()
+        except OSError:
+            return self._normalizar({})
+
+        assinatura = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            lido = self._lidos.get(nome)
+        if lido and lido[0] == assinatura:
+            return lido[1]
+
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                bruto = json.load(f)
+            conteudo = self._normalizar(bruto)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Série {nome} ilegível em {caminho}: {e}")
+            return self._normalizar({})
+
+        with self._lock:
+            self._lidos[nome] = (assinatura, conteudo)
+        return conteudo
+
+    @staticmethod
+    def _normalizar(bruto: Dict[str, Any]) -> Dict[str, Any]:
+        """Formato novo ou antigo -> dados ordenados, vetores de datas/valores e intervalos como datas"""
+        if "intervalos" in bruto:
+            intervalos = [(date.fromisoformat(i), date.fromisoformat(f)) for i, f in bruto["intervalos"]]
+        elif bruto.get("data_inicio") and bruto.get("data_fim"):
+            # Formato antigo: o arquivo guardava só a última busca
+            intervalos = [(date.fromisoformat(bruto["data_inicio"]), date.fromisoformat(bruto["data_fim"]))]
+        else:
+            intervalos = []
+        dados = sorted(bruto.get("dados", []), key=_chave)
+        return {
+            "dados": dados,
+            "datas": array("q", (data_registro(d).toordinal() for d in dados)),
+            "valores": array("d", (_valor(d) for d in dados)),
+            "intervalos": mesclar_intervalos(intervalos),
+        }
+
+    def cobertura(self, nome: str) -> List[Intervalo]:
+        return list(self.ler(nome)["intervalos"])
+
+    def lacunas(self, nome: str, inicio: date, fim: date) -> List[Intervalo]:
+        """Partes de [inicio, fim] fora dos intervalos cobertos"""
+        faltando: List[Intervalo] = []
+        cursor = inicio
+        for coberto_inicio, coberto_fim in self.ler(nome)["intervalos"]:
+            if coberto_fim < cursor:
+                continue
+            if coberto_inicio > fim:
+                break
+            if coberto_inicio > cursor:
+                faltando.append((cursor, coberto_inicio - timedelta(days=1)))
+            cursor = max(cursor, coberto_fim + timedelta(days=1))
+            if cursor > fim:
+                break
+        if cursor <= fim:
+            faltando.append((cursor, fim))
+        return faltando
+
+    def _fatia(self, conteudo: Dict[str, Any], inicio: date, fim: date) -> slice:
+        datas = conteudo["datas"]
+        return slice(bisect_left(datas, inicio.toordinal()), bisect_right(datas, fim.toordinal()))
+
+    def registros(self, nome: str, inicio: date, fim: date) -> List[Dict[str, Any]]:
+        """Registros com data em [inicio, fim], coberto ou não"""
+        conteudo = self.ler(nome)
+        return conteudo["dados"][self._fatia(conteudo, inicio, fim)]
+
+    def vetores(self, nome: str, inicio: date, fim: date) -> Tuple[array, array]:
+        """(datas ordinais, valores) dos registros em [inicio, fim]"""
+        conteudo = self.ler(nome)
+        fatia = self._fatia(conteudo, inicio, fim)
+        return conteudo["datas"][fatia], conteudo["valores"][fatia]
+
+    def consultar(self, nome: str, inicio: date, fim: date) -> Optional[List[Dict[str, Any]]]:
+        """Registros do período se ele está inteiramente coberto (None = precisa buscar)"""
+        if self.lacunas(nome, inicio, fim):
+            return None
+        return self.registros(nome, inicio, fim)
+
+    def todos(self, nome: str) -> List[Dict[str, Any]]:
+        return list(self.ler(nome)["dados"])
+
+    def mesclar(self, nome: str, dados: List[Dict[str, Any]], inicio: date, fim: date) -> int:
+        """
+        Junta registros buscados em [inicio, fim] ao histórico e marca o intervalo como coberto
+        Registros repetidos (mesma data/dataFim) são substituídos pelos novos
+
+        Returns:
+            Quantidade de registros que não existiam
+        """
+        # Período recente: só conta como coberto até o último dado publicado
+        if fim >= date.today() - timedelta(days=self.margem_publicacao_dias):
+            ultimo = max((_fim_do_periodo(d) for d in dados), default=None)
+            fim = min(fim, ultimo) if ultimo else inicio - timedelta(days=1)
+
+        caminho = self._caminho(nome)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        with self._travar(caminho):
+            atual = self._normalizar(self._ler_arquivo(caminho))
+            por_chave = {_chave(d): d for d in atual["dados"]}
+            novos = sum(1 for d in dados if _chave(d) not in por_chave)
+            por_chave.update((_chave(d), d) for d in dados)
+
+            intervalos = list(atual["intervalos"])
+            if inicio <= fim:
+                intervalos.append((inicio, fim))
+            intervalos = mesclar_intervalos(intervalos)
+
+            conteudo = {
+                "taxa": nome,
+                "data_inicio": intervalos[0][0].isoformat() if intervalos else None,
+                "data_fim": intervalos[-1][1].isoformat() if intervalos else None,
+                "intervalos": [[i.isoformat(), f.isoformat()] for i, f in intervalos],
+                "atualizado_em": datetime.now().isoformat(),
+                "dados": [por_chave[chave] for chave in sorted(por_chave)],
+            }
+            self._gravar_atomico(caminho, conteudo)
+            self._memorizar(nome, caminho, conteudo)
+
+        logger.debug(f"Série {nome}: +{novos} registros, cobertura {conteudo['intervalos']}")
+        return novos
+
+    def _memorizar(self, nome: str, caminho: Path, bruto: Dict[str, Any]):
+        """Deixa a versão recém-gravada em memória (evita reler o próprio arquivo)"""
+        try:
+            stat = caminho.stat()
+        except OSError:
+            return
+        with self._lock:
+            self._lidos[nome] = ((stat.st_mtime_ns, stat.st_size), self._normalizar(bruto))
+
+    @staticmethod
+    def _ler_arquivo(caminho: Path) -> Dict[str, Any]:
+        try:
+            with open(caminho, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"⚠️ {caminho} corrompido, recomeçando a série: {e}")
+            return {}
+
+    @staticmethod
+    def _gravar_atomico(caminho: Path, conteudo: Dict[str, Any]):
+        descritor, temporario = tempfile.mkstemp(dir=caminho.parent, prefix=f".{caminho.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(descritor, "w", encoding="utf-8") as f:
+                json.dump(conteudo, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporario, caminho)
+        except BaseException:
+            try:
+                os.unlink(temporario)
+            except OSError:
+                pass
+            raise
+
+    @contextmanager
+    def _travar(self, caminho: Path):
+        """Trava exclusiva entre processos (arquivo .lock ao lado da série)"""
+        with open(f"{caminho}.lock", "a+b") as trava:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(trava.fileno(), fcntl.LOCK_EX)
+            elif MSVCRT_AVAILABLE:
+                trava.seek(0)
+                msvcrt.locking(trava.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(trava.fileno(), fcntl.LOCK_UN)
+                elif MSVCRT_AVAILABLE:
+                    trava.seek(0)
+                    msvcrt.locking(trava.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Instâncias por diretório (cache de leitura compartilhado entre serviços)
+_stores: Dict[Path, SeriesStore] = {}
+_stores_lock = threading.Lock()
+
+
+# Funções auxiliares para uso direto
+def obter_series_store(diretorio: Optional[Path] = None) -> SeriesStore:
+    """Store do diretório (padrão: TAXAS_CACHE_DIR)"""
+    if diretorio is None:
+        from config import TAXAS_CACHE_DIR
+        diretorio = TAXAS_CACHE_DIR
+    chave = Path(diretorio).resolve()
+    with _stores_lock:
+        if chave not in _stores:
+            _stores[chave] = SeriesStore(chave)
+        return _stores[chave]
+
+
+if __name__ == "__main__":
+    # Cobertura local de cada série
+    store = obter_series_store()
+    for serie in ("SELIC", "TR", "IPCA", "IPCA-E"):
+        intervalos = store.cobertura(serie)
+        texto = ", ".join(f"{i:%d/%m/%Y}-{f:%d/%m/%Y}" for i, f in intervalos) or "sem dados"
+        print(f"{serie:7s} {len(store.todos(serie)):6d} registros | {texto}")
@@ -0,0 +1,129 @@
+"""
+Coalescência de cálculos idênticos em andamento (single-flight)
+A primeira requisição de uma chave executa; as duplicadas que chegam
+enquanto ela roda aguardam o mesmo Future e recebem o mesmo resultado
+"""
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FuturoTimeout
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Intervalo (s) entre verificações de quem aguarda a execução líder (ex: job cancelado)
+INTERVALO_VERIFICACAO = 1.0
+
+
+class ExecucaoCancelada(Exception):
+    """
+    Execução interrompida a pedido de quem a iniciou (ex: job cancelado)
+    Não é um erro do cálculo: quem aguardava a mesma chave executa de novo
+    """
+
+
+class SingleFlight:
+    """
+    Uma execução por chave ao mesmo tempo
+
+    Thread-safe: as requisições rodam no threadpool do FastAPI
+    """
+
+    def __init__(self):
+        self._em_voo: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.execucoes = 0
+        self.coalescidas = 0
+
+    def executar(
+        self,
+        chave: str,
+        funcao: Callable[[], Any],
+        verificar: Optional[Callable[[], None]] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Executa `funcao` ou aguarda a execução em andamento da mesma chave
+
+        Args:
+            chave: Hash canônico das entradas
+            funcao: Cálculo (sem argumentos)
+            verificar: Chamada a cada INTERVALO_VERIFICACAO enquanto aguarda a líder;
+                levanta ExecucaoCancelada para desistir sem esperar o fim da líder
+
+        Returns:
+            (resultado, compartilhado) - compartilhado=True quando veio de outra execução
+
+        Raises:
+            A mesma exceção da execução líder (exceto ExecucaoCancelada, que faz
+            as requisições em espera executarem por conta própria) ou a
+            ExecucaoCancelada levantada por `verificar`
+        """
+        while True:
+            with self._lock:
+                futuro = self._em_voo.get(chave)
+                if futuro is not None:
+                    self.coalescidas += 1
+                    lider = False
+                else:
+                    futuro = Future()
+                    self._em_voo[chave] = futuro
+                    self.execucoes += 1
+                    lider = True
+
+            if lider:
+                break
+
+            logger.info(f"🔗 Cálculo idêntico em andamento - aguardando resultado ({chave[:12]})")
+            try:
+                return self._aguardar(futuro, verificar), True
+            except ExecucaoCancelada as e:
+                if not futuro.done() or futuro.exception() is not e:
+                    # Cancelada por `verificar` - não pela líder
+                    logger.info(f"🛑 Espera pelo cálculo idêntico cancelada ({chave[:12]})")
+                    raise
+                logger.info(f"🔁 Execução líder cancelada - executando novamente ({chave[:12]})")
+
+        try:
+            resultado = funcao()
+            futuro.set_result(resultado)
+            return resultado, False
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._em_voo.pop(chave, None)
+
+    @staticmethod
+    def _aguardar(futuro: Future, verificar: Optional[Callable[[], None]]) -> Any:
+        """Resultado da líder; sem `verificar`, bloqueia até ela terminar"""
+        if verificar is None:
+            return futuro.result()
+        while True:
+            try:
+                return futuro.result(timeout=INTERVALO_VERIFICACAO)
+            except FuturoTimeout:
+                verificar()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "execucoes": self.execucoes,
+                "coalescidas": self.coalescidas,
+                "em_andamento": len(self._em_voo),
+            }
+
+
+# Instância global (por processo)
+_single_flight: Optional[SingleFlight] = None
+_single_flight_lock = threading.Lock()
+
+
+# Funções auxiliares para uso direto
+def obter_single_flight() -> SingleFlight:
+    """Coalescedor de cálculos do processo"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,216 @@
+"""
+Frontend estático pré-comprimido e com cache (substitui o StaticFiles)
+
+Na subida, cada arquivo de static/ é lido uma vez, comprimido em gzip e, se o
+pacote `brotli` estiver instalado, em brotli. As respostas saem da memória:
+- negociação por Accept-Encoding (br > gzip > sem compressão)
+- ETag forte por variante e 304 para If-None-Match
+- nomes com hash do conteúdo (script.<hash>.js) servidos com cache imutável;
+  o index.html é reescrito para referenciar esses nomes e sempre revalida
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+
+logger = logging.getLogger(__name__)
+
+# Flag para verificar dependência opcional
+BROTLI_AVAILABLE = False
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    pass
+
+# Tipos que valem a pena comprimir
+_COMPRIMIVEIS = ("text/", "application/javascript", "application/json", "image/svg+xml")
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"
+
+# Sufixo de ETag por codificação
+_SUFIXOS = {"br": "-br", "gzip": "-gz", "identity": ""}
+
+
+@dataclass
+class Ativo:
+    """Um arquivo do frontend e suas variantes comprimidas"""
+    url: str
+    tipo: str
+    conteudo: bytes
+    hash: str
+    imutavel: bool = False
+    variantes: Dict[str, bytes] = field(default_factory=dict)
+
+    def etag(self, codificacao: str) -> str:
+        return f'"{self.hash}{_SUFIXOS[codificacao]}"'
+
+    def corpo(self, codificacao: str) -> bytes:
+        return self.variantes.get(codificacao, self.conteudo)
+
+
+def escolher_codificacao(accept_encoding: str, disponiveis) -> str:
+    """
+    Melhor codificação aceita pelo cliente entre as disponíveis
+
+    Respeita q=0 (recusa); br tem preferência sobre gzip quando ambos são aceitos
+    """
+    aceitas: Dict[str, float] = {}
+    for parte in accept_encoding.lower().split(","):
+        nome, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                q = float(parametros.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if nome:
+            aceitas[nome] = q
+
+    for codificacao in ("br", "gzip"):
+        q = aceitas.get(codificacao, aceitas.get("*", 0.0))
+        if codificacao in disponiveis and q > 0:
+            return codificacao
+    return "identity"
+
+
+class StaticAssets:
+    """
+    Aplicação ASGI com os arquivos de um diretório em memória
+
+    Uso: app.mount("/", StaticAssets(STATIC_DIR), name="static")
+    """
+
+    def __init__(self, diretorio: Path, min_bytes: int = 512):
+        """
+        Args:
+            diretorio: Pasta do frontend (index.html, .js, .css...)
+            min_bytes: Arquivos menores que isso não são comprimidos
+        """
+        self.diretorio = Path(diretorio)
+        self.min_bytes = min_bytes
+        self._ativos: Dict[str, Ativo] = {}
+        self.carregar()
+
+    def carregar(self):
+        """Lê, calcula hashes, gera nomes imutáveis e comprime todos os arquivos"""
+        ativos: Dict[str, Ativo] = {}
+        renomeados: Dict[str, str] = {}
+
+        arquivos = sorted(p for p in self.diretorio.rglob("*") if p.is_file())
+        paginas = [p for p in arquivos if p.suffix == ".html"]
+
+        for caminho in arquivos:
+            if caminho in paginas:
+                continue
+            url = "/" + caminho.relative_to(self.diretorio).as_posix()
+            ativo = self._criar(url, caminho.read_bytes())
+            ativos[url] = ativo
+            # script.js -> script.<hash>.js (conteúdo muda = nome muda)
+            hashed = re.sub(r"(\.[^./]+)$", rf".{ativo.hash[:10]}\1", url)
+            ativos[hashed] = Ativo(url=hashed, tipo=ativo.tipo, conteudo=ativo.conteudo, hash=ativo.hash,
+                                   imutavel=True, variantes=ativo.variantes)
+            renomeados[url] = hashed
+
+        for caminho in paginas:
+            url = "/" + caminho.relative_to(self.diretorio).as_posix()
+            html = self._reescrever(caminho.read_text(encoding="utf-8"), url, renomeados)
+            ativos[url] = self._criar(url, html.encode("utf-8"))
+
+        self._ativos = ativos
+        total = sum(len(a.conteudo) for a in ativos.values() if not a.imutavel)
+        comprimido = sum(len(a.variantes.get("gzip", a.conteudo)) for a in ativos.values() if not a.imutavel)
+        logger.info(
+            f"📦 Frontend em memória: {len(renomeados) + len(paginas)} arquivos, "
+            f"{total} bytes ({comprimido} em gzip{', brotli ativo' if BROTLI_AVAILABLE else ''})"
+        )
+
+    def _criar(self, url: str, conteudo: bytes) -> Ativo:
+        tipo = mimetypes.guess_type(url)[0] or "application/octet-stream"
+        if tipo == "application/javascript":
+            tipo += "; charset=utf-8"  # text/* já recebe charset da Response
+        ativo = Ativo(url=url, tipo=tipo, conteudo=conteudo, hash=hashlib.sha256(conteudo).hexdigest()[:16])
+
+        if len(conteudo) >= self.min_bytes and tipo.startswith(_COMPRIMIVEIS):
+            # mtime=0: mesmo conteúdo, mesmos bytes comprimidos
+            variantes = {"gzip": gzip.compress(conteudo, compresslevel=9, mtime=0)}
+            if BROTLI_AVAILABLE:
+                variantes["br"] = brotli.compress(conteudo, quality=11)
+            ativo.variantes = {cod: dados for cod, dados in variantes.items() if len(dados) < len(conteudo)}
+        return ativo
+
+    @staticmethod
+    def _reescrever(html: str, url_pagina: str, renomeados: Mapping[str, str]) -> str:
+        """Troca href/src relativos ou absolutos pelos nomes com hash"""
+        base = url_pagina.rsplit("/", 1)[0] + "/"
+
+        def trocar(match: "re.Match") -> str:
+            valor = match.group(2)
+            if "://" in valor or valor.startswith(("#", "data:", "//")):
+                return match.group(0)
+            alvo = valor if valor.startswith("/") else base + valor
+            novo = renomeados.get(alvo)
+            if novo is None:
+                return match.group(0)
+            if not valor.startswith("/"):
+                novo = novo[len(base):]
+            return f'{match.group(1)}"{novo}"'
+
+        return re.sub(r'((?:href|src)=)"([^"]+)"', trocar, html)
+
+    def resolver(self, caminho: str) -> Optional[Ativo]:
+        if caminho.endswith("/"):
+            caminho += "index.html"
+        return self._ativos.get(caminho)
+
+    def responder(self, metodo: str, caminho: str, cabecalhos: Mapping[str, str]) -> Response:
+        """Resposta para o caminho pedido (404 se não existe, 405 fora de GET/HEAD)"""
+        if metodo not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        ativo = self.resolver(caminho)
+        if ativo is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        codificacao = escolher_codificacao(cabecalhos.get("accept-encoding", ""), ativo.variantes)
+        headers = {
+            "ETag": ativo.etag(codificacao),
+            "Cache-Control": CACHE_IMUTAVEL if ativo.imutavel else CACHE_REVALIDAR,
+            "Vary": "Accept-Encoding",
+        }
+        if codificacao != "identity":
+            headers["Content-Encoding"] = codificacao
+
+        if_none_match = cabecalhos.get("if-none-match")
+        if if_none_match and self._etag_confere(if_none_match, ativo):
+            return Response(status_code=304, headers=headers)
+
+        corpo = ativo.corpo(codificacao)
+        if metodo == "HEAD":
+            headers["Content-Length"] = str(len(corpo))
+            return Response(status_code=200, headers=headers, media_type=ativo.tipo)
+        return Response(content=corpo, status_code=200, headers=headers, media_type=ativo.tipo)
+
+    @staticmethod
+    def _etag_confere(if_none_match: str, ativo: Ativo) -> bool:
+        if if_none_match.strip() == "*":
+            return True
+        etags = {ativo.etag(cod) for cod in _SUFIXOS}
+        return any(tag.strip().removeprefix("W/") in etags for tag in if_none_match.split(","))
+
+    def urls(self) -> List[Tuple[str, bool]]:
+        """(url, imutável) de tudo que é servido"""
+        return sorted((url, ativo.imutavel) for url, ativo in self._ativos.items())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        request = Request(scope, receive)
+        resposta = self.responder(request.method, request.url.path, request.headers)
+        await resposta(scope, receive, send)
@@ -8,8 +8,9 @@ from datetime import date
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 
-from src.bacen_service import BacenService
-from src.ibge_service import IbgeService
+from src.bacen_service import obter_bacen_service
+from src.http_client import executar_em_paralelo
+from src.ibge_service import obter_ibge_service
 
 logger = logging.getLogger(__name__)
 
@@ -50,9 +51,9 @@ class TaxasCompletoValidator:
     ULTIMA_ATUALIZACAO_EXCEL = date(2025, 1, 31)
     
     def __init__(self):
-        """Inicializa serviços de API"""
-        self.bacen = BacenService()
-        self.ibge = IbgeService()
+        """Inicializa serviços de API (instâncias compartilhadas do processo)"""
+        self.bacen = obter_bacen_service()
+        self.ibge = obter_ibge_service()
         
         logger.info("TaxasCompletoValidator inicializado")
     
@@ -84,13 +85,14 @@ class TaxasCompletoValidator:
                 'mensagem': 'Excel desatualizado. 4/4 taxas precisam de atualização.'
             }
         """
-        resultados = {}
-        
-        # Validar cada taxa
-        resultados['SELIC'] = self._validar_selic(data_inicio, data_fim, verificar_apis)
-        resultados['TR'] = self._validar_tr(data_inicio, data_fim, verificar_apis)
-        resultados['IPCA'] = self._validar_ipca(data_inicio, data_fim, verificar_apis)
-        resultados['IPCA-E'] = self._validar_ipca_e(data_inicio, data_fim, verificar_apis)
+        # Validar as 4 taxas em paralelo (BACEN e IBGE respondem ao mesmo tempo;
+        # o cliente HTTP limita as requisições simultâneas por host)
+        resultados = executar_em_paralelo({
+            'SELIC': lambda: self._validar_selic(data_inicio, data_fim, verificar_apis),
+            'TR': lambda: self._validar_tr(data_inicio, data_fim, verificar_apis),
+            'IPCA': lambda: self._validar_ipca(data_inicio, data_fim, verificar_apis),
+            'IPCA-E': lambda: self._validar_ipca_e(data_inicio, data_fim, verificar_apis),
+        })
         
         # Gerar resumo
         total = len(resultados)
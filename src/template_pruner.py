@@ -0,0 +1,209 @@
+"""
+Poda do template por cone de dependências
+Gera um workbook de execução só com o que influencia RESUMO D23:F69:
+abas de repasse/auxiliares que não alimentam as saídas são removidas,
+assim como células e nomes definidos fora do cone
+
+Uso:
+    python src/template_pruner.py [origem.xlsx] [destino.xlsx]
+
+Depois apontar EXCEL_RUNTIME_FILE_PATH para o arquivo gerado
+"""
+import io
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from openpyxl import load_workbook
+
+from formula_engine import FormulaEngine
+
+logger = logging.getLogger(__name__)
+
+
+class TemplatePruner:
+    """
+    Remove do template tudo o que não é precedente das células de saída
+
+    Observação: o arquivo podado é salvo pelo openpyxl e por isso não tem
+    valores calculados em cache - o motor de fórmulas avalia a base na carga
+    e o Excel recalcula ao abrir.
+    """
+
+    @staticmethod
+    def podar(
+        conteudo: bytes,
+        saidas: Sequence[Tuple[str, str]],
+        entradas: Sequence[Tuple[str, str]] = ()
+    ) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Poda o template em memória
+
+        Args:
+            conteudo: Bytes do template original
+            saidas: Ranges de saída [("RESUMO", "D23:F69")]
+            entradas: Células de entrada [("RESUMO", "B6")]
+
+        Returns:
+            (bytes do template podado, relatório)
+        """
+        inicio = time.time()
+        engine = FormulaEngine.carregar(conteudo, saidas, entradas)
+
+        manter = engine.celulas_do_cone()
+        faixas_por_aba: Dict[str, List[Tuple[int, int, int, int]]] = {}
+        for planilha, r1, c1, r2, c2 in engine.faixas_do_cone():
+            faixas_por_aba.setdefault(planilha, []).append((r1, c1, r2, c2))
+
+        def na_faixa(planilha: str, linha: int, coluna: int) -> bool:
+            return any(
+                r1 <= linha <= r2 and c1 <= coluna <= c2
+                for r1, c1, r2, c2 in faixas_por_aba.get(planilha, ())
+            )
+
+        wb = load_workbook(io.BytesIO(conteudo), data_only=False)
+        # Abas referenciadas pelo cone ficam mesmo se vazias (evita #REF!)
+        abas_usadas = {chave[0] for chave in manter} | set(faixas_por_aba)
+
+        celulas_removidas = 0
+        celulas_mantidas = 0
+        abas_removidas: List[str] = []
+
+        for ws in list(wb.worksheets):
+            removidas = [
+                coordenada for coordenada in ws._cells
+                if (ws.title, *coordenada) not in manter and not na_faixa(ws.title, *coordenada)
+            ]
+            mantidas = len(ws._cells) - len(removidas)
+
+            if mantidas == 0 and ws.title not in abas_usadas:
+                celulas_removidas += len(ws._cells)
+                abas_removidas.append(ws.title)
+                wb.remove(ws)
+                continue
+
+            for coordenada in removidas:
+                del ws._cells[coordenada]
+            celulas_removidas += len(removidas)
+            celulas_mantidas += mantidas
+
+        # Nomes definidos que o cone não usa (inclusive os das abas removidas)
+        nomes_removidos = 0
+        for nome in list(wb.defined_names):
+            if (None, nome.upper()) not in engine.nomes_usados:
+                del wb.defined_names[nome]
+                nomes_removidos += 1
+        for ws in wb.worksheets:
+            for nome in list(ws.defined_names):
+                if (ws.title, nome.upper()) not in engine.nomes_usados:
+                    del ws.defined_names[nome]
+                    nomes_removidos += 1
+
+        aba_saida = engine.resolver_planilha(saidas[0][0]) if saidas else None
+        wb.active = wb.sheetnames.index(aba_saida) if aba_saida in wb.sheetnames else 0
+
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        wb.close()
+        podado = buffer.getvalue()
+
+        relatorio = {
+            "celulas_mantidas": celulas_mantidas,
+            "celulas_removidas": celulas_removidas,
+            "abas_mantidas": len(wb.sheetnames),
+            "abas_removidas": abas_removidas,
+            "nomes_removidos": nomes_removidos,
+            "bytes_original": len(conteudo),
+            "bytes_podado": len(podado),
+            "bytes_removidos": len(conteudo) - len(podado),
+            "tempo_ms": int((time.time() - inicio) * 1000),
+        }
+        return podado, relatorio
+
+    @staticmethod
+    def conferir(
+        original: bytes,
+        podado: bytes,
+        saidas: Sequence[Tuple[str, str]],
+        entradas: Sequence[Tuple[str, str]] = (),
+        casos: Optional[Sequence[Dict[Tuple[str, str], Any]]] = None
+    ) -> bool:
+        """
+        Confere se o template podado produz as mesmas saídas que o original
+
+        Args:
+            casos: Conjuntos de entradas a testar (padrão: valores do próprio template)
+
+        Returns:
+            True se todas as saídas coincidem
+        """
+        engine_original = FormulaEngine.carregar(original, saidas, entradas)
+        engine_podado = FormulaEngine.carregar(podado, saidas, entradas)
+
+        for caso in casos or [{}]:
+            esperado = engine_original.avaliar_completo(caso)
+            obtido = engine_podado.avaliar_completo(caso)
+            for planilha, range_address in saidas:
+                if esperado.ler_range(planilha, range_address) != obtido.ler_range(planilha, range_address):
+                    logger.error(f"❌ Divergência em {planilha}!{range_address} para entradas {caso}")
+                    return False
+        return True
+
+
+# Funções auxiliares para uso direto
+def podar_template(
+    origem: Path,
+    destino: Path,
+    saidas: Sequence[Tuple[str, str]],
+    entradas: Sequence[Tuple[str, str]] = (),
+    conferir: bool = True
+) -> Dict[str, Any]:
+    """
+    Gera o template de execução podado em `destino`
+
+    Returns:
+        Relatório da poda (células/abas/bytes removidos)
+
+    Raises:
+        ValueError: se o template podado não reproduzir as saídas do original
+    """
+    conteudo = Path(origem).read_bytes()
+    podado, relatorio = TemplatePruner.podar(conteudo, saidas, entradas)
+
+    if conferir and not TemplatePruner.conferir(conteudo, podado, saidas, entradas):
+        raise ValueError("Template podado diverge do original - arquivo não gravado")
+
+    Path(destino).parent.mkdir(parents=True, exist_ok=True)
+    Path(destino).write_bytes(podado)
+
+    logger.info(
+        f"✅ Template podado: {relatorio['celulas_removidas']} células, "
+        f"{len(relatorio['abas_removidas'])} abas e "
+        f"{relatorio['bytes_removidos'] / 1024:.0f} KB removidos -> {destino}"
+    )
+    return relatorio
+
+
+if __name__ == "__main__":
+    import sys
+
+    from calculator_service import INPUT_MAPPING, OUTPUT_RANGE
+    from config import EXCEL_SOURCE_PATH
+
+    logging.basicConfig(level=logging.INFO)
+
+    origem = Path(sys.argv[1]) if len(sys.argv) > 1 else EXCEL_SOURCE_PATH
+    destino = Path(sys.argv[2]) if len(sys.argv) > 2 else origem.with_name(f"{origem.stem}_runtime.xlsx")
+
+    relatorio = podar_template(origem, destino, [OUTPUT_RANGE], list(INPUT_MAPPING.values()))
+
+    print(f"📦 Template podado: {destino}")
+    print(f"   Células: {relatorio['celulas_mantidas']} mantidas, {relatorio['celulas_removidas']} removidas")
+    print(f"   Abas removidas ({len(relatorio['abas_removidas'])}): {', '.join(relatorio['abas_removidas'])}")
+    print(f"   Nomes definidos removidos: {relatorio['nomes_removidos']}")
+    print(
+        f"   Tamanho: {relatorio['bytes_original'] / 1024:.0f} KB -> "
+        f"{relatorio['bytes_podado'] / 1024:.0f} KB ({relatorio['bytes_removidos'] / 1024:.0f} KB a menos)"
+    )
+    print(f"   Configure EXCEL_RUNTIME_FILE_PATH={destino}")
@@ -0,0 +1,174 @@
+"""
+Gerenciador de workspaces por execução
+Cada cálculo recebe seu próprio diretório (chave: run_id), evitando que
+execuções concorrentes sobrescrevam/deletem arquivos umas das outras
+"""
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from config import WORKSPACE_DIR, WORKSPACE_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+# Diretório em memória (tmpfs) disponível na maioria das distribuições Linux
+RAM_DIR = Path("/dev/shm")
+
+# run_id vira nome de diretório: aceitar apenas caracteres seguros
+_RUN_ID_VALIDO = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class WorkspaceManager:
+    """
+    Cria, libera e limpa diretórios de trabalho por execução
+    
+    Layout: <base>/calculadora_workspaces/run_<run_id>/
+    
+    A base é escolhida na seguinte ordem:
+    1. WORKSPACE_DIR (variável de ambiente)
+    2. /dev/shm (RAM) quando existir e for gravável
+    3. Diretório temporário do sistema
+    
+    Exemplo:
+        >>> manager = WorkspaceManager()
+        >>> with manager.workspace(run_id) as pasta:
+        ...     arquivo = pasta / "calc.xlsx"
+    """
+    
+    PREFIXO = "run_"
+    SUBDIRETORIO = "calculadora_workspaces"
+    
+    def __init__(self, base_dir: Optional[Path] = None, max_idade: int = WORKSPACE_MAX_AGE):
+        """
+        Args:
+            base_dir: Diretório raiz dos workspaces (None = escolha automática)
+            max_idade: Idade (segundos) a partir da qual um workspace é considerado abandonado
+        """
+        raiz = Path(base_dir) if base_dir else self._escolher_raiz()
+        self.base_dir = raiz / self.SUBDIRETORIO
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.max_idade = max_idade
+        
+        self._lock = threading.Lock()
+        self._ultima_limpeza = 0.0
+        
+        logger.info(f"Workspaces em: {self.base_dir}")
+    
+    @staticmethod
+    def _escolher_raiz() -> Path:
+        """Escolhe diretório raiz (preferência para RAM)"""
+        if WORKSPACE_DIR:
+            return Path(WORKSPACE_DIR)
+        
+        if RAM_DIR.is_dir() and os.access(RAM_DIR, os.W_OK):
+            return RAM_DIR
+        
+        return Path(tempfile.gettempdir())
+    
+    def criar(self, run_id: Optional[str] = None) -> Path:
+        """
+        Cria workspace exclusivo para a execução
+        
+        Args:
+            run_id: ID da execução (None = gera um novo)
+            
+        Returns:
+            Caminho do diretório criado
+            
+        Raises:
+            ValueError: run_id com caracteres inválidos
+            FileExistsError: workspace já existe para este run_id
+        """
+        run_id = run_id or str(uuid.uuid4())
+        if not _RUN_ID_VALIDO.match(run_id):
+            raise ValueError(f"run_id inválido para workspace: {run_id!r}")
+        
+        self._limpar_se_necessario()
+        
+        caminho = self.base_dir / f"{self.PREFIXO}{run_id}"
+        caminho.mkdir(parents=True, exist_ok=False)
+        logger.debug(f"Workspace criado: {caminho}")
+        return caminho
+    
+    def remover(self, caminho: Path):
+        """Remove workspace e todo o seu conteúdo"""
+        try:
+            shutil.rmtree(caminho)
+            logger.debug(f"Workspace removido: {caminho}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Erro ao remover workspace {caminho}: {e}")
+    
+    @contextmanager
+    def workspace(self, run_id: Optional[str] = None) -> Iterator[Path]:
+        """Context manager - cria workspace e remove ao final"""
+        caminho = self.criar(run_id)
+        try:
+            yield caminho
+        finally:
+            self.remover(caminho)
+    
+    def limpar_antigos(self, max_idade: Optional[int] = None) -> int:
+        """
+        Remove workspaces abandonados (ex: processo morto no meio do cálculo)
+        
+        Args:
+            max_idade: Idade mínima em segundos (None = self.max_idade)
+            
+        Returns:
+            Número de workspaces removidos
+        """
+        max_idade = self.max_idade if max_idade is None else max_idade
+        limite = time.time() - max_idade
+        removidos = 0
+        
+        for caminho in self.base_dir.glob(f"{self.PREFIXO}*"):
+            try:
+                if caminho.is_dir() and caminho.stat().st_mtime < limite:
+                    self.remover(caminho)
+                    removidos += 1
+            except FileNotFoundError:
+                # Removido por outro processo/worker
+                continue
+        
+        if removidos:
+            logger.info(f"🧹 {removidos} workspace(s) antigo(s) removido(s)")
+        return removidos
+    
+    def _limpar_se_necessario(self):
+        """Limpeza oportunista, no máximo uma vez a cada 1/4 de max_idade"""
+        agora = time.time()
+        with self._lock:
+            if agora - self._ultima_limpeza < self.max_idade / 4:
+                return
+            self._ultima_limpeza = agora
+        self.limpar_antigos()
+
+
+# Instância compartilhada pelo processo
+_manager: Optional[WorkspaceManager] = None
+_manager_lock = threading.Lock()
+
+
+def obter_workspace_manager() -> WorkspaceManager:
+    """
+    Retorna o WorkspaceManager compartilhado (criado sob demanda)
+    
+    Returns:
+        Instância única por processo
+    """
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = WorkspaceManager()
+    return _manager
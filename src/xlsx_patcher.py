@@ -0,0 +1,440 @@
+"""
+Escrita direta de células no XML do .xlsx
+Altera apenas o XML da aba de entrada (ex: RESUMO) dentro do zip;
+todas as outras partes (abas de cálculo, estilos, valores em cache)
+são copiadas byte a byte, ainda comprimidas (sem descomprimir/recomprimir) -
+muito mais rápido que carregar/salvar com openpyxl
+
+Quando uma entrada sobrescreve uma fórmula, xl/calcChain.xml é removido
+(com sua relação e content type), como faz o openpyxl: uma cadeia de cálculo
+apontando para célula sem fórmula faz o Excel acusar arquivo corrompido
+"""
+import io
+import logging
+import posixpath
+import re
+import struct
+import zipfile
+import zlib
+from datetime import date, datetime, time as dt_time
+from typing import Any, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from openpyxl.utils.cell import coordinate_to_tuple
+from openpyxl.utils.datetime import to_excel
+
+logger = logging.getLogger(__name__)
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_WORKBOOK = "xl/workbook.xml"
+_WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+_CONTENT_TYPES = "[Content_Types].xml"
+_TIPO_CALC_CHAIN = "/calcChain"
+
+_ATRIBUTO_R = re.compile(rb'\br="([^"]+)"')
+_ATRIBUTO_S = re.compile(rb'\bs="(\d+)"')
+_ATRIBUTO_SPANS = re.compile(rb'\s+spans="[^"]*"')
+_FORMULA = re.compile(rb"<(\w+:)?f[\s>/]")
+
+# Estruturas do zip (APPNOTE 4.3.7 / 4.3.12 / 4.3.16)
+_CABECALHO_LOCAL = struct.Struct("<4s5H3L2H")
+_CABECALHO_CENTRAL = struct.Struct("<4s6H3L5H2L")
+_FIM_CENTRAL = struct.Struct("<4s4H2LH")
+_LIMITE_ZIP32 = 0xFFFFFFFF
+
+
+class XlsxPatchError(Exception):
+    """Estrutura do .xlsx não permite a escrita direta"""
+
+
+def localizar_planilhas(conteudo: bytes) -> Dict[str, str]:
+    """
+    Mapeia nome da aba -> caminho da parte XML no zip (via workbook.xml.rels)
+
+    Args:
+        conteudo: Bytes do arquivo .xlsx
+
+    Returns:
+        {"RESUMO": "xl/worksheets/sheet1.xml", ...}
+    """
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+        return localizar_planilhas_zip(zf)
+
+
+def localizar_planilhas_zip(zf: zipfile.ZipFile) -> Dict[str, str]:
+    """Igual a localizar_planilhas, para um zip já aberto"""
+    workbook = ElementTree.fromstring(zf.read(_WORKBOOK))
+    rels = ElementTree.fromstring(zf.read(_WORKBOOK_RELS))
+
+    alvos = {}
+    for rel in rels.iter(f"{{{_NS_PKG_REL}}}Relationship"):
+        alvo = rel.get("Target")
+        if alvo.startswith("/"):
+            alvo = alvo.lstrip("/")
+        else:
+            alvo = posixpath.normpath(posixpath.join(posixpath.dirname(_WORKBOOK), alvo))
+        alvos[rel.get("Id")] = alvo
+
+    planilhas = {}
+    for sheet in workbook.iter(f"{{{_NS_MAIN}}}sheet"):
+        rid = sheet.get(f"{{{_NS_REL}}}id")
+        if rid in alvos:
+            planilhas[sheet.get("name")] = alvos[rid]
+    return planilhas
+
+
+def _formatar_celula(prefixo: bytes, endereco: str, estilo: Optional[bytes], valor: Any) -> bytes:
+    """Gera o XML <c> de uma célula constante (sem fórmula)"""
+    abertura = b"<" + prefixo + b'c r="' + endereco.encode("ascii") + b'"'
+    if estilo is not None:
+        abertura += b' s="' + estilo + b'"'
+
+    if valor is None:
+        return abertura + b"/>"
+
+    if isinstance(valor, bool):
+        return abertura + b' t="b"><' + prefixo + b"v>" + (b"1" if valor else b"0") + b"</" + prefixo + b"v></" + prefixo + b"c>"
+
+    if isinstance(valor, (datetime, date, dt_time)):
+        valor = to_excel(valor)
+
+    if isinstance(valor, (int, float)):
+        numero = repr(float(valor)) if isinstance(valor, float) else str(valor)
+        if numero.endswith(".0"):
+            numero = numero[:-2]
+        return abertura + b"><" + prefixo + b"v>" + numero.encode("ascii") + b"</" + prefixo + b"v></" + prefixo + b"c>"
+
+    texto = str(valor)
+    espaco = b' xml:space="preserve"' if texto != texto.strip() else b""
+    return (
+        abertura + b' t="inlineStr"><' + prefixo + b"is><" + prefixo + b"t" + espaco + b">"
+        + escape(texto).encode("utf-8")
+        + b"</" + prefixo + b"t></" + prefixo + b"is></" + prefixo + b"c>"
+    )
+
+
+def _elementos(xml: bytes, prefixo: bytes, tag: bytes, inicio: int, fim: int) -> List[Tuple[int, int, bytes]]:
+    """
+    Localiza elementos <tag ...>...</tag> ou <tag .../> de primeiro nível em xml[inicio:fim]
+
+    Returns:
+        Lista de (início, fim, cabeçalho) - cabeçalho = texto da tag de abertura
+    """
+    abre = b"<" + prefixo + tag
+    fecha = b"</" + prefixo + tag + b">"
+    encontrados = []
+    pos = inicio
+    while True:
+        pos = xml.find(abre, pos, fim)
+        if pos < 0:
+            return encontrados
+        seguinte = xml[pos + len(abre):pos + len(abre) + 1]
+        if seguinte not in (b" ", b">", b"/", b"\t", b"\n", b"\r"):
+            pos += len(abre)
+            continue
+        fim_cabecalho = xml.find(b">", pos, fim) + 1
+        cabecalho = xml[pos:fim_cabecalho]
+        if cabecalho.endswith(b"/>"):
+            encontrados.append((pos, fim_cabecalho, cabecalho))
+            pos = fim_cabecalho
+        else:
+            fechamento = xml.find(fecha, fim_cabecalho, fim)
+            if fechamento < 0:
+                raise XlsxPatchError(f"Elemento {tag.decode()} sem fechamento")
+            encontrados.append((pos, fechamento + len(fecha), cabecalho))
+            pos = fechamento + len(fecha)
+
+
+def aplicar_valores_planilha(
+    xml: bytes,
+    valores: Dict[str, Any],
+    formulas_removidas: Optional[List[str]] = None
+) -> bytes:
+    """
+    Escreve valores de células no XML de uma aba
+
+    Mantém o estilo (`s`) de cada célula; remove fórmula/tipo anteriores.
+    Linhas e células inexistentes são inseridas na posição correta.
+
+    Args:
+        xml: Conteúdo de xl/worksheets/sheetN.xml
+        valores: {"B6": "TIMON", "E6": date(...), ...}
+        formulas_removidas: Recebe os endereços cuja fórmula foi sobrescrita
+
+    Returns:
+        XML alterado
+    """
+    m = re.search(rb"<(\w+:)?sheetData\b", xml)
+    if not m:
+        raise XlsxPatchError("sheetData não encontrado")
+    prefixo = m.group(1) or b""
+
+    # <sheetData/> vazio vira <sheetData></sheetData>
+    fim_abertura = xml.find(b">", m.start()) + 1
+    if xml[fim_abertura - 2:fim_abertura] == b"/>":
+        xml = xml[:fim_abertura - 2] + b"></" + prefixo + b"sheetData>" + xml[fim_abertura:]
+        fim_abertura -= 1
+    fim_dados = xml.find(b"</" + prefixo + b"sheetData>", fim_abertura)
+
+    por_linha: Dict[int, Dict[int, Tuple[str, Any]]] = {}
+    for endereco, valor in valores.items():
+        endereco = endereco.replace("$", "").upper()
+        linha, coluna = coordinate_to_tuple(endereco)
+        por_linha.setdefault(linha, {})[coluna] = (endereco, valor)
+
+    linhas = _elementos(xml, prefixo, b"row", fim_abertura, fim_dados)
+    numeros = [int(_ATRIBUTO_R.search(cab).group(1)) for _, _, cab in linhas]
+
+    # Substituições de trás para frente (posições anteriores continuam válidas)
+    trocas: List[Tuple[int, int, bytes]] = []
+    for numero_linha in sorted(por_linha):
+        celulas = por_linha[numero_linha]
+        if numero_linha in numeros:
+            inicio, fim, cabecalho = linhas[numeros.index(numero_linha)]
+            trocas.append((inicio, fim, _alterar_linha(
+                xml[inicio:fim], cabecalho, prefixo, celulas, formulas_removidas
+            )))
+        else:
+            nova = b"<" + prefixo + b'row r="' + str(numero_linha).encode() + b'">' + b"".join(
+                _formatar_celula(prefixo, endereco, None, valor)
+                for _, (endereco, valor) in sorted(celulas.items())
+            ) + b"</" + prefixo + b"row>"
+            posicao = next(
+                (inicio for (inicio, _, _), n in zip(linhas, numeros) if n > numero_linha),
+                fim_dados
+            )
+            trocas.append((posicao, posicao, nova))
+
+    for inicio, fim, novo in sorted(trocas, key=lambda t: (t[0], t[1]), reverse=True):
+        xml = xml[:inicio] + novo + xml[fim:]
+    return xml
+
+
+def _alterar_linha(
+    xml_linha: bytes,
+    cabecalho: bytes,
+    prefixo: bytes,
+    celulas: Dict[int, Tuple[str, Any]],
+    formulas_removidas: Optional[List[str]] = None
+) -> bytes:
+    """Reescreve/insere as células de uma linha existente"""
+    if cabecalho.endswith(b"/>"):
+        cabecalho = cabecalho[:-2].rstrip() + b">"
+        xml_linha = cabecalho + b"</" + prefixo + b"row>"
+    # spans é só uma dica de leitura - removido para não ficar inconsistente
+    novo_cabecalho = _ATRIBUTO_SPANS.sub(b"", cabecalho)
+    corpo_inicio = len(cabecalho)
+    corpo_fim = len(xml_linha) - len(b"</" + prefixo + b"row>")
+
+    existentes = _elementos(xml_linha, prefixo, b"c", corpo_inicio, corpo_fim)
+    colunas = [coordinate_to_tuple(_ATRIBUTO_R.search(cab).group(1).decode())[1] for _, _, cab in existentes]
+
+    trocas: List[Tuple[int, int, bytes]] = []
+    for coluna, (endereco, valor) in celulas.items():
+        if coluna in colunas:
+            inicio, fim, cab = existentes[colunas.index(coluna)]
+            estilo = _ATRIBUTO_S.search(cab)
+            if formulas_removidas is not None and _FORMULA.search(xml_linha, inicio, fim):
+                formulas_removidas.append(endereco)
+            trocas.append((inicio, fim, _formatar_celula(prefixo, endereco, estilo.group(1) if estilo else None, valor)))
+        else:
+            posicao = next(
+                (inicio for (inicio, _, _), c in zip(existentes, colunas) if c > coluna),
+                corpo_fim
+            )
+            trocas.append((posicao, posicao, _formatar_celula(prefixo, endereco, None, valor)))
+
+    corpo = xml_linha
+    for inicio, fim, novo in sorted(trocas, key=lambda t: (t[0], t[1]), reverse=True):
+        corpo = corpo[:inicio] + novo + corpo[fim:]
+    return novo_cabecalho + corpo[len(cabecalho):]
+
+
+def marcar_recalculo_ao_abrir(xml_workbook: bytes) -> bytes:
+    """Define calcPr fullCalcOnLoad="1" (valores em cache ficaram desatualizados)"""
+    m = re.search(rb"<(\w+:)?calcPr\b[^>]*?/?>", xml_workbook)
+    if m:
+        tag = m.group(0)
+        if b"fullCalcOnLoad=" in tag:
+            nova = re.sub(rb'fullCalcOnLoad="[^"]*"', b'fullCalcOnLoad="1"', tag)
+        else:
+            fim = -2 if tag.endswith(b"/>") else -1
+            nova = tag[:fim].rstrip() + b' fullCalcOnLoad="1"' + tag[fim:]
+        return xml_workbook[:m.start()] + nova + xml_workbook[m.end():]
+
+    m = re.search(rb"</(\w+:)?workbook>", xml_workbook)
+    if not m:
+        raise XlsxPatchError("workbook.xml inválido")
+    prefixo = m.group(1) or b""
+    # calcPr vem depois de sheets/definedNames e antes de extLst/fechamento
+    ext = xml_workbook.find(b"<" + prefixo + b"extLst")
+    posicao = ext if ext >= 0 else m.start()
+    return xml_workbook[:posicao] + b"<" + prefixo + b'calcPr fullCalcOnLoad="1"/>' + xml_workbook[posicao:]
+
+
+def _alvo_calc_chain(xml_rels: bytes) -> Optional[str]:
+    """Caminho da parte calcChain no zip (None se o workbook não tem)"""
+    for rel in ElementTree.fromstring(xml_rels).iter(f"{{{_NS_PKG_REL}}}Relationship"):
+        if rel.get("Type", "").endswith(_TIPO_CALC_CHAIN):
+            alvo = rel.get("Target")
+            if alvo.startswith("/"):
+                return alvo.lstrip("/")
+            return posixpath.normpath(posixpath.join(posixpath.dirname(_WORKBOOK), alvo))
+    return None
+
+
+def remover_calc_chain(xml_rels: bytes, xml_tipos: bytes, parte: str) -> Tuple[bytes, bytes]:
+    """Tira a relação e o content type de calcChain (workbook.xml.rels, [Content_Types].xml)"""
+    xml_rels = re.sub(
+        rb'<(\w+:)?Relationship\b[^>]*Type="[^"]*' + _TIPO_CALC_CHAIN.encode() + rb'"[^>]*?(/>|>\s*</(\w+:)?Relationship>)',
+        b"", xml_rels
+    )
+    xml_tipos = re.sub(
+        rb'<(\w+:)?Override\b[^>]*PartName="/' + re.escape(parte.encode()) + rb'"[^>]*?(/>|>\s*</(\w+:)?Override>)',
+        b"", xml_tipos
+    )
+    return xml_rels, xml_tipos
+
+
+def _data_hora_dos(data_hora: Tuple[int, ...]) -> Tuple[int, int]:
+    ano, mes, dia, hora, minuto, segundo = data_hora
+    return hora << 11 | minuto << 5 | segundo // 2, (ano - 1980) << 9 | mes << 5 | dia
+
+
+class _EscritorZip:
+    """
+    Monta o zip de saída entrada por entrada
+
+    copiar() repete os bytes comprimidos da origem (sem descomprimir);
+    gravar() comprime conteúdo novo com o mesmo método da entrada original.
+    Só zip32 - templates têm alguns MB
+    """
+
+    def __init__(self, conteudo: bytes):
+        self.conteudo = conteudo
+        self.saida = io.BytesIO()
+        self._centrais: List[bytes] = []
+
+    def copiar(self, info: zipfile.ZipInfo):
+        inicio = info.header_offset
+        cabecalho = _CABECALHO_LOCAL.unpack_from(self.conteudo, inicio)
+        if cabecalho[0] != b"PK\x03\x04":
+            raise XlsxPatchError(f"Cabeçalho local inválido: {info.filename}")
+        dados = inicio + _CABECALHO_LOCAL.size + cabecalho[-2] + cabecalho[-1]
+        self._adicionar(info, self.conteudo[dados:dados + info.compress_size], info.CRC, info.file_size, info.compress_type)
+
+    def gravar(self, info: zipfile.ZipInfo, dados: bytes):
+        if info.compress_type == zipfile.ZIP_STORED:
+            comprimidos, metodo = dados, zipfile.ZIP_STORED
+        else:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            comprimidos, metodo = compressor.compress(dados) + compressor.flush(), zipfile.ZIP_DEFLATED
+        self._adicionar(info, comprimidos, zlib.crc32(dados), len(dados), metodo)
+
+    def _adicionar(self, info: zipfile.ZipInfo, comprimidos: bytes, crc: int, tamanho: int, metodo: int):
+        try:
+            nome, utf8 = info.filename.encode("ascii"), 0
+        except UnicodeEncodeError:
+            nome, utf8 = info.filename.encode("utf-8"), 0x800
+        # Sem data descriptor: CRC e tamanhos já vão no cabeçalho local
+        flags = (info.flag_bits & ~0x808) | utf8
+        hora, data = _data_hora_dos(info.date_time)
+        versao = max(info.extract_version, 20)
+        deslocamento = self.saida.tell()
+        if max(deslocamento, tamanho, len(comprimidos)) >= _LIMITE_ZIP32:
+            raise XlsxPatchError("Arquivo grande demais para a escrita direta (zip64)")
+
+        self.saida.write(_CABECALHO_LOCAL.pack(
+            b"PK\x03\x04", versao, flags, metodo, hora, data, crc, len(comprimidos), tamanho, len(nome), 0
+        ))
+        self.saida.write(nome)
+        self.saida.write(comprimidos)
+        self._centrais.append(_CABECALHO_CENTRAL.pack(
+            b"PK\x01\x02", info.create_system << 8 | info.create_version, versao, flags, metodo, hora, data,
+            crc, len(comprimidos), tamanho, len(nome), 0, len(info.comment), 0,
+            info.internal_attr, info.external_attr, deslocamento
+        ) + nome + info.comment)
+
+    def finalizar(self, comentario: bytes = b"") -> bytes:
+        inicio = self.saida.tell()
+        for central in self._centrais:
+            self.saida.write(central)
+        self.saida.write(_FIM_CENTRAL.pack(
+            b"PK\x05\x06", 0, 0, len(self._centrais), len(self._centrais),
+            self.saida.tell() - inicio, inicio, len(comentario)
+        ) + comentario)
+        return self.saida.getvalue()
+
+
+class XlsxPatcher:
+    """
+    Aplica valores em células diretamente no zip do .xlsx
+
+    Exemplo:
+        >>> novo = XlsxPatcher.aplicar(conteudo, {"RESUMO": {"B6": "TIMON", "B13": 0.2}})
+    """
+
+    @staticmethod
+    def aplicar(
+        conteudo: bytes,
+        alteracoes: Dict[str, Dict[str, Any]],
+        recalcular_ao_abrir: bool = True
+    ) -> bytes:
+        """
+        Gera novo .xlsx com as células alteradas
+
+        Args:
+            conteudo: Bytes do .xlsx original
+            alteracoes: {aba: {endereço: valor}}
+            recalcular_ao_abrir: Marca o workbook para recálculo completo ao abrir
+
+        Returns:
+            Bytes do novo .xlsx (demais partes idênticas ao original, inclusive comprimidas)
+
+        Raises:
+            KeyError: Aba inexistente
+            XlsxPatchError: XML ou zip em formato inesperado
+        """
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as origem:
+            planilhas = localizar_planilhas_zip(origem)
+            partes: Dict[str, Dict[str, Any]] = {}
+            for aba, valores in alteracoes.items():
+                if aba not in planilhas:
+                    raise KeyError(f"Worksheet {aba} does not exist.")
+                partes.setdefault(planilhas[aba], {}).update(valores)
+
+            # Abas alteradas primeiro: saber se alguma fórmula foi sobrescrita
+            formulas_removidas: List[str] = []
+            novas: Dict[str, bytes] = {
+                parte: aplicar_valores_planilha(origem.read(parte), valores, formulas_removidas)
+                for parte, valores in partes.items()
+            }
+            if recalcular_ao_abrir:
+                novas[_WORKBOOK] = marcar_recalculo_ao_abrir(origem.read(_WORKBOOK))
+
+            calc_chain = _alvo_calc_chain(origem.read(_WORKBOOK_RELS)) if formulas_removidas else None
+            if calc_chain:
+                logger.debug(f"Fórmulas sobrescritas ({', '.join(formulas_removidas)}) - removendo {calc_chain}")
+                novas[_WORKBOOK_RELS], novas[_CONTENT_TYPES] = remover_calc_chain(
+                    origem.read(_WORKBOOK_RELS), origem.read(_CONTENT_TYPES), calc_chain
+                )
+
+            escritor = _EscritorZip(conteudo)
+            for info in origem.infolist():
+                if info.filename == calc_chain:
+                    continue
+                if info.filename in novas:
+                    escritor.gravar(info, novas[info.filename])
+                else:
+                    escritor.copiar(info)
+            return escritor.finalizar(origem.comment)
+
+
+# Funções auxiliares para uso direto
+def escrever_celulas(conteudo: bytes, aba: str, valores: Dict[str, Any]) -> bytes:
+    """Atalho para XlsxPatcher.aplicar com uma única aba"""
+    return XlsxPatcher.aplicar(conteudo, {aba: valores})
@@ -0,0 +1,308 @@
+"""
+Leitura em streaming dos valores em cache de uma aba do .xlsx
+Resolve a parte XML da aba pelas relações do workbook e percorre
+apenas o XML dela (iterparse) até coletar as linhas pedidas -
+sem carregar estilos completos nem as outras abas
+
+Benchmark contra o caminho openpyxl:
+    python src/xlsx_stream_reader.py [arquivo.xlsx]
+"""
+import io
+import logging
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from xml.etree import ElementTree
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.cell import coordinate_to_tuple, range_boundaries
+from openpyxl.utils.datetime import from_excel
+
+from xlsx_patcher import localizar_planilhas_zip
+
+logger = logging.getLogger(__name__)
+
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_ROW = f"{_NS}row"
+_C = f"{_NS}c"
+_V = f"{_NS}v"
+_IS = f"{_NS}is"
+_T = f"{_NS}t"
+_F = f"{_NS}f"
+_SI = f"{_NS}si"
+_NUMFMT = f"{_NS}numFmt"
+_CELLXFS = f"{_NS}cellXfs"
+_XF = f"{_NS}xf"
+
+_SHARED_STRINGS = "xl/sharedStrings.xml"
+_STYLES = "xl/styles.xml"
+
+
+class XlsxStreamError(Exception):
+    """Arquivo não pôde ser lido pelo leitor em streaming"""
+
+
+def _texto(elemento) -> str:
+    """Texto de <si>/<is>: <t> simples ou runs <r><t>"""
+    return "".join(t.text or "" for t in elemento.iter(_T))
+
+
+def _numero(texto: str) -> Any:
+    """Mesma conversão do openpyxl: int quando não há parte decimal/expoente"""
+    if "." in texto or "E" in texto or "e" in texto:
+        return float(texto)
+    return int(texto)
+
+
+class _SharedStrings:
+    """Strings compartilhadas lidas sob demanda (só até o maior índice pedido)"""
+
+    def __init__(self, zf: zipfile.ZipFile):
+        self._zf = zf
+        self._itens: List[str] = []
+        self._eventos = None
+
+    def __getitem__(self, indice: int) -> str:
+        if self._eventos is None:
+            if _SHARED_STRINGS not in self._zf.namelist():
+                raise XlsxStreamError("sharedStrings.xml ausente")
+            self._eventos = ElementTree.iterparse(self._zf.open(_SHARED_STRINGS), events=("end",))
+        while len(self._itens) <= indice:
+            try:
+                _, elemento = next(self._eventos)
+            except StopIteration:
+                raise XlsxStreamError(f"String compartilhada {indice} inexistente")
+            if elemento.tag == _SI:
+                self._itens.append(_texto(elemento))
+                elemento.clear()
+        return self._itens[indice]
+
+
+class _FormatosData:
+    """Índices de estilo (s=) cujo formato numérico é de data - lido sob demanda"""
+
+    def __init__(self, zf: zipfile.ZipFile):
+        self._zf = zf
+        self._datas: Optional[set] = None
+
+    def e_data(self, estilo: int) -> bool:
+        if self._datas is None:
+            self._datas = self._carregar()
+        return estilo in self._datas
+
+    def _carregar(self) -> set:
+        if _STYLES not in self._zf.namelist():
+            return set()
+        formatos = dict(BUILTIN_FORMATS)
+        datas = set()
+        indice = 0
+        dentro_cellxfs = False
+        for evento, elemento in ElementTree.iterparse(self._zf.open(_STYLES), events=("start", "end")):
+            if evento == "start":
+                if elemento.tag == _CELLXFS:
+                    dentro_cellxfs = True
+                continue
+            if elemento.tag == _NUMFMT:
+                formatos[int(elemento.get("numFmtId"))] = elemento.get("formatCode")
+            elif elemento.tag == _XF and dentro_cellxfs:
+                codigo = formatos.get(int(elemento.get("numFmtId", 0)))
+                if codigo and is_date_format(codigo):
+                    datas.add(indice)
+                indice += 1
+            elif elemento.tag == _CELLXFS:
+                break
+        return datas
+
+
+class XlsxStreamReader:
+    """
+    Lê valores em cache (resultado do último cálculo salvo) de ranges de uma aba
+
+    Retorna no mesmo formato de ExcelTemplateCalculator.read_ranges_calculated:
+    lista de listas por range, None para células vazias
+
+    O valor em cache de uma fórmula só vale se o arquivo foi recalculado depois
+    da última escrita; com formulas_em_cache=False essas células voltam None
+    """
+
+    @staticmethod
+    def ler_ranges(
+        conteudo: bytes,
+        ranges: Sequence[Tuple[str, str]],
+        formulas_em_cache: bool = True
+    ) -> List[List[List]]:
+        """
+        Lê vários ranges (de uma ou mais abas) percorrendo cada aba uma única vez
+
+        Args:
+            conteudo: Bytes do .xlsx
+            ranges: [(aba, "D23:F23"), ...]
+            formulas_em_cache: False = células com fórmula retornam None
+                (entradas foram escritas e o arquivo não foi recalculado)
+
+        Returns:
+            Resultados na mesma ordem de `ranges`
+
+        Raises:
+            KeyError: Aba inexistente
+            XlsxStreamError: Estrutura inesperada
+        """
+        pedidos: Dict[str, List[Tuple[int, int, int, int, int]]] = {}
+        for indice, (planilha, range_address) in enumerate(ranges):
+            min_col, min_row, max_col, max_row = range_boundaries(range_address.replace("$", ""))
+            pedidos.setdefault(planilha, []).append((indice, min_col, min_row, max_col, max_row))
+
+        resultados: List[List[List]] = [None] * len(ranges)
+
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+            partes = localizar_planilhas_zip(zf)
+            compartilhadas = _SharedStrings(zf)
+            formatos = _FormatosData(zf)
+
+            for planilha, itens in pedidos.items():
+                if planilha not in partes:
+                    raise KeyError(f"Worksheet {planilha} does not exist.")
+                min_col = min(item[1] for item in itens)
+                min_row = min(item[2] for item in itens)
+                max_col = max(item[3] for item in itens)
+                max_row = max(item[4] for item in itens)
+
+                valores = XlsxStreamReader._ler_janela(
+                    zf, partes[planilha], min_row, min_col, max_row, max_col, compartilhadas, formatos,
+                    formulas_em_cache
+                )
+
+                for indice, r_min_col, r_min_row, r_max_col, r_max_row in itens:
+                    resultados[indice] = [
+                        [valores.get((r, c)) for c in range(r_min_col, r_max_col + 1)]
+                        for r in range(r_min_row, r_max_row + 1)
+                    ]
+
+        return resultados
+
+    @staticmethod
+    def _ler_janela(
+        zf: zipfile.ZipFile,
+        parte: str,
+        min_row: int,
+        min_col: int,
+        max_row: int,
+        max_col: int,
+        compartilhadas: _SharedStrings,
+        formatos: _FormatosData,
+        formulas_em_cache: bool = True
+    ) -> Dict[Tuple[int, int], Any]:
+        """Percorre o XML da aba e para ao passar da última linha pedida"""
+        if parte not in zf.namelist():
+            raise XlsxStreamError(f"Parte {parte} ausente no arquivo")
+
+        valores: Dict[Tuple[int, int], Any] = {}
+        linha_atual = 0
+
+        for _, elemento in ElementTree.iterparse(zf.open(parte), events=("end",)):
+            tag = elemento.tag
+            if tag == _C:
+                referencia = elemento.get("r")
+                if referencia is None:
+                    raise XlsxStreamError("Célula sem atributo r (não suportado)")
+                linha, coluna = coordinate_to_tuple(referencia)
+                linha_atual = linha
+                if min_row <= linha <= max_row and min_col <= coluna <= max_col:
+                    if formulas_em_cache or elemento.find(_F) is None:
+                        valores[(linha, coluna)] = XlsxStreamReader._valor(elemento, compartilhadas, formatos)
+                elemento.clear()
+            elif tag == _ROW:
+                r = elemento.get("r")
+                if r is not None:
+                    linha_atual = int(r)
+                elemento.clear()
+                if linha_atual >= max_row:
+                    break
+        return valores
+
+    @staticmethod
+    def _valor(elemento, compartilhadas: _SharedStrings, formatos: _FormatosData) -> Any:
+        tipo = elemento.get("t", "n")
+
+        if tipo == "inlineStr":
+            inline = elemento.find(_IS)
+            return _texto(inline) if inline is not None else None
+
+        v = elemento.find(_V)
+        if v is None or v.text is None:
+            return None
+        texto = v.text
+
+        if tipo == "n":
+            numero = _numero(texto)
+            estilo = elemento.get("s")
+            if estilo and estilo != "0" and formatos.e_data(int(estilo)):
+                return from_excel(numero)
+            return numero
+        if tipo == "s":
+            return compartilhadas[int(texto)]
+        if tipo == "b":
+            return texto == "1"
+        if tipo == "d":
+            return datetime.fromisoformat(texto)
+        # str (resultado texto de fórmula) e e (erro: #N/A, #DIV/0!, ...)
+        return texto
+
+
+# Funções auxiliares para uso direto
+def ler_range(conteudo: bytes, planilha: str, range_address: str, formulas_em_cache: bool = True) -> List[List]:
+    """Lê um único range com o leitor em streaming"""
+    return XlsxStreamReader.ler_ranges(conteudo, [(planilha, range_address)], formulas_em_cache)[0]
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from pathlib import Path
+
+    from openpyxl import Workbook, load_workbook
+
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) > 1:
+        conteudo = Path(sys.argv[1]).read_bytes()
+    else:
+        # Workbook sintético com o formato do template: RESUMO + abas grandes de repasse
+        wb = Workbook()
+        resumo = wb.active
+        resumo.title = "RESUMO"
+        resumo["B6"] = "TIMON"
+        for linha in range(23, 70):
+            for coluna in "DEF":
+                resumo[f"{coluna}{linha}"] = linha * 1000.5
+        for uf in ("PA", "CE", "BA", "PI", "PB", "MA"):
+            ws = wb.create_sheet(f"Repasse {uf}")
+            for linha in range(1, 2001):
+                ws.append([f"MUNICIPIO {linha}"] + [linha * 1.5] * 20)
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        conteudo = buffer.getvalue()
+
+    ranges = [("RESUMO", "D23:F69")]
+    repeticoes = 20
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        wb = load_workbook(io.BytesIO(conteudo), read_only=True, data_only=True)
+        openpyxl_valores = [
+            [list(linha) for linha in wb["RESUMO"].iter_rows(
+                min_row=23, max_row=69, min_col=4, max_col=6, values_only=True
+            )]
+        ]
+        wb.close()
+    tempo_openpyxl = (time.perf_counter() - inicio) / repeticoes
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        stream_valores = XlsxStreamReader.ler_ranges(conteudo, ranges)
+    tempo_stream = (time.perf_counter() - inicio) / repeticoes
+
+    print(f"📊 Arquivo: {len(conteudo) / 1024:.0f} KB | range RESUMO!D23:F69 | {repeticoes} repetições")
+    print(f"   openpyxl (read_only): {tempo_openpyxl * 1000:.1f} ms")
+    print(f"   streaming:            {tempo_stream * 1000:.1f} ms ({tempo_openpyxl / tempo_stream:.1f}x)")
+    print(f"   Valores iguais: {'✅' if openpyxl_valores == stream_valores else '❌'}")
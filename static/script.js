@@ -11,6 +11,21 @@ const CENARIOS_NOMES = {
     'nt36_ipca_e_1pct': 'NT36 IPCA-E + 1% a.m.'
 };
 
+// Nomes das etapas publicadas em /api/runs/{run_id}/events
+const ETAPAS_NOMES = {
+    'iniciando': 'Iniciando',
+    'copiando_template': 'Copiando template',
+    'escrevendo_entradas': 'Escrevendo entradas',
+    'salvando_entradas': 'Salvando entradas',
+    'recalculando': 'Recalculando fórmulas',
+    'lendo_resultados': 'Lendo resultados',
+    'salvando_excel': 'Salvando Excel',
+    'copiando_saida': 'Copiando Excel processado',
+    'validando_taxas': 'Validando taxas',
+    'info_selic': 'Consultando SELIC',
+    'backup_csv': 'Salvando CSV de backup'
+};
+
 // Estado global para armazenar resultado
 let ultimoResultado = null;
 
@@ -82,12 +97,17 @@ async function handleSubmit(event) {
     esconderErro();
     esconderResultados();
     
+    // Acompanhar as etapas do cálculo em tempo real (SSE)
+    const runId = gerarRunId();
+    const eventos = acompanharExecucao(runId);
+    
     try {
         // Fazer requisição
         const response = await fetch('/api/calcular', {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'X-Run-Id': runId
             },
             body: JSON.stringify(dados)
         });
@@ -105,12 +125,74 @@ async function handleSubmit(event) {
         
     } catch (error) {
         console.error('Erro:', error);
+        esconderResultados();
         mostrarErro(error.message);
     } finally {
+        if (eventos) {
+            eventos.close();
+        }
         esconderLoading();
     }
 }
 
+// ID da execução gerado no navegador (enviado em X-Run-Id)
+function gerarRunId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return 'run-' + Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 10);
+}
+
+// Assinar os eventos da execução: etapa atual no loading e cenários parciais
+function acompanharExecucao(runId) {
+    if (!window.EventSource) {
+        return null;
+    }
+    
+    const eventos = new EventSource(`/api/runs/${runId}/events`);
+    const etapaEl = document.getElementById('loadingEtapa');
+    
+    eventos.addEventListener('etapa_inicio', (e) => {
+        const evento = JSON.parse(e.data);
+        const nome = ETAPAS_NOMES[evento.etapa] || evento.etapa;
+        etapaEl.textContent = `${nome}... (${(evento.decorrido_ms / 1000).toFixed(1)}s)`;
+    });
+    
+    eventos.addEventListener('etapa_fim', (e) => {
+        const evento = JSON.parse(e.data);
+        console.debug(`Etapa ${evento.etapa}: ${evento.duracao_ms}ms`);
+    });
+    
+    eventos.addEventListener('cenario', (e) => {
+        const evento = JSON.parse(e.data);
+        exibirCenarioParcial(evento.cenario, evento);
+    });
+    
+    eventos.addEventListener('concluido', () => eventos.close());
+    eventos.addEventListener('erro', () => eventos.close());
+    eventos.addEventListener('expirado', () => eventos.close());
+    eventos.onerror = () => eventos.close();
+    
+    return eventos;
+}
+
+// Mostrar um cenário assim que lido (antes da resposta final)
+function exibirCenarioParcial(key, dados) {
+    const resultadosDiv = document.getElementById('resultados');
+    const contentDiv = document.getElementById('resultadosContent');
+    
+    if (resultadosDiv.style.display !== 'block') {
+        contentDiv.innerHTML = '';
+        document.getElementById('metadata').innerHTML = '<p>Finalizando cálculo...</p>';
+        resultadosDiv.style.display = 'block';
+    }
+    if (!contentDiv.querySelector(`[data-cenario="${key}"]`)) {
+        const card = criarCardCenario(key, dados);
+        card.dataset.cenario = key;
+        contentDiv.appendChild(card);
+    }
+}
+
 // Validar dados
 function validarDados(dados) {
     // Validar datas não futuras
@@ -138,6 +220,7 @@ function validarDados(dados) {
 
 // Mostrar loading
 function mostrarLoading() {
+    document.getElementById('loadingEtapa').textContent = '';
     document.getElementById('loading').style.display = 'block';
     document.getElementById('btnCalcular').disabled = true;
 }
@@ -192,7 +275,7 @@ function exibirResultados(resultado) {
     metadataDiv.innerHTML = `
         <p><strong>Run ID:</strong> ${resultado.run_id}</p>
         <p><strong>Timestamp:</strong> ${formatarDataHora(resultado.timestamp)}</p>
-        <p><strong>Tempo de Execução:</strong> ${resultado.execution_time_ms}ms</p>
+        <p><strong>Tempo de Execução:</strong> ${resultado.execution_time_ms}ms${resultado.cache_hit ? ' (⚡ cache)' : ''}</p>
         <p><strong>Versão da Planilha:</strong> ${resultado.workbook_version || 'N/A'}</p>
         <p><strong>SELIC:</strong> ${resultado.selic_context.message}</p>
         ${excelLink}
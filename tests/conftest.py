@@ -0,0 +1,16 @@
+"""
+Configuração compartilhada dos testes
+Módulos de src/ usam imports diretos (ex: `from models import ...`)
+"""
+import sys
+from pathlib import Path
+
+# Adicionar src ao path (mesmo esquema do app.py)
+SRC_DIR = Path(__file__).parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+# Raiz do projeto, para módulos importados como src.<módulo> (ex: taxas_completo_validator)
+ROOT_DIR = SRC_DIR.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.append(str(ROOT_DIR))
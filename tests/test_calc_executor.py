@@ -0,0 +1,88 @@
+"""
+Testes do pool de cálculos com fila limitada (backpressure)
+"""
+import asyncio
+import math
+import threading
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+import calc_executor
+from calc_executor import CalcExecutor, FilaCheiaError, calcular_tamanho_pool
+from models import CalculadoraInput
+
+
+def test_fila_cheia_rejeita_com_retry_after():
+    executor = CalcExecutor("thread", workers=1, max_fila=1)
+    liberar = threading.Event()
+
+    async def cenario():
+        primeiro = asyncio.ensure_future(executor.submeter(liberar.wait, 5))
+        segundo = asyncio.ensure_future(executor.submeter(lambda: "ok"))
+        await asyncio.sleep(0)
+        with pytest.raises(FilaCheiaError) as erro:
+            await executor.submeter(lambda: "rejeitado")
+        assert erro.value.retry_after >= 1
+        assert executor.estatisticas()["aguardando"] == 1
+
+        liberar.set()
+        assert await primeiro is True
+        assert await segundo == "ok"
+        # Vagas liberadas: volta a aceitar
+        assert await executor.submeter(lambda: 42) == 42
+
+    asyncio.run(cenario())
+    estatisticas = executor.estatisticas()
+    assert estatisticas["rejeitados"] == 1
+    assert estatisticas["ocupados"] == 0
+    assert estatisticas["concluidos"] == 3
+    executor.encerrar()
+
+
+def test_pool_de_processos(monkeypatch):
+    monkeypatch.setattr(calc_executor, "_aquecer_processo", lambda: None)
+    executor = CalcExecutor("process", workers=1, max_fila=0)
+    assert asyncio.run(executor.submeter(math.factorial, 10)) == 3628800
+    executor.encerrar()
+
+
+def test_tamanho_pool_por_cpu_e_memoria(monkeypatch):
+    monkeypatch.setattr(calc_executor.os, "cpu_count", lambda: 8)
+    monkeypatch.setattr(calc_executor, "memoria_disponivel_mb", lambda: 2048)
+    assert calcular_tamanho_pool("process", 512) == 4   # limitado pela memória
+    assert calcular_tamanho_pool("process", 128) == 8   # limitado pela CPU
+    assert calcular_tamanho_pool("thread", 64) == 12    # CPU + 4
+    monkeypatch.setattr(calc_executor, "memoria_disponivel_mb", lambda: 100)
+    assert calcular_tamanho_pool("process", 512) == 1
+
+
+def test_endpoint_responde_503_com_retry_after(monkeypatch):
+    import main
+
+    class Cheio:
+        async def calcular(self, inputs, run_id=None):
+            raise FilaCheiaError(7)
+
+    monkeypatch.setattr(main, "obter_calc_executor", lambda: Cheio())
+    inputs = CalculadoraInput(
+        municipio="TIMON",
+        periodo_inicio=date(2020, 1, 1),
+        periodo_fim=date(2020, 3, 1),
+        ajuizamento=date(2020, 4, 10),
+        citacao=date(2020, 5, 10),
+        correcao_ate=date(2020, 7, 1),
+    )
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(main.calcular(inputs))
+    assert erro.value.status_code == 503
+    assert erro.value.headers == {"Retry-After": "7"}
+
+
+def test_auto_usa_threads(monkeypatch):
+    # Coalescência e cache em memória só valem entre requisições do mesmo processo
+    import excel_template_calculator
+    monkeypatch.setattr(excel_template_calculator, "RECALC_BACKEND", "formula")
+    assert calc_executor.resolver_modo("auto") == "thread"
+    assert calc_executor.resolver_modo("process") == "process"
@@ -0,0 +1,160 @@
+"""
+Testes do cálculo em lote com saída NDJSON
+"""
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import main
+from calc_executor import FilaCheiaError
+from calculo_lote import LoteInvalidoError, executar_lote, ler_csv, validar_lote
+from models import CalculadoraOutput, CenarioOutput
+from rate_limiter import MemoriaBackend, PoliticaLimite, RateLimiter, ROTAS_CALCULO, ROTAS_LOTE
+
+CASO = {
+    "municipio": "TIMON",
+    "periodo_inicio": "2020-01-01",
+    "periodo_fim": "2020-03-01",
+    "ajuizamento": "2020-04-10",
+    "citacao": "2020-05-10",
+    "correcao_ate": "2020-07-01",
+}
+
+
+class ExecutorFalso:
+    """Pool de 2 workers que rejeita a primeira submissão (fila cheia) e falha em CAXIAS"""
+
+    workers = 2
+
+    def __init__(self):
+        self.chamadas = 0
+        self.simultaneos = 0
+        self.max_simultaneos = 0
+
+    async def calcular(self, inputs):
+        self.chamadas += 1
+        if self.chamadas == 1:
+            raise FilaCheiaError(0)
+        self.simultaneos += 1
+        self.max_simultaneos = max(self.max_simultaneos, self.simultaneos)
+        await asyncio.sleep(0.01)
+        self.simultaneos -= 1
+        if inputs.municipio == "CAXIAS":
+            raise ValueError("Município sem valores de repasse")
+        return CalculadoraOutput(
+            run_id=f"run-{inputs.municipio}",
+            timestamp=datetime(2025, 1, 1),
+            inputs=inputs.model_dump(mode="json"),
+            outputs={"nt7_tr": CenarioOutput(principal=1.0, honorarios=0.1, total=1.1)},
+            execution_time_ms=10,
+        )
+
+
+async def _coletar(gerador):
+    return [json.loads(linha) async for linha in gerador]
+
+
+def test_ler_csv_formato_brasileiro():
+    texto = (
+        "municipio;periodo_inicio;periodo_fim;ajuizamento;citacao;correcao_ate;honorarios_fixo\n"
+        "Timon;01/01/2020;01/03/2020;10/04/2020;10/05/2020;01/07/2020;1.234,50\n"
+        "Caxias;2020-01-01;2020-03-01;2020-04-10;2020-05-10;2020-07-01;\n"
+    )
+    itens = ler_csv(texto)
+    assert itens[0]["periodo_inicio"] == "2020-01-01"
+    assert itens[0]["honorarios_fixo"] == "1234.50"
+    assert "honorarios_fixo" not in itens[1]
+    assert [c.honorarios_fixo for c in validar_lote(itens, 10)] == [1234.5, 0.0]
+
+
+def test_validacao_reporta_todos_os_casos_invalidos():
+    with pytest.raises(LoteInvalidoError) as erro:
+        validar_lote([CASO, {**CASO, "periodo_fim": "2019-01-01"}, "texto", {"municipio": "X"}], 10)
+    assert [e["indice"] for e in erro.value.erros] == [1, 2, 3]
+
+    with pytest.raises(LoteInvalidoError):
+        validar_lote([CASO] * 3, 2)
+    with pytest.raises(LoteInvalidoError):
+        validar_lote([], 10)
+
+
+def test_lote_paralelo_com_resumo():
+    executor = ExecutorFalso()
+    casos = validar_lote([{**CASO, "municipio": m} for m in ("TIMON", "CAXIAS", "PICOS", "BACABAL", "FLORIANO")], 10)
+
+    linhas = asyncio.run(_coletar(executar_lote(casos, executor)))
+
+    assert linhas[-1]["tipo"] == "resumo"
+    assert (linhas[-1]["total"], linhas[-1]["concluidos"], linhas[-1]["erros"]) == (5, 4, 1)
+    por_indice = {linha["indice"]: linha for linha in linhas[:-1]}
+    assert sorted(por_indice) == [0, 1, 2, 3, 4]
+    assert por_indice[1]["tipo"] == "erro"
+    assert por_indice[2]["resultado"]["run_id"] == "run-PICOS"
+    assert executor.max_simultaneos <= ExecutorFalso.workers
+
+
+def _requisicao(corpo: bytes, content_type: str) -> Request:
+    async def receber():
+        return {"type": "http.request", "body": corpo, "more_body": False}
+    escopo = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/calcular/lote",
+        "headers": [(b"content-type", content_type.encode())],
+        "client": ("1.2.3.4", 5000),
+    }
+    return Request(escopo, receber)
+
+
+def _limiter(casos: int) -> RateLimiter:
+    return RateLimiter(
+        MemoriaBackend(), PoliticaLimite("api", 100, 60), PoliticaLimite("calculo", 2, 60), ROTAS_CALCULO,
+        PoliticaLimite("lote", casos, 3600), ROTAS_LOTE,
+    )
+
+
+def test_endpoint_lote_json(monkeypatch):
+    monkeypatch.setattr(main, "obter_calc_executor", lambda: ExecutorFalso())
+    monkeypatch.setattr(main, "obter_rate_limiter", lambda: _limiter(10))
+
+    async def cenario():
+        resposta = await main.calcular_lote(_requisicao(json.dumps([CASO, CASO]).encode(), "application/json"))
+        assert resposta.media_type == "application/x-ndjson"
+        return [json.loads(linha) async for linha in resposta.body_iterator]
+
+    linhas = asyncio.run(cenario())
+    assert linhas[-1]["concluidos"] == 2
+
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(main.calcular_lote(_requisicao(b"municipio\nTIMON\n", "text/csv")))
+    assert erro.value.status_code == 400
+    assert erro.value.detail["erros"][0]["indice"] == 0
+
+
+def test_lote_conta_cada_caso_no_rate_limit(monkeypatch):
+    limiter = _limiter(3)
+    monkeypatch.setattr(main, "obter_calc_executor", lambda: ExecutorFalso())
+    monkeypatch.setattr(main, "obter_rate_limiter", lambda: limiter)
+
+    # Mais casos que a cota do lote: nunca seria aceito
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(main.calcular_lote(_requisicao(json.dumps([CASO] * 4).encode(), "application/json")))
+    assert erro.value.status_code == 400
+
+    # Middleware conta 1, o endpoint cobra os demais casos: 2 de 3
+    assert limiter.verificar("1.2.3.4", "POST", "/api/calcular/lote").permitido
+    resposta = asyncio.run(main.calcular_lote(_requisicao(json.dumps([CASO] * 2).encode(), "application/json")))
+    assert resposta.media_type == "application/x-ndjson"
+    # Limite interativo (2/min) intacto
+    assert limiter.verificar("1.2.3.4", "POST", "/api/calcular").permitido
+    assert limiter.verificar("1.2.3.4", "POST", "/api/calcular").permitido
+
+    # Próximo lote de 2 passa no middleware (3 de 3), mas o segundo caso estoura o limite
+    assert limiter.verificar("1.2.3.4", "POST", "/api/calcular/lote").permitido
+    resposta = asyncio.run(main.calcular_lote(_requisicao(json.dumps([CASO] * 2).encode(), "application/json")))
+    assert resposta.status_code == 429
+    assert int(resposta.headers["Retry-After"]) > 0
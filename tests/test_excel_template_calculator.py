@@ -0,0 +1,130 @@
+"""
+Testes do ExcelTemplateCalculator (template sintético)
+"""
+import pytest
+from openpyxl import Workbook
+
+from excel_template_calculator import ExcelTemplateCalculator
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    """Cria template mínimo com aba RESUMO e valores nas linhas de saída"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "RESUMO"
+    for linha in range(23, 70):
+        ws[f"D{linha}"] = linha * 1000.0
+        ws[f"E{linha}"] = linha * 10.0
+        ws[f"F{linha}"] = linha * 1.0
+    outra = wb.create_sheet("NT7 IPCA SELIC")
+    outra["P127"] = 12345.67
+    caminho = tmp_path / "template.xlsx"
+    wb.save(caminho)
+    return caminho
+
+
+class TestLeituraEmLote:
+    """Leitura de vários ranges em uma única passada"""
+    
+    def test_lote_igual_a_leitura_individual(self, template_path):
+        ranges = [("RESUMO", f"D{l}:F{l}") for l in (23, 24, 28, 29, 68, 69)]
+        ranges.append(("NT7 IPCA SELIC", "P127"))
+        
+        with ExcelTemplateCalculator(template_path) as calc:
+            lote = calc.read_ranges_calculated(ranges)
+            individuais = [calc.read_range_calculated(aba, rng) for aba, rng in ranges]
+        
+        assert lote == individuais
+        assert lote[0] == [[23000.0, 230.0, 23.0]]
+        assert lote[-1] == [[12345.67]]
+    
+    def test_celulas_vazias_retornam_none(self, template_path):
+        with ExcelTemplateCalculator(template_path) as calc:
+            lote = calc.read_ranges_calculated([("RESUMO", "G23:H24"), ("RESUMO", "D80")])
+        
+        assert lote == [[[None, None], [None, None]], [[None]]]
+
+
+class TestTemplateEmMemoria:
+    """Clone em memória do template"""
+    
+    def test_nao_cria_arquivo_temporario_sem_recalculo(self, template_path):
+        with ExcelTemplateCalculator(template_path) as calc:
+            calc.write_cell("RESUMO", "B6", "TIMON")
+            calc.save_workbook()
+            assert calc.temp_path is None
+            assert calc.read_ranges_calculated([("RESUMO", "B6")]) == [[["TIMON"]]]
+    
+    def test_calculos_isolados_e_template_intacto(self, template_path, tmp_path):
+        original = template_path.read_bytes()
+        
+        with ExcelTemplateCalculator(template_path) as calc:
+            calc.write_cell("RESUMO", "D23", -1.0)
+            calc.save_workbook()
+            destino = tmp_path / "saida.xlsx"
+            calc.export(destino)
+        
+        with ExcelTemplateCalculator(template_path) as calc:
+            assert calc.read_ranges_calculated([("RESUMO", "D23")]) == [[[23000.0]]]
+        
+        assert template_path.read_bytes() == original
+        with ExcelTemplateCalculator(destino) as calc:
+            assert calc.read_ranges_calculated([("RESUMO", "D23")]) == [[[-1.0]]]
+    
+    def test_template_relido_quando_arquivo_muda(self, template_path):
+        from openpyxl import load_workbook
+        
+        assert ExcelTemplateCalculator.preload(template_path)
+        wb = load_workbook(template_path)
+        wb["RESUMO"]["D23"] = 1.5
+        wb.save(template_path)
+        
+        with ExcelTemplateCalculator(template_path) as calc:
+            assert calc.read_ranges_calculated([("RESUMO", "D23")]) == [[[1.5]]]
+
+
+@pytest.fixture
+def template_formula(tmp_path):
+    """RESUMO!D23 = B6*2 com o valor em cache do template (46)"""
+    import io
+    import zipfile
+    
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "RESUMO"
+    ws["B6"] = 23
+    ws["D23"] = "=B6*2"
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    
+    caminho = tmp_path / "template_formula.xlsx"
+    with zipfile.ZipFile(buffer) as origem, zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as destino:
+        for info in origem.infolist():
+            dados = origem.read(info.filename)
+            if info.filename == "xl/worksheets/sheet1.xml":
+                dados = dados.replace(b"<f>B6*2</f><v />", b"<f>B6*2</f><v>46</v>")
+            destino.writestr(info, dados)
+    return caminho
+
+
+class TestCacheDoTemplate:
+    """Valores em cache de fórmulas só valem se o arquivo foi recalculado nesta execução"""
+    
+    def test_sem_escrita_usa_cache(self, template_formula):
+        with ExcelTemplateCalculator(template_formula) as calc:
+            assert calc.cache_valido
+            assert calc.read_ranges_calculated([("RESUMO", "D23")]) == [[[46]]]
+    
+    def test_escrita_sem_recalculo_nao_devolve_valor_do_template(self, template_formula, monkeypatch):
+        with ExcelTemplateCalculator(template_formula, backend="none") as calc:
+            calc.write_cell("RESUMO", "B6", 50)
+            calc.save_workbook()
+            assert not calc.recalculate_workbook()
+            assert not calc.cache_valido
+            assert calc.read_ranges_calculated([("RESUMO", "B6"), ("RESUMO", "D23")]) == [[[50]], [[None]]]
+            
+            # Caminho openpyxl (fallback) com a mesma regra
+            monkeypatch.setattr(calc, "_ler_streaming", lambda ranges: None)
+            assert calc.read_ranges_calculated([("RESUMO", "B6"), ("RESUMO", "D23")]) == [[[50]], [[None]]]
+            assert calc.read_range_calculated("RESUMO", "D23") == [[None]]
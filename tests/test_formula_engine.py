@@ -0,0 +1,221 @@
+"""
+Testes do motor de fórmulas Python (template sintético com a estrutura do TIMON)
+"""
+from datetime import date
+
+import pytest
+from openpyxl import Workbook
+
+import formula_functions as ff
+from excel_template_calculator import ExcelTemplateCalculator
+from formula_engine import FormulaEngine, FormulaNaoSuportada
+
+
+SAIDAS = [("RESUMO", "D23:F24")]
+ENTRADAS = [("RESUMO", c) for c in ("B6", "E6", "F6", "B11", "B12", "B13", "B14")]
+
+
+def _workbook_timon():
+    """RESUMO -> aba de cálculo -> repasses por município (mesma cadeia do template)"""
+    wb = Workbook()
+    resumo = wb.active
+    resumo.title = "RESUMO"
+    resumo["B6"] = "TIMON"
+    resumo["E6"] = date(2020, 1, 1)
+    resumo["F6"] = date(2020, 12, 31)
+    resumo["B11"] = 0.10
+    resumo["B12"] = 500.0
+    resumo["B13"] = 0.0
+    resumo["B14"] = 0.0
+    resumo["D23"] = "='NT7 IPCA SELIC'!P127"
+    resumo["E23"] = "='NT7 IPCA SELIC'!Q127"
+    resumo["F23"] = "=$B$12"
+    resumo["D24"] = "=D23*(1-$B$13)"
+    resumo["E24"] = "=E23*(1-$B$14)"
+    resumo["F24"] = "=F23*(1-$B$14)"
+    resumo["H1"] = "não usado"
+    resumo["H2"] = "=INDIRECT(\"A1\")"  # fora do cone: não deve impedir a montagem
+
+    repasse = wb.create_sheet("Repasse PA")
+    for linha, (nome, valor) in enumerate([("TIMON", 1000.0), ("CAXIAS", 2500.0), ("CODÓ", 300.0)], start=1):
+        repasse[f"A{linha}"] = nome
+        repasse[f"B{linha}"] = valor
+
+    calc = wb.create_sheet("NT7 IPCA SELIC")
+    calc["B3"] = "=RESUMO!B11"
+    calc["B4"] = "=IFERROR(VLOOKUP(RESUMO!B6,'Repasse PA'!$A$1:$B$3,2,FALSE),0)"
+    calc["B5"] = "=DATEDIF(RESUMO!E6,RESUMO!F6+1,\"m\")"
+    calc["P127"] = "=ROUND(B4*B5*(1+2%)^2,2)"
+    calc["Q127"] = "=IF(P127>0,P127*B3,0)"
+    return wb
+
+
+@pytest.fixture
+def template_timon(tmp_path):
+    caminho = tmp_path / "timon.xlsx"
+    _workbook_timon().save(caminho)
+    return caminho
+
+
+@pytest.fixture
+def engine(template_timon):
+    return FormulaEngine.carregar(template_timon.read_bytes(), SAIDAS, ENTRADAS)
+
+
+class TestFormulaEngine:
+    """Avaliação do cone RESUMO D23:F24"""
+
+    def test_cone_contem_apenas_precedentes_das_saidas(self, engine):
+        assert ("RESUMO", 2, 8) not in engine._compiladas
+        assert ("NT7 IPCA SELIC", 127, 16) in engine._compiladas
+
+    def test_avalia_com_valores_do_template(self, engine):
+        valores = engine.avaliar({}).ler_range("RESUMO", "D23:F24")
+        principal = round(1000.0 * 12 * 1.02 ** 2, 2)
+
+        assert valores[0] == [pytest.approx(principal), pytest.approx(principal * 0.10), 500.0]
+        assert valores[1] == [pytest.approx(principal), pytest.approx(principal * 0.10), 500.0]
+
+    def test_entradas_alteram_resultado(self, engine):
+        avaliacao = engine.avaliar({
+            ("RESUMO", "B6"): "CAXIAS",
+            ("RESUMO", "F6"): date(2020, 6, 30),
+            ("RESUMO", "B11"): 0.20,
+            ("RESUMO", "B13"): 0.25,
+        })
+        principal = round(2500.0 * 6 * 1.02 ** 2, 2)
+
+        assert avaliacao.valor("RESUMO", "D23") == pytest.approx(principal)
+        assert avaliacao.valor("RESUMO", "E23") == pytest.approx(principal * 0.20)
+        assert avaliacao.valor("RESUMO", "D24") == pytest.approx(principal * 0.75)
+
+    def test_municipio_inexistente_usa_iferror(self, engine):
+        avaliacao = engine.avaliar({("RESUMO", "B6"): "INEXISTENTE"})
+        assert avaliacao.valor("RESUMO", "D23") == 0.0
+        assert avaliacao.valor("RESUMO", "E23") == 0.0
+
+    def test_range_fora_do_cone_nao_coberto(self, engine):
+        assert engine.avaliar({}).ler_range("RESUMO", "H2") is None
+
+    def test_funcao_nao_suportada_no_cone(self, tmp_path):
+        wb = _workbook_timon()
+        wb["NT7 IPCA SELIC"]["B5"] = "=INDIRECT(\"B6\")"
+        caminho = tmp_path / "dinamico.xlsx"
+        wb.save(caminho)
+
+        with pytest.raises(FormulaNaoSuportada):
+            FormulaEngine.carregar(caminho.read_bytes(), SAIDAS, ENTRADAS)
+
+    def test_referencia_circular(self, tmp_path):
+        wb = _workbook_timon()
+        wb["NT7 IPCA SELIC"]["B3"] = "=RESUMO!E23"
+        caminho = tmp_path / "circular.xlsx"
+        wb.save(caminho)
+
+        with pytest.raises(Exception, match="circular"):
+            FormulaEngine.carregar(caminho.read_bytes(), SAIDAS, ENTRADAS)
+
+
+class TestRecalculoIncremental:
+    """Apenas células a jusante das entradas alteradas são reavaliadas"""
+
+    def test_desagio_recalcula_so_linha_liquida(self, engine):
+        avaliacao = engine.avaliar({("RESUMO", "B13"): 0.5})
+
+        assert avaliacao.recalculadas == 1
+        assert avaliacao.valor("RESUMO", "D24") == pytest.approx(avaliacao.valor("RESUMO", "D23") * 0.5)
+
+    def test_honorarios_recalcula_cadeia_de_honorarios(self, engine):
+        avaliacao = engine.avaliar({("RESUMO", "B11"): 0.30})
+
+        # NT7!B3 -> NT7!Q127 -> RESUMO!E23 -> RESUMO!E24
+        assert avaliacao.recalculadas == 4
+        assert avaliacao.valor("RESUMO", "E24") == pytest.approx(avaliacao.valor("RESUMO", "D23") * 0.30)
+
+    def test_incremental_igual_a_avaliacao_completa(self, engine):
+        sequencia = [
+            {("RESUMO", "B6"): "CAXIAS", ("RESUMO", "B11"): 0.2},
+            {("RESUMO", "B6"): "CAXIAS", ("RESUMO", "B11"): 0.2, ("RESUMO", "B13"): 0.1},
+            {("RESUMO", "B6"): "CODÓ", ("RESUMO", "F6"): date(2021, 3, 31)},
+            {},
+        ]
+        for entradas in sequencia:
+            incremental = engine.avaliar(entradas).ler_range("RESUMO", "D23:F24")
+            completa = engine.avaliar_completo(entradas).ler_range("RESUMO", "D23:F24")
+            assert incremental == completa
+
+    def test_repetir_entradas_nao_reavalia(self, engine):
+        entradas = {("RESUMO", "B6"): "CAXIAS", ("RESUMO", "B14"): 0.1}
+        engine.avaliar(entradas)
+
+        assert engine.avaliar(entradas).recalculadas == 0
+
+
+class TestFuncoes:
+    """Semântica de funções/operadores que divergem do Python"""
+
+    def test_arredondamento_meio_para_cima(self):
+        assert ff.FUNCOES["ROUND"](2.675, 2) == 2.68
+        assert ff.FUNCOES["ROUND"](-2.5, 0) == -3.0
+
+    def test_comparacao_texto_sem_diferenciar_maiusculas(self):
+        assert ff.op_binario("=", "timon", "TIMON") is True
+
+    def test_divisao_por_zero(self):
+        with pytest.raises(ff.ErroExcel):
+            ff.op_binario("/", 1.0, 0.0)
+
+
+class TestBackendFormula:
+    """ExcelTemplateCalculator com backend "formula" """
+
+    def test_recalculo_em_python(self, template_timon):
+        with ExcelTemplateCalculator(
+            template_timon,
+            backend="formula",
+            celulas_saida=SAIDAS,
+            celulas_entrada=ENTRADAS
+        ) as calc:
+            calc.write_cell("RESUMO", "B6", "CODÓ")
+            calc.write_cell("RESUMO", "B13", 0.5)
+            calc.save_workbook()
+            assert calc.recalculate_workbook()
+            assert calc.temp_path is None
+
+            linhas = calc.read_ranges_calculated([("RESUMO", "D23:F23"), ("RESUMO", "D24:F24")])
+
+        principal = round(300.0 * 12 * 1.02 ** 2, 2)
+        assert linhas[0][0][0] == pytest.approx(principal)
+        assert linhas[1][0][0] == pytest.approx(principal * 0.5)
+
+    def test_sem_saidas_nao_recalcula(self, template_timon):
+        with ExcelTemplateCalculator(template_timon, backend="formula") as calc:
+            assert calc.recalculate_workbook() is False
+
+
+def test_auto_usa_pool_quando_motor_recusa_o_template(tmp_path, monkeypatch):
+    import excel_template_calculator
+    from recalc_backends import StubBackend
+
+    wb = _workbook_timon()
+    wb["NT7 IPCA SELIC"]["B5"] = "=OFFSET(B6,0,0)"
+    template = tmp_path / "template.xlsx"
+    wb.save(template)
+
+    stub = StubBackend(valores={"RESUMO": {"D23": 1234.5}})
+    monkeypatch.setattr(excel_template_calculator, "RECALC_BACKEND", "auto")
+    monkeypatch.setattr(excel_template_calculator, "WIN32COM_AVAILABLE", False)
+    monkeypatch.setattr(ExcelTemplateCalculator, "_formula_recusada", False)
+    monkeypatch.setattr(
+        excel_template_calculator, "obter_backend", lambda nome: stub if nome == "libreoffice" else None
+    )
+
+    assert ExcelTemplateCalculator.resolver_backend() == "formula"
+    with ExcelTemplateCalculator(template, celulas_saida=SAIDAS, celulas_entrada=ENTRADAS) as calc:
+        calc.write_cell("RESUMO", "B6", "CODÓ")
+        assert calc.recalculate_workbook()
+        assert calc.read_ranges_calculated([("RESUMO", "D23")]) == [[[1234.5]]]
+
+    # Recusa lembrada: próximos cálculos vão direto para o pool
+    assert ExcelTemplateCalculator.resolver_backend() == "libreoffice"
+    assert len(stub.chamadas) == 1
@@ -0,0 +1,136 @@
+"""
+Testes do cliente HTTP compartilhado contra um servidor local
+(keep-alive, retentativas com backoff, limite por host, busca paralela das 4 séries)
+"""
+import json
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from bacen_service import BacenService
+from http_client import HttpClient, executar_em_paralelo
+from ibge_service import IbgeService
+
+
+class _Servidor:
+    """Stand-in de BACEN/IBGE: respostas programáveis e registro das conexões"""
+
+    def __init__(self):
+        self.falhas = []  # status a devolver antes do 200 (consumidos em ordem)
+        self.atraso = 0.0
+        self.portas = set()
+        self.em_voo = 0
+        self.max_em_voo = 0
+        self.caminhos = []
+        self._lock = threading.Lock()
+
+    def corpo(self, caminho: str):
+        if "/agregados/" in caminho:
+            return [{"resultados": [{"series": [{"serie": {"202502": "1.31", "202503": "0.56"}}]}]}]
+        if "bcdata.sgs.226" in caminho:
+            return [{"data": "01/03/2025", "dataFim": "01/04/2025", "valor": "0.1"}]
+        return [{"data": "31/03/2025", "valor": "0.050788"}]
+
+
+@pytest.fixture
+def servidor():
+    estado = _Servidor()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            with estado._lock:
+                estado.portas.add(self.client_address[1])
+                estado.caminhos.append(self.path)
+                estado.em_voo += 1
+                estado.max_em_voo = max(estado.max_em_voo, estado.em_voo)
+                status = estado.falhas.pop(0) if estado.falhas else 200
+            time.sleep(estado.atraso)
+            with estado._lock:
+                estado.em_voo -= 1
+
+            corpo = json.dumps(estado.corpo(self.path) if status == 200 else {"erro": status}).encode()
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "2")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    estado.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield estado
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_conexao_reaproveitada(servidor):
+    cliente = HttpClient()
+    for _ in range(5):
+        assert cliente.get(f"{servidor.url}/ping").status_code == 200
+    assert len(servidor.portas) == 1
+    cliente.fechar()
+
+
+def test_retentativa_com_backoff_e_retry_after(servidor):
+    esperas = []
+    cliente = HttpClient(tentativas=4, backoff_base=0.5, dormir=esperas.append, aleatorio=lambda: 1.0)
+
+    servidor.falhas = [503, 502, 429]
+    resposta = cliente.get(f"{servidor.url}/dados")
+    assert resposta.status_code == 200
+    assert esperas == [0.5, 1.0, 2.0]  # 2.0 do Retry-After
+    assert cliente.estatisticas()["retentativas"] == 3
+
+    # Tentativas esgotadas: devolve a última resposta; 4xx não é repetido
+    servidor.falhas = [500, 500]
+    assert cliente.get(f"{servidor.url}/dados", tentativas=2).status_code == 500
+    servidor.falhas = [404]
+    assert cliente.get(f"{servidor.url}/dados").status_code == 404
+    assert cliente.estatisticas()["retentativas"] == 4
+
+
+def test_jitter_fica_abaixo_do_teto():
+    cliente = HttpClient(backoff_base=0.5, backoff_max=3.0)
+    for tentativa in range(1, 8):
+        assert 0 <= cliente.espera(tentativa) <= min(3.0, 0.5 * 2 ** (tentativa - 1))
+
+
+def test_limite_por_host(servidor):
+    servidor.atraso = 0.1
+    cliente = HttpClient(max_por_host=2)
+    resultados = executar_em_paralelo(
+        {str(i): (lambda: cliente.get(f"{servidor.url}/lento").status_code) for i in range(6)}
+    )
+    assert set(resultados.values()) == {200}
+    assert servidor.max_em_voo == 2
+
+
+def test_validador_busca_as_quatro_series_em_paralelo(servidor, tmp_path, monkeypatch):
+    from src.taxas_completo_validator import TaxasCompletoValidator
+
+    servidor.atraso = 0.3
+    validador = TaxasCompletoValidator()
+    monkeypatch.setattr(validador, "bacen", BacenService(base_url=f"{servidor.url}/bcdata.sgs", cache_dir=tmp_path))
+    monkeypatch.setattr(validador, "ibge", IbgeService(cache_dir=tmp_path, base_url=f"{servidor.url}/agregados"))
+
+    inicio = time.monotonic()
+    resultado = validador.validar_todas(date(2024, 1, 1), date(2025, 3, 31))
+    decorrido = time.monotonic() - inicio
+
+    assert len(servidor.caminhos) == 4
+    assert decorrido < 4 * servidor.atraso  # em sequência levaria 1.2s
+    assert all(taxa.disponivel_api for taxa in resultado["taxas"].values())
+    assert resultado["taxas"]["SELIC"].ultimo_mes_api == "03/2025"
+    assert resultado["taxas"]["IPCA-E"].ultimo_mes_api == "03/2025"
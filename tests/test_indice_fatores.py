@@ -0,0 +1,118 @@
+"""
+Testes do índice de fatores acumulados (produtos prefixados, totais mensais, atualização incremental)
+"""
+import math
+from datetime import date, timedelta
+
+import pytest
+
+from bacen_service import BacenService
+from indice_fatores import IndicesTaxas, IndiceFatores, competencia
+from series_store import SeriesStore
+
+
+def _selic_diarias(inicio: date, dias: int, valor: float = 0.04):
+    return [
+        {"data": (inicio + timedelta(days=i)).strftime("%d/%m/%Y"), "valor": f"{valor + i * 0.0001:.6f}"}
+        for i in range(dias)
+    ]
+
+
+def _produto(registros):
+    return math.prod(1 + float(r["valor"]) / 100 for r in registros)
+
+
+def test_fator_entre_datas_e_uma_divisao():
+    indice = IndiceFatores("SELIC", diario=True)
+    dados = _selic_diarias(date(2023, 1, 1), 90)
+    indice.anexar(
+        [date(2023, 1, 1).toordinal() + i for i in range(90)], [float(d["valor"]) for d in dados]
+    )
+
+    inicio, fim = date(2023, 1, 10), date(2023, 2, 20)
+    esperado = _produto(dados[9:51])
+    assert indice.fator(inicio.toordinal(), fim.toordinal()) == pytest.approx(esperado, rel=1e-12)
+    assert indice.fator(date(2024, 1, 1).toordinal(), date(2024, 2, 1).toordinal()) is None
+
+    with pytest.raises(ValueError):
+        indice.anexar([date(2023, 1, 5).toordinal()], [0.05])
+
+
+def test_anexar_publica_instantaneo_novo_sem_alterar_o_anterior():
+    indice = IndiceFatores("IPCA", diario=False)
+    indice.anexar([100, 101], [1.0, 2.0])
+    anterior = indice._atual
+    totais = indice.totais_mensais()
+
+    indice.anexar([102], [3.0])
+    assert indice._atual is not anterior
+    assert list(anterior.chaves) == [100, 101] and len(anterior.acumulado) == 3
+    assert not anterior.acumulado.flags.writeable
+    assert indice.fator(100, 102) == pytest.approx(1.01 * 1.02 * 1.03)
+    assert 102 not in totais and indice.totais_mensais()[102] == 3.0
+
+
+def test_totais_mensais_batem_com_composicao_das_diarias():
+    indice = IndiceFatores("SELIC", diario=True)
+    dados = _selic_diarias(date(2023, 1, 15), 80)
+    ordinais = [date(2023, 1, 15).toordinal() + i for i in range(80)]
+    indice.anexar(ordinais, [float(d["valor"]) for d in dados])
+
+    fatores = {}
+    for o, d in zip(ordinais, dados):
+        mes = competencia(date.fromordinal(o))
+        fatores[mes] = fatores.get(mes, 1.0) * (1 + float(d["valor"]) / 100)
+    esperado = {mes: (fator - 1) * 100 for mes, fator in fatores.items()}
+    totais = indice.totais_mensais()
+    assert set(totais) == set(esperado)
+    for mes, taxa in esperado.items():
+        assert totais[mes] == pytest.approx(taxa, rel=1e-9)
+
+
+def test_serie_mensal_exige_competencias_continuas(tmp_path):
+    store = SeriesStore(tmp_path)
+    store.mesclar(
+        "IPCA",
+        [{"data": "01/2023", "valor": 0.53}, {"data": "02/2023", "valor": 0.84}, {"data": "04/2023", "valor": 0.61}],
+        date(2023, 1, 1),
+        date(2023, 4, 30),
+    )
+    indices = IndicesTaxas(store)
+
+    assert indices.fator("IPCA", date(2023, 1, 1), date(2023, 2, 28)) == pytest.approx(1.0053 * 1.0084)
+    assert indices.fator("IPCA", date(2023, 1, 1), date(2023, 4, 30)) is None  # falta 03/2023
+
+
+def test_atualizacao_incremental(tmp_path):
+    store = SeriesStore(tmp_path)
+    dados = _selic_diarias(date(2022, 1, 1), 60)
+    store.mesclar("SELIC", dados[:30], date(2022, 1, 1), date(2022, 1, 30))
+    indices = IndicesTaxas(store)
+    indices.fator("SELIC", date(2022, 1, 1), date(2022, 1, 30))
+    assert indices.estatisticas()["reconstrucoes"] == 1
+
+    # Registros novos no fim: só anexa
+    store.mesclar("SELIC", dados[30:], date(2022, 1, 31), date(2022, 3, 1))
+    fator = indices.fator("SELIC", date(2022, 1, 1), date(2022, 3, 1))
+    assert fator == pytest.approx(_produto(dados), rel=1e-12)
+    assert indices.estatisticas()["reconstrucoes"] == 1
+    assert indices.estatisticas()["anexacoes"] == 1
+
+    # Revisão de um valor antigo: reconstrói
+    store.mesclar("SELIC", [{"data": "05/01/2022", "valor": "0.5"}], date(2022, 1, 5), date(2022, 1, 5))
+    indices.fator("SELIC", date(2022, 1, 1), date(2022, 3, 1))
+    assert indices.estatisticas()["reconstrucoes"] == 2
+
+
+def test_bacen_selic_mes_usa_o_indice(tmp_path, monkeypatch):
+    service = BacenService()
+    service.series = SeriesStore(tmp_path)
+    service.indices = IndicesTaxas(service.series)
+    dados = _selic_diarias(date(2023, 3, 1), 31)
+    service.series.mesclar("SELIC", dados, date(2023, 3, 1), date(2023, 3, 31))
+    monkeypatch.setattr(service, "_consultar_api", lambda *args: pytest.fail("período já coberto"))
+
+    assert service.buscar_selic_mes(2023, 3) == round((_produto(dados) - 1) * 100, 4)
+    assert service.fator_acumulado("SELIC", date(2023, 3, 5), date(2023, 3, 10)) == pytest.approx(
+        _produto(dados[4:10]), rel=1e-12
+    )
@@ -0,0 +1,150 @@
+"""
+Testes dos jobs de cálculo assíncronos (/api/jobs)
+"""
+import asyncio
+import threading
+import time
+from datetime import date, datetime
+
+import pytest
+from fastapi import HTTPException
+
+import calculator_service
+import main
+from calc_executor import CalcExecutor
+from calculator_service import CalculadoraService
+from job_manager import JobManager
+from models import CalculadoraInput, CalculadoraOutput, CenarioOutput
+from result_cache import ResultCache
+from result_store import ResultStore
+from run_events import Acompanhamento
+from single_flight import SingleFlight
+
+
+def _inputs():
+    return CalculadoraInput(
+        municipio="TIMON",
+        periodo_inicio=date(2020, 1, 1),
+        periodo_fim=date(2020, 3, 1),
+        ajuizamento=date(2020, 4, 10),
+        citacao=date(2020, 5, 10),
+        correcao_ate=date(2020, 7, 1),
+        honorarios_perc=10,
+    )
+
+
+@pytest.fixture
+def calculo_controlado(monkeypatch):
+    """_executar falso que passa pelas etapas e para em `liberar` no meio do recálculo"""
+    monkeypatch.setattr(calculator_service, "obter_result_cache", lambda: ResultCache(max_bytes=0))
+    monkeypatch.setattr(calculator_service, "obter_result_store", lambda: None)
+    monkeypatch.setattr(calculator_service, "obter_single_flight", lambda: SingleFlight())
+    controle = {"liberar": threading.Event(), "recalculando": threading.Event(), "execucoes": 0}
+
+    def executar(self, inputs, progresso=None, run_id=None):
+        controle["execucoes"] += 1
+        acompanhamento = Acompanhamento(run_id or "teste-job", progresso)
+        acompanhamento.etapa("iniciando", 5)
+        acompanhamento.etapa("recalculando", 30)
+        controle["recalculando"].set()
+        controle["liberar"].wait(5)
+        acompanhamento.etapa("lendo_resultados", 70)
+        return CalculadoraOutput(
+            run_id=f"run-{controle['execucoes']}",
+            timestamp=datetime(2025, 1, 1),
+            inputs=inputs.model_dump(mode="json"),
+            outputs={"nt7_tr": CenarioOutput(principal=1.0, honorarios=0.1, total=1.1)},
+            execution_time_ms=10,
+        )
+
+    monkeypatch.setattr(CalculadoraService, "_executar", executar)
+    return controle
+
+
+def _aguardar(manager, job_id, status):
+    limite = time.monotonic() + 5
+    while time.monotonic() < limite:
+        job = manager.obter(job_id)
+        if job.status == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} não chegou a {status}: {manager.obter(job_id)}")
+
+
+def test_job_conclui_com_progresso_e_resultado(tmp_path, calculo_controlado):
+    executor = CalcExecutor("thread", workers=1, max_fila=1)
+    store = ResultStore(tmp_path / "resultados.db")
+    manager = JobManager(executor, store)
+
+    job = manager.criar(_inputs())
+    assert job.status == "pendente"
+
+    assert calculo_controlado["recalculando"].wait(5)
+    andamento = manager.obter(job.job_id)
+    assert (andamento.status, andamento.etapa, andamento.progresso) == ("executando", "recalculando", 30)
+
+    calculo_controlado["liberar"].set()
+    final = _aguardar(manager, job.job_id, "concluido")
+    assert final.progresso == 100
+    assert final.resultado.outputs["nt7_tr"].total == 1.1
+
+    # Outro worker (sem o job em memória) responde pelo store
+    store.guardar(None, final.resultado)
+    outro = JobManager(executor, store).obter(job.job_id)
+    assert outro.status == "concluido"
+    assert outro.resultado.run_id == final.resultado.run_id
+
+    executor.encerrar()
+    store.fechar()
+
+
+def test_cancelamento_em_execucao_e_na_fila(tmp_path, calculo_controlado):
+    executor = CalcExecutor("thread", workers=1, max_fila=1)
+    store = ResultStore(tmp_path / "resultados.db")
+    manager = JobManager(executor, store)
+
+    rodando = manager.criar(_inputs())
+    assert calculo_controlado["recalculando"].wait(5)
+    na_fila = manager.criar(_inputs())
+
+    assert manager.cancelar(na_fila.job_id).status == "cancelado"
+    manager.cancelar(rodando.job_id)
+    calculo_controlado["liberar"].set()
+
+    assert _aguardar(manager, rodando.job_id, "cancelado").resultado is None
+    assert calculo_controlado["execucoes"] == 1  # o job da fila nunca rodou
+    assert store.obter_job(rodando.job_id)["status"] == "cancelado"
+
+    executor.encerrar()
+    store.fechar()
+
+
+def test_endpoints_de_jobs(monkeypatch):
+    executor = CalcExecutor("thread", workers=1, max_fila=0)
+    liberar = threading.Event()
+    executor.iniciar(liberar.wait, 5)
+    monkeypatch.setattr(main, "obter_job_manager", lambda: JobManager(executor, None))
+
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(main.criar_job(_inputs()))
+    assert erro.value.status_code == 503
+    assert "Retry-After" in erro.value.headers
+
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(main.obter_job("inexistente"))
+    assert erro.value.status_code == 404
+
+    liberar.set()
+    executor.encerrar()
+
+
+def test_compactacao_remove_jobs_encerrados(tmp_path):
+    store = ResultStore(tmp_path / "resultados.db", retencao_jobs_horas=1)
+    antigo = time.time() - 7200
+    store.salvar_job({"job_id": "velho", "status": "concluido", "criado_em": antigo, "atualizado_em": antigo})
+    store.salvar_job({"job_id": "rodando", "status": "executando", "criado_em": antigo, "atualizado_em": antigo})
+
+    assert store.compactar()["jobs_removidos"] == 1
+    assert store.obter_job("velho") is None
+    assert store.obter_job("rodando") is not None
+    store.fechar()
@@ -0,0 +1,120 @@
+"""
+Testes do rate limiter (janela deslizante, políticas por rota, backends)
+"""
+import pytest
+
+from rate_limiter import (
+    MemoriaBackend,
+    PoliticaLimite,
+    RateLimiter,
+    ROTAS_CALCULO,
+    ROTAS_LOTE,
+    SQLiteBackend,
+    janela_deslizante,
+)
+
+CALCULO = PoliticaLimite("calculo", 3, 60)
+LOTE = PoliticaLimite("lote", 100, 3600)
+
+
+def _limiter(backend, agora):
+    return RateLimiter(
+        backend,
+        PoliticaLimite("api", 5, 60),
+        CALCULO,
+        ROTAS_CALCULO,
+        LOTE,
+        ROTAS_LOTE,
+        relogio=lambda: agora[0],
+    )
+
+
+def test_janela_deslizante_decai_com_o_tempo():
+    estado = None
+    for _ in range(3):
+        estado, decisao = janela_deslizante(estado, 10.0, CALCULO)
+        assert decisao.permitido
+    estado, decisao = janela_deslizante(estado, 10.0, CALCULO)
+    assert not decisao.permitido
+    assert decisao.retry_after == 70  # fim da janela + 1/3 da próxima
+
+    # Meio da janela seguinte: 3 * 0.5 = 1.5 estimadas - cabe mais uma
+    estado, decisao = janela_deslizante(estado, 90.0, CALCULO)
+    assert decisao.permitido
+    # Duas janelas depois, tudo zerado
+    estado, decisao = janela_deslizante(estado, 250.0, CALCULO)
+    assert estado == (4, 1, 0)
+
+
+def test_custo_por_caso():
+    estado, decisao = janela_deslizante(None, 10.0, CALCULO, custo=2)
+    assert decisao.permitido and decisao.restante == 1
+    estado, decisao = janela_deslizante(estado, 10.0, CALCULO, custo=2)
+    assert not decisao.permitido
+    assert decisao.retry_after == 80  # fim da janela + metade da próxima (2 casos de uma vez)
+    assert estado == (0, 2, 0)  # negada não consome
+
+    # Lote cobra da cota própria, sem consumir o limite interativo
+    limiter = _limiter(MemoriaBackend(), [0.0])
+    assert limiter.verificar("1.2.3.4", "POST", "/api/calcular/lote", custo=50).permitido
+    decisao = limiter.verificar("1.2.3.4", "POST", "/api/calcular/lote", custo=50)
+    assert decisao.permitido and decisao.restante == 0
+    assert not limiter.verificar("1.2.3.4", "POST", "/api/calcular/lote").permitido
+    for _ in range(3):
+        assert limiter.verificar("1.2.3.4", "POST", "/api/calcular").permitido
+
+    # Custo acima da cota nunca seria aceito - quem cobra limita o tamanho antes
+    with pytest.raises(ValueError):
+        limiter.verificar("5.6.7.8", "POST", "/api/calcular/lote", custo=101)
+
+
+def test_politicas_por_rota():
+    agora = [0.0]
+    limiter = _limiter(MemoriaBackend(), agora)
+
+    assert limiter.politica("GET", "/") is None
+    assert limiter.politica("GET", "/script.js") is None
+    assert limiter.politica("GET", "/api/health") is None
+    assert limiter.politica("POST", "/api/calcular/lote").nome == "lote"
+    assert limiter.politica("POST", "/api/calcular").nome == "calculo"
+    assert limiter.politica("GET", "/api/jobs/abc").nome == "api"
+
+    for _ in range(3):
+        assert limiter.verificar("1.2.3.4", "POST", "/api/calcular").permitido
+    negada = limiter.verificar("1.2.3.4", "POST", "/api/calcular")
+    assert not negada.permitido and negada.retry_after > 0
+    # Limites independentes: outra política, outro IP, rota isenta
+    assert limiter.verificar("1.2.3.4", "GET", "/api/metricas").permitido
+    assert limiter.verificar("5.6.7.8", "POST", "/api/calcular").permitido
+    assert limiter.verificar("1.2.3.4", "GET", "/api/health").permitido
+
+
+def test_memoria_limitada_sob_varredura_de_ips():
+    agora = [0.0]
+    backend = MemoriaBackend(max_chaves=100, ociosidade=120)
+    limiter = _limiter(backend, agora)
+
+    for i in range(1000):
+        limiter.verificar(f"10.0.{i // 256}.{i % 256}", "GET", "/api/metricas")
+    assert backend.estatisticas()["chaves"] == 100
+
+    # Chaves ociosas saem na próxima atualização
+    agora[0] = 500.0
+    limiter.verificar("1.1.1.1", "GET", "/api/metricas")
+    assert backend.estatisticas()["chaves"] == 1
+
+
+def test_backend_sqlite_compartilhado(tmp_path):
+    agora = [0.0]
+    # Dois "workers" com o mesmo arquivo
+    worker_a = _limiter(SQLiteBackend(tmp_path / "limites.db"), agora)
+    worker_b = _limiter(SQLiteBackend(tmp_path / "limites.db"), agora)
+
+    assert worker_a.verificar("1.2.3.4", "POST", "/api/calcular").permitido
+    assert worker_b.verificar("1.2.3.4", "POST", "/api/calcular").permitido
+    assert worker_a.verificar("1.2.3.4", "POST", "/api/calcular").permitido
+    assert not worker_b.verificar("1.2.3.4", "POST", "/api/calcular").permitido
+
+    agora[0] = 1000.0
+    assert worker_a.backend.limpar(agora[0]) == 1
+    assert worker_b.backend.estatisticas()["chaves"] == 0
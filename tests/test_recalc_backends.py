@@ -0,0 +1,155 @@
+"""
+Testes do pool de workers de recálculo e do backend stub
+"""
+import threading
+import time
+
+import pytest
+from openpyxl import Workbook
+
+from excel_template_calculator import ExcelTemplateCalculator
+from recalc_backends import RecalcWorker, StubBackend, WorkerPool, registrar_backend
+
+
+class WorkerFalso(RecalcWorker):
+    """Worker em memória que registra em qual thread cada etapa rodou"""
+
+    nome = "falso"
+    iniciados = []
+    encerrados = []
+
+    def __init__(self, identificador):
+        self.identificador = identificador
+        self.thread = None
+        self.ok = True
+
+    def iniciar(self):
+        self.thread = threading.get_ident()
+        WorkerFalso.iniciados.append(self.identificador)
+
+    def recalcular(self, caminho):
+        assert threading.get_ident() == self.thread
+        return True
+
+    def saudavel(self):
+        return self.ok
+
+    def encerrar(self):
+        WorkerFalso.encerrados.append(self.identificador)
+
+
+@pytest.fixture(autouse=True)
+def limpar_registros():
+    WorkerFalso.iniciados.clear()
+    WorkerFalso.encerrados.clear()
+
+
+def test_pool_reutiliza_e_recicla_workers(tmp_path):
+    pool = WorkerPool(WorkerFalso, tamanho=1, max_jobs=3, timeout=5)
+    try:
+        for _ in range(7):
+            assert pool.executar(tmp_path / "x.xlsx")
+    finally:
+        pool.encerrar()
+
+    # 7 jobs com reciclagem a cada 3: workers 1, 2 e 3
+    assert WorkerFalso.iniciados[:3] == [1, 2, 3]
+    assert pool.estatisticas["jobs"] == 7
+    assert pool.estatisticas["reciclados"] == 2
+
+
+def test_pool_substitui_worker_sem_saude(tmp_path):
+    pool = WorkerPool(WorkerFalso, tamanho=1, max_jobs=100, timeout=5)
+    try:
+        assert pool.executar(tmp_path / "x.xlsx")
+        pool._todos[0].worker.ok = False
+        assert pool.executar(tmp_path / "x.xlsx")
+        assert pool._todos[0].identificador == 2
+    finally:
+        pool.encerrar()
+
+
+def test_calculadora_com_backend_stub(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "RESUMO"
+    ws["B6"] = "TIMON"
+    ws["D23"] = 1.0
+    template = tmp_path / "template.xlsx"
+    wb.save(template)
+
+    stub = StubBackend(valores={"RESUMO": {"D23": 999.5}})
+    registrar_backend("stub", stub)
+
+    with ExcelTemplateCalculator(template, backend="stub") as calc:
+        calc.write_cell("RESUMO", "B6", "CAXIAS")
+        assert calc.recalculate_workbook()
+        valores = calc.read_ranges_calculated([("RESUMO", "B6"), ("RESUMO", "D23")])
+        workspace = calc.workspace_path
+
+    assert valores == [[["CAXIAS"]], [[999.5]]]
+    assert len(stub.chamadas) == 1
+    assert not workspace.exists()
+
+
+class WorkerLento(WorkerFalso):
+    """Segura o worker até o evento ser liberado"""
+
+    liberar = threading.Event()
+
+    def recalcular(self, caminho):
+        WorkerLento.liberar.wait(5)
+        return True
+
+
+def test_pool_ocupado_levanta_erro_proprio(tmp_path):
+    import pickle
+    from recalc_backends import PoolOcupadoError
+
+    WorkerLento.liberar.clear()
+    pool = WorkerPool(WorkerLento, tamanho=1, max_jobs=100, timeout=0.2)
+    ocupando = threading.Thread(target=pool.executar, args=(tmp_path / "a.xlsx",))
+    ocupando.start()
+    try:
+        while pool._livres.qsize():
+            time.sleep(0.01)
+        with pytest.raises(PoolOcupadoError) as erro:
+            pool.executar(tmp_path / "b.xlsx")
+        assert pool.estatisticas["ocupado"] == 1
+        # Atravessa o pool de processos com o mesmo retry_after
+        copia = pickle.loads(pickle.dumps(erro.value))
+        assert copia.retry_after == erro.value.retry_after >= 1
+    finally:
+        WorkerLento.liberar.set()
+        ocupando.join()
+        pool.encerrar()
+
+
+def test_calculadora_propaga_pool_ocupado(tmp_path):
+    from recalc_backends import PoolOcupadoError, RecalcBackend
+
+    class BackendOcupado(RecalcBackend):
+        nome = "ocupado"
+
+        def recalcular_arquivo(self, caminho):
+            raise PoolOcupadoError(3)
+
+    wb = Workbook()
+    wb.active.title = "RESUMO"
+    template = tmp_path / "template.xlsx"
+    wb.save(template)
+    registrar_backend("ocupado", BackendOcupado())
+
+    with ExcelTemplateCalculator(template, backend="ocupado") as calc:
+        calc.write_cell("RESUMO", "B6", "CAXIAS")
+        with pytest.raises(PoolOcupadoError):
+            calc.recalculate_workbook()
+
+
+def test_interfaces_abstratas():
+    from recalc_backends import RecalcBackend
+
+    with pytest.raises(TypeError):
+        RecalcWorker()
+    with pytest.raises(TypeError):
+        RecalcBackend()
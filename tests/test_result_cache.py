@@ -0,0 +1,120 @@
+"""
+Testes do cache de resultados endereçado por conteúdo
+"""
+from datetime import date, datetime
+
+import calculator_service
+from calculator_service import CalculadoraService
+from models import CalculadoraInput, CalculadoraOutput, CenarioOutput
+from result_cache import ResultCache, chave_resultado, impressao_arquivos
+
+
+def _inputs(**campos):
+    dados = dict(
+        municipio="TIMON",
+        periodo_inicio=date(2020, 1, 1),
+        periodo_fim=date(2020, 3, 1),
+        ajuizamento=date(2020, 4, 10),
+        citacao=date(2020, 5, 10),
+        correcao_ate=date(2020, 7, 1),
+        honorarios_perc=10,
+    )
+    dados.update(campos)
+    return CalculadoraInput(**dados)
+
+
+def _resultado(run_id="run-1"):
+    return CalculadoraOutput(
+        run_id=run_id,
+        timestamp=datetime(2025, 1, 1),
+        inputs={},
+        outputs={"nt7_tr": CenarioOutput(principal=1.0, honorarios=0.1, total=1.1)},
+        execution_time_ms=1500,
+    )
+
+
+def test_chave_canonica():
+    base = chave_resultado(_inputs(), "t", "x")
+    assert chave_resultado(_inputs(municipio="  timon "), "t", "x") == base
+    assert chave_resultado(_inputs(honorarios_perc=10.0), "t", "x") == base
+    assert chave_resultado(_inputs(honorarios_perc=11), "t", "x") != base
+    assert chave_resultado(_inputs(), "outro-template", "x") != base
+    assert chave_resultado(_inputs(), "t", "outras-taxas") != base
+
+
+def test_impressao_muda_com_conteudo(tmp_path):
+    arquivo = tmp_path / "selic_cache.json"
+    arquivo.write_text("{}")
+    antes = impressao_arquivos([arquivo])
+    assert impressao_arquivos([arquivo]) == antes
+    arquivo.write_text('{"dados": [1]}')
+    assert impressao_arquivos([arquivo]) != antes
+
+
+def test_lru_respeita_orcamento_de_memoria():
+    tamanho = len(_resultado().model_dump_json().encode("utf-8"))
+    cache = ResultCache(max_bytes=tamanho * 2)
+    cache.guardar("a", _resultado("a"))
+    cache.guardar("b", _resultado("b"))
+    assert cache.obter("a").run_id == "a"  # "a" passa a ser o mais recente
+    cache.guardar("c", _resultado("c"))
+
+    assert cache.obter("b") is None
+    assert cache.obter("a").cache_hit is True
+    assert cache.estatisticas()["despejos"] == 1
+    assert cache.estatisticas()["bytes"] <= tamanho * 2
+
+
+def test_ttl_expira_entradas():
+    agora = [0.0]
+    cache = ResultCache(max_bytes=1024 * 1024, ttl=10, relogio=lambda: agora[0])
+    cache.guardar("a", _resultado())
+    agora[0] = 9
+    assert cache.obter("a") is not None
+    agora[0] = 11
+    assert cache.obter("a") is None
+    assert cache.estatisticas()["entradas"] == 0
+
+
+def test_servico_usa_cache(tmp_path, monkeypatch):
+    template = tmp_path / "template.xlsx"
+    template.write_bytes(b"conteudo do template")
+    monkeypatch.setattr(calculator_service, "obter_result_cache", lambda: cache)
+    monkeypatch.setattr(calculator_service, "obter_result_store", lambda: None)
+    cache = ResultCache(max_bytes=1024 * 1024)
+
+    execucoes = []
+
+    def executar(self, inputs, progresso=None, run_id=None):
+        execucoes.append(inputs)
+        return _resultado(f"run-{len(execucoes)}")
+
+    monkeypatch.setattr(CalculadoraService, "_executar", executar)
+    contextos = []
+    monkeypatch.setattr(
+        CalculadoraService, "_contexto_selic",
+        lambda self, inputs, acompanhamento=None: contextos.append(inputs) or {"consulta": len(contextos)}
+    )
+    service = CalculadoraService()
+    service.excel_path = template
+
+    primeiro = service.calcular(_inputs())
+    segundo = service.calcular(_inputs(municipio="Timon"))
+
+    assert len(execucoes) == 1
+    assert primeiro.cache_hit is False
+    assert segundo.cache_hit is True
+    assert segundo.run_id != primeiro.run_id
+    assert segundo.outputs == primeiro.outputs
+    # Horário e contexto SELIC da resposta, não os do resultado guardado
+    assert segundo.timestamp > primeiro.timestamp
+    assert segundo.selic_context == {"consulta": 1}
+
+    # Hit com X-Run-Id: resposta no run_id do cliente
+    assert service.calcular(_inputs(), run_id="cliente-123").run_id == "cliente-123"
+    assert len(execucoes) == 1
+
+    # Template diferente invalida a chave
+    template.write_bytes(b"template novo")
+    assert service.calcular(_inputs()).cache_hit is False
+    assert len(execucoes) == 2
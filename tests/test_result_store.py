@@ -0,0 +1,151 @@
+"""
+Testes do store persistente de resultados (SQLite WAL)
+"""
+import asyncio
+import time
+from datetime import date, datetime
+
+import pytest
+from fastapi import HTTPException
+
+import calculator_service
+from calculator_service import CalculadoraService
+from models import CalculadoraInput, CalculadoraOutput, CenarioOutput
+from result_cache import ResultCache
+from result_store import ResultStore
+
+
+def _resultado(run_id):
+    return CalculadoraOutput(
+        run_id=run_id,
+        timestamp=datetime(2025, 1, 1),
+        inputs={"municipio": "TIMON"},
+        outputs={"nt7_tr": CenarioOutput(principal=1.0, honorarios=0.1, total=1.1)},
+        execution_time_ms=1500,
+    )
+
+
+def test_grava_e_le_por_chave_e_run_id(tmp_path):
+    store = ResultStore(tmp_path / "resultados.db")
+    store.guardar("chave-a", _resultado("run-1"))
+    store.guardar("chave-a", _resultado("run-2"))
+    store.guardar(None, _resultado("run-3"))
+
+    assert store.obter("chave-a").run_id == "run-2"  # mais recente para a chave
+    assert store.obter_por_run_id("run-1").outputs["nt7_tr"].total == 1.1
+    assert store.obter_por_run_id("run-3").cache_hit is True
+    assert store.obter("inexistente") is None
+    assert store.obter_por_run_id("inexistente") is None
+    store.fechar()
+
+
+def test_compartilhado_entre_instancias_e_reinicios(tmp_path):
+    caminho = tmp_path / "resultados.db"
+    worker_1 = ResultStore(caminho)
+    worker_2 = ResultStore(caminho)
+
+    worker_1.guardar("chave", _resultado("run-1"))
+    assert worker_2.obter("chave").run_id == "run-1"
+
+    worker_1.fechar()
+    worker_2.fechar()
+    assert ResultStore(caminho).obter_por_run_id("run-1") is not None
+
+
+def test_compactacao_remove_excedentes_e_velhos(tmp_path):
+    store = ResultStore(tmp_path / "resultados.db", max_idade_dias=1, max_registros=2)
+    for indice in range(4):
+        store.guardar(f"chave-{indice}", _resultado(f"run-{indice}"))
+        time.sleep(0.01)
+    store.obter_por_run_id("run-0")  # acesso recente preserva o registro
+
+    relatorio = store.compactar()
+    assert relatorio["removidos_excedentes"] == 2
+    assert relatorio["registros"] == 2
+    assert store.obter_por_run_id("run-0") is not None
+    assert store.obter_por_run_id("run-1") is None
+
+    store._conexao().execute("UPDATE resultados SET acessado_em = 0")
+    store._conexao().commit()
+    assert store.compactar()["removidos_idade"] == 2
+    store.fechar()
+
+
+def test_apelido_aponta_para_o_resultado_e_sai_com_ele(tmp_path):
+    store = ResultStore(tmp_path / "resultados.db", max_registros=1)
+    store.guardar("chave-a", _resultado("run-1"))
+    store.apelidar("hit-1", "run-1")
+
+    apelido = store.obter_por_run_id("hit-1")
+    assert apelido.run_id == "hit-1"
+    assert apelido.timestamp > datetime(2025, 1, 1)
+    assert apelido.outputs == store.obter_por_run_id("run-1").outputs
+
+    time.sleep(0.01)
+    store.guardar("chave-b", _resultado("run-2"))
+    relatorio = store.compactar()
+    assert relatorio["removidos_excedentes"] == 1
+    assert relatorio["aliases_removidos"] == 1
+    assert store.obter_por_run_id("hit-1") is None
+    assert not store.contem_run_id("hit-1")
+    store.fechar()
+
+
+def test_servico_consulta_store_depois_da_memoria(tmp_path, monkeypatch):
+    template = tmp_path / "template.xlsx"
+    template.write_bytes(b"template")
+    store = ResultStore(tmp_path / "resultados.db")
+    monkeypatch.setattr(calculator_service, "obter_result_store", lambda: store)
+
+    execucoes = []
+
+    def executar(self, inputs, progresso=None, run_id=None):
+        execucoes.append(inputs)
+        return _resultado(f"run-{len(execucoes)}")
+
+    monkeypatch.setattr(CalculadoraService, "_executar", executar)
+    inputs = CalculadoraInput(
+        municipio="TIMON",
+        periodo_inicio=date(2020, 1, 1),
+        periodo_fim=date(2020, 3, 1),
+        ajuizamento=date(2020, 4, 10),
+        citacao=date(2020, 5, 10),
+        correcao_ate=date(2020, 7, 1),
+    )
+
+    service = CalculadoraService()
+    service.excel_path = template
+
+    monkeypatch.setattr(calculator_service, "obter_result_cache", lambda: ResultCache(1024 * 1024))
+    primeiro = service.calcular(inputs)
+
+    # Outro processo (memória vazia) encontra o resultado no SQLite
+    monkeypatch.setattr(calculator_service, "obter_result_cache", lambda: ResultCache(1024 * 1024))
+    segundo = service.calcular(inputs, run_id="cliente-123")
+
+    assert len(execucoes) == 1
+    assert segundo.cache_hit is True
+    assert segundo.run_id == "cliente-123"
+    # Hit vira apelido do resultado gravado - /api/resultados/{run_id} encontra os dois
+    apelido = store.obter_por_run_id("cliente-123")
+    assert apelido.run_id == "cliente-123"
+    assert apelido.outputs == primeiro.outputs
+    assert store.obter_por_run_id(primeiro.run_id) is not None
+    assert store.contem_run_id("cliente-123") and not store.contem_run_id("outro-run-id")
+    assert store.estatisticas()["registros"] == 1
+    assert store.estatisticas()["aliases"] == 1
+    store.fechar()
+
+
+def test_endpoint_resultado_por_run_id(tmp_path, monkeypatch):
+    import main
+
+    store = ResultStore(tmp_path / "resultados.db")
+    store.guardar("chave", _resultado("run-api"))
+    monkeypatch.setattr(main, "obter_result_store", lambda: store)
+
+    assert asyncio.run(main.obter_resultado("run-api")).run_id == "run-api"
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(main.obter_resultado("outro"))
+    assert erro.value.status_code == 404
+    store.fechar()
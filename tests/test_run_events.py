@@ -0,0 +1,189 @@
+"""
+Testes dos eventos de progresso por execução (SSE)
+"""
+import asyncio
+import threading
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+
+import calculator_service
+import main
+import run_events
+from calculator_service import CalculadoraService
+from models import CalculadoraInput
+from result_cache import ResultCache
+from run_events import Acompanhamento, EventosExecucao
+from single_flight import SingleFlight
+
+
+def _coletar(eventos, run_id, **opcoes):
+    async def cenario():
+        return [evento async for evento in eventos.assinar(run_id, **opcoes)]
+    return asyncio.run(cenario())
+
+
+def test_assinante_recebe_historico_e_eventos_ao_vivo():
+    eventos = EventosExecucao()
+    eventos.publicar("run-12345", "etapa_inicio", {"etapa": "iniciando"})
+
+    async def cenario():
+        recebidos = []
+        async for evento in eventos.assinar("run-12345"):
+            recebidos.append(evento)
+            if len(recebidos) == 1:
+                # Publicação vinda de outra thread (pool de cálculos)
+                threading.Thread(target=lambda: (
+                    eventos.publicar("run-12345", "etapa_fim", {"etapa": "iniciando"}),
+                    eventos.publicar("run-12345", "concluido"),
+                )).start()
+        return recebidos
+
+    recebidos = asyncio.run(cenario())
+    assert [e["tipo"] for e in recebidos] == ["etapa_inicio", "etapa_fim", "concluido"]
+    assert [e["id"] for e in recebidos] == [1, 2, 3]
+
+    # Depois do evento final nada mais é aceito; nova assinatura recebe só o histórico
+    eventos.publicar("run-12345", "erro", {"mensagem": "tarde demais"})
+    assert [e["tipo"] for e in _coletar(eventos, "run-12345")] == ["etapa_inicio", "etapa_fim", "concluido"]
+
+
+def test_execucao_que_nao_comeca_expira():
+    recebidos = _coletar(EventosExecucao(), "run-nunca", intervalo_keepalive=0.01, espera_max=0.03)
+    assert None in recebidos  # keepalive
+    assert recebidos[-1]["tipo"] == "expirado"
+
+
+def test_acompanhamento_mede_etapas(monkeypatch):
+    eventos = EventosExecucao()
+    monkeypatch.setattr(run_events, "_eventos", eventos)
+    progresso = []
+
+    acompanhamento = Acompanhamento("run-etapas", lambda etapa, pct: progresso.append((etapa, pct)))
+    acompanhamento.etapa("recalculando", 30)
+    acompanhamento.etapa("lendo_resultados", 70)
+    acompanhamento.concluir({"execution_time_ms": 5})
+
+    tipos = [(e["tipo"], e.get("etapa")) for e in _coletar(eventos, "run-etapas")]
+    assert tipos == [
+        ("etapa_inicio", "recalculando"),
+        ("etapa_fim", "recalculando"),
+        ("etapa_inicio", "lendo_resultados"),
+        ("etapa_fim", "lendo_resultados"),
+        ("concluido", None),
+    ]
+    assert progresso == [("recalculando", 30), ("lendo_resultados", 70)]
+
+
+def test_servico_publica_etapas_e_cenarios_no_run_id_do_cliente(monkeypatch):
+    eventos = EventosExecucao()
+    monkeypatch.setattr(run_events, "_eventos", eventos)
+    monkeypatch.setattr(calculator_service, "obter_result_cache", lambda: ResultCache(max_bytes=0))
+    monkeypatch.setattr(calculator_service, "obter_cache_brutos", lambda: ResultCache(max_bytes=0))
+    monkeypatch.setattr(calculator_service, "obter_result_store", lambda: None)
+    monkeypatch.setattr(calculator_service, "obter_single_flight", lambda: SingleFlight())
+    monkeypatch.setattr(CalculadoraService, "_chave_cache", lambda self, inputs, campos=None: None)
+
+    def calcular_excel(self, inputs, run_id, output_dir, municipio_safe, acompanhamento):
+        acompanhamento.etapa("recalculando", 30)
+        return "TESTE", {"nt7_tr": 100.0}, None
+
+    monkeypatch.setattr(CalculadoraService, "_calcular_excel", calcular_excel)
+    monkeypatch.setattr(CalculadoraService, "_validar_taxas", lambda self, *datas: {"completo": True})
+    monkeypatch.setattr(CalculadoraService, "_obter_info_selic", lambda self, *datas: {})
+    monkeypatch.setattr(CalculadoraService, "_salvar_csv_backup", lambda self, *args: None)
+
+    inputs = CalculadoraInput(
+        municipio="TIMON",
+        periodo_inicio=date(2020, 1, 1),
+        periodo_fim=date(2020, 3, 1),
+        ajuizamento=date(2020, 4, 10),
+        citacao=date(2020, 5, 10),
+        correcao_ate=date(2020, 7, 1),
+        honorarios_perc=10,
+    )
+    resultado = CalculadoraService().calcular(inputs, run_id="run-do-cliente")
+    assert resultado.run_id == "run-do-cliente"
+
+    recebidos = _coletar(eventos, "run-do-cliente")
+    inicios = [e["etapa"] for e in recebidos if e["tipo"] == "etapa_inicio"]
+    assert inicios == ["iniciando", "recalculando", "validando_taxas", "info_selic", "backup_csv"]
+    cenario = next(e for e in recebidos if e["tipo"] == "cenario")
+    assert (cenario["cenario"], cenario["principal"], cenario["honorarios"]) == ("nt7_tr", 100.0, 10.0)
+    assert recebidos[-1]["tipo"] == "concluido"
+    assert all(e["decorrido_ms"] >= 0 for e in recebidos if e["tipo"].startswith("etapa"))
+
+
+def test_endpoint_rejeita_run_id_invalido():
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(main.eventos_execucao("../x"))
+    assert erro.value.status_code == 400
+
+
+def test_run_id_reservado_uma_vez():
+    eventos = EventosExecucao()
+    # Assinar antes do POST não reserva
+    _coletar(eventos, "run-assinado", intervalo_keepalive=0.01, espera_max=0.01)
+    assert eventos.reservar("run-assinado")
+    assert not eventos.reservar("run-assinado")  # em andamento
+
+    eventos.publicar("run-assinado", "concluido")
+    assert not eventos.reservar("run-assinado")  # concluído
+
+    # Execução que falhou recomeça do zero
+    eventos.reservar("run-com-erro")
+    eventos.publicar("run-com-erro", "erro", {"mensagem": "fila cheia"})
+    assert eventos.reservar("run-com-erro")
+    eventos.publicar("run-com-erro", "concluido")
+    assert [e["tipo"] for e in _coletar(eventos, "run-com-erro")] == ["concluido"]
+
+
+def test_retencao_remove_so_execucoes_encerradas_ou_que_nao_comecaram():
+    agora = [0.0]
+    eventos = EventosExecucao(retencao=10, relogio=lambda: agora[0])
+    eventos.reservar("run-parado")
+    eventos.publicar("run-rodando", "etapa_inicio", {"etapa": "iniciando"})
+    eventos.publicar("run-pronto", "concluido")
+
+    agora[0] = 5.0
+    eventos.reservar("run-novo")
+    assert eventos.estatisticas()["execucoes"] == 4
+
+    # Só os dois primeiros da fila de expiração venceram; o em andamento fica
+    agora[0] = 11.0
+    eventos.publicar("run-rodando", "etapa_fim", {"etapa": "iniciando"})
+    assert set(eventos._execucoes) == {"run-rodando", "run-novo"}
+    assert list(eventos._expiracoes) == ["run-novo"]
+
+    eventos.publicar("run-rodando", "concluido")
+    agora[0] = 30.0
+    eventos.publicar("outro", "etapa_inicio", {"etapa": "iniciando"})
+    assert set(eventos._execucoes) == {"outro"}
+
+
+def test_endpoint_recusa_run_id_em_uso(monkeypatch):
+    eventos = EventosExecucao()
+    monkeypatch.setattr(main, "obter_eventos", lambda: eventos)
+    monkeypatch.setattr(main, "obter_result_store", lambda: None)
+
+    class Executor:
+        async def calcular(self, inputs, run_id=None):
+            Acompanhamento(run_id).concluir()
+            return "ok"
+
+    monkeypatch.setattr(main, "obter_calc_executor", lambda: Executor())
+    monkeypatch.setattr(run_events, "_eventos", eventos)
+    inputs = CalculadoraInput(
+        municipio="TIMON",
+        periodo_inicio=date(2020, 1, 1),
+        periodo_fim=date(2020, 3, 1),
+        ajuizamento=date(2020, 4, 10),
+        citacao=date(2020, 5, 10),
+        correcao_ate=date(2020, 7, 1),
+    )
+
+    assert asyncio.run(main.calcular(inputs, x_run_id="run-repetido")) == "ok"
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(main.calcular(inputs, x_run_id="run-repetido"))
+    assert erro.value.status_code == 409
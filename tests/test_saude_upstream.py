@@ -0,0 +1,155 @@
+"""
+Testes da saúde do BACEN em segundo plano (circuit breaker, monitor, selic_context sem rede)
+"""
+import asyncio
+import math
+import threading
+import time
+from datetime import date, timedelta
+from functools import partial
+
+import requests
+
+import calc_executor
+import calculator_service
+import saude_upstream
+from bacen_service import BacenService
+from calc_executor import CalcExecutor
+from calculator_service import CalculadoraService
+from saude_upstream import CircuitBreaker, MonitorUpstream
+from series_store import SeriesStore
+
+
+def test_circuit_breaker_abre_e_fecha():
+    agora = [0.0]
+    breaker = CircuitBreaker("BACEN", limite_falhas=2, tempo_aberto=60, relogio=lambda: agora[0])
+
+    breaker.registrar_falha()
+    assert breaker.permitir()
+    breaker.registrar_falha()
+    assert breaker.estado == CircuitBreaker.ABERTO
+    assert not breaker.permitir()
+
+    # Passado o tempo aberto: uma tentativa só
+    agora[0] = 61
+    assert breaker.permitir()
+    assert breaker.estado == CircuitBreaker.MEIO_ABERTO
+    assert not breaker.permitir()
+    breaker.registrar_falha()
+    assert breaker.estado == CircuitBreaker.ABERTO
+
+    agora[0] = 130
+    assert breaker.permitir()
+    breaker.registrar_sucesso()
+    assert breaker.estado == CircuitBreaker.FECHADO
+    assert breaker.estatisticas()["aberturas"] == 1
+
+
+def test_monitor_verifica_e_executa_tarefas_so_com_circuito_fechado():
+    respostas = [False, True]
+    breaker = CircuitBreaker("BACEN", limite_falhas=1, tempo_aberto=0)
+    monitor = MonitorUpstream("BACEN", lambda: respostas.pop(0), breaker, intervalo=0)
+
+    executadas = []
+    assert monitor.agendar("a", lambda: executadas.append("a"))
+    assert monitor.agendar("a", lambda: executadas.append("duplicada"))
+
+    assert monitor.verificar_agora() is False
+    assert monitor.executar_pendentes() == 0  # circuito aberto: tarefa espera
+
+    assert monitor.verificar_agora() is True
+    assert monitor.executar_pendentes() == 1
+    assert executadas == ["a"]
+    assert monitor.status()["circuito"] == CircuitBreaker.FECHADO
+
+
+def test_thread_do_monitor_executa_agendadas():
+    monitor = MonitorUpstream("BACEN", lambda: True, CircuitBreaker("BACEN"), intervalo=0)
+    feito = threading.Event()
+    monitor.iniciar()
+    try:
+        monitor.agendar("x", feito.set)
+        assert feito.wait(5)
+    finally:
+        monitor.parar()
+
+
+def test_bacen_nao_chama_api_com_circuito_aberto(tmp_path, monkeypatch):
+    service = BacenService()
+    service.series = SeriesStore(tmp_path)
+    service.breaker = CircuitBreaker("BACEN", limite_falhas=1, tempo_aberto=3600)
+
+    chamadas = []
+
+    def consultar_api(*args):
+        chamadas.append(args)
+        raise requests.exceptions.ConnectionError("sem rede")
+
+    monkeypatch.setattr(service, "_consultar_api", consultar_api)
+    assert service.buscar_selic_periodo(date(2023, 1, 1), date(2023, 1, 31)) is None
+    assert service.buscar_selic_periodo(date(2023, 1, 1), date(2023, 1, 31)) is None
+    assert len(chamadas) == 1
+
+
+def test_info_selic_pela_cobertura_sem_rede(tmp_path, monkeypatch):
+    monitor = MonitorUpstream("BACEN", lambda: True, CircuitBreaker("BACEN"), intervalo=0)
+    monkeypatch.setattr(calculator_service, "obter_monitor_bacen", lambda: monitor)
+    service = CalculadoraService()
+    # Serviço BACEN é compartilhado no processo: troca só durante o teste
+    monkeypatch.setattr(service.bacen_service, "series", SeriesStore(tmp_path))
+    monkeypatch.setattr(service.bacen_service, "verificar_disponibilidade", lambda *a: 1 / 0)
+
+    dados = [{"data": f"{d:02d}/01/2023", "valor": "0.05"} for d in range(2, 32)]
+    service.bacen_service.series.mesclar("SELIC", dados, date(2023, 1, 1), date(2023, 1, 31))
+
+    info = service._obter_info_selic(date(2023, 1, 1), date(2023, 1, 31))
+    assert info["updated"] is True
+    assert info["registros"] == 30
+    assert info["cobertura"] == [["2023-01-01", "2023-01-31"]]
+    assert monitor.estatisticas()["tarefas_pendentes"] == 0
+
+    # Período fora do histórico: responde na hora e agenda a busca
+    info = service._obter_info_selic(date(2022, 6, 1), date(2023, 1, 31))
+    assert info["updated"] is False
+    assert info["source"] == "Cache local"
+    assert monitor.estatisticas()["tarefas_pendentes"] == 1
+
+    # Só os últimos dias sem publicação: não conta como falta
+    hoje = date.today()
+    recentes = [{"data": (hoje - timedelta(days=d)).strftime("%d/%m/%Y"), "valor": "0.05"} for d in range(10, 2, -1)]
+    service.bacen_service.series.mesclar("SELIC", recentes, hoje - timedelta(days=10), hoje)
+    info = service._obter_info_selic(hoje - timedelta(days=10), hoje)
+    assert info["updated"] is True
+
+
+def _monitor_no_filho():
+    monitor = saude_upstream.obter_monitor_bacen()
+    monitor.agendar("SELIC:teste", partial(math.factorial, 5))
+    return type(monitor).__name__, monitor.status()
+
+
+def test_pool_de_processos_le_o_monitor_da_api(monkeypatch):
+    monitor = MonitorUpstream("BACEN", lambda: True, CircuitBreaker("BACEN"), intervalo=0)
+    monkeypatch.setattr(saude_upstream, "_monitor_bacen", monitor)
+    monkeypatch.setattr(saude_upstream, "_canal_bacen", None)
+    monkeypatch.setattr(calc_executor, "_aquecer_processo", lambda: None)
+    _, fila = saude_upstream.canal_monitor_bacen()
+    monitor.verificar_agora()
+
+    executor = CalcExecutor("process", workers=1, max_fila=0)
+    try:
+        nome, status = asyncio.run(executor.submeter(_monitor_no_filho))
+    finally:
+        executor.encerrar()
+
+    # Filho não sobe thread nem verifica a API: lê o status publicado pelo processo da API
+    assert nome == "MonitorRemoto"
+    assert (status["disponivel"], status["circuito"]) == (True, "fechado")
+    assert monitor.verificacoes == 1
+
+    # Atualização agendada no filho chega ao monitor do processo da API
+    limite = time.monotonic() + 5
+    while monitor.estatisticas()["tarefas_pendentes"] == 0 and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert monitor.estatisticas()["tarefas_pendentes"] == 1
+    fila.put(None)
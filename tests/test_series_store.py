@@ -0,0 +1,164 @@
+"""
+Testes do histórico local de taxas (mescla, cobertura, formato antigo, gravação concorrente)
+"""
+import json
+import threading
+from datetime import date
+
+import requests
+
+from bacen_service import BacenService
+from saude_upstream import CircuitBreaker
+from series_store import SeriesStore, mesclar_intervalos
+
+
+def _selic(dia, mes, ano, valor="0.040168"):
+    return {"data": f"{dia:02d}/{mes:02d}/{ano}", "valor": valor}
+
+
+def test_mescla_ordena_e_remove_duplicatas(tmp_path):
+    store = SeriesStore(tmp_path)
+    assert store.mesclar("SELIC", [_selic(3, 1, 2023), _selic(2, 1, 2023)], date(2023, 1, 1), date(2023, 1, 3)) == 2
+    # Sobreposição: 03/01 repetido com valor revisado, 04/01 novo
+    assert store.mesclar("SELIC", [_selic(3, 1, 2023, "0.05"), _selic(4, 1, 2023)], date(2023, 1, 3), date(2023, 1, 4)) == 1
+
+    dados = store.todos("SELIC")
+    assert [d["data"] for d in dados] == ["02/01/2023", "03/01/2023", "04/01/2023"]
+    assert dados[1]["valor"] == "0.05"
+    assert store.cobertura("SELIC") == [(date(2023, 1, 1), date(2023, 1, 4))]
+
+    # TR: mesma data de início com dataFim diferente são registros distintos
+    tr = [{"data": "01/01/2023", "dataFim": f"{d:02d}/02/2023", "valor": "0.1"} for d in (1, 2)]
+    store.mesclar("TR", tr + tr, date(2023, 1, 1), date(2023, 1, 31))
+    assert len(store.todos("TR")) == 2
+
+
+def test_cobertura_e_lacunas(tmp_path):
+    store = SeriesStore(tmp_path)
+    store.mesclar("SELIC", [_selic(10, 1, 2023)], date(2023, 1, 1), date(2023, 1, 31))
+    store.mesclar("SELIC", [_selic(10, 3, 2023)], date(2023, 3, 1), date(2023, 3, 31))
+
+    assert store.consultar("SELIC", date(2023, 1, 5), date(2023, 1, 20)) == [_selic(10, 1, 2023)]
+    assert store.consultar("SELIC", date(2023, 1, 5), date(2023, 3, 20)) is None
+    assert store.lacunas("SELIC", date(2022, 12, 1), date(2023, 4, 10)) == [
+        (date(2022, 12, 1), date(2022, 12, 31)),
+        (date(2023, 2, 1), date(2023, 2, 28)),
+        (date(2023, 4, 1), date(2023, 4, 10)),
+    ]
+    assert mesclar_intervalos([(date(2023, 2, 1), date(2023, 2, 28)), (date(2023, 1, 1), date(2023, 1, 31))]) == [
+        (date(2023, 1, 1), date(2023, 2, 28))
+    ]
+
+
+def test_periodo_recente_so_cobre_o_publicado(tmp_path):
+    store = SeriesStore(tmp_path)
+    hoje = date.today()
+    store.mesclar("IPCA", [], date(hoje.year - 1, 1, 1), hoje)
+    assert store.cobertura("IPCA") == []
+
+
+def test_formato_antigo_e_convertido(tmp_path):
+    antigo = {
+        "taxa": "IPCA-E",
+        "data_inicio": "2023-01-01",
+        "data_fim": "2023-02-28",
+        "atualizado_em": "2023-03-01T00:00:00",
+        "dados": [{"data": "02/2023", "valor": 0.76}, {"data": "01/2023", "valor": 0.55}],
+    }
+    (tmp_path / "ipca_e_cache.json").write_text(json.dumps(antigo), encoding="utf-8")
+    store = SeriesStore(tmp_path)
+
+    assert [d["data"] for d in store.consultar("IPCA-E", date(2023, 1, 1), date(2023, 2, 28))] == ["01/2023", "02/2023"]
+
+    store.mesclar("IPCA-E", [{"data": "03/2023", "valor": 0.41}], date(2023, 3, 1), date(2023, 3, 31))
+    gravado = json.loads((tmp_path / "ipca_e_cache.json").read_text(encoding="utf-8"))
+    assert gravado["intervalos"] == [["2023-01-01", "2023-03-31"]]
+    assert (gravado["data_inicio"], gravado["data_fim"]) == ("2023-01-01", "2023-03-31")
+    assert len(gravado["dados"]) == 3
+
+
+def test_gravacoes_concorrentes_nao_perdem_dados(tmp_path):
+    # Instâncias separadas simulam workers diferentes
+    def gravar(mes):
+        SeriesStore(tmp_path).mesclar(
+            "SELIC", [_selic(dia, mes, 2022) for dia in range(1, 28)], date(2022, mes, 1), date(2022, mes, 27)
+        )
+
+    threads = [threading.Thread(target=gravar, args=(mes,)) for mes in range(1, 13)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    store = SeriesStore(tmp_path)
+    assert len(store.todos("SELIC")) == 12 * 27
+    assert len(store.cobertura("SELIC")) == 12
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_bacen_busca_so_as_lacunas(tmp_path, monkeypatch):
+    service = BacenService()
+    service.series = SeriesStore(tmp_path)
+    service.series.mesclar("SELIC", [_selic(2, 1, 2023)], date(2023, 1, 1), date(2023, 1, 31))
+
+    consultas = []
+
+    def consultar_api(taxa_nome, serie_codigo, inicio, fim):
+        consultas.append((inicio, fim))
+        return [_selic(1, 2, 2023)]
+
+    monkeypatch.setattr(service, "_consultar_api", consultar_api)
+
+    dados = service.buscar_selic_periodo(date(2023, 1, 1), date(2023, 2, 28))
+    assert consultas == [(date(2023, 2, 1), date(2023, 2, 28))]
+    assert [d["data"] for d in dados] == ["02/01/2023", "01/02/2023"]
+
+    # Agora coberto: sem rede
+    assert service.buscar_selic_periodo(date(2023, 1, 1), date(2023, 2, 28)) == dados
+    assert len(consultas) == 1
+
+
+def test_leitura_em_memoria_com_busca_binaria(tmp_path):
+    store = SeriesStore(tmp_path)
+    store.mesclar("SELIC", [_selic(dia, 1, 2023) for dia in range(1, 32)], date(2023, 1, 1), date(2023, 1, 31))
+
+    conteudo = store.ler("SELIC")
+    assert store.ler("SELIC") is conteudo  # arquivo não mudou: nada é relido
+    assert list(conteudo["datas"]) == [date(2023, 1, dia).toordinal() for dia in range(1, 32)]
+
+    datas, valores = store.vetores("SELIC", date(2023, 1, 10), date(2023, 1, 12))
+    assert list(datas) == [date(2023, 1, dia).toordinal() for dia in (10, 11, 12)]
+    assert list(valores) == [0.040168] * 3
+    assert [d["data"] for d in store.registros("SELIC", date(2022, 12, 1), date(2023, 1, 2))] == ["01/01/2023", "02/01/2023"]
+
+    # Outro processo grava: o arquivo muda e a próxima leitura vê a versão nova
+    SeriesStore(tmp_path).mesclar("SELIC", [_selic(1, 2, 2023)], date(2023, 2, 1), date(2023, 2, 1))
+    assert store.ler("SELIC") is not conteudo
+    assert len(store.todos("SELIC")) == 32
+
+
+def test_api_interrompida_no_meio_mantem_o_que_ja_veio(tmp_path, monkeypatch):
+    service = BacenService()
+    service.series = SeriesStore(tmp_path)
+    service.series.mesclar("SELIC", [_selic(2, 2, 2023)], date(2023, 2, 1), date(2023, 2, 28))
+    service.series.mesclar("SELIC", [_selic(1, 6, 2023)], date(2023, 6, 1), date(2023, 6, 30))
+    service.series.mesclar("SELIC", [_selic(1, 8, 2023)], date(2023, 8, 1), date(2023, 8, 31))
+    service.breaker = CircuitBreaker("BACEN", limite_falhas=1, tempo_aberto=3600)
+
+    def consultar_api(taxa_nome, serie_codigo, inicio, fim):
+        if inicio.month == 1:
+            return [_selic(3, 1, 2023)]
+        raise requests.exceptions.ConnectionError("sem rede")  # abre o circuito
+
+    monkeypatch.setattr(service, "_consultar_api", consultar_api)
+
+    # Lacunas: janeiro (ok) e março-maio (falha) - janeiro não é descartado
+    dados = service.buscar_selic_periodo(date(2023, 1, 1), date(2023, 6, 30))
+    assert [d["data"] for d in dados] == ["03/01/2023", "02/02/2023", "01/06/2023"]
+    assert service.breaker.permitir() is False
+
+    # Circuito abre entre duas lacunas (outra requisição falhou): idem
+    monkeypatch.setattr(service.breaker, "permitir", iter([True, False]).__next__)
+    monkeypatch.setattr(service, "_consultar_api", lambda *args: [_selic(3, 7, 2023)])
+    dados = service.buscar_selic_periodo(date(2023, 6, 1), date(2023, 9, 30))
+    assert [d["data"] for d in dados] == ["01/06/2023", "03/07/2023", "01/08/2023"]
@@ -0,0 +1,165 @@
+"""
+Testes da coalescência de cálculos idênticos em andamento
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import pytest
+
+import calculator_service
+import single_flight
+from calculator_service import CalculadoraService
+from models import CalculadoraInput, CalculadoraOutput, CenarioOutput
+from result_cache import ResultCache
+from single_flight import ExecucaoCancelada, SingleFlight
+
+
+def test_duplicadas_aguardam_a_mesma_execucao():
+    voo = SingleFlight()
+    liberar = threading.Event()
+    chamadas = []
+
+    def calcular():
+        chamadas.append(1)
+        assert liberar.wait(5)
+        return {"valor": 42}
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futuros = [executor.submit(voo.executar, "chave", calcular) for _ in range(4)]
+        while voo.estatisticas()["coalescidas"] < 3:
+            threading.Event().wait(0.01)
+        liberar.set()
+        resultados = [futuro.result(timeout=5) for futuro in futuros]
+
+    assert len(chamadas) == 1
+    assert sorted(compartilhado for _, compartilhado in resultados) == [False, True, True, True]
+    assert all(resultado == {"valor": 42} for resultado, _ in resultados)
+    assert voo.estatisticas() == {"execucoes": 1, "coalescidas": 3, "em_andamento": 0}
+
+    # Depois de concluído, a mesma chave executa de novo
+    liberar.set()
+    assert voo.executar("chave", calcular) == ({"valor": 42}, False)
+    assert len(chamadas) == 2
+
+
+def test_erro_da_lider_propaga_para_duplicadas():
+    voo = SingleFlight()
+    liberar = threading.Event()
+
+    def falhar():
+        liberar.wait(5)
+        raise ValueError("taxas incompletas")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futuros = [executor.submit(voo.executar, "chave", falhar) for _ in range(2)]
+        while voo.estatisticas()["coalescidas"] < 1:
+            threading.Event().wait(0.01)
+        liberar.set()
+        for futuro in futuros:
+            with pytest.raises(ValueError):
+                futuro.result(timeout=5)
+
+
+def test_cancelamento_da_lider_nao_derruba_duplicadas():
+    voo = SingleFlight()
+    liberar = threading.Event()
+    chamadas = []
+
+    def calcular():
+        chamadas.append(1)
+        if len(chamadas) == 1:
+            liberar.wait(5)
+            raise ExecucaoCancelada("job cancelado")
+        return {"valor": 42}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        lider = executor.submit(voo.executar, "chave", calcular)
+        while voo.estatisticas()["em_andamento"] < 1:
+            threading.Event().wait(0.01)
+        duplicada = executor.submit(voo.executar, "chave", calcular)
+        while voo.estatisticas()["coalescidas"] < 1:
+            threading.Event().wait(0.01)
+        liberar.set()
+        with pytest.raises(ExecucaoCancelada):
+            lider.result(timeout=5)
+        assert duplicada.result(timeout=5) == ({"valor": 42}, False)
+
+    assert len(chamadas) == 2
+
+
+def test_duplicada_cancelada_desiste_sem_esperar_a_lider(monkeypatch):
+    monkeypatch.setattr(single_flight, "INTERVALO_VERIFICACAO", 0.01)
+    voo = SingleFlight()
+    liberar = threading.Event()
+    cancelar = threading.Event()
+
+    def calcular():
+        assert liberar.wait(5)
+        return {"valor": 42}
+
+    def verificar():
+        if cancelar.is_set():
+            raise ExecucaoCancelada("job cancelado")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        lider = executor.submit(voo.executar, "chave", calcular)
+        while voo.estatisticas()["em_andamento"] < 1:
+            threading.Event().wait(0.01)
+        duplicada = executor.submit(voo.executar, "chave", calcular, verificar)
+        while voo.estatisticas()["coalescidas"] < 1:
+            threading.Event().wait(0.01)
+
+        cancelar.set()
+        with pytest.raises(ExecucaoCancelada):
+            duplicada.result(timeout=5)
+        assert not lider.done()
+
+        liberar.set()
+        assert lider.result(timeout=5) == ({"valor": 42}, False)
+
+
+def test_servico_coalesce_com_run_id_proprio(tmp_path, monkeypatch):
+    template = tmp_path / "template.xlsx"
+    template.write_bytes(b"template")
+    voo = SingleFlight()
+    monkeypatch.setattr(calculator_service, "obter_result_cache", lambda: ResultCache(0))
+    monkeypatch.setattr(calculator_service, "obter_result_store", lambda: None)
+    monkeypatch.setattr(calculator_service, "obter_single_flight", lambda: voo)
+
+    liberar = threading.Event()
+    execucoes = []
+
+    def executar(self, inputs, progresso=None, run_id=None):
+        execucoes.append(inputs)
+        assert liberar.wait(5)
+        return CalculadoraOutput(
+            run_id="lider",
+            timestamp=datetime(2025, 1, 1),
+            inputs={},
+            outputs={"nt7_tr": CenarioOutput(principal=1.0, honorarios=0.1, total=1.1)},
+            execution_time_ms=10,
+        )
+
+    monkeypatch.setattr(CalculadoraService, "_executar", executar)
+    service = CalculadoraService()
+    service.excel_path = template
+    inputs = CalculadoraInput(
+        municipio="TIMON",
+        periodo_inicio=date(2020, 1, 1),
+        periodo_fim=date(2020, 3, 1),
+        ajuizamento=date(2020, 4, 10),
+        citacao=date(2020, 5, 10),
+        correcao_ate=date(2020, 7, 1),
+    )
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futuros = [executor.submit(service.calcular, inputs) for _ in range(3)]
+        while voo.estatisticas()["coalescidas"] < 2:
+            threading.Event().wait(0.01)
+        liberar.set()
+        resultados = [futuro.result(timeout=5) for futuro in futuros]
+
+    assert len(execucoes) == 1
+    assert len({resultado.run_id for resultado in resultados}) == 3
+    assert all(resultado.outputs == resultados[0].outputs for resultado in resultados)
@@ -0,0 +1,79 @@
+"""
+Testes do frontend pré-comprimido (negociação, ETag/304, nomes com hash)
+"""
+import asyncio
+import gzip
+
+import pytest
+
+from static_assets import CACHE_IMUTAVEL, StaticAssets, escolher_codificacao
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / "index.html").write_text(
+        '<link rel="stylesheet" href="styles.css">\n'
+        '<script src="/script.js"></script>\n'
+        '<a href="https://exemplo.com/script.js">externo</a>\n',
+        encoding="utf-8",
+    )
+    (tmp_path / "script.js").write_text("console.log('calculadora');\n" * 100, encoding="utf-8")
+    (tmp_path / "styles.css").write_text("body { margin: 0; }\n" * 100, encoding="utf-8")
+    return StaticAssets(tmp_path)
+
+
+def test_escolher_codificacao():
+    assert escolher_codificacao("gzip, deflate, br", {"gzip", "br"}) == "br"
+    assert escolher_codificacao("gzip, deflate, br", {"gzip"}) == "gzip"
+    assert escolher_codificacao("br;q=0, gzip;q=0.5", {"gzip", "br"}) == "gzip"
+    assert escolher_codificacao("*", {"gzip"}) == "gzip"
+    assert escolher_codificacao("", {"gzip", "br"}) == "identity"
+
+
+def test_html_referencia_nomes_com_hash(assets):
+    html = assets.resolver("/").conteudo.decode("utf-8")
+    imutaveis = [url for url, imutavel in assets.urls() if imutavel]
+    assert len(imutaveis) == 2
+    script = next(url for url in imutaveis if url.endswith(".js"))
+    assert f'src="{script}"' in html
+    assert f'href="{next(url for url in imutaveis if url.endswith(".css"))[1:]}"' in html
+    assert 'href="https://exemplo.com/script.js"' in html
+
+    resposta = assets.responder("GET", script, {})
+    assert resposta.headers["cache-control"] == CACHE_IMUTAVEL
+    assert assets.responder("GET", "/script.js", {}).headers["cache-control"] == "no-cache"
+
+
+def test_gzip_etag_e_304(assets):
+    resposta = assets.responder("GET", "/script.js", {"accept-encoding": "gzip"})
+    assert resposta.headers["content-encoding"] == "gzip"
+    assert resposta.headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(resposta.body) == (assets.diretorio / "script.js").read_bytes()
+
+    etag = resposta.headers["etag"]
+    revalidacao = assets.responder("GET", "/script.js", {"accept-encoding": "gzip", "if-none-match": etag})
+    assert revalidacao.status_code == 304
+    assert revalidacao.body == b""
+
+    sem_compressao = assets.responder("GET", "/script.js", {})
+    assert "content-encoding" not in sem_compressao.headers
+    assert sem_compressao.headers["etag"] != etag
+
+
+def test_asgi_404_e_metodos(assets):
+    async def chamar(metodo, caminho):
+        enviados = []
+
+        async def receber():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def enviar(mensagem):
+            enviados.append(mensagem)
+
+        escopo = {"type": "http", "method": metodo, "path": caminho, "headers": [], "query_string": b""}
+        await assets(escopo, receber, enviar)
+        return enviados[0]["status"]
+
+    assert asyncio.run(chamar("GET", "/index.html")) == 200
+    assert asyncio.run(chamar("GET", "/../config.py")) == 404
+    assert asyncio.run(chamar("POST", "/script.js")) == 405
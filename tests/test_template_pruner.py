@@ -0,0 +1,63 @@
+"""
+Testes da poda do template por cone de dependências
+"""
+from openpyxl import Workbook, load_workbook
+from openpyxl.workbook.defined_name import DefinedName
+
+from template_pruner import podar_template
+
+
+SAIDAS = [("RESUMO", "D23:F24")]
+ENTRADAS = [("RESUMO", "B6"), ("RESUMO", "B13")]
+
+
+def _template(caminho):
+    wb = Workbook()
+    resumo = wb.active
+    resumo.title = "RESUMO"
+    resumo["B6"] = "TIMON"
+    resumo["B13"] = 0.1
+    resumo["A1"] = "Título (fora do cone)"
+    resumo["D23"] = "=VLOOKUP(B6,'Repasse PA'!A1:B2,2,FALSE)*TAXA"
+    resumo["D24"] = "=D23*(1-$B$13)"
+    resumo["E23"] = "='Auxiliar'!A1"  # aba referenciada, mas vazia
+
+    repasse = wb.create_sheet("Repasse PA")
+    repasse["A1"], repasse["B1"] = "TIMON", 100.0
+    repasse["A2"], repasse["B2"] = "CAXIAS", 200.0
+    repasse["C10"] = "anotação fora do intervalo"
+
+    parametros = wb.create_sheet("Parametros")
+    parametros["A1"] = 1.5
+    parametros["A2"] = 99.0
+
+    wb.create_sheet("Auxiliar")
+    outra = wb.create_sheet("Repasse CE")
+    for linha in range(1, 50):
+        outra[f"A{linha}"] = f"MUNICIPIO {linha}"
+        outra[f"B{linha}"] = linha * 10.0
+
+    wb.defined_names["TAXA"] = DefinedName("TAXA", attr_text="Parametros!$A$1")
+    wb.defined_names["NAO_USADO"] = DefinedName("NAO_USADO", attr_text="'Repasse CE'!$A$1:$B$49")
+    wb.save(caminho)
+
+
+def test_poda_remove_o_que_nao_alimenta_saidas(tmp_path):
+    origem = tmp_path / "template.xlsx"
+    destino = tmp_path / "runtime" / "template_runtime.xlsx"
+    _template(origem)
+
+    relatorio = podar_template(origem, destino, SAIDAS, ENTRADAS)
+
+    assert relatorio["abas_removidas"] == ["Repasse CE"]
+    assert relatorio["nomes_removidos"] == 1
+    assert relatorio["celulas_removidas"] == 98 + 3  # Repasse CE + A1, C10, Parametros!A2
+    assert relatorio["bytes_removidos"] > 0
+
+    wb = load_workbook(destino)
+    assert wb.sheetnames == ["RESUMO", "Repasse PA", "Parametros", "Auxiliar"]
+    assert wb["RESUMO"]["A1"].value is None
+    assert wb["RESUMO"]["D24"].value == "=D23*(1-$B$13)"
+    assert wb["Repasse PA"]["C10"].value is None
+    assert wb["Repasse PA"]["B2"].value == 200.0
+    assert list(wb.defined_names) == ["TAXA"]
@@ -0,0 +1,139 @@
+"""
+Paridade entre honorários/deságio aplicados em Python sobre os valores brutos
+e as linhas pares do RESUMO (fórmulas do template)
+"""
+import io
+from datetime import date
+
+import pytest
+from openpyxl import Workbook
+
+import calculator_service
+import excel_template_calculator
+from calculator_service import INPUT_MAPPING, OUTPUT_LINES, OUTPUT_RANGE, CalculadoraService, montar_saidas
+from excel_template_calculator import RecalculoError
+from formula_engine import FormulaEngine
+from models import CalculadoraInput, CalculadoraOutput
+from result_cache import ResultCache
+
+
+def _template() -> bytes:
+    """RESUMO com as mesmas fórmulas das linhas de saída do template"""
+    wb = Workbook()
+    resumo = wb.active
+    resumo.title = "RESUMO"
+    resumo["B11"], resumo["B12"], resumo["B13"], resumo["B14"] = 0.1, 0.0, 0.0, 0.0
+    calculo = wb.create_sheet("NT7 IPCA SELIC")
+    calculo["B3"] = "=RESUMO!B11"
+    for indice, linha in enumerate(OUTPUT_LINES.values()):
+        calculo[f"P{indice + 1}"] = 1000.0 * (indice + 1) + 0.37
+        calculo[f"Q{indice + 1}"] = f"=P{indice + 1}*$B$3"
+        resumo[f"D{linha}"] = f"='NT7 IPCA SELIC'!P{indice + 1}"
+        resumo[f"E{linha}"] = f"='NT7 IPCA SELIC'!Q{indice + 1}"
+        resumo[f"F{linha}"] = "=$B$12"
+        resumo[f"D{linha + 1}"] = f"=D{linha}*(1-$B$13)"
+        resumo[f"E{linha + 1}"] = f"=E{linha}*(1-$B$14)"
+        resumo[f"F{linha + 1}"] = f"=F{linha}*(1-$B$14)"
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _inputs(**campos):
+    dados = dict(
+        municipio="TIMON",
+        periodo_inicio=date(2020, 1, 1),
+        periodo_fim=date(2020, 3, 1),
+        ajuizamento=date(2020, 4, 10),
+        citacao=date(2020, 5, 10),
+        correcao_ate=date(2020, 7, 1),
+    )
+    dados.update(campos)
+    return CalculadoraInput(**dados)
+
+
+@pytest.mark.parametrize("perc, fixo, desagio_p, desagio_h", [
+    (0.0, 0.0, 0.0, 0.0),
+    (10.0, 0.0, 20.0, 0.0),
+    (15.0, 2500.0, 35.5, 12.25),
+    (0.0, 1000.0, 0.0, 100.0),
+])
+def test_paridade_com_linhas_pares(perc, fixo, desagio_p, desagio_h):
+    engine = FormulaEngine.carregar(_template(), [OUTPUT_RANGE], list(INPUT_MAPPING.values()))
+    avaliacao = engine.avaliar_completo({
+        INPUT_MAPPING["honorarios_perc"]: perc / 100,
+        INPUT_MAPPING["honorarios_fixo"]: fixo,
+        INPUT_MAPPING["desagio_principal"]: desagio_p / 100,
+        INPUT_MAPPING["desagio_honorarios"]: desagio_h / 100,
+    })
+
+    brutos = {nome: avaliacao.valor("RESUMO", f"D{linha}") for nome, linha in OUTPUT_LINES.items()}
+    saidas = montar_saidas(brutos, _inputs(
+        honorarios_perc=perc, honorarios_fixo=fixo, desagio_principal=desagio_p, desagio_honorarios=desagio_h
+    ))
+
+    for nome, linha in OUTPUT_LINES.items():
+        d, e, f = avaliacao.ler_range("RESUMO", f"D{linha + 1}:F{linha + 1}")[0]
+        assert saidas[nome].principal == pytest.approx(d, rel=1e-12)
+        assert saidas[nome].honorarios == pytest.approx(e + f, rel=1e-12)
+        assert saidas[nome].total == pytest.approx(d + e + f, rel=1e-12)
+
+
+def test_percentuais_nao_refazem_o_calculo(tmp_path, monkeypatch):
+    template = tmp_path / "template.xlsx"
+    template.write_bytes(b"template")
+    monkeypatch.setattr(calculator_service, "obter_result_cache", lambda: ResultCache(0))
+    monkeypatch.setattr(calculator_service, "obter_result_store", lambda: None)
+    brutos_cache = ResultCache(1024 * 1024)
+    monkeypatch.setattr(calculator_service, "obter_cache_brutos", lambda: brutos_cache)
+    monkeypatch.setattr(CalculadoraService, "_validar_taxas", lambda self, *args: {})
+    consultas_selic = []
+    monkeypatch.setattr(
+        CalculadoraService, "_obter_info_selic",
+        lambda self, *args: consultas_selic.append(args) or {"message": f"consulta {len(consultas_selic)}"}
+    )
+    monkeypatch.setattr(CalculadoraService, "_salvar_csv_backup", lambda self, *args: None)
+
+    ciclos = []
+
+    def calcular_excel(self, inputs, run_id, output_dir, municipio_safe, acompanhamento=None):
+        ciclos.append(run_id)
+        return "TESTE", {nome: 1000.0 for nome in OUTPUT_LINES}, None
+
+    monkeypatch.setattr(CalculadoraService, "_calcular_excel", calcular_excel)
+    service = CalculadoraService()
+    service.excel_path = template
+
+    primeiro = service.calcular(_inputs(honorarios_perc=10.0))
+    segundo = service.calcular(_inputs(honorarios_perc=20.0, desagio_principal=50.0))
+
+    assert len(ciclos) == 1
+    assert isinstance(segundo, CalculadoraOutput)
+    assert primeiro.outputs["nt7_tr"].honorarios == pytest.approx(100.0)
+    assert segundo.outputs["nt7_tr"].principal == pytest.approx(500.0)
+    assert segundo.outputs["nt7_tr"].honorarios == pytest.approx(200.0)
+    # Contexto SELIC não vem do cache dos brutos - refeito a cada resposta
+    assert len(consultas_selic) == 2
+    assert segundo.selic_context["message"] == "consulta 2"
+
+    # Outra data de citação -> novo ciclo
+    service.calcular(_inputs(citacao=date(2020, 6, 10)))
+    assert len(ciclos) == 2
+
+
+def test_falha_no_recalculo_nao_vai_para_o_cache(tmp_path, monkeypatch):
+    template = tmp_path / "template.xlsx"
+    template.write_bytes(_template())
+    monkeypatch.setattr(excel_template_calculator, "RECALC_BACKEND", "none")
+    resultados, brutos_cache = ResultCache(1024 * 1024), ResultCache(1024 * 1024)
+    monkeypatch.setattr(calculator_service, "obter_result_cache", lambda: resultados)
+    monkeypatch.setattr(calculator_service, "obter_cache_brutos", lambda: brutos_cache)
+    monkeypatch.setattr(calculator_service, "obter_result_store", lambda: None)
+    service = CalculadoraService()
+    service.excel_path = template
+
+    with pytest.raises(RecalculoError):
+        service.calcular(_inputs())
+
+    assert resultados.estatisticas()["entradas"] == 0
+    assert brutos_cache.estatisticas()["entradas"] == 0
@@ -0,0 +1,52 @@
+"""
+Testes do WorkspaceManager
+"""
+import os
+import time
+
+import pytest
+
+from workspace_manager import WorkspaceManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return WorkspaceManager(base_dir=tmp_path, max_idade=60)
+
+
+def test_workspaces_isolados_por_run_id(manager):
+    a = manager.criar("run-a")
+    b = manager.criar("run-b")
+    
+    assert a != b
+    (a / "calc.xlsx").write_bytes(b"a")
+    (b / "calc.xlsx").write_bytes(b"b")
+    
+    manager.remover(a)
+    assert not a.exists()
+    assert (b / "calc.xlsx").read_bytes() == b"b"
+
+
+def test_run_id_duplicado_ou_invalido(manager):
+    manager.criar("run-a")
+    with pytest.raises(FileExistsError):
+        manager.criar("run-a")
+    with pytest.raises(ValueError):
+        manager.criar("../fora")
+
+
+def test_limpar_antigos_preserva_recentes(manager):
+    antigo = manager.criar("antigo")
+    recente = manager.criar("recente")
+    passado = time.time() - 3600
+    os.utime(antigo, (passado, passado))
+    
+    assert manager.limpar_antigos() == 1
+    assert not antigo.exists()
+    assert recente.exists()
+
+
+def test_context_manager_remove_ao_sair(manager):
+    with manager.workspace("ctx") as pasta:
+        assert pasta.is_dir()
+    assert not pasta.exists()
@@ -0,0 +1,143 @@
+"""
+Testes da escrita direta no XML do .xlsx
+"""
+import io
+import struct
+import zipfile
+from datetime import date, datetime
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from xlsx_patcher import XlsxPatcher, localizar_planilhas
+
+
+@pytest.fixture
+def conteudo():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "RESUMO"
+    ws["B6"] = "TIMON"
+    ws["E6"] = date(2020, 1, 1)
+    ws["E6"].number_format = "DD/MM/YYYY"
+    ws["B11"] = 0.1
+    ws["B11"].number_format = "0.00%"
+    ws["D23"] = "=B11*2"
+    ws["A30"] = "rodapé"
+    outra = wb.create_sheet("NT7 IPCA SELIC")
+    outra["P127"] = 123.45
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _ler(conteudo):
+    return load_workbook(io.BytesIO(conteudo))
+
+
+def test_localiza_partes_pelas_relacoes(conteudo):
+    planilhas = localizar_planilhas(conteudo)
+    assert set(planilhas) == {"RESUMO", "NT7 IPCA SELIC"}
+    assert all(p.startswith("xl/worksheets/") for p in planilhas.values())
+
+
+def test_escreve_celulas_existentes_mantendo_estilo(conteudo):
+    novo = XlsxPatcher.aplicar(conteudo, {"RESUMO": {
+        "B6": "CAXIAS & CIA",
+        "E6": date(2021, 3, 15),
+        "B11": 0.25,
+    }})
+    ws = _ler(novo)["RESUMO"]
+
+    assert ws["B6"].value == "CAXIAS & CIA"
+    assert ws["E6"].value == datetime(2021, 3, 15)
+    assert ws["E6"].number_format == "DD/MM/YYYY"
+    assert ws["B11"].value == 0.25
+    assert ws["B11"].number_format == "0.00%"
+    assert ws["D23"].value == "=B11*2"
+
+
+def test_insere_linhas_e_celulas_em_ordem(conteudo):
+    novo = XlsxPatcher.aplicar(conteudo, {"RESUMO": {"A6": 1, "C6": 2.5, "B15": "novo", "B1": None}})
+    ws = _ler(novo)["RESUMO"]
+
+    assert [c.value for c in ws[6][:3]] == [1, "TIMON", 2.5]
+    assert ws["B15"].value == "novo"
+    assert ws["A30"].value == "rodapé"
+    assert ws["B1"].value is None
+
+
+def test_demais_partes_identicas_e_recalculo_ao_abrir(conteudo):
+    novo = XlsxPatcher.aplicar(conteudo, {"RESUMO": {"B6": "CODÓ"}})
+    alvo = localizar_planilhas(conteudo)["RESUMO"]
+
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as antes, zipfile.ZipFile(io.BytesIO(novo)) as depois:
+        assert antes.namelist() == depois.namelist()
+        for nome in antes.namelist():
+            if nome not in (alvo, "xl/workbook.xml"):
+                assert antes.read(nome) == depois.read(nome), nome
+        assert b'fullCalcOnLoad="1"' in depois.read("xl/workbook.xml")
+
+
+def _comprimidos(conteudo, nome):
+    """Bytes da entrada como estão no zip (ainda comprimidos)"""
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+        info = zf.getinfo(nome)
+    tamanho_nome, tamanho_extra = struct.unpack_from("<2H", conteudo, info.header_offset + 26)
+    inicio = info.header_offset + 30 + tamanho_nome + tamanho_extra
+    return conteudo[inicio:inicio + info.compress_size]
+
+
+def test_demais_partes_copiadas_sem_recomprimir(conteudo):
+    novo = XlsxPatcher.aplicar(conteudo, {"RESUMO": {"B6": "CODÓ"}})
+    alvo = localizar_planilhas(conteudo)["RESUMO"]
+
+    with zipfile.ZipFile(io.BytesIO(novo)) as zf:
+        assert zf.testzip() is None
+        nomes = zf.namelist()
+    for nome in nomes:
+        if nome not in (alvo, "xl/workbook.xml"):
+            assert _comprimidos(novo, nome) == _comprimidos(conteudo, nome), nome
+
+
+def _com_calc_chain(conteudo):
+    """Acrescenta xl/calcChain.xml (openpyxl não grava) apontando para RESUMO!D23"""
+    saida = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as origem, zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED) as destino:
+        for info in origem.infolist():
+            dados = origem.read(info.filename)
+            if info.filename == "xl/_rels/workbook.xml.rels":
+                dados = dados.replace(b"</Relationships>", (
+                    b'<Relationship Id="rIdCalc" Target="calcChain.xml" Type="http://schemas.openxmlformats.org/'
+                    b'officeDocument/2006/relationships/calcChain"/></Relationships>'
+                ))
+            elif info.filename == "[Content_Types].xml":
+                dados = dados.replace(b"</Types>", (
+                    b'<Override PartName="/xl/calcChain.xml" ContentType="application/'
+                    b'vnd.openxmlformats-officedocument.spreadsheetml.calcChain+xml"/></Types>'
+                ))
+            destino.writestr(info, dados)
+        destino.writestr("xl/calcChain.xml", (
+            b'<calcChain xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><c r="D23" i="1"/></calcChain>'
+        ))
+    return saida.getvalue()
+
+
+def test_calc_chain_removido_so_quando_formula_sobrescrita(conteudo):
+    conteudo = _com_calc_chain(conteudo)
+
+    mantido = XlsxPatcher.aplicar(conteudo, {"RESUMO": {"B6": "CODÓ"}})
+    with zipfile.ZipFile(io.BytesIO(mantido)) as zf:
+        assert "xl/calcChain.xml" in zf.namelist()
+
+    novo = XlsxPatcher.aplicar(conteudo, {"RESUMO": {"D23": 10}})
+    with zipfile.ZipFile(io.BytesIO(novo)) as zf:
+        assert "xl/calcChain.xml" not in zf.namelist()
+        assert b"calcChain" not in zf.read("xl/_rels/workbook.xml.rels")
+        assert b"calcChain" not in zf.read("[Content_Types].xml")
+    assert _ler(novo)["RESUMO"]["D23"].value == 10
+
+
+def test_aba_inexistente(conteudo):
+    with pytest.raises(KeyError):
+        XlsxPatcher.aplicar(conteudo, {"NAO EXISTE": {"A1": 1}})
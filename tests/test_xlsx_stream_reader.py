@@ -0,0 +1,65 @@
+"""
+Testes do leitor em streaming (paridade com openpyxl data_only)
+"""
+import io
+from datetime import datetime
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from xlsx_patcher import XlsxPatcher
+from xlsx_stream_reader import XlsxStreamReader
+
+
+RANGES = [("RESUMO", "A1:F10"), ("RESUMO", "D23:F24"), ("Outra", "B2"), ("RESUMO", "Z100")]
+
+
+@pytest.fixture
+def conteudo():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "RESUMO"
+    ws["A1"] = "Município"
+    ws["B1"] = "TIMON"
+    ws["C2"] = 42
+    ws["D3"] = 1234.5678
+    ws["E4"] = True
+    ws["F5"] = datetime(2025, 1, 31)
+    ws["A6"] = "#N/A"
+    ws["B7"] = "  com espaços  "
+    for linha in (23, 24):
+        for coluna in "DEF":
+            ws[f"{coluna}{linha}"] = linha * 1000.25
+    ws["A500"] = "depois da janela"
+    outra = wb.create_sheet("Outra")
+    outra["B2"] = "TIMON"  # string compartilhada repetida
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _openpyxl(conteudo, ranges):
+    wb = load_workbook(io.BytesIO(conteudo), data_only=True)
+    resultado = []
+    for aba, rng in ranges:
+        celulas = wb[aba][rng]
+        if not isinstance(celulas, tuple):
+            celulas = ((celulas,),)
+        resultado.append([[c.value for c in linha] for linha in celulas])
+    return resultado
+
+
+def test_paridade_com_openpyxl(conteudo):
+    assert XlsxStreamReader.ler_ranges(conteudo, RANGES) == _openpyxl(conteudo, RANGES)
+
+
+def test_paridade_apos_escrita_direta(conteudo):
+    alterado = XlsxPatcher.aplicar(conteudo, {"RESUMO": {"B1": "CAXIAS", "C2": 0.15, "G9": "novo"}})
+    ranges = [("RESUMO", "A1:G10")]
+
+    assert XlsxStreamReader.ler_ranges(alterado, ranges) == _openpyxl(alterado, ranges)
+
+
+def test_aba_inexistente(conteudo):
+    with pytest.raises(KeyError):
+        XlsxStreamReader.ler_ranges(conteudo, [("NAO EXISTE", "A1")])